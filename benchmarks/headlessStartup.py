@@ -0,0 +1,76 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Startup time of a headless ilastik process, up to the point where its workflow class is known.
+
+Usage: python benchmarks/headlessStartup.py [--repeats N] [--workflow NAME]
+
+Every scenario runs in a fresh interpreter.  Compares looking up a single workflow in the registry
+(what headless mode does) with importing all workflows (what ilastik did at startup before),
+and reports the time until the object feature plugins are first used.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+SCENARIOS = [
+    ("import ilastik.workflows", "import ilastik.workflows"),
+    (
+        "lookup workflow",
+        "from ilastik.workflow import getWorkflowFromName\nassert getWorkflowFromName({workflow!r}) is not None",
+    ),
+    ("import all workflows", "import ilastik.workflows\nilastik.workflows.loadAllWorkflows()"),
+    (
+        "first plugin use",
+        "from ilastik.plugins import pluginManager\npluginManager.getPluginsOfCategory('ObjectFeatures')",
+    ),
+]
+
+TIMED = """
+import sys, time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start, len(sys.modules))
+"""
+
+
+def _run_scenario(code, workflow):
+    output = subprocess.check_output([sys.executable, "-c", TIMED.format(code=code.format(workflow=workflow))])
+    seconds, num_modules = output.split()[-2:]
+    return float(seconds), int(num_modules)
+
+
+def run(repeats, workflow):
+    print("{:>24} {:>12} {:>10}".format("scenario", "median", "modules"))
+    for name, code in SCENARIOS:
+        results = [_run_scenario(code, workflow) for _ in range(repeats)]
+        median = statistics.median(seconds for seconds, _ in results)
+        print("{:>24} {:>11.2f}s {:>10}".format(name, median, results[-1][1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workflow", default="Pixel Classification")
+    args = parser.parse_args()
+
+    run(args.repeats, args.workflow)
@@ -0,0 +1,101 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Retrain latency of the pixel classification random forest against the number of labelled pixels.
+
+Usage: python benchmarks/incrementalRfRetraining.py [--trees N] [--features N] [--stroke N]
+
+Simulates interactive labelling: each step adds a brush stroke of new samples and retrains.
+Compares training from scratch (ParallelVigraRfLazyflowClassifierFactory) with incremental
+updates (IncrementalParallelVigraRfLazyflowClassifierFactory), and reports the accuracy of both
+on held-out samples.
+"""
+
+import argparse
+import time
+
+import numpy
+
+from lazyflow.classifiers import (
+    ParallelVigraRfLazyflowClassifierFactory,
+    IncrementalParallelVigraRfLazyflowClassifierFactory,
+)
+
+LABEL_COUNTS = (10000, 50000, 200000, 1000000)
+
+
+def _samples(rng, num_samples, num_features):
+    X = rng.normal(size=(num_samples, num_features)).astype(numpy.float32)
+    y = (X[:, 0] + 0.5 * X[:, 1] ** 2 > 0.5).astype(numpy.uint32) + 1
+    return X, y
+
+
+def _accuracy(classifier, X, y):
+    return (numpy.argmax(classifier.predict_probabilities(X), axis=-1) + 1 == y).mean()
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(num_trees, num_features, stroke_size):
+    rng = numpy.random.RandomState(0)
+    X_test, y_test = _samples(rng, 10000, num_features)
+
+    full_factory = ParallelVigraRfLazyflowClassifierFactory(num_trees)
+    incremental_factory = IncrementalParallelVigraRfLazyflowClassifierFactory(num_trees)
+
+    print("{:>10} {:>14} {:>14} {:>10} {:>10}".format("labels", "full", "incremental", "acc/full", "acc/incr"))
+    for num_labels in LABEL_COUNTS:
+        X, y = _samples(rng, num_labels, num_features)
+        # The state before the latest brush stroke
+        previous = incremental_factory.create_and_train(X[:-stroke_size], y[:-stroke_size])
+
+        full, full_time = _timed(full_factory.create_and_train, X, y)
+        incremental, incremental_time = _timed(
+            incremental_factory.create_and_train,
+            X,
+            y,
+            previous_classifier=previous,
+            appended_rows=numpy.arange(len(X) - stroke_size, len(X)),
+        )
+        print(
+            "{:>10} {:>13.2f}s {:>13.2f}s {:>10.3f} {:>10.3f}".format(
+                num_labels,
+                full_time,
+                incremental_time,
+                _accuracy(full, X_test, y_test),
+                _accuracy(incremental, X_test, y_test),
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--features", type=int, default=37)
+    parser.add_argument("--stroke", type=int, default=500)
+    args = parser.parse_args()
+
+    run(args.trees, args.features, args.stroke)
@@ -0,0 +1,130 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Throughput of RESTfulPrecomputedChunkedVolume.read against a local HTTP server.
+
+Usage: python benchmarks/precomputedChunkFetching.py [--latency SECONDS] [--threads 1 4 8 16]
+
+The server delays every chunk by --latency to mimic a remote server. The volume is read
+once per thread count, and finally twice with an on-disk chunk cache (cold and warm).
+"""
+import argparse
+import http.server
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+
+import numpy
+
+from lazyflow.utility.io_util.RESTfulPrecomputedChunkedVolume import RESTfulPrecomputedChunkedVolume
+
+SHAPE_CZYX = (1, 64, 256, 256)
+CHUNK_SIZE_XYZ = (64, 64, 16)
+
+
+def write_volume(directory):
+    data = numpy.random.randint(0, 255, SHAPE_CZYX).astype(numpy.uint8)
+    c, z, y, x = SHAPE_CZYX
+    info = (
+        '{"type": "image", "data_type": "uint8", "num_channels": %d, "scales": [{"key": "1_1_1", '
+        '"size": [%d, %d, %d], "resolution": [1, 1, 1], "voxel_offset": [0, 0, 0], '
+        '"chunk_sizes": [[%d, %d, %d]], "encoding": "raw"}]}' % ((c, x, y, z) + CHUNK_SIZE_XYZ)
+    )
+    with open(os.path.join(directory, "info"), "w") as f:
+        f.write(info)
+    os.makedirs(os.path.join(directory, "1_1_1"))
+    cx, cy, cz = CHUNK_SIZE_XYZ
+    for z0 in range(0, z, cz):
+        for y0 in range(0, y, cy):
+            for x0 in range(0, x, cx):
+                name = f"{x0}-{x0 + cx}_{y0}-{y0 + cy}_{z0}-{z0 + cz}"
+                with open(os.path.join(directory, "1_1_1", name), "wb") as f:
+                    f.write(data[:, z0 : z0 + cz, y0 : y0 + cy, x0 : x0 + cx].tobytes())
+    return data
+
+
+def start_server(directory, latency):
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def do_GET(self):
+            if self.path.startswith("/1_1_1/"):
+                time.sleep(latency)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    httpd = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def timed_read(url, n_threads, chunk_cache_dir=None):
+    volume = RESTfulPrecomputedChunkedVolume(url, n_threads=n_threads, chunk_cache_dir=chunk_cache_dir)
+    result = numpy.zeros(SHAPE_CZYX, dtype=numpy.uint8)
+    start = time.perf_counter()
+    volume.read(((0, 0, 0, 0), SHAPE_CZYX), result)
+    elapsed = time.perf_counter() - start
+    volume.close()
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.01, help="server delay per chunk in seconds")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    try:
+        data = write_volume(directory)
+        httpd = start_server(directory, args.latency)
+        url = f"http://127.0.0.1:{httpd.server_address[1]}"
+        megabytes = data.nbytes / 1024 ** 2
+
+        print(f"{'threads':>8} {'seconds':>10} {'MB/s':>10}")
+        for n_threads in args.threads:
+            result, elapsed = timed_read(url, n_threads)
+            assert (result == data).all()
+            print(f"{n_threads:>8} {elapsed:>10.3f} {megabytes / elapsed:>10.1f}")
+
+        for label in ("cold cache", "warm cache"):
+            result, elapsed = timed_read(url, max(args.threads), chunk_cache_dir=cache_dir)
+            assert (result == data).all()
+            print(f"{label:>8} {elapsed:>10.3f} {megabytes / elapsed:>10.1f}")
+        httpd.shutdown()
+    finally:
+        shutil.rmtree(directory)
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    main()
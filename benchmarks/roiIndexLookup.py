@@ -0,0 +1,99 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Lookup latency of the array caches' block index against the number of cached blocks.
+
+Usage: python benchmarks/roiIndexLookup.py [--queries N]
+
+Compares a linear scan (``lazyflow.roi.containing_rois``, which the caches used before)
+with ``lazyflow.utility.RoiIndex`` for containment queries (cache hits)
+and intersection queries (dirty propagation).
+"""
+import argparse
+import itertools
+import random
+import time
+
+from lazyflow.roi import containing_rois, getIntersection
+from lazyflow.utility.roiIndex import RoiIndex
+
+BLOCKSHAPE = (1, 64, 64, 64, 1)
+CACHE_SIZES = (100, 1000, 10000, 50000)
+
+
+def _block_rois(num_blocks):
+    side = int(round(num_blocks ** (1 / 3.0))) + 1
+    starts = itertools.product(range(side), range(side), range(side))
+    rois = []
+    for z, y, x in itertools.islice(starts, num_blocks):
+        start = (0, z * 64, y * 64, x * 64, 0)
+        rois.append((start, tuple(b + s for b, s in zip(start, BLOCKSHAPE))))
+    return rois
+
+
+def _random_subroi(rng, roi):
+    start = tuple(rng.randrange(b, e) for b, e in zip(*roi))
+    stop = tuple(rng.randrange(b + 1, e + 1) for b, e in zip(start, roi[1]))
+    return (start, stop)
+
+
+def _time_per_query(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def run(num_queries):
+    rng = random.Random(0)
+    print(
+        "{:>8} {:>22} {:>22} {:>22} {:>22}".format(
+            "blocks", "contain/scan", "contain/index", "dirty/scan", "dirty/index"
+        )
+    )
+    for num_blocks in CACHE_SIZES:
+        rois = _block_rois(num_blocks)
+        index = RoiIndex(BLOCKSHAPE)
+        for roi in rois:
+            index.add(roi)
+
+        hits = [_random_subroi(rng, rng.choice(rois)) for _ in range(num_queries)]
+        dirty = [_random_subroi(rng, ((0, 0, 0, 0, 0), (1, 256, 256, 256, 1))) for _ in range(num_queries)]
+
+        def scan_intersecting(q):
+            return [r for r in rois if getIntersection(r, q, assertIntersect=False) is not None]
+
+        timings = (
+            _time_per_query(lambda q: containing_rois(rois, q), hits),
+            _time_per_query(index.containing, hits),
+            _time_per_query(scan_intersecting, dirty),
+            _time_per_query(index.intersecting, dirty),
+        )
+        print("{:>8} {:>20.1f}us {:>20.1f}us {:>20.1f}us {:>20.1f}us".format(num_blocks, *(t * 1e6 for t in timings)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    run(args.queries)
@@ -0,0 +1,107 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Micro-benchmarks comparing the lazyflow thread pool schedulers.
+
+Usage: python benchmarks/threadPoolScheduling.py [--workers N] [--tasks N] [--repeat N]
+
+Each scenario is run once per scheduler in ``lazyflow.request.threadPool.SCHEDULERS``:
+
+* flat: many tiny requests submitted from the main thread
+* fan-out: a few parent requests that each spawn and wait for many child requests
+  (this is how blockwise operators use the request system)
+* imbalanced: child requests of very different cost, spawned from a single parent
+"""
+import argparse
+import time
+
+from lazyflow.request import Request, RequestPool
+from lazyflow.request.threadPool import SCHEDULERS
+
+
+def _tiny_work(n=200):
+    x = 0
+    for i in range(n):
+        x += i
+    return x
+
+
+def flat(num_tasks):
+    pool = RequestPool()
+    for _ in range(num_tasks):
+        pool.add(Request(_tiny_work))
+    pool.wait()
+
+
+def fan_out(num_tasks, num_parents=8):
+    def parent():
+        pool = RequestPool()
+        for _ in range(num_tasks // num_parents):
+            pool.add(Request(_tiny_work))
+        pool.wait()
+
+    pool = RequestPool()
+    for _ in range(num_parents):
+        pool.add(Request(parent))
+    pool.wait()
+
+
+def imbalanced(num_tasks):
+    def parent():
+        pool = RequestPool()
+        for i in range(num_tasks):
+            # Every 16th task is expensive
+            pool.add(Request(lambda i=i: _tiny_work(20000 if i % 16 == 0 else 200)))
+        pool.wait()
+
+    Request(parent).wait()
+
+
+SCENARIOS = {"flat": flat, "fan-out": fan_out, "imbalanced": imbalanced}
+
+
+def run(num_workers, num_tasks, repeat):
+    results = {}
+    for scheduler in SCHEDULERS:
+        Request.reset_thread_pool(num_workers, scheduler=scheduler)
+        for name, scenario in SCENARIOS.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                scenario(num_tasks)
+                timings.append(time.perf_counter() - start)
+            results[(scheduler, name)] = min(timings)
+
+    print("{:<12} {:>16} {:>16}".format("scenario", *SCHEDULERS))
+    for name in SCENARIOS:
+        row = [results[(scheduler, name)] for scheduler in SCHEDULERS]
+        print("{:<12} {:>15.3f}s {:>15.3f}s".format(name, *row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.workers, args.tasks, args.repeat)
@@ -297,12 +297,19 @@ def _prepare_lazyflow_config(parsed_args):
     # Check environment variable settings.
     n_threads = os.getenv("LAZYFLOW_THREADS", None)
     total_ram_mb = os.getenv("LAZYFLOW_TOTAL_RAM_MB", None)
+    scheduler = os.getenv("LAZYFLOW_SCHEDULER", None)
+    n_processes = os.getenv("LAZYFLOW_PROCESSES", None)
+    eviction_policy = os.getenv("LAZYFLOW_CACHE_EVICTION_POLICY", None)
+    spill_directory = os.getenv("LAZYFLOW_SPILL_DIRECTORY", None)
+    spill_max_mb = os.getenv("LAZYFLOW_SPILL_MAX_MB", None)
     status_interval_secs = int(os.getenv("LAZYFLOW_STATUS_MONITOR_SECONDS", "0"))
 
     # Convert str -> int
     if n_threads is not None:
         n_threads = int(n_threads)
     total_ram_mb = total_ram_mb and int(total_ram_mb)
+    n_processes = n_processes and int(n_processes)
+    spill_max_mb = spill_max_mb and int(spill_max_mb)
 
     # If not in env, check config file.
     if n_threads is None:
@@ -310,9 +317,28 @@ def _prepare_lazyflow_config(parsed_args):
         if n_threads == -1:
             n_threads = None
     total_ram_mb = total_ram_mb or ilastik_config.getint("lazyflow", "total_ram_mb")
+    scheduler = scheduler or ilastik_config.get("lazyflow", "scheduler")
+    if scheduler == "default":
+        scheduler = None
+    n_processes = n_processes or ilastik_config.getint("lazyflow", "processes")
+    eviction_policy = eviction_policy or ilastik_config.get("lazyflow", "cache_eviction_policy")
+    if eviction_policy == "lru":
+        eviction_policy = None
+    spill_directory = spill_directory or ilastik_config.get("lazyflow", "spill_directory")
+    spill_max_mb = spill_max_mb or ilastik_config.getint("lazyflow", "spill_max_mb")
+    if not spill_directory:
+        spill_max_mb = 0
 
     # Note that n_threads == 0 is valid and useful for debugging.
-    if (n_threads is not None) or total_ram_mb or status_interval_secs:
+    if (
+        (n_threads is not None)
+        or total_ram_mb
+        or status_interval_secs
+        or scheduler
+        or n_processes
+        or eviction_policy
+        or spill_max_mb
+    ):
 
         def _configure_lazyflow_settings():
             import lazyflow
@@ -325,9 +351,26 @@ def _prepare_lazyflow_config(parsed_args):
                 memory_logger.setLevel(logging.DEBUG)
                 cacheMemoryManager.setRefreshInterval(status_interval_secs)
 
-            if n_threads is not None:
-                logger.info(f"Resetting lazyflow thread pool with {n_threads} " "threads.")
-                lazyflow.request.Request.reset_thread_pool(n_threads)
+            if eviction_policy:
+                logger.info(f"Using {eviction_policy} cache eviction policy.")
+                cacheMemoryManager.setEvictionPolicy(eviction_policy)
+
+            if spill_max_mb > 0:
+                from lazyflow.operators import cacheSpillStore
+
+                logger.info(f"Spilling up to {spill_max_mb} MB of evicted cache blocks to {spill_directory}")
+                cacheSpillStore.configure(spill_directory, spill_max_mb * 1024 ** 2)
+
+            if n_threads is not None or scheduler or n_processes:
+                kwargs = {}
+                if n_threads is not None:
+                    kwargs["num_workers"] = n_threads
+                if scheduler:
+                    kwargs["scheduler"] = scheduler
+                if n_processes:
+                    kwargs["num_processes"] = n_processes
+                logger.info(f"Resetting lazyflow thread pool with {kwargs}.")
+                lazyflow.request.Request.reset_thread_pool(**kwargs)
             if total_ram_mb > 0:
                 if total_ram_mb < 500:
                     raise Exception(
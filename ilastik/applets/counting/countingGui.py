@@ -27,6 +27,7 @@ import numpy
 
 from ilastik.applets.counting.countingGuiBoxesInterface import BoxController, BoxInterpreter, Tool
 from ilastik.applets.counting.countingGuiDotsInterface import DotCrosshairController, DotInterpreter
+from ilastik.applets.counting.opCounting import OpDensityIntegral
 from ilastik.applets.labeling.labelingGui import LabelingGui
 from ilastik.shell.gui.iconMgr import ilastikIcons
 from ilastik.utility import bind
@@ -209,7 +210,11 @@ class CountingGui(LabelingGui):
         self.density5d = OpReorderAxes(graph=self.op.graph, parent=self.op.parent)  #
 
         self.density5d.Input.connect(self.op.Density)
-        self.boxController = BoxController(self.editor, self.density5d.Output, self.labelingDrawerUi.boxListModel)
+        self.densityIntegral = OpDensityIntegral(graph=self.op.graph, parent=self.op.parent)
+        self.densityIntegral.Input.connect(self.density5d.Output)
+        self.boxController = BoxController(
+            self.editor, self.density5d.Output, self.labelingDrawerUi.boxListModel, self.densityIntegral
+        )
         self.boxInterpreter = BoxInterpreter(self.editor.navInterpret, self.editor.posModel, self.centralWidget())
         self.boxInterpreter.boxDrawn.connect(self.boxController.addNewBox)
 
@@ -470,7 +470,16 @@ class RedRubberBand(QRubberBand):
 
 
 class CoupledRectangleElement(object):
-    def __init__(self, pos: QRect, inputSlot, editor=None, scene=None, parent=None, qcolor=QColor(0, 0, 255)):
+    def __init__(
+        self,
+        pos: QRect,
+        inputSlot,
+        editor=None,
+        scene=None,
+        parent=None,
+        qcolor=QColor(0, 0, 255),
+        densityIntegral=None,
+    ):
         """
         Couples the functionality of the lazyflow operator OpSubRegion which gets a subregion of interest
         and the functionality of the resizable rectangle Item.
@@ -482,6 +491,7 @@ class CoupledRectangleElement(object):
         :param scene: the scene where to put the graphics item
         :param parent: the parent object if any
         :param qcolor: initial color of the rectangle
+        :param densityIntegral: OpDensityIntegral connected to inputSlot, used to compute the box sum if given
         """
         assert inputSlot.meta.getTaggedShape()["c"] == 1
 
@@ -493,6 +503,9 @@ class CoupledRectangleElement(object):
         self._opsub = OpSubRegion(graph=inputSlot.operator.graph, parent=inputSlot.operator.parent)
 
         self._inputSlot = inputSlot  # input slot which connect to the sub array
+        self._densityIntegral = densityIntegral
+        # The integral is only up to date once it has been notified itself
+        self._dirtySlot = inputSlot if densityIntegral is None else densityIntegral.Output
 
         self.boxLabel = None  # a reference to the label in the labellist model
         self._initConnect()
@@ -501,7 +514,7 @@ class CoupledRectangleElement(object):
         # Operator changes
         self._opsub.Input.connect(self._inputSlot)
         self._opsub.Roi.setValue([self.getStart(), self.getStop()])
-        self._inputSlot.notifyDirty(self._updateTextWhenChanges)
+        self._dirtySlot.notifyDirty(self._updateTextWhenChanges)
 
         # Signaling when the rectangle is moved
         self._rectItem.Signaller.signalHasMoved.connect(self._updateTextWhenChanges)
@@ -520,10 +533,13 @@ class CoupledRectangleElement(object):
         # region get a wrong size
         # try:
         try:
-            subarray = self.getSubRegion()
-            value = 0
-            if subarray is not None:
-                value = subarray.sum()
+            if self._densityIntegral is not None:
+                value = self._densityIntegral.box_sum(self.getStart(), self.getStop())
+            else:
+                subarray = self.getSubRegion()
+                value = 0
+                if subarray is not None:
+                    value = subarray.sum()
 
             self._rectItem.updateText(f"{value:.1f}")
 
@@ -540,7 +556,7 @@ class CoupledRectangleElement(object):
         return self._rectItem
 
     def disconnectInput(self):
-        self._inputSlot.unregisterDirty(self._updateTextWhenChanges)
+        self._dirtySlot.unregisterDirty(self._updateTextWhenChanges)
         self._opsub.Input.disconnect()
 
     def getStart(self):
@@ -703,13 +719,14 @@ class BoxController(QObject):
     fixedBoxesChanged = pyqtSignal(dict)
     viewBoxesChanged = pyqtSignal(dict)
 
-    def __init__(self, editor, connectionInput, boxListModel):
+    def __init__(self, editor, connectionInput, boxListModel, densityIntegral=None):
         """
         Class which controls all boxes on the scene
 
         :param scene:
         :param connectionInput: The imput slot to which connect all the new boxes
         :param boxListModel:
+        :param densityIntegral: OpDensityIntegral connected to connectionInput, for fast box sums
 
         """
 
@@ -720,6 +737,7 @@ class BoxController(QObject):
         self._setUpRandomColors()
         self.scene = scene
         self.connectionInput = connectionInput
+        self.densityIntegral = densityIntegral
         self._currentBoxesList = []
         self.currentColor = self._getNextBoxColor()
         self.boxListModel = boxListModel
@@ -738,7 +756,12 @@ class BoxController(QObject):
             return
 
         rect = CoupledRectangleElement(
-            pos, self.connectionInput, editor=self._editor, scene=self.scene, parent=self.scene.parent()
+            pos,
+            self.connectionInput,
+            editor=self._editor,
+            scene=self.scene,
+            parent=self.scene.parent(),
+            densityIntegral=self.densityIntegral,
         )
         rect.setZValue(len(self._currentBoxesList))
         rect.setColor(self.currentColor)
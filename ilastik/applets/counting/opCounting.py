@@ -47,7 +47,7 @@ from lazyflow.operators import (
 from lazyflow.operators.opDenseLabelArray import OpDenseLabelArray
 
 from lazyflow.request import Request, RequestPool
-from lazyflow.roi import roiToSlice, sliceToRoi, determineBlockShape
+from lazyflow.roi import roiToSlice, sliceToRoi, determineBlockShape, getIntersectingBlocks, getBlockBounds
 
 from ilastik.applets.counting.countingOperators import OpTrainCounter, OpPredictCounter, OpLabelPreviewer
 
@@ -70,6 +70,18 @@ class OpVolumeOperator(Operator):
     DefaultBlockSize = (128, 128, None)
     blockShape = InputSlot(value=DefaultBlockSize)
 
+    def __init__(self, *args, **kwargs):
+        super(OpVolumeOperator, self).__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self.cache = None
+        # Function value of each block, by block start. Only blocks that became dirty are recomputed.
+        self._blockResults = {}
+        # Incremented whenever a block (or, for _resets, everything) becomes dirty,
+        # so that results computed from old data are not stored
+        self._blockVersions = {}
+        self._resets = 0
+        self._dirtyCount = 0
+
     def setupOutputs(self):
         testInput = numpy.ones((3, 3))
         testFun = self.Function.value
@@ -78,59 +90,199 @@ class OpVolumeOperator(Operator):
         self.outputs["Output"].meta.dtype = testOutput.dtype
         self.outputs["Output"].meta.shape = (1,)
         self.outputs["Output"].setDirty((slice(0, 1, None),))
+
+        shape = self.Input.meta.shape
+        with self._lock:
+            # self.blockshape has None in the last dimension to indicate that it should not be
+            # handled block-wise. None is replaced with the image shape in the respective axis.
+            self._fullBlockShape = tuple(u if u is not None else v for u, v in zip(self.blockShape.value, shape))
+            self._reset()
+
+    def _reset(self):
         self.cache = None
-        self._lock = threading.Lock()
+        self._blockResults = {}
+        self._resets += 1
+        self._dirtyCount += 1
+
+    def _blockVersion(self, blockStart):
+        return (self._resets, self._blockVersions.get(blockStart, 0))
 
     def execute(self, slot, subindex, roi, result):
+        shape = self.Input.meta.shape
+        with self._lock:
+            if self.cache is not None:
+                return self.cache
+            blockShape = self._fullBlockShape
+            blockStarts = list(map(tuple, getIntersectingBlocks(blockShape, ([0] * len(shape), shape))))
+            blockResults = {b: self._blockResults[b] for b in blockStarts if b in self._blockResults}
+            missing = {b: self._blockVersion(b) for b in blockStarts if b not in blockResults}
+            dirtyCount = self._dirtyCount
+
+        fun = self.inputs["Function"].value
+
+        def predict_block(blockStart):
+            blockKey = roiToSlice(*getBlockBounds(shape, blockShape, blockStart))
+            data = self.Input[blockKey].wait()
+            blockResults[blockStart] = fun(data)
+
+        pool = RequestPool()
+        for blockStart in missing:
+            pool.request(partial(predict_block, blockStart))
+
+        pool.wait()
+        pool.clean()
+
+        blockCache = numpy.array([blockResults[b] for b in blockStarts], dtype=self.Output.meta.dtype)
+        value = [fun(blockCache)]
+
         with self._lock:
-            if self.cache is None:
-                shape = self.Input.meta.shape
-                # self.blockshape has None in the last dimension to indicate that it should not be
-                # handled block-wise. None is replaced with the image shape in the respective axis.
-                fullBlockShape = []
-                for u, v in zip(self.blockShape.value, shape):
-                    if u is not None:
-                        fullBlockShape.append(u)
-                    else:
-                        fullBlockShape.append(v)
-                fullBlockShape = numpy.array(fullBlockShape, dtype=numpy.float64)
-
-                # data = self.inputs["Input"][:].wait()
-                # split up requests into blocks
-
-                numBlocks = numpy.ceil(shape / fullBlockShape).astype("int")
-                blockCache = numpy.ndarray(shape=numpy.prod(numBlocks), dtype=self.Output.meta.dtype)
-                pool = RequestPool()
-                # blocks holds the different roi keys for each of the blocks
-                blocks = itertools.product(*[list(range(i)) for i in numBlocks])
-                blockKeys = []
-                for b in blocks:
-                    start = b * fullBlockShape
-                    stop = b * fullBlockShape + fullBlockShape
-                    stop = numpy.min(numpy.vstack((stop, shape)), axis=0)
-                    blockKey = roiToSlice(start, stop)
-                    blockKeys.append(blockKey)
-
-                fun = self.inputs["Function"].value
-
-                def predict_block(i):
-                    data = self.Input[blockKeys[i]].wait()
-                    blockCache[i] = fun(data)
-
-                for i, f in enumerate(blockCache):
-                    req = pool.request(partial(predict_block, i))
-
-                pool.wait()
-                pool.clean()
-
-                self.cache = [fun(blockCache)]
-            return self.cache
+            # Don't keep results of blocks that became dirty in the meantime
+            for blockStart, version in missing.items():
+                if self._blockVersion(blockStart) == version:
+                    self._blockResults[blockStart] = blockResults[blockStart]
+            if self._dirtyCount == dirtyCount:
+                self.cache = value
+        return value
 
     def propagateDirty(self, slot, subindex, roi):
-        key = roi.toSlice()
-        if slot == self.Input or slot == self.Function:
+        with self._lock:
+            if slot == self.Input:
+                for blockStart in getIntersectingBlocks(self._fullBlockShape, (roi.start, roi.stop)):
+                    blockStart = tuple(blockStart)
+                    self._blockResults.pop(blockStart, None)
+                    self._blockVersions[blockStart] = self._blockVersions.get(blockStart, 0) + 1
+                self._dirtyCount += 1
+                self.cache = None
+            elif slot == self.Function:
+                self._reset()
+            else:
+                self.cache = None
+        if slot in (self.Input, self.Function):
             self.outputs["Output"].setDirty(slice(None))
-        self.cache = None
+
+
+class OpDensityIntegral(Operator):
+    """
+    Sums of the Input over arbitrary axis-aligned boxes (see box_sum), e.g. for the counting boxes.
+
+    The Input is split into blocks, and a summed-area table (integral image) is kept for each block.
+    The sum over a box is then assembled from the blocks it intersects, with 2**ndim table lookups per block.
+    Only blocks that become dirty are discarded (and recomputed on the next query).
+
+    Output is the sum over the whole Input; it is set dirty whenever the Input becomes dirty.
+    """
+
+    name = "OpDensityIntegral"
+
+    Input = InputSlot()
+    # Blocks span DefaultBlockSize pixels along the spatial axes, and a single time step (if not given)
+    BlockShape = InputSlot(optional=True)
+    Output = OutputSlot()
+
+    DefaultBlockSize = 128
+
+    def __init__(self, *args, **kwargs):
+        super(OpDensityIntegral, self).__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._versions = {}
+        self._shape = None
+        self._blockShape = None
+
+    def setupOutputs(self):
+        shape = self.Input.meta.shape
+        if self.BlockShape.ready():
+            blockShape = tuple(u if u is not None else v for u, v in zip(self.BlockShape.value, shape))
+        else:
+            blockShape = []
+            for key, size in zip(self.Input.meta.getAxisKeys(), shape):
+                if key in "xyz":
+                    blockShape.append(min(size, self.DefaultBlockSize))
+                elif key == "t":
+                    blockShape.append(1)
+                else:
+                    blockShape.append(size)
+        blockShape = tuple(blockShape)
+
+        if (shape, blockShape) != (self._shape, self._blockShape):
+            with self._lock:
+                self._shape = shape
+                self._blockShape = blockShape
+                self._tables = {}
+                self._versions = {}
+
+        # Corners of a box, as choice between start (0) and stop (1) per axis, and their sign in the sum
+        self._corner_choices = numpy.array(list(itertools.product((0, 1), repeat=len(shape))), dtype=bool)
+        self._corner_signs = (-1) ** (len(shape) - self._corner_choices.sum(axis=1))
+
+        self.Output.meta.dtype = numpy.float64
+        self.Output.meta.shape = (1,)
+
+    def execute(self, slot, subindex, roi, result):
+        result[0] = self.box_sum([0] * len(self._shape), self._shape)
+        return result
+
+    def box_sum(self, start, stop):
+        """
+        Sum of the Input within the box [start, stop)
+        """
+        start = numpy.maximum(start, 0)
+        stop = numpy.minimum(stop, self._shape)
+        if (stop <= start).any():
+            return 0.0
+
+        blockStarts = list(map(tuple, getIntersectingBlocks(self._blockShape, (start, stop))))
+        tables = self._get_tables(blockStarts)
+
+        total = 0.0
+        for blockStart in blockStarts:
+            table = tables[blockStart]
+            tableStart = numpy.maximum(start - blockStart, 0)
+            tableStop = numpy.minimum(stop - blockStart, numpy.array(table.shape) - 1)
+            corners = numpy.where(self._corner_choices, tableStop, tableStart)
+            total += numpy.dot(table[tuple(corners.T)], self._corner_signs)
+        return total
+
+    def _get_tables(self, blockStarts):
+        with self._lock:
+            tables = {b: self._tables.get(b) for b in blockStarts}
+            missing = {b: self._versions.get(b, 0) for b, table in tables.items() if table is None}
+
+        if missing:
+            pool = RequestPool()
+            reqs = {}
+            for blockStart in missing:
+                reqs[blockStart] = Request(partial(self._compute_table, blockStart))
+                pool.add(reqs[blockStart])
+            pool.wait()
+
+            with self._lock:
+                for blockStart, req in reqs.items():
+                    tables[blockStart] = req.result
+                    # Don't keep the table if the block became dirty in the meantime
+                    if self._versions.get(blockStart, 0) == missing[blockStart]:
+                        self._tables[blockStart] = req.result
+        return tables
+
+    def _compute_table(self, blockStart):
+        blockStart, blockStop = getBlockBounds(self._shape, self._blockShape, blockStart)
+        data = self.Input(blockStart, blockStop).wait()
+
+        # Pad with a leading zero row along every axis, so that table[i, j, ...] is the sum of data[:i, :j, ...]
+        table = numpy.zeros(tuple(numpy.array(data.shape) + 1), dtype=numpy.float64)
+        table[(slice(1, None),) * data.ndim] = data
+        for axis in range(table.ndim):
+            numpy.cumsum(table, axis=axis, out=table)
+        return table
+
+    def propagateDirty(self, slot, subindex, roi):
+        if slot == self.Input:
+            with self._lock:
+                for blockStart in getIntersectingBlocks(self._blockShape, (roi.start, roi.stop)):
+                    blockStart = tuple(blockStart)
+                    self._tables.pop(blockStart, None)
+                    self._versions[blockStart] = self._versions.get(blockStart, 0) + 1
+        self.Output.setDirty(slice(None))
 
 
 # FIXME: this operator does _not_ calculate anything related to data - just
@@ -29,6 +29,7 @@ import numpy
 from ilastik.applets.base.applet import Applet
 from ilastik.utility import OpMultiLaneWrapper
 from ilastik.utility.commandLineProcessing import ParseListFromString
+from lazyflow.operators.ioOperators import OpH5N5WriterBigDataset
 from .dataExportSerializer import DataExportSerializer
 from .opDataExport import OpDataExport
 
@@ -171,6 +172,19 @@ class DataExportApplet(Applet):
 
         arg_parser.add_argument("--table_only", help="Export only csv/HDF5 table.", action="store_true", default=False)
 
+        arg_parser.add_argument(
+            "--export_compression",
+            help="Compression of the exported dataset (applies to hdf5/n5 output only)",
+            choices=OpH5N5WriterBigDataset.COMPRESSORS,
+            required=False,
+        )
+        arg_parser.add_argument(
+            "--export_parallel_write",
+            help="Compress and write hdf5/n5 chunks on all worker threads (chunks are written out of order)",
+            action="store_true",
+            default=False,
+        )
+
         return arg_parser
 
     @classmethod
@@ -326,5 +340,11 @@ class DataExportApplet(Applet):
         if parsed_args.table_only:
             opDataExport.TableOnly.setValue(True)
 
+        if parsed_args.export_compression:
+            opDataExport.Compression.setValue(parsed_args.export_compression)
+
+        if parsed_args.export_parallel_write:
+            opDataExport.ParallelWrite.setValue(True)
+
         # Re-connect the 'transaction' slot to apply all settings at once.
         opDataExport.TransactionSlot.setValue(True)
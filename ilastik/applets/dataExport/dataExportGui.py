@@ -263,6 +263,8 @@ class DataExportGui(QWidget):
                 opExportModelOp.OutputFilenameFormat,
                 opExportModelOp.OutputInternalPath,
                 opExportModelOp.OutputFormat,
+                opExportModelOp.Compression,
+                opExportModelOp.ParallelWrite,
             ]
 
             # Disconnect the special 'transaction' slot to prevent these
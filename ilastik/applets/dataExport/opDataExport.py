@@ -95,6 +95,8 @@ class OpDataExport(Operator):
     )  # A format string allowing {dataset_dir} {nickname}, {roi}, {x_start}, {x_stop}, etc.
     OutputInternalPath = InputSlot(value="exported_data")
     OutputFormat = InputSlot(value="hdf5")
+    Compression = InputSlot(optional=True)  # hdf5/n5 only: one of OpH5N5WriterBigDataset.COMPRESSORS
+    ParallelWrite = InputSlot(value=False)  # hdf5/n5 only: compress and write chunks on the worker threads
 
     # Only export csv/HDF5 table (don't export volume)
     TableOnlyName = InputSlot(value="Table-Only")
@@ -149,6 +151,8 @@ class OpDataExport(Operator):
         opFormattedExport.ExportDtype.connect(self.ExportDtype)
         opFormattedExport.OutputAxisOrder.connect(self.OutputAxisOrder)
         opFormattedExport.OutputFormat.connect(self.OutputFormat)
+        opFormattedExport.Compression.connect(self.Compression)
+        opFormattedExport.ParallelWrite.connect(self.ParallelWrite)
 
         self.ConvertedImage.connect(opFormattedExport.ConvertedImage)
         self.ImageToExport.connect(opFormattedExport.ImageToExport)
@@ -321,6 +325,8 @@ def get_model_op(wrappedOp):
         wrappedOp.OutputFilenameFormat,
         wrappedOp.OutputInternalPath,
         wrappedOp.OutputFormat,
+        wrappedOp.Compression,
+        wrappedOp.ParallelWrite,
     ]
 
     # Use an instance of OpFormattedDataExport, since has the important slots and no others.
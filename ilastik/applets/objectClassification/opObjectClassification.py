@@ -1256,8 +1256,6 @@ class OpObjectPredict(Operator):
             rows, cols = replace_missing(ftmatrix)
             self.bad_objects[t] = numpy.zeros((ftmatrix.shape[0],))
             self.bad_objects[t][rows] = 1
-            self.uncertainty_estimate[t] = numpy.zeros((ftmatrix.shape[0],))
-            self.uncertainty_estimate[t][rows] = 1
             feats[t] = ftmatrix
 
         # Are there any objects to predict?
@@ -1315,39 +1313,50 @@ class OpObjectPredict(Operator):
 
             elif slot == self.UncertaintyEstimate:
                 for t in times:
-
-                    prob = self.prob_cache[t]
-                    shape = numpy.shape(prob)
-                    res = numpy.zeros(shape=(shape[0]))
-                    if shape[1] <= 1:
-                        self.uncertainty_estimate[t] = res
-                        return {t: self.uncertainty_estimate[t] for t in times}
-                    else:
-                        maxElt = numpy.argmax(self.prob_cache[t], axis=1)
-                        ones = numpy.zeros(shape)
-                        for i in range(shape[0]):
-                            ones[i, maxElt[i]] = 1
-                        probMinusMax = prob - numpy.multiply(prob, ones)
-                        if numpy.max(probMinusMax) <= 0:
-                            self.uncertainty_estimate[t] = numpy.zeros(shape=(shape[0]))
-                        else:
-                            secondElt = numpy.argmax(probMinusMax, axis=1)
-                            for i in range(shape[0]):
-                                res[i] = 1 - (prob[i][maxElt[i]] - prob[i][secondElt[i]])
-                            self.uncertainty_estimate[t] = res
-                            self.uncertainty_estimate[t][0] = 0
+                    if t not in self.uncertainty_estimate:
+                        self.uncertainty_estimate[t] = _margin_uncertainty(self.prob_cache[t])
                 return {t: self.uncertainty_estimate[t] for t in times}
             else:
                 assert False, "Unknown input slot"
 
     def propagateDirty(self, slot, subindex, roi):
-        self.prob_cache = {}
-        if slot is self.InputProbabilities:
-            self.prob_cache = self.InputProbabilities([]).wait()
-        self.Predictions.setDirty(())
-        self.Probabilities.setDirty(())
-        self.UncertaintyEstimate.setDirty(())
-        self.ProbabilityChannels.setDirty(())
+        if slot is self.Features and len(roi) > 0:
+            # Only the predictions of the given time steps are affected
+            times = list(roi)
+            with self.lock:
+                for t in times:
+                    self.prob_cache.pop(t, None)
+                    self.bad_objects.pop(t, None)
+                    self.uncertainty_estimate.pop(t, None)
+        else:
+            # A new classifier (or feature selection) affects all time steps
+            times = ()
+            self.prob_cache = {}
+            self.uncertainty_estimate = {}
+            if slot is self.InputProbabilities:
+                self.prob_cache = self.InputProbabilities([]).wait()
+
+        self.Predictions.setDirty(times)
+        self.Probabilities.setDirty(times)
+        self.UncertaintyEstimate.setDirty(times)
+        self.ProbabilityChannels.setDirty(times)
+
+
+def _margin_uncertainty(prob):
+    """
+    Uncertainty of each object: 1 - (difference between the two highest class probabilities).
+
+    :param prob: probabilities, shape (num_objects, num_classes), row 0 is the background object
+    :returns: array of shape (num_objects,), 0 for the background object
+    """
+    prob = numpy.asarray(prob)
+    if prob.ndim < 2 or prob.shape[1] <= 1:
+        return numpy.zeros((len(prob),))
+
+    top_two = numpy.partition(prob, -2, axis=1)[:, -2:]
+    uncertainty = 1 - (top_two[:, 1] - top_two[:, 0])
+    uncertainty[0] = 0
+    return uncertainty
 
 
 class OpRelabelSegmentation(Operator):
@@ -0,0 +1,307 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Mergeable accumulators for object features, so that the features of very large frames
+can be computed block by block.
+
+Each block contributes per-object statistics (count, central moments, extrema, coordinate
+moments) which are merged into the statistics of the whole frame. Since the label image is
+labeled globally, objects that span several blocks are merged by their label, and no halo
+is needed.
+"""
+import numpy
+
+# Features of the "Standard Object Features" plugin that can be computed blockwise
+SUPPORTED_FEATURES = frozenset(
+    [
+        "Count",
+        "Sum",
+        "Mean",
+        "Variance",
+        "Skewness",
+        "Kurtosis",
+        "Minimum",
+        "Maximum",
+        "Coord<Minimum>",
+        "Coord<Maximum>",
+        "RegionCenter",
+        "RegionRadii",
+    ]
+)
+
+# Highest central moment of the intensities needed by each feature
+_MOMENT_ORDER = {"Sum": 1, "Mean": 1, "Variance": 2, "Skewness": 3, "Kurtosis": 4}
+
+
+def _merge_moments(na, mean_a, ma, nb, mean_b, mb):
+    """
+    Merge the means and central moment sums (ma[p], mb[p] for p = 2, 3, 4) of two sets of samples.
+
+    See Pebay, "Formulas for robust, one-pass parallel computation of covariances and
+    arbitrary-order statistical moments" (2008).
+    """
+    n = na + nb
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        delta = mean_b - mean_a
+        delta_n = numpy.where(n > 0, delta / n, 0.0)
+        mean = mean_a + nb * delta_n
+
+        merged = {}
+        if 2 in ma:
+            merged[2] = ma[2] + mb[2] + delta * delta_n * na * nb
+        if 3 in ma:
+            merged[3] = (
+                ma[3] + mb[3] + delta * delta_n ** 2 * na * nb * (na - nb) + 3 * delta_n * (na * mb[2] - nb * ma[2])
+            )
+        if 4 in ma:
+            merged[4] = (
+                ma[4]
+                + mb[4]
+                + delta * delta_n ** 3 * na * nb * (na * na - na * nb + nb * nb)
+                + 6 * delta_n ** 2 * (na * na * mb[2] + nb * nb * ma[2])
+                + 4 * delta_n * (na * mb[3] - nb * ma[3])
+            )
+    return mean, merged
+
+
+class RegionFeatureAccumulator(object):
+    """
+    Accumulates object features over the blocks of a label image.
+
+    >>> labels = numpy.array([[1, 1, 0, 2], [1, 0, 0, 2]])
+    >>> raw = numpy.arange(8, dtype=float).reshape(2, 4, 1)
+    >>> acc = RegionFeatureAccumulator(["Count", "Mean", "Coord<Minimum>"], num_channels=1, coord_axes=[0, 1])
+    >>> acc.update(labels[:, :2], raw[:, :2], offset=(0, 0))
+    >>> acc.update(labels[:, 2:], raw[:, 2:], offset=(0, 2))
+    >>> feats = acc.features()
+    >>> feats["Count"].ravel().tolist(), feats["Mean"].ravel().tolist()
+    ([3.0, 2.0], [1.6666666666666667, 5.0])
+    >>> feats["Coord<Minimum>"].tolist()
+    [[0.0, 0.0], [0.0, 3.0]]
+    """
+
+    def __init__(self, features, num_channels, coord_axes):
+        """
+        :param features: names of the features to compute (see SUPPORTED_FEATURES)
+        :param num_channels: number of channels of the raw data
+        :param coord_axes: which spatial axes of the label blocks to report coordinates for
+            (e.g. without z for 2D images)
+        """
+        unsupported = set(features) - SUPPORTED_FEATURES
+        if unsupported:
+            raise ValueError("Features cannot be computed blockwise: {}".format(", ".join(sorted(unsupported))))
+
+        self.feature_names = list(features)
+        self.num_channels = num_channels
+        self.coord_axes = list(coord_axes)
+        self._moment_order = max([_MOMENT_ORDER.get(f, 0) for f in features] + [0])
+        self._extrema = bool({"Minimum", "Maximum"} & set(features))
+        self._coord_extrema = bool({"Coord<Minimum>", "Coord<Maximum>"} & set(features))
+        self._coord_scatter = "RegionRadii" in features
+
+        ndim = len(self.coord_axes)
+        self._count = numpy.zeros(0)
+        self._mean = numpy.zeros((0, num_channels))
+        self._moments = {p: numpy.zeros((0, num_channels)) for p in range(2, self._moment_order + 1)}
+        self._min = numpy.zeros((0, num_channels))
+        self._max = numpy.zeros((0, num_channels))
+        self._coord_mean = numpy.zeros((0, ndim))
+        self._coord_scatter_matrix = numpy.zeros((0, ndim, ndim))
+        self._coord_min = numpy.zeros((0, ndim))
+        self._coord_max = numpy.zeros((0, ndim))
+
+    @property
+    def max_label(self):
+        return len(self._count) - 1
+
+    def _resize(self, size):
+        old_size = len(self._count)
+        if size <= old_size:
+            return
+
+        def grow(a, fill=0.0):
+            grown = numpy.full((size,) + a.shape[1:], fill)
+            grown[:old_size] = a
+            return grown
+
+        self._count = grow(self._count)
+        self._mean = grow(self._mean)
+        self._moments = {p: grow(m) for p, m in self._moments.items()}
+        self._min = grow(self._min, numpy.inf)
+        self._max = grow(self._max, -numpy.inf)
+        self._coord_mean = grow(self._coord_mean)
+        self._coord_scatter_matrix = grow(self._coord_scatter_matrix)
+        self._coord_min = grow(self._coord_min, numpy.inf)
+        self._coord_max = grow(self._coord_max, -numpy.inf)
+
+    def update(self, labels, raw, offset):
+        """
+        Add the statistics of one block.
+
+        :param labels: the label image of the block (spatial axes only), background is 0
+        :param raw: the raw data of the block, with the spatial axes of labels followed by a channel axis
+        :param offset: the position of the block in the frame
+        """
+        self.merge(self.block_statistics(labels, raw, offset))
+
+    def block_statistics(self, labels, raw, offset):
+        """
+        Compute the statistics of the objects in one block, without changing the accumulator.
+
+        This is the expensive part of update(), and can run for several blocks in parallel.
+        The result is added to the accumulator with merge().
+
+        :returns: dict of per-object statistics, or None if the block contains no objects
+        """
+        assert raw.shape[:-1] == labels.shape, "raw and labels do not match: {} {}".format(raw.shape, labels.shape)
+        labels = numpy.asarray(labels)
+        foreground = numpy.nonzero(labels)
+        if len(foreground[0]) == 0:
+            return None
+
+        ids, index = numpy.unique(labels[foreground], return_inverse=True)
+        num = len(ids)
+        count = numpy.bincount(index, minlength=num).astype(numpy.float64)
+        stats = {"ids": ids, "count": count}
+
+        values = numpy.asarray(raw)[foreground].astype(numpy.float64)
+        mean = numpy.stack([numpy.bincount(index, values[:, c], num) for c in range(self.num_channels)], axis=1)
+        mean /= count[:, None]
+        stats["mean"] = mean
+        stats["moments"] = {}
+        if self._moment_order >= 2:
+            deviation = values - mean[index]
+            for p in range(2, self._moment_order + 1):
+                powers = deviation ** p
+                stats["moments"][p] = numpy.stack(
+                    [numpy.bincount(index, powers[:, c], num) for c in range(self.num_channels)], axis=1
+                )
+
+        coords = numpy.stack([foreground[a] + offset[a] for a in self.coord_axes], axis=1).astype(numpy.float64)
+        coord_mean = numpy.stack([numpy.bincount(index, coords[:, d], num) for d in range(coords.shape[1])], axis=1)
+        coord_mean /= count[:, None]
+        stats["coord_mean"] = coord_mean
+
+        if self._coord_scatter:
+            coord_deviation = coords - coord_mean[index]
+            ndim = coords.shape[1]
+            scatter = numpy.zeros((num, ndim, ndim))
+            for i in range(ndim):
+                for j in range(i, ndim):
+                    scatter[:, i, j] = scatter[:, j, i] = numpy.bincount(
+                        index, coord_deviation[:, i] * coord_deviation[:, j], num
+                    )
+            stats["coord_scatter"] = scatter
+
+        if self._extrema or self._coord_extrema:
+            order = numpy.argsort(index, kind="stable")
+            starts = numpy.searchsorted(index[order], numpy.arange(num))
+            if self._extrema:
+                sorted_values = values[order]
+                stats["min"] = numpy.minimum.reduceat(sorted_values, starts, axis=0)
+                stats["max"] = numpy.maximum.reduceat(sorted_values, starts, axis=0)
+            if self._coord_extrema:
+                sorted_coords = coords[order]
+                stats["coord_min"] = numpy.minimum.reduceat(sorted_coords, starts, axis=0)
+                stats["coord_max"] = numpy.maximum.reduceat(sorted_coords, starts, axis=0)
+
+        return stats
+
+    def merge(self, stats):
+        """
+        Add the statistics of one block, as computed by block_statistics().
+        """
+        if stats is None:
+            return
+
+        ids = stats["ids"]
+        self._resize(ids[-1] + 1)
+
+        na = self._count[ids][:, None]
+        nb = stats["count"][:, None]
+        self._mean[ids], merged = _merge_moments(
+            na, self._mean[ids], {p: m[ids] for p, m in self._moments.items()}, nb, stats["mean"], stats["moments"]
+        )
+        for p, m in merged.items():
+            self._moments[p][ids] = m
+
+        coord_mean = stats["coord_mean"]
+        if self._coord_scatter:
+            with numpy.errstate(invalid="ignore", divide="ignore"):
+                delta = coord_mean - self._coord_mean[ids]
+                correction = (na * nb / (na + nb))[:, :, None] * delta[:, :, None] * delta[:, None, :]
+            self._coord_scatter_matrix[ids] += stats["coord_scatter"] + correction
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            self._coord_mean[ids] += (coord_mean - self._coord_mean[ids]) * (nb / (na + nb))
+        self._count[ids] += stats["count"]
+
+        if self._extrema:
+            self._min[ids] = numpy.minimum(self._min[ids], stats["min"])
+            self._max[ids] = numpy.maximum(self._max[ids], stats["max"])
+        if self._coord_extrema:
+            self._coord_min[ids] = numpy.minimum(self._coord_min[ids], stats["coord_min"])
+            self._coord_max[ids] = numpy.maximum(self._coord_max[ids], stats["coord_max"])
+
+    def features(self, max_label=None):
+        """
+        Return the accumulated features of the objects 1..max_label (i.e. without background),
+        in the format of ObjectFeaturesPlugin.compute_global: dict[feature_name] = 2D array.
+
+        Coord<Maximum> is exclusive (like the values computed by the vigra plugin).
+        """
+        if max_label is None:
+            max_label = self.max_label
+        self._resize(max_label + 1)
+        rows = slice(1, max_label + 1)
+        n = self._count[rows][:, None]
+
+        result = {}
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            for name in self.feature_names:
+                if name == "Count":
+                    value = n
+                elif name == "Sum":
+                    value = self._mean[rows] * n
+                elif name == "Mean":
+                    value = self._mean[rows]
+                elif name == "Variance":
+                    value = self._moments[2][rows] / n
+                elif name == "Skewness":
+                    value = numpy.sqrt(n) * self._moments[3][rows] / self._moments[2][rows] ** 1.5
+                elif name == "Kurtosis":
+                    value = n * self._moments[4][rows] / self._moments[2][rows] ** 2 - 3.0
+                elif name == "Minimum":
+                    value = self._min[rows]
+                elif name == "Maximum":
+                    value = self._max[rows]
+                elif name == "Coord<Minimum>":
+                    value = self._coord_min[rows]
+                elif name == "Coord<Maximum>":
+                    value = self._coord_max[rows] + 1
+                elif name == "RegionCenter":
+                    value = self._coord_mean[rows]
+                elif name == "RegionRadii":
+                    covariance = self._coord_scatter_matrix[rows] / n[:, :, None]
+                    covariance[n[:, 0] == 0] = 0
+                    value = numpy.sqrt(numpy.maximum(numpy.linalg.eigvalsh(covariance)[:, ::-1], 0))
+                result[name] = value
+        return result
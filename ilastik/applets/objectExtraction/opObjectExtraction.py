@@ -31,11 +31,12 @@ import vigra.analysis
 
 # lazyflow
 from lazyflow.graph import Operator, InputSlot, OutputSlot, OperatorWrapper
-from lazyflow.request import Request, RequestPool
+from lazyflow.request import Request, RequestLock, RequestPool
 from lazyflow.stype import Opaque
 from lazyflow.rtype import List, SubRegion
-from lazyflow.roi import roiToSlice, sliceToRoi
+from lazyflow.roi import roiToSlice, sliceToRoi, getIntersectingBlocks
 from lazyflow.operators import OpLabelVolume, OpCompressedCache, OpBlockedArrayCache
+from lazyflow.request.processPool import process_pool_kernel
 from itertools import groupby, count
 
 import logging
@@ -49,6 +50,7 @@ except:
     logger.warning("could not import pluginManager")
 
 from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.applets.objectExtraction.blockwiseRegionFeatures import RegionFeatureAccumulator, SUPPORTED_FEATURES
 
 # These features are always calculated, but not used for prediction.
 # They are needed by our gui, or by downstream applets.
@@ -116,6 +118,54 @@ def make_bboxes(binary_bbox, margin):
     return passed, context
 
 
+class _ImageAxes(object):
+    """Positions of the x, y, z and c axes in a 4D image, as passed to the object feature plugins."""
+
+    def __init__(self, axistags):
+        self.x = axistags.index("x")
+        self.y = axistags.index("y")
+        self.z = axistags.index("z")
+        self.c = axistags.index("c")
+
+
+def _tagged(array, axiskeys):
+    """Restore the axistags that arrays lose when they are passed to a worker process."""
+    if isinstance(array, vigra.VigraArray):
+        return array
+    return vigra.taggedView(array, axiskeys)
+
+
+def _object_features_plugin(plugin_name, plugin_state):
+    """Look up a plugin and bring it into the given state (the plugin's attributes).
+
+    Plugins may remember things between compute_global and compute_local (e.g. the standard
+    object features plugin remembers whether the data is 2D or 3D). When the kernels below run in
+    worker processes, that state has to be carried across along with the arguments.
+    """
+    plugin = pluginManager.getPluginByName(plugin_name, "ObjectFeatures").plugin_object
+    plugin.__dict__.update(plugin_state)
+    return plugin
+
+
+@process_pool_kernel
+def _compute_global_features(plugin_name, plugin_state, image, labels, axiskeys, feature_dict, axes):
+    """Returns the features computed by the plugin's compute_global, and the plugin's state afterwards."""
+    plugin = _object_features_plugin(plugin_name, plugin_state)
+    features = plugin.compute_global(_tagged(image, axiskeys[0]), _tagged(labels, axiskeys[1]), feature_dict, axes)
+    return features, dict(vars(plugin))
+
+
+@process_pool_kernel
+def _compute_local_features_batch(
+    plugin_name, plugin_state, image, labels, axiskeys, object_ids, extents, feature_dict, axes
+):
+    """Runs the plugin's compute_local_batch."""
+    plugin = _object_features_plugin(plugin_name, plugin_state)
+    return plugin.compute_local_batch(
+        _tagged(image, axiskeys[0]), _tagged(labels, axiskeys[1]), object_ids, extents, feature_dict, axes
+    )
+
+
 class OpCachedRegionFeatures(Operator):
     """Caches the region features computed by OpRegionFeatures."""
 
@@ -124,6 +174,7 @@ class OpCachedRegionFeatures(Operator):
     LabelImage = InputSlot()
     CacheInput = InputSlot(optional=True)
     Features = InputSlot(rtype=List, stype=Opaque)
+    BlockShape3dDict = InputSlot(optional=True)
 
     Output = OutputSlot()
     CleanBlocks = OutputSlot()
@@ -145,6 +196,7 @@ class OpCachedRegionFeatures(Operator):
         self._opRegionFeatures.Atlas.connect(self.Atlas)
         self._opRegionFeatures.LabelVolume.connect(self.LabelImage)
         self._opRegionFeatures.Features.connect(self.Features)
+        self._opRegionFeatures.BlockShape3dDict.connect(self.BlockShape3dDict)
 
         # Hook up the cache.
         self._opCache = OpBlockedArrayCache(parent=self)
@@ -329,6 +381,10 @@ class OpObjectExtraction(Operator):
     # for example {"Standard Object Features": {"Mean in neighborhood":{"margin": (5, 5, 2)}}}
     Features = InputSlot(rtype=List, stype=Opaque, value={})
 
+    # If set, features are computed block by block, with blocks of this (spatial) shape,
+    # e.g. {"x": 512, "y": 512, "z": 128}. See OpRegionFeatures.
+    BlockShape3dDict = InputSlot(optional=True)
+
     LabelImage = OutputSlot()
     ObjectCenterImage = OutputSlot()
 
@@ -377,6 +433,7 @@ class OpObjectExtraction(Operator):
         self._opRegFeats.RawImage.connect(self.RawImage)
         self._opRegFeats.LabelImage.connect(self._opLabelVolume.CachedOutput)
         self._opRegFeats.Features.connect(self.Features)
+        self._opRegFeats.BlockShape3dDict.connect(self.BlockShape3dDict)
         self._opRegFeats.Atlas.connect(self.Atlas)  # move into constructor?
         self.RegionFeaturesCleanBlocks.connect(self._opRegFeats.CleanBlocks)
 
@@ -463,6 +520,14 @@ class OpRegionFeatures(Operator):
     * Features : a nested dictionary of features to compute.
       Features[plugin name][feature name][parameter name] = parameter value
 
+    * BlockShape3dDict (optional) : a dict of spatial block dims, e.g. {"x": 512, "y": 512, "z": 128}.
+      If set, each time slice is processed block by block and the per-block statistics are merged
+      by label, so that memory use is bounded by the block size instead of the frame size.
+      Only the features of the "Standard Object Features" plugin that can be merged this way are
+      supported (see blockwiseRegionFeatures.SUPPORTED_FEATURES), no neighborhood features.
+      If not set, time slices with more than MAX_FRAME_VOXELS voxels are processed in blocks of
+      DEFAULT_BLOCK_SHAPE_3D, if the selected features allow it.
+
     Outputs:
 
     * Output : a nested dictionary of features.
@@ -474,9 +539,17 @@ class OpRegionFeatures(Operator):
     Atlas = InputSlot(optional=True)
     LabelVolume = InputSlot()
     Features = InputSlot(rtype=List, stype=Opaque)
+    BlockShape3dDict = InputSlot(optional=True)
 
     Output = OutputSlot()
 
+    # Number of objects per request in the computation of local (neighborhood) features
+    LOCAL_FEATURES_CHUNK_SIZE = 256
+
+    # Time slices larger than this are processed block by block if BlockShape3dDict is not set
+    MAX_FRAME_VOXELS = 2 ** 28
+    DEFAULT_BLOCK_SHAPE_3D = {"x": 512, "y": 512, "z": 128}
+
     def setupOutputs(self):
         if self.LabelVolume.meta.axistags != self.RawVolume.meta.axistags:
             raise Exception("raw and label axis tags do not match")
@@ -502,7 +575,13 @@ class OpRegionFeatures(Operator):
         t_ind = self.RawVolume.meta.axistags.index("t")
         assert t_ind < len(self.RawVolume.meta.shape)
 
+        block_shape_dict = self._blockShape3dDict()
+
         def compute_features_for_time_slice(res_t_ind, t):
+            if block_shape_dict is not None:
+                result[res_t_ind] = self._extract_blockwise(t, block_shape_dict)
+                return
+
             axes4d = [k for k in self.RawVolume.meta.getTaggedShape().keys() if k in "xyzc"]
 
             # Process entire spatial volume
@@ -573,12 +652,97 @@ class OpRegionFeatures(Operator):
 
         return result
 
+    def compute_extents(self, image, mincoords, maxcoords, axes, margin):
+        """Like compute_extent, for all objects at once."""
+        nobj = mincoords.shape[0]
+        starts = numpy.zeros((nobj, 3), dtype=int)
+        stops = numpy.ones((nobj, 3), dtype=int)
+        for axis in (axes.x, axes.y, axes.z):
+            # no z coordinates for 2D images
+            if axis < mincoords.shape[1]:
+                starts[:, axis] = numpy.maximum(mincoords[:, axis] - margin[axis], 0)
+                stops[:, axis] = numpy.minimum(maxcoords[:, axis] + 1 + margin[axis], image.shape[axis])
+
+        return [list(map(slice, start, stop)) for start, stop in zip(starts.tolist(), stops.tolist())]
+
     def compute_rawbbox(self, image, extent, axes):
         """essentially returns image[extent], preserving all channels."""
         key = copy(extent)
         key.insert(axes.c, slice(None))
         return image[tuple(key)]
 
+    def _compute_local_features(
+        self, image, labels, mincoords, maxcoords, axes, margin, feature_names, has_local_features
+    ):
+        """Compute the features in the neighborhood of each object.
+
+        Objects are processed in chunks of LOCAL_FEATURES_CHUNK_SIZE, in parallel.
+        Each plugin gets all objects of a chunk at once (see ObjectFeaturesPlugin.compute_local_batch).
+
+        Returns local_features[plugin name][feature name] = list with one entry per object
+        """
+        nobj = mincoords.shape[0]
+        extents = self.compute_extents(image, mincoords, maxcoords, axes, margin)
+        plugins = {
+            plugin_name: pluginManager.getPluginByName(plugin_name, "ObjectFeatures").plugin_object
+            for plugin_name in feature_names
+            if has_local_features[plugin_name]
+        }
+
+        chunk_size = self.LOCAL_FEATURES_CHUNK_SIZE
+        chunk_starts = range(0, nobj, chunk_size)
+        chunk_results = [None] * len(chunk_starts)
+
+        axiskeys = ("".join(image.axistags.keys()), "".join(labels.axistags.keys()))
+
+        def compute_chunk(chunk_index, first):
+            last = min(first + chunk_size, nobj)
+            logger.debug("processing objects {} to {}".format(first, last - 1))
+            # starting from 0, we stripped 0th background object in global computation,
+            # so object i has label i+1
+            object_ids = range(first + 1, last + 1)
+
+            # Only pass the region covered by the objects of this chunk, relative extents go with it.
+            chunk_extents = extents[first:last]
+            bounds = [
+                slice(min(e[i].start for e in chunk_extents), max(e[i].stop for e in chunk_extents)) for i in range(3)
+            ]
+            chunk_extents = [
+                [slice(s.start - b.start, s.stop - b.start) for s, b in zip(e, bounds)] for e in chunk_extents
+            ]
+            raw_bounds = list(bounds)
+            raw_bounds.insert(axes.c, slice(None))
+            chunk_image = image[tuple(raw_bounds)]
+            chunk_labels = labels[tuple(bounds)]
+
+            chunk_results[chunk_index] = {
+                plugin_name: _compute_local_features_batch(
+                    plugin_name,
+                    dict(vars(plugin)),
+                    chunk_image,
+                    chunk_labels,
+                    axiskeys,
+                    object_ids,
+                    chunk_extents,
+                    feature_names[plugin_name],
+                    axes,
+                )
+                for plugin_name, plugin in plugins.items()
+            }
+
+        pool = RequestPool()
+        for chunk_index, first in enumerate(chunk_starts):
+            pool.add(Request(partial(compute_chunk, chunk_index, first)))
+        pool.wait()
+        pool.clean()
+
+        local_features = collections.defaultdict(lambda: collections.defaultdict(list))
+        for chunk_features in chunk_results:
+            for plugin_name, feats in chunk_features.items():
+                for key, values in feats.items():
+                    local_features[plugin_name][key].extend(values)
+        return local_features
+
     def _augmentFeatureNames(self, features):
         # Take a dictionary of feature names, augment it by default features and set to Features() slot
 
@@ -631,14 +795,7 @@ class OpRegionFeatures(Operator):
                 "both images must be 4D. raw image shape: {}" " label image shape: {}".format(image.shape, labels.shape)
             )
 
-        # FIXME: maybe simplify? taggedShape should be easier here
-        class Axes(object):
-            x = image.axistags.index("x")
-            y = image.axistags.index("y")
-            z = image.axistags.index("z")
-            c = image.axistags.index("c")
-
-        axes = Axes()
+        axes = _ImageAxes(image.axistags)
 
         slc3d = [slice(None)] * 4  # FIXME: do not hardcode
         slc3d[axes.c] = 0
@@ -654,9 +811,14 @@ class OpRegionFeatures(Operator):
         global_features = {}
         pool = RequestPool()
 
+        axiskeys = ("".join(image.axistags.keys()), "".join(labels.axistags.keys()))
+
         def compute_for_one_plugin(plugin_name, feature_dict):
-            plugin_inner = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
-            global_features[plugin_name] = plugin_inner.plugin_object.compute_global(image, labels, feature_dict, axes)
+            plugin_inner = pluginManager.getPluginByName(plugin_name, "ObjectFeatures").plugin_object
+            global_features[plugin_name], plugin_state = _compute_global_features(
+                plugin_name, dict(vars(plugin_inner)), image, labels, axiskeys, feature_dict, axes
+            )
+            plugin_inner.__dict__.update(plugin_state)
 
         for plugin_name, feature_dict in feature_names.items():
             if plugin_name != default_features_key:
@@ -664,6 +826,98 @@ class OpRegionFeatures(Operator):
 
         pool.wait()
 
+        return self._merge_features(feature_names, global_features, image, labels, axes, atlas)
+
+    def _blockShape3dDict(self):
+        """The spatial block shape to compute the features with, or None for whole time slices."""
+        if self.BlockShape3dDict.ready():
+            return self.BlockShape3dDict.value
+
+        tagged_shape = self.RawVolume.meta.getTaggedShape()
+        if numpy.prod([tagged_shape.get(k, 1) for k in "xyz"]) <= self.MAX_FRAME_VOXELS:
+            return None
+
+        feature_names = self._augmentFeatureNames(deepcopy(self.Features([]).wait()))
+        blockwise_possible = (
+            not self.Atlas.ready()
+            and set(feature_names) <= {"Standard Object Features", default_features_key}
+            and set(feature_names["Standard Object Features"]) <= SUPPORTED_FEATURES
+        )
+        if not blockwise_possible:
+            logger.info("Computing object features for whole time slices, the selected features need them")
+            return None
+        logger.info("Computing object features in blocks of {}".format(self.DEFAULT_BLOCK_SHAPE_3D))
+        return self.DEFAULT_BLOCK_SHAPE_3D
+
+    def _extract_blockwise(self, t, block_shape_dict):
+        """Compute the features of time slice t in blocks of the given spatial shape, see BlockShape3dDict."""
+        if self.Atlas.ready():
+            raise Exception("atlas mapping is not supported for blockwise feature computation")
+
+        feature_names = deepcopy(self.Features([]).wait())
+        feature_names = self._augmentFeatureNames(feature_names)
+        other_plugins = set(feature_names) - {"Standard Object Features", default_features_key}
+        if other_plugins:
+            raise Exception(
+                "features of {} cannot be computed blockwise, only Standard Object Features".format(
+                    ", ".join(sorted(other_plugins))
+                )
+            )
+
+        tagged_shape = self.RawVolume.meta.getTaggedShape()
+        spatial_axes = [k for k in tagged_shape if k in "xyz"]
+        spatial_shape = numpy.array([tagged_shape[k] for k in spatial_axes])
+        block_shape = numpy.array([min(block_shape_dict.get(k, s), s) for k, s in zip(spatial_axes, spatial_shape)])
+
+        # Like the vigra plugin, don't report z coordinates for 2D images
+        coord_axes = [i for i, k in enumerate(spatial_axes) if k != "z" or tagged_shape[k] > 1]
+        acc = RegionFeatureAccumulator(
+            feature_names["Standard Object Features"].keys(), tagged_shape.get("c", 1), coord_axes
+        )
+        acc_lock = RequestLock()
+
+        def block_roi(slot, block_start, block_stop):
+            start, stop = [], []
+            for k, s in slot.meta.getTaggedShape().items():
+                if k == "t":
+                    start.append(t)
+                    stop.append(t + 1)
+                elif k in spatial_axes:
+                    start.append(block_start[spatial_axes.index(k)])
+                    stop.append(block_stop[spatial_axes.index(k)])
+                else:
+                    start.append(0)
+                    stop.append(s)
+            return start, stop
+
+        def process_block(block_start):
+            block_stop = numpy.minimum(block_start + block_shape, spatial_shape)
+            raw_req = self.RawVolume(*block_roi(self.RawVolume, block_start, block_stop))
+            raw_req.submit()
+            labels = self.LabelVolume(*block_roi(self.LabelVolume, block_start, block_stop)).wait()
+            raw = raw_req.wait()
+
+            labels = vigra.taggedView(labels, axistags=self.LabelVolume.meta.axistags).withAxes(*spatial_axes)
+            raw = vigra.taggedView(raw, axistags=self.RawVolume.meta.axistags).withAxes(*(spatial_axes + ["c"]))
+            stats = acc.block_statistics(labels.view(numpy.ndarray), raw.view(numpy.ndarray), block_start)
+            # Only merging into the frame statistics needs to be serialized
+            with acc_lock:
+                acc.merge(stats)
+
+        pool = RequestPool()
+        for block_start in getIntersectingBlocks(block_shape, (numpy.zeros_like(spatial_shape), spatial_shape)):
+            pool.add(Request(partial(process_block, block_start)))
+        pool.wait()
+        pool.clean()
+
+        global_features = {"Standard Object Features": acc.features()}
+        return self._merge_features(feature_names, global_features)
+
+    def _merge_features(self, feature_names, global_features, image=None, labels=None, axes=None, atlas=None):
+        """Add the default and local features to the global features, and bring all of them into the output format.
+
+        image, labels and axes are only needed for local (neighborhood) features.
+        """
         extrafeats = {}
         for feat_key in default_features:
             try:
@@ -689,12 +943,6 @@ class OpRegionFeatures(Operator):
         maxcoords = extrafeats["Coord<Maximum>"].astype(int)
         nobj = mincoords.shape[0]
 
-        # local features: loop over all objects
-        def dictextend(a, b):
-            for key in b:
-                a[key].append(b[key])
-            return a
-
         local_features = collections.defaultdict(lambda: collections.defaultdict(list))
         margin = max_margin(feature_names)
         has_local_features = {}
@@ -706,19 +954,9 @@ class OpRegionFeatures(Operator):
                     break
 
         if numpy.any(margin) > 0:
-            # starting from 0, we stripped 0th background object in global computation
-            for i in range(0, nobj):
-                logger.debug("processing object {}".format(i))
-                extent = self.compute_extent(i, image, mincoords, maxcoords, axes, margin)
-                rawbbox = self.compute_rawbbox(image, extent, axes)
-                # it's i+1 here, because the background has label 0
-                binary_bbox = numpy.where(labels[tuple(extent)] == i + 1, 1, 0).astype(numpy.bool)
-                for plugin_name, feature_dict in feature_names.items():
-                    if not has_local_features[plugin_name]:
-                        continue
-                    plugin = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
-                    feats = plugin.plugin_object.compute_local(rawbbox, binary_bbox, feature_dict, axes)
-                    local_features[plugin_name] = dictextend(local_features[plugin_name], feats)
+            local_features = self._compute_local_features(
+                image, labels, mincoords, maxcoords, axes, margin, feature_names, has_local_features
+            )
 
         logger.debug("computing done, removing failures")
         # remove local features that failed
@@ -763,7 +1001,7 @@ class OpRegionFeatures(Operator):
         return all_features
 
     def propagateDirty(self, slot, subindex, roi):
-        if slot is self.Features:
+        if slot is self.Features or slot is self.BlockShape3dDict:
             self.Output.setDirty(slice(None))
         else:
             axes = list(self.RawVolume.meta.getTaggedShape().keys())
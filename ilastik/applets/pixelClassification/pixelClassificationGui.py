@@ -133,6 +133,7 @@ class ClassifierSelectionDlg(QDialog):
             VigraRfLazyflowClassifierFactory,
             SklearnLazyflowClassifierFactory,
             ParallelVigraRfLazyflowClassifierFactory,
+            IncrementalParallelVigraRfLazyflowClassifierFactory,
             VigraRfPixelwiseClassifierFactory,
             LazyflowVectorwiseClassifierFactoryABC,
             LazyflowPixelwiseClassifierFactoryABC,
@@ -140,6 +141,9 @@ class ClassifierSelectionDlg(QDialog):
 
         classifiers = OrderedDict()
         classifiers["Parallel Random Forest (VIGRA)"] = ParallelVigraRfLazyflowClassifierFactory(100)
+        classifiers[
+            "Incremental Parallel Random Forest (VIGRA)"
+        ] = IncrementalParallelVigraRfLazyflowClassifierFactory(100)
 
         try:
             from sklearn.ensemble import RandomForestClassifier, AdaBoostClassifier
@@ -37,7 +37,12 @@ from lazyflow.operators import (
     OpMultiArrayMerger,
 )
 from ilastik.applets.base.applet import DatasetConstraintError
-from lazyflow.operators.generic import OpConvertDtype, OpPixelOperator
+from lazyflow.operators.opFusedPixelChain import (
+    OpFusedPixelChain,
+    ReorderAxesStage,
+    ConvertDtypeStage,
+    PixelFunctionStage,
+)
 
 
 # local
@@ -104,32 +109,25 @@ class OpThresholdTwoLevels(Operator):
     def __init__(self, *args, **kwargs):
         super(OpThresholdTwoLevels, self).__init__(*args, **kwargs)
 
-        self.opReorderInput = OpReorderAxes(parent=self)
-        self.opReorderInput.AxisOrder.setValue("tzyxc")
-        self.opReorderInput.Input.connect(self.InputImage)
-
-        # PROBABILITIES: Convert to float32
-        self.opConvertProbabilities = OpConvertDtype(parent=self)
-        self.opConvertProbabilities.ConversionDtype.setValue(np.float32)
-        self.opConvertProbabilities.Input.connect(self.opReorderInput.Output)
-
-        # PROBABILITIES: Normalize drange to [0.0, 1.0]
-        self.opNormalizeProbabilities = OpPixelOperator(parent=self)
+        # PROBABILITIES: Reorder to tzyxc, convert to float32 and normalize drange to [0.0, 1.0] (in one step)
+        self.opPreprocessProbabilities = OpFusedPixelChain(parent=self)
 
         def normalize_inplace(a):
-            drange = self.opNormalizeProbabilities.Input.meta.drange
+            drange = self.opPreprocessProbabilities.Input.meta.drange
             if drange is None or (drange[0] == 0.0 and drange[1] == 1.0):
                 return a
             a[:] -= drange[0]
             a[:] = a[:] / float((drange[1] - drange[0]))
             return a
 
-        self.opNormalizeProbabilities.Input.connect(self.opConvertProbabilities.Output)
-        self.opNormalizeProbabilities.Function.setValue(normalize_inplace)
+        self.opPreprocessProbabilities.Stages.setValue(
+            [ReorderAxesStage("tzyxc"), ConvertDtypeStage(np.float32), PixelFunctionStage(normalize_inplace)]
+        )
+        self.opPreprocessProbabilities.Input.connect(self.InputImage)
 
         self.opSmoother = OpAnisotropicGaussianSmoothing5d(parent=self)
         self.opSmoother.Sigmas.connect(self.SmootherSigma)
-        self.opSmoother.Input.connect(self.opNormalizeProbabilities.Output)
+        self.opSmoother.Input.connect(self.opPreprocessProbabilities.Output)
 
         self.opSmootherCache = OpBlockedArrayCache(parent=self)
         self.opSmootherCache.BlockShape.setValue((1, None, None, None, 1))
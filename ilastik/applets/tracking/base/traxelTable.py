@@ -0,0 +1,245 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Probabilities are clipped to this range before they are handed to the tracking solver
+MIN_PROBABILITY = 0.0000001
+MAX_PROBABILITY = 0.99999999
+
+
+class FrameTraxels:
+    """
+    Columnar representation of all traxels (detected objects) of one time frame.
+
+    Instead of one object per traxel, every property is stored as a numpy array with one row per traxel:
+    ids (N,), com, lower and upper (N, 3, z=0 for 2d data), count (N,), and any number of additional
+    feature matrices (N, k) in ``features``.
+    """
+
+    def __init__(self, time, ids, com, lower, upper, count, features=None):
+        self.time = int(time)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.com = np.asarray(com, dtype=np.float64)
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.count = np.asarray(count, dtype=np.float64).reshape(-1)
+        self.features = dict(features or {})
+        self._kdtree = None
+
+    @classmethod
+    def from_region_features(cls, time, region_features):
+        """
+        Build the traxels of one frame from the default region features (RegionCenter, Coord<Minimum>,
+        Coord<Maximum> and Count), skipping the background object (label 0).
+        """
+        com = np.asarray(region_features["RegionCenter"])[1:]
+        lower = np.asarray(region_features["Coord<Minimum>"])[1:]
+        upper = np.asarray(region_features["Coord<Maximum>"])[1:]
+        count = np.asarray(region_features["Count"])[1:]
+
+        if com.ndim == 2 and com.shape[1] not in (2, 3):
+            raise ValueError("The RegionCenter feature must have dimensionality 2 or 3.")
+
+        return cls(
+            time,
+            ids=np.arange(1, len(com) + 1),
+            com=_pad_to_3d(com),
+            lower=_pad_to_3d(lower),
+            upper=_pad_to_3d(upper),
+            count=count,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def kdtree(self):
+        """
+        KD-tree of the traxel centers, built once and shared by the transitions to and from this frame.
+        """
+        if self._kdtree is None:
+            self._kdtree = cKDTree(self.com)
+        return self._kdtree
+
+    def add_probabilities(self, name, probabilities):
+        """
+        Add a per-object probability matrix (indexed by label, including the background object 0),
+        clipped to [MIN_PROBABILITY, MAX_PROBABILITY].
+        """
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.features[name] = np.clip(probabilities[self.ids], MIN_PROBABILITY, MAX_PROBABILITY)
+
+    def add_division_probabilities(self, division_probabilities):
+        """
+        Add the (1 - p, p) division feature from the per-object division probabilities (indexed by label).
+        """
+        probabilities = np.asarray(division_probabilities, dtype=np.float64)[self.ids, 1]
+        probabilities = np.clip(probabilities, MIN_PROBABILITY, MAX_PROBABILITY)
+        self.features["divProb"] = np.stack((1.0 - probabilities, probabilities), axis=1)
+
+    def add_local_centers(self, local_centers):
+        """
+        Add the local centers of every object (indexed by label), as ragged features localCentersX/Y/Z.
+        """
+        centers = [np.asarray(local_centers[idx], dtype=np.float64).reshape((-1, 3)) for idx in self.ids.tolist()]
+        for axis, name in enumerate(("localCentersX", "localCentersY", "localCentersZ")):
+            column = np.empty(len(centers), dtype=object)
+            column[:] = [c[:, axis] for c in centers]
+            self.features[name] = column
+
+    def in_range(self, x_range, y_range, z_range, size_range):
+        """
+        Mask of the traxels whose bounding box intersects the given ranges, and whose size is within size_range.
+        """
+        mask = (self.count >= size_range[0]) & (self.count < size_range[1])
+        for axis, (start, stop) in enumerate((x_range, y_range, z_range)):
+            mask &= (self.upper[:, axis] >= start) & (self.lower[:, axis] < stop)
+        return mask
+
+    def select(self, mask):
+        """
+        The traxels for which mask is True.
+        """
+        return FrameTraxels(
+            self.time,
+            self.ids[mask],
+            self.com[mask],
+            self.lower[mask],
+            self.upper[mask],
+            self.count[mask],
+            {name: values[mask] for name, values in self.features.items()},
+        )
+
+    def to_traxels(self, traxel_class, scales=(1.0, 1.0, 1.0)):
+        """
+        Create one traxel object (e.g. hytra's Traxel) per row, for consumers that need them.
+
+        :returns: dict from object id to traxel
+        """
+        # Convert every column to python floats at once, instead of indexing numpy arrays per traxel
+        columns = {"com": self.com, "CoordMinimum": self.lower, "CoordMaximum": self.upper}
+        columns.update(self.features)
+        columns["count"] = self.count.reshape((-1, 1))
+        columns = {name: _to_lists(values) for name, values in columns.items()}
+
+        traxels = {}
+        for row, idx in enumerate(self.ids.tolist()):
+            traxel = traxel_class()
+            traxel.Id = idx
+            traxel.Timestep = self.time
+            traxel.set_x_scale(scales[0])
+            traxel.set_y_scale(scales[1])
+            traxel.set_z_scale(scales[2])
+            for name, values in columns.items():
+                row_values = values[row]
+                traxel.add_feature_array(name, len(row_values))
+                for i, value in enumerate(row_values):
+                    traxel.set_feature_value(name, i, value)
+            traxels[idx] = traxel
+        return traxels
+
+
+def transition_candidates(source, target, num_neighbors, max_distance, forward_backward=True):
+    """
+    Candidate transitions between the traxels of two frames, from one KD-tree query per frame.
+
+    Every traxel of source is linked to its num_neighbors nearest traxels (by center) in target that are closer than
+    max_distance, or to all traxels of target if there are no more than num_neighbors of them.
+    With forward_backward, the traxels of target are also linked to their nearest neighbours in source.
+    Divisions are chosen among these candidates as well, they need no candidates of their own.
+
+    :returns: (source ids, target ids) of the candidate links, without duplicates
+    """
+    source_rows, target_rows = _nearest_neighbors(source, target, num_neighbors, max_distance)
+    if forward_backward:
+        backward_target_rows, backward_source_rows = _nearest_neighbors(target, source, num_neighbors, max_distance)
+        source_rows = np.concatenate((source_rows, backward_source_rows))
+        target_rows = np.concatenate((target_rows, backward_target_rows))
+
+    links = np.unique(np.stack((source.ids[source_rows], target.ids[target_rows]), axis=1), axis=0)
+    return links[:, 0], links[:, 1]
+
+
+def build_hypotheses_graph(
+    hypotheses_graph, frames, traxels_per_frame, num_neighbors, max_distance, forward_backward=True, skip_links=1
+):
+    """
+    Add one node per traxel and the transition candidates between frames up to skip_links apart
+    (see transition_candidates) to a hypotheses graph, e.g. hytra's HypothesesGraph.
+
+    :param frames: dict from time to the FrameTraxels of that frame
+    :param traxels_per_frame: dict from time to a dict from id to the traxel object of the node
+        (see FrameTraxels.to_traxels)
+    """
+    for t in sorted(frames):
+        traxels = traxels_per_frame[t]
+        for idx in frames[t].ids.tolist():
+            hypotheses_graph.addNodeFromTraxel(traxels[idx])
+
+    for t, frame in sorted(frames.items()):
+        for gap in range(1, skip_links + 1):
+            if t + gap not in frames:
+                continue
+            sources, targets = transition_candidates(
+                frame, frames[t + gap], num_neighbors, max_distance, forward_backward
+            )
+            hypotheses_graph._graph.add_edges_from(
+                ((t, source), (t + gap, target), {"gap": gap})
+                for source, target in zip(sources.tolist(), targets.tolist())
+            )
+
+
+def _nearest_neighbors(query, data, num_neighbors, max_distance):
+    """
+    Rows of the candidate pairs (query row, data row), see transition_candidates.
+    """
+    if len(query) == 0 or len(data) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if len(data) <= num_neighbors:
+        query_rows, data_rows = np.meshgrid(np.arange(len(query)), np.arange(len(data)), indexing="ij")
+        return query_rows.ravel(), data_rows.ravel()
+
+    distances, data_rows = data.kdtree().query(query.com, k=num_neighbors, distance_upper_bound=max_distance)
+    distances = distances.reshape((len(query), -1))
+    data_rows = data_rows.reshape((len(query), -1))
+    found = distances < max_distance
+    return np.nonzero(found)[0], data_rows[found]
+
+
+def _to_lists(values):
+    """
+    One list of python floats per row, for feature matrices (N, k) as well as ragged (object) columns.
+    """
+    if values.dtype == object:
+        return [np.asarray(row, dtype=np.float64).tolist() for row in values]
+    return np.asarray(values, dtype=np.float64).tolist()
+
+
+def _pad_to_3d(coordinates):
+    """
+    Append a zero z-coordinate to 2d coordinates of shape (N, 2).
+    """
+    if len(coordinates) == 0:
+        return np.zeros((0, 3))
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape((len(coordinates), -1))
+    if coordinates.shape[1] == 3:
+        return coordinates
+    return np.concatenate((coordinates, np.zeros((len(coordinates), 3 - coordinates.shape[1]))), axis=1)
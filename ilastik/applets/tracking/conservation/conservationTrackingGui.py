@@ -307,6 +307,9 @@ class ConservationTrackingGui(TrackingBaseGui, ExportingGui):
             motionModelWeight = self._drawer.motionModelWeightBox.value()
             solver = self._drawer.solverComboBox.currentText()
 
+            # There are no widgets for windowed tracking, keep the settings stored in the project
+            parameters = self.topLevelOperatorView.Parameters.value
+
             ndim = 3
             if to_z - from_z == 0:
                 ndim = 2
@@ -344,6 +347,8 @@ class ConservationTrackingGui(TrackingBaseGui, ExportingGui):
                     force_build_hypotheses_graph=False,
                     max_nearest_neighbors=self._drawer.maxNearestNeighborsSpinBox.value(),
                     numFramesPerSplit=self._drawer.numFramesPerSplitSpinBox.value(),
+                    windowSize=parameters.get("windowSize", 0),
+                    windowOverlap=parameters.get("windowOverlap", 10),
                     solverName=solver,
                     progressWindow=self.progressWindow,
                     progressVisitor=self.progressVisitor,
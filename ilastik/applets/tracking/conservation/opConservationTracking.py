@@ -3,6 +3,7 @@ from __future__ import absolute_import
 from __future__ import division
 from builtins import range
 from past.utils import old_div
+import collections
 import numpy as np
 import os
 from lazyflow.graph import Operator, InputSlot, OutputSlot
@@ -21,18 +22,21 @@ from lazyflow.operators import OpBlockedArrayCache
 from lazyflow.operators.valueProviders import OpZeroDefault
 from lazyflow.roi import sliceToRoi
 from .opRelabeledMergerFeatureExtraction import OpRelabeledMergerFeatureExtraction
+from ilastik.applets.tracking.base.traxelTable import FrameTraxels, build_hypotheses_graph
+from .windowedTracking import WindowSolution, time_windows
 
 from functools import partial
-from lazyflow.request import Request, RequestPool
+from lazyflow.request import Request, RequestPool, RequestLock
+from lazyflow.request.processPool import process_pool_kernel
 
 from hytra.core.jsongraph import (
-    getMappingsBetweenUUIDsAndTraxels,
     getMergersDetectionsLinksDivisions,
     getMergersPerTimestep,
     getLinksPerTimestep,
     getDetectionsPerTimestep,
     getDivisionsPerTimestep,
 )
+from hytra.core.hypothesesgraph import HypothesesGraph
 from hytra.core.ilastikhypothesesgraph import IlastikHypothesesGraph
 from hytra.core.fieldofview import FieldOfView
 from hytra.core.ilastikmergerresolver import IlastikMergerResolver
@@ -59,6 +63,66 @@ except ImportError:
         logger.warning("Could not find any ILP solver")
 
 
+def _lookup(lut, volume):
+    """
+    Gather lut[volume], labels beyond the end of the lut are mapped to its last entry.
+    """
+    return lut[np.minimum(volume, len(lut) - 1)]
+
+
+@process_pool_kernel
+def _solveTrackingModel(model, weights, solverName, numFramesPerSplit=0):
+    """
+    Run the tracking solver on the model, in the lazyflow process pool if one is configured.
+    """
+    if solverName == "Flow-based" and dpct:
+        if numFramesPerSplit:
+            # Run solver with frame splits (split, solve, and stitch video to improve running-time)
+            from hytra.core.splittracking import SplitTracking
+
+            return SplitTracking.trackFlowBasedWithSplits(model, weights, numFramesPerSplit=numFramesPerSplit)
+        else:
+            # casting weights to float (raised TypeError on Windows before)
+            weights["weights"] = [float(w) for w in weights["weights"]]
+            return dpct.trackFlowBased(model, weights)
+
+    elif solverName == "ILP" and mht:
+        return mht.track(model, weights)
+    else:
+        raise ValueError("Invalid tracking solver selected")
+
+
+class FrameTraxelsHypothesesGraph(IlastikHypothesesGraph):
+    """
+    IlastikHypothesesGraph whose nodes and transition candidates are built from the columnar FrameTraxels of every
+    frame (see traxelTable.build_hypotheses_graph), instead of one nearest neighbour query per traxel.
+    """
+
+    def __init__(self, frames, **kwargs):
+        # IlastikHypothesesGraph builds the graph in its constructor
+        self._frames = frames
+        super().__init__(**kwargs)
+
+    def buildFromProbabilityGenerator(
+        self,
+        probabilityGenerator,
+        maxNeighborDist=200,
+        numNearestNeighbors=1,
+        forwardBackwardCheck=True,
+        skipLinks=1,
+        **kwargs,
+    ):
+        build_hypotheses_graph(
+            self,
+            self._frames,
+            probabilityGenerator.TraxelsPerFrame,
+            numNearestNeighbors,
+            maxNeighborDist,
+            forward_backward=forwardBackwardCheck,
+            skip_links=skipLinks,
+        )
+
+
 class OpConservationTracking(Operator):
     LabelImage = InputSlot()
     ObjectFeatures = InputSlot(stype=Opaque, rtype=List)
@@ -132,6 +196,14 @@ class OpConservationTracking(Operator):
 
         self.result = None
 
+        # Per-frame lookup tables from labels to lineage IDs (see _getFrameLookupTables)
+        self._frameLookupTablesLock = RequestLock()
+        self._frameLookupTables = {}
+        self._nodesPerFrame = None
+        # Not in propagateDirty, which is only called once the operator is configured
+        self.HypothesesGraph.notifyDirty(self._resetFrameLookupTables)
+        self.ResolvedMergers.notifyDirty(self._resetFrameLookupTables)
+
         # progress bar
         self.progressWindow = None
         self.progressVisitor = DefaultProgressVisitor()
@@ -254,12 +326,17 @@ class OpConservationTracking(Operator):
             slot == self.InputHdf5 or slot == self.MergerInputHdf5 or slot == self.RelabeledInputHdf5
         ), "Invalid slot for setInSlot(): {}".format(slot.name)
 
-    def _createHypothesesGraph(self):
+    def _createHypothesesGraph(self, time_range=None, filtered_labels=None):
         """
         Construct a hypotheses graph given the current settings in the parameters slot
+
+        :param time_range: first and last frame, defaults to the time_range parameter
+        :param filtered_labels: see _generate_traxelstore
         """
         parameters = self.Parameters.value
-        time_range = list(range(parameters["time_range"][0], parameters["time_range"][1] + 1))
+        if time_range is None:
+            time_range = parameters["time_range"]
+        time_range = list(range(time_range[0], time_range[-1] + 1))
         x_range = parameters["x_range"]
         y_range = parameters["y_range"]
         z_range = parameters["z_range"]
@@ -273,7 +350,7 @@ class OpConservationTracking(Operator):
         max_nearest_neighbors = parameters["max_nearest_neighbors"]
         borderAwareWidth = parameters["borderAwareWidth"]
 
-        traxelstore = self._generate_traxelstore(
+        traxelstore, frames = self._generate_traxelstore(
             time_range,
             x_range,
             y_range,
@@ -284,6 +361,7 @@ class OpConservationTracking(Operator):
             scales[2],
             with_div=withDivisions,
             with_classifier_prior=withClassifierPrior,
+            filtered_labels=filtered_labels,
         )
 
         def constructFov(shape, t0, t1, scale=[1, 1, 1]):
@@ -295,7 +373,8 @@ class OpConservationTracking(Operator):
 
         fieldOfView = constructFov((x_range[1], y_range[1], z_range[1]), time_range[0], time_range[-1] + 1, scales)
 
-        hypothesesGraph = IlastikHypothesesGraph(
+        hypothesesGraph = FrameTraxelsHypothesesGraph(
+            frames,
             probabilityGenerator=traxelstore,
             timeRange=(time_range[0], time_range[-1] + 1),
             maxNumObjects=maxObj,
@@ -309,15 +388,13 @@ class OpConservationTracking(Operator):
         )
         return hypothesesGraph
 
-    def _resolveMergers(self, hypothesesGraph, model):
+    def _resolveMergers(self, originalGraph):
         """
-        run merger resolution on the hypotheses graph which contains the current solution
+        run merger resolution on the (traxel level) hypotheses graph which contains the current solution
         """
         logger.info("Resolving mergers.")
 
         parameters = self.Parameters.value
-        withTracklets = parameters["withTracklets"]
-        originalGraph = hypothesesGraph.referenceTraxelGraph if withTracklets else hypothesesGraph
         resolvedMergersDict = {}
 
         # Enable full graph computation for animal tracking workflow
@@ -336,9 +413,7 @@ class OpConservationTracking(Operator):
         else:
             # Fit and refine merger nodes using a GMM
             # It has to be done per time-step in order to aviod loading the whole video on RAM
-            traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap = getMappingsBetweenUUIDsAndTraxels(model)
-            timesteps = [int(t) for t in list(traxelIdPerTimestepToUniqueIdMap.keys())]
-            timesteps.sort()
+            timesteps = sorted({int(t) for t, idx in originalGraph._graph.nodes()})
 
             timeIndex = self.LabelImage.meta.axistags.index("t")
             numTimeStep = len(timesteps)
@@ -429,6 +504,9 @@ class OpConservationTracking(Operator):
         force_build_hypotheses_graph=False,
         max_nearest_neighbors=1,
         numFramesPerSplit=0,
+        windowSize=0,
+        windowOverlap=10,
+        numParallelWindows=1,
         withBatchProcessing=False,
         solverName="Flow-based",
         progressWindow=None,
@@ -436,6 +514,10 @@ class OpConservationTracking(Operator):
     ):
         """
         Main conservation tracking function. Runs tracking solver, generates hypotheses graph, and resolves mergers.
+
+        If windowSize is set and the time range is longer, overlapping windows of windowSize frames (overlapping by
+        windowOverlap frames) are tracked separately, numParallelWindows at a time, and their solutions are stitched.
+        Memory then depends on the window size instead of the length of the time range.
         """
 
         self.progressWindow = progressWindow
@@ -476,6 +558,8 @@ class OpConservationTracking(Operator):
         parameters["z_range"] = z_range
         parameters["max_nearest_neighbors"] = max_nearest_neighbors
         parameters["numFramesPerSplit"] = numFramesPerSplit
+        parameters["windowSize"] = windowSize
+        parameters["windowOverlap"] = windowOverlap
         parameters["solver"] = str(solverName)
 
         # Set a size range with a minimum area equal to the max number of objects (since the GMM throws an error if we try to fit more gaussians than the number of pixels in the object)
@@ -514,54 +598,36 @@ class OpConservationTracking(Operator):
                     + "one training example for each class.",
                 )
 
-        hypothesesGraph = self._createHypothesesGraph()
-        hypothesesGraph.allowLengthOneTracks = True
-
-        if withTracklets:
-            hypothesesGraph = hypothesesGraph.generateTrackletGraph()
-
-        hypothesesGraph.insertEnergies()
-        trackingGraph = hypothesesGraph.toTrackingGraph()
-        trackingGraph.convexifyCosts()
-        model = trackingGraph.model
-        model["settings"]["allowLengthOneTracks"] = True
-
         detWeight = 10.0  # FIXME: Should we store this weight in the parameters slot?
-        weights = trackingGraph.weightsListToDict(
-            [transWeight, detWeight, divWeight, appearance_cost, disappearance_cost]
-        )
-
-        stepStr = solverName + " tracking solver"
-        self.progressVisitor.showState(stepStr)
-        self.progressVisitor.showProgress(0)
-
-        if solverName == "Flow-based" and dpct:
-            if numFramesPerSplit:
-                # Run solver with frame splits (split, solve, and stitch video to improve running-time)
-                from hytra.core.splittracking import SplitTracking
-
-                result = SplitTracking.trackFlowBasedWithSplits(model, weights, numFramesPerSplit=numFramesPerSplit)
-            else:
-                # casting weights to float (raised TypeError on Windows before)
-                weights["weights"] = [float(w) for w in weights["weights"]]
-                result = dpct.trackFlowBased(model, weights)
-
-        elif solverName == "ILP" and mht:
-            result = mht.track(model, weights)
+        weightsList = [transWeight, detWeight, divWeight, appearance_cost, disappearance_cost]
+
+        first, last = parameters["time_range"]
+        if windowSize and last - first + 1 > windowSize:
+            # The stitched graph is on traxel level, also when using tracklets.
+            # Mergers are resolved in each window.
+            hypothesesGraph, resolvedMergersDict = self._trackWindowed(
+                windowSize,
+                windowOverlap,
+                numParallelWindows,
+                weightsList,
+                solverName,
+                numFramesPerSplit,
+                withMergerResolution,
+            )
+            traxelGraph = hypothesesGraph
+            result = hypothesesGraph.getSolutionDictionary()
         else:
-            raise ValueError("Invalid tracking solver selected")
-
-        self.progressVisitor.showProgress(1.0)
-        # Insert the solution into the hypotheses graph and from that deduce the lineages
-        if hypothesesGraph:
-            hypothesesGraph.insertSolution(result)
-
-        # Merger resolution
-        resolvedMergersDict = {}
-        if withMergerResolution:
-            stepStr = "Merger resolution"
-            self.progressVisitor.showState(stepStr)
-            resolvedMergersDict = self._resolveMergers(hypothesesGraph, model)
+            hypothesesGraph, result = self._trackTimeRange(
+                parameters["time_range"], weightsList, solverName, numFramesPerSplit
+            )
+            traxelGraph = hypothesesGraph.referenceTraxelGraph if withTracklets else hypothesesGraph
+
+            # Merger resolution
+            resolvedMergersDict = {}
+            if withMergerResolution:
+                stepStr = "Merger resolution"
+                self.progressVisitor.showState(stepStr)
+                resolvedMergersDict = self._resolveMergers(traxelGraph)
 
         # Set value of resolved mergers slot (Should be empty if mergers are disabled)
         self.ResolvedMergers.setValue(resolvedMergersDict, check_changed=False)
@@ -578,8 +644,7 @@ class OpConservationTracking(Operator):
         # hgv = HypothesesGraphDiagram(hypothesesGraph._graph, timeRange=(0, 10), fileName='HypothesesGraph.png' )
 
         # Set value of hypotheses grap slot (use referenceTraxelGraph if using tracklets)
-        hypothesesGraph = hypothesesGraph.referenceTraxelGraph if withTracklets else hypothesesGraph
-        self.HypothesesGraph.setValue(hypothesesGraph, check_changed=False)
+        self.HypothesesGraph.setValue(traxelGraph, check_changed=False)
 
         # Set all the output slots dirty (See execute() function)
         self.Output.setDirty()
@@ -588,6 +653,91 @@ class OpConservationTracking(Operator):
 
         return result
 
+    def _trackTimeRange(self, time_range, weightsList, solverName, numFramesPerSplit, filtered_labels=None):
+        """
+        Build the hypotheses graph for the given time range (first and last frame), run the tracking solver,
+        and insert the solution into the graph.
+
+        :return: the hypotheses graph (a tracklet graph if withTracklets is set), and the solver result
+        """
+        hypothesesGraph = self._createHypothesesGraph(time_range, filtered_labels)
+        hypothesesGraph.allowLengthOneTracks = True
+
+        if self.Parameters.value["withTracklets"]:
+            hypothesesGraph = hypothesesGraph.generateTrackletGraph()
+
+        hypothesesGraph.insertEnergies()
+        trackingGraph = hypothesesGraph.toTrackingGraph()
+        trackingGraph.convexifyCosts()
+        model = trackingGraph.model
+        model["settings"]["allowLengthOneTracks"] = True
+        weights = trackingGraph.weightsListToDict(weightsList)
+
+        stepStr = solverName + " tracking solver"
+        self.progressVisitor.showState(stepStr)
+        self.progressVisitor.showProgress(0)
+
+        result = _solveTrackingModel(model, weights, solverName, numFramesPerSplit)
+
+        self.progressVisitor.showProgress(1.0)
+        # Insert the solution into the hypotheses graph and from that deduce the lineages
+        if hypothesesGraph:
+            hypothesesGraph.insertSolution(result)
+        return hypothesesGraph, result
+
+    def _trackWindowed(
+        self,
+        windowSize,
+        windowOverlap,
+        numParallelWindows,
+        weightsList,
+        solverName,
+        numFramesPerSplit,
+        withMergerResolution=False,
+    ):
+        """
+        Track overlapping time windows separately, resolve their mergers, and stitch their solutions
+        (see windowedTracking). Only the hypotheses graphs of numParallelWindows windows are held in memory at a time.
+
+        :return: a hypotheses graph on traxel level, with all traxels and the selected links of the stitched solution,
+            and the resolved mergers (see _resolveMergers)
+        """
+        parameters = self.Parameters.value
+        withTracklets = parameters["withTracklets"]
+        first, last = parameters["time_range"]
+        windows = time_windows(first, last, windowSize, windowOverlap)
+        logger.info("Tracking {} overlapping time windows of {} frames".format(len(windows), windowSize))
+
+        def trackWindow(window):
+            logger.info("Tracking frames {} to {}".format(*window))
+            windowFilteredLabels = {}
+            hypothesesGraph, _ = self._trackTimeRange(
+                window, weightsList, solverName, numFramesPerSplit, windowFilteredLabels
+            )
+            traxelGraph = hypothesesGraph.referenceTraxelGraph if withTracklets else hypothesesGraph
+            resolvedMergers = self._resolveMergers(traxelGraph) if withMergerResolution else {}
+            # Filtered labels are keyed by the frame relative to the start of the tracked time range
+            windowFilteredLabels = {
+                str(int(t) + window[0] - first): labels for t, labels in windowFilteredLabels.items()
+            }
+            return WindowSolution.from_hypotheses_graph(traxelGraph, window, resolvedMergers), windowFilteredLabels
+
+        numParallelWindows = max(1, numParallelWindows)
+        solution = None
+        filteredLabels = {}
+        for batchStart in range(0, len(windows), numParallelWindows):
+            batch = windows[batchStart : batchStart + numParallelWindows]
+            requests = [Request(partial(trackWindow, window)) for window in batch]
+            for request in requests:
+                request.submit()
+            for request in requests:
+                windowSolution, windowFilteredLabels = request.wait()
+                solution = windowSolution if solution is None else solution.stitch(windowSolution)
+                filteredLabels.update(windowFilteredLabels)
+
+        self.FilteredLabels.setValue(filteredLabels, check_changed=True)
+        return solution.to_hypotheses_graph(HypothesesGraph), solution.mergers
+
     def propagateDirty(self, inputSlot, subindex, roi):
         if inputSlot is self.LabelImage:
             self.Output.setDirty(roi)
@@ -607,13 +757,14 @@ class OpConservationTracking(Operator):
         if time not in resolvedMergersDict:
             return volume
 
-        idxs = vigra.analysis.unique(volume)
+        # Only look at the labels that are mergers (usually very few)
+        isMerger = self._getFrameLookupTables(time)["isMerger"]
+        idxs = np.unique(volume[_lookup(isMerger, volume)])
 
         for idx in idxs:
-            if idx in resolvedMergersDict[time]:
-                fits = resolvedMergersDict[time][idx]["fits"]
-                newIds = resolvedMergersDict[time][idx]["newIds"]
-                self.mergerResolverPlugin.updateLabelImage(volume, idx, fits, newIds, offset=offset)
+            fits = resolvedMergersDict[time][idx]["fits"]
+            newIds = resolvedMergersDict[time][idx]["newIds"]
+            self.mergerResolverPlugin.updateLabelImage(volume, idx, fits, newIds, offset=offset)
 
         return volume
 
@@ -624,45 +775,63 @@ class OpConservationTracking(Operator):
 
         :return: the relabeled volume, where 0 means background, 1 means false detection, and all higher numbers indicate lineages
         """
-        hypothesesGraph = self.HypothesesGraph.value
-
-        if not hypothesesGraph:
+        if not self.HypothesesGraph.value:
             return np.zeros_like(volume)
 
-        resolvedMergersDict = self.ResolvedMergers.value
+        luts = self._getFrameLookupTables(time)
+        indexMapping = luts["mergerLineage"] if onlyMergers else luts["lineage"]
+        return _lookup(indexMapping, volume).astype(volume.dtype, copy=False)
 
-        indexMapping = np.zeros(np.amax(volume) + 1, dtype=volume.dtype)
+    def _getFrameLookupTables(self, time):
+        """
+        Dense lookup tables (indexed by label) for a single time frame, computed once per tracking result:
+        - lineage: lineage ID of each label (1 for false detections, 0 for labels that are not in the graph)
+        - mergerLineage: like lineage, but only for segments that were resolved from a merger
+        - isMerger: whether the label is a merger that was resolved
+        """
+        with self._frameLookupTablesLock:
+            if time not in self._frameLookupTables:
+                self._frameLookupTables[time] = self._computeFrameLookupTables(time)
+            return self._frameLookupTables[time]
 
-        idxs = vigra.analysis.unique(volume)
+    def _computeFrameLookupTables(self, time):
+        hypothesesGraph = self.HypothesesGraph.value
+        resolvedMergersDict = self.ResolvedMergers.value or {}
 
-        # Reduce labels to the ones that contain mergers
-        if onlyMergers:
-            if resolvedMergersDict:
-                if time not in resolvedMergersDict:
-                    idxs = []
-                else:
-                    newIds = [
-                        newId for _, nodeDict in list(resolvedMergersDict[time].items()) for newId in nodeDict["newIds"]
-                    ]
-                    idxs = [id for id in idxs if id in newIds]
-            else:
-                idxs = [
-                    idx
-                    for idx in idxs
-                    if idx > 0
-                    and hypothesesGraph.hasNode((time, idx))
-                    and hypothesesGraph._graph.node[(time, idx)]["value"] > 1
-                ]
-
-        # Map labels to corresponding lineage IDs
+        if self._nodesPerFrame is None:
+            self._nodesPerFrame = collections.defaultdict(list)
+            for t, idx in hypothesesGraph._graph.nodes():
+                self._nodesPerFrame[t].append(idx)
+
+        idxs = [idx for idx in self._nodesPerFrame.get(time, []) if idx > 0]
+        mergers = resolvedMergersDict.get(time, {})
+        # One extra (zero) entry at the end, for all labels that are not in the graph
+        size = max(idxs + list(mergers.keys()) + [0]) + 2
+
+        lineage = np.zeros(size, dtype=np.int64)
         for idx in idxs:
-            if idx > 0 and hypothesesGraph.hasNode((time, idx)):
-                lineage_id = hypothesesGraph.getLineageId(time, idx)
-                if lineage_id is None:
-                    lineage_id = 1
-                indexMapping[idx] = lineage_id
+            lineage_id = hypothesesGraph.getLineageId(time, idx)
+            lineage[idx] = 1 if lineage_id is None else lineage_id
+
+        # Reduce labels to the ones that contain mergers
+        if resolvedMergersDict:
+            mergerIdxs = [newId for nodeDict in mergers.values() for newId in nodeDict["newIds"]]
+        else:
+            mergerIdxs = [idx for idx in idxs if hypothesesGraph._graph.node[(time, idx)]["value"] > 1]
+        mergerIdxs = [idx for idx in mergerIdxs if 0 < idx < size - 1 and hypothesesGraph.hasNode((time, idx))]
+
+        mergerLineage = np.zeros(size, dtype=np.int64)
+        mergerLineage[mergerIdxs] = lineage[mergerIdxs]
 
-        return indexMapping[volume]
+        isMerger = np.zeros(size, dtype=bool)
+        isMerger[list(mergers.keys())] = True
+
+        return {"lineage": lineage, "mergerLineage": mergerLineage, "isMerger": isMerger}
+
+    def _resetFrameLookupTables(self, *args):
+        with self._frameLookupTablesLock:
+            self._frameLookupTables = {}
+            self._nodesPerFrame = None
 
     def _setupRelabeledFeatureSlot(self, original_feature_slot):
         from ilastik.applets.trackingFeatureExtraction import config
@@ -773,7 +942,13 @@ class OpConservationTracking(Operator):
         with_div=False,
         with_local_centers=False,
         with_classifier_prior=False,
+        filtered_labels=None,
     ):
+        """
+        :param filtered_labels: if given, the labels of the objects outside of the ranges are added to this dict
+            (keyed by the frame relative to time_range[0]), instead of being stored in the FilteredLabels slot
+        :returns: the traxelstore, and the FrameTraxels of every non-empty frame (the same traxels, in columns)
+        """
 
         logger.info("generating traxels")
 
@@ -781,6 +956,7 @@ class OpConservationTracking(Operator):
         self.progressVisitor.showProgress(0)
 
         traxelstore = ProbabilityGenerator()
+        frames = {}
 
         logger.info("fetching region features and division probabilities")
         feats = self.ObjectFeatures(time_range).wait()
@@ -813,7 +989,9 @@ class OpConservationTracking(Operator):
 
         logger.info("filling traxelstore")
 
-        filtered_labels = {}
+        storeFilteredLabels = filtered_labels is None
+        if storeFilteredLabels:
+            filtered_labels = {}
         total_count = 0
         empty_frame = False
         numTimeStep = len(list(feats.keys()))
@@ -826,131 +1004,33 @@ class OpConservationTracking(Operator):
             countT += 1
             self.progressVisitor.showProgress(old_div(countT, float(numTimeStep)))
 
-            rc = feats[t][default_features_key]["RegionCenter"]
-            lower = feats[t][default_features_key]["Coord<Minimum>"]
-            upper = feats[t][default_features_key]["Coord<Maximum>"]
-            if rc.size:
-                rc = rc[1:, ...]
-                lower = lower[1:, ...]
-                upper = upper[1:, ...]
-
-            ct = feats[t][default_features_key]["Count"]
-            if ct.size:
-                ct = ct[1:, ...]
-
-            logger.debug("at timestep {}, {} traxels found".format(t, rc.shape[0]))
-            count = 0
-            filtered_labels_at = []
-            for idx in range(rc.shape[0]):
-                traxel = Traxel()
-
-                # for 2d data, set z-coordinate to 0:
-                if len(rc[idx]) == 2:
-                    x, y = rc[idx]
-                    z = 0
-                    x_lower, y_lower = lower[idx]
-                    x_upper, y_upper = upper[idx]
-                    z_lower = 0
-                    z_upper = 0
-                elif len(rc[idx]) == 3:
-                    x, y, z = rc[idx]
-                    x_lower, y_lower, z_lower = lower[idx]
-                    x_upper, y_upper, z_upper = upper[idx]
-                else:
-                    raise DatasetConstraintError(
-                        "Tracking", "The RegionCenter feature must have dimensionality 2 or 3."
-                    )
-
-                size = ct[idx]
-
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    filtered_labels_at.append(int(idx + 1))
-                    continue
-                else:
-                    count += 1
-
-                traxel.Id = int(idx + 1)
-                traxel.Timestep = int(t)
-                traxel.set_x_scale(x_scale)
-                traxel.set_y_scale(y_scale)
-                traxel.set_z_scale(z_scale)
-
-                # Expects always 3 coordinates, z=0 for 2d data
-                traxel.add_feature_array("com", 3)
-                for i, v in enumerate([x, y, z]):
-                    traxel.set_feature_value("com", i, float(v))
-
-                traxel.add_feature_array("CoordMinimum", 3)
-                for i, v in enumerate(lower[idx]):
-                    traxel.set_feature_value("CoordMinimum", i, float(v))
-                traxel.add_feature_array("CoordMaximum", 3)
-                for i, v in enumerate(upper[idx]):
-                    traxel.set_feature_value("CoordMaximum", i, float(v))
-
-                if with_div:
-                    traxel.add_feature_array("divProb", 2)
-                    # idx+1 because rc and ct start from 1, divProbs starts from 0
-                    prob = float(divProbs[t][idx + 1][1])
-                    prob = float(prob)
-                    if prob < 0.0000001:
-                        prob = 0.0000001
-                    if prob > 0.99999999:
-                        prob = 0.99999999
-                    traxel.set_feature_value("divProb", 0, 1.0 - prob)
-                    traxel.set_feature_value("divProb", 1, prob)
-
-                if with_classifier_prior:
-                    traxel.add_feature_array("detProb", len(detProbs[t][idx + 1]))
-                    for i, v in enumerate(detProbs[t][idx + 1]):
-                        val = float(v)
-                        if val < 0.0000001:
-                            val = 0.0000001
-                        if val > 0.99999999:
-                            val = 0.99999999
-                        traxel.set_feature_value("detProb", i, float(val))
-
-                # FIXME: check whether it is 2d or 3d data!
-                if with_local_centers:
-                    traxel.add_feature_array("localCentersX", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersY", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersZ", len(localCenters[t][idx + 1]))
-
-                    for i, v in enumerate(localCenters[t][idx + 1]):
-                        traxel.set_feature_value("localCentersX", i, float(v[0]))
-                        traxel.set_feature_value("localCentersY", i, float(v[1]))
-                        traxel.set_feature_value("localCentersZ", i, float(v[2]))
-
-                traxel.add_feature_array("count", 1)
-                traxel.set_feature_value("count", 0, float(size))
-
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    logger.info("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                    print("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                else:
-                    logger.debug("Adding traxel with ID: {}  {}".format(traxel.Id, t))
-                    traxelstore.TraxelsPerFrame.setdefault(int(t), {})[int(idx + 1)] = traxel
+            try:
+                frame = FrameTraxels.from_region_features(t, feats[t][default_features_key])
+            except ValueError as e:
+                raise DatasetConstraintError("Tracking", str(e))
+            logger.debug("at timestep {}, {} traxels found".format(t, len(frame)))
+
+            # The probabilities are indexed by label (including the background object 0)
+            if with_div:
+                frame.add_division_probabilities(divProbs[t])
+            if with_classifier_prior:
+                frame.add_probabilities("detProb", detProbs[t])
+            # FIXME: check whether it is 2d or 3d data!
+            if with_local_centers:
+                frame.add_local_centers(localCenters[t])
+
+            in_range = frame.in_range(x_range, y_range, z_range, size_range)
+            filtered_labels_at = frame.ids[~in_range].tolist()
+            frame = frame.select(in_range)
+            count = len(frame)
 
             if len(filtered_labels_at) > 0:
                 filtered_labels[str(int(t) - time_range[0])] = filtered_labels_at
 
+            if count > 0:
+                frames[int(t)] = frame
+                traxelstore.TraxelsPerFrame[int(t)] = frame.to_traxels(Traxel, (x_scale, y_scale, z_scale))
+
             logger.debug("at timestep {}, {} traxels passed filter".format(t, count))
 
             if count == 0:
@@ -960,9 +1040,10 @@ class OpConservationTracking(Operator):
             total_count += count
 
         self.parent.parent.trackingApplet.progressSignal(100)
-        self.FilteredLabels.setValue(filtered_labels, check_changed=True)
+        if storeFilteredLabels:
+            self.FilteredLabels.setValue(filtered_labels, check_changed=True)
 
-        return traxelstore
+        return traxelstore, frames
 
     def isTrackingSolutionAvailable(self):
         """
@@ -0,0 +1,206 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Sliding-window tracking: long movies are tracked in overlapping time windows, each with its own
+hypotheses graph, and the solutions of consecutive windows are stitched where they overlap.
+
+Consecutive windows are stitched at the transition t -> t+1 in their overlap at which their solutions
+agree best (ideally: the same detections in both frames, and the same links between them).  Frames up to t
+are taken from the earlier window, frames from t+1 on from the later one, and of the links between t and t+1
+only those selected in both windows are kept.  Mergers are resolved in every window, and each frame keeps the
+resolution of the window it is taken from.
+"""
+
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def time_windows(first, last, window_size, overlap):
+    """
+    Overlapping time windows covering the frames first..last.
+
+    :returns: list of (first, last) frame of each window (inclusive, like the tracking time_range)
+
+    >>> time_windows(0, 9, 4, 2)
+    [(0, 3), (2, 5), (4, 7), (6, 9)]
+    >>> time_windows(0, 8, 5, 2)
+    [(0, 4), (3, 7), (4, 8)]
+    """
+    if overlap < 2:
+        raise ValueError("Tracking windows must overlap by at least two frames, got {}".format(overlap))
+    if window_size <= overlap:
+        raise ValueError(
+            "The tracking window size ({}) must be larger than the overlap ({})".format(window_size, overlap)
+        )
+
+    windows = []
+    start = first
+    while True:
+        stop = min(start + window_size - 1, last)
+        windows.append((start, stop))
+        if stop == last:
+            break
+        start = stop - overlap + 1
+
+    # Extend the last window backwards to full length, more context is better than a short window
+    windows[-1] = (max(first, last - window_size + 1), last)
+    return windows
+
+
+# The only node and link attributes that are kept of the window graphs
+NODE_ATTRIBUTES = ("traxel", "value", "divisionValue")
+LINK_ATTRIBUTES = ("value", "gap")
+
+
+class WindowSolution:
+    """
+    Tracking solution of a range of frames, detached from its hypotheses graph.
+
+    nodes[t] maps every traxel (t, id) of frame t to its node attributes (the traxel, its "value" and "divisionValue"),
+    links[t] maps the selected links (source, destination) from frame t to their edge attributes ("value" and "gap"),
+    mergers[t] are the resolved mergers of frame t, if any (see OpConservationTracking._resolveMergers).
+    """
+
+    def __init__(self, first, last, nodes, links, mergers=None):
+        self.first = first
+        self.last = last
+        self.nodes = nodes
+        self.links = links
+        self.mergers = mergers or {}
+
+    @classmethod
+    def from_hypotheses_graph(cls, hypotheses_graph, time_range, mergers=None):
+        """
+        Extract the solution of a (traxel level) hypotheses graph, after the solution was inserted
+        (and the mergers were resolved).
+        """
+        first, last = time_range[0], time_range[-1]
+        nodes = {t: {} for t in range(first, last + 1)}
+        links = {t: {} for t in range(first, last + 1)}
+        graph = hypotheses_graph._graph
+        for node, attributes in graph.nodes(data=True):
+            nodes[node[0]][node] = {key: attributes[key] for key in NODE_ATTRIBUTES if key in attributes}
+        for source, destination, attributes in graph.edges(data=True):
+            if attributes.get("value", 0) > 0:
+                links[source[0]][(source, destination)] = {
+                    key: attributes[key] for key in LINK_ATTRIBUTES if key in attributes
+                }
+        return cls(first, last, nodes, links, dict(mergers or {}))
+
+    def node_value(self, node):
+        return self.nodes.get(node[0], {}).get(node, {}).get("value", 0)
+
+    def link_value(self, link):
+        return self.links.get(link[0][0], {}).get(link, {}).get("value", 0)
+
+    def disagreements(self, other, t):
+        """
+        Number of nodes in frames t and t + 1, links from t to t + 1, and divisions at t that differ between the
+        solutions.
+        """
+        nodes = set()
+        for solution in (self, other):
+            nodes.update(solution.nodes.get(t, {}), solution.nodes.get(t + 1, {}))
+        links = set(self.links.get(t, {})) | set(other.links.get(t, {}))
+        count = sum(self.node_value(node) != other.node_value(node) for node in nodes)
+        count += sum(self.link_value(link) != other.link_value(link) for link in links)
+        count += sum(
+            bool(self.nodes.get(t, {}).get(node, {}).get("divisionValue"))
+            != bool(other.nodes.get(t, {}).get(node, {}).get("divisionValue"))
+            for node in nodes
+            if node[0] == t
+        )
+        return count
+
+    def stitch(self, following):
+        """
+        Append the solution of the following (overlapping) window to this one, in place.
+
+        Only the frames of the overlap are compared and rewritten, the later frames of the following window are taken
+        over as they are.
+
+        :returns: self
+        """
+        overlap_first, overlap_last = following.first, self.last
+        if overlap_last - overlap_first < 1:
+            raise ValueError(
+                "Windows {}-{} and {}-{} must overlap by at least two frames".format(
+                    self.first, self.last, following.first, following.last
+                )
+            )
+
+        # Cut at the transition with the fewest disagreements, preferably in the middle of the overlap,
+        # where both windows have the most context
+        center = (overlap_first + overlap_last - 1) / 2.0
+        disagreements = {t: self.disagreements(following, t) for t in range(overlap_first, overlap_last)}
+        cut = min(disagreements, key=lambda t: (disagreements[t], abs(t - center)))
+        if disagreements[cut]:
+            logger.warning(
+                "The tracking windows {}-{} and {}-{} disagree on {} assignments at frame {}, "
+                "tracks may be interrupted there".format(
+                    self.first, self.last, following.first, following.last, disagreements[cut], cut
+                )
+            )
+
+        # Of the links between cut and cut + 1, keep those selected in both windows
+        cut_links = {
+            link: attributes
+            for link, attributes in self.links.get(cut, {}).items()
+            if following.link_value(link) == attributes.get("value", 0)
+        }
+        self.links[cut] = cut_links
+
+        # Divisions at the cut whose children were dropped are no divisions anymore
+        children = collections.Counter(source for source, destination in cut_links)
+        for node, attributes in self.nodes.get(cut, {}).items():
+            if attributes.get("divisionValue") and children[node] < 2:
+                attributes["divisionValue"] = False
+
+        for t in range(cut + 1, self.last + 1):
+            self.nodes.pop(t, None)
+            self.links.pop(t, None)
+            self.mergers.pop(t, None)
+        for t in range(cut + 1, following.last + 1):
+            self.nodes[t] = following.nodes.get(t, {})
+            self.links[t] = following.links.get(t, {})
+            if t in following.mergers:
+                self.mergers[t] = following.mergers[t]
+        self.last = following.last
+        return self
+
+    def to_hypotheses_graph(self, graph_class):
+        """
+        Create a hypotheses graph (e.g. hytra's HypothesesGraph) that contains all traxels, and the selected links
+        only, with the solution inserted.
+        """
+        hypotheses_graph = graph_class()
+        hypotheses_graph.allowLengthOneTracks = True
+        for t in sorted(self.nodes):
+            for node in sorted(self.nodes[t]):
+                attributes = dict(self.nodes[t][node])
+                # The graph assigns new unique ids
+                hypotheses_graph.addNodeFromTraxel(attributes.pop("traxel"), **attributes)
+        for t in sorted(self.links):
+            for (source, destination), attributes in sorted(self.links[t].items()):
+                hypotheses_graph._graph.add_edge(source, destination, **attributes)
+        return hypotheses_graph
@@ -43,6 +43,11 @@ plugin_directories: ~/.ilastik/plugins,
 [lazyflow]
 threads: -1
 total_ram_mb: 0
+scheduler: default
+processes: 0
+cache_eviction_policy: lru
+spill_directory:
+spill_max_mb: 0
 
 [hbp]
 token_url: https://web.ilastik.org/token/
@@ -24,7 +24,9 @@ from ilastik.config import cfg
 from yapsy.IPlugin import IPlugin
 from yapsy.PluginManager import PluginManager
 
+import collections
 import os
+import threading
 from collections import namedtuple
 from functools import partial
 import numpy
@@ -94,6 +96,35 @@ class ObjectFeaturesPlugin(IPlugin):
         """
         return dict()
 
+    def compute_local_batch(self, image, labels, object_ids, extents, features, axes):
+        """Calculate features on many objects at once.
+
+        Plugins can override this to compute the features of all given
+        objects in one (vectorized) pass. The default implementation
+        calls compute_local for each object.
+
+        :param image: np.ndarray - the whole image
+        :param labels: np.ndarray - the whole label image (without channel axis)
+        :param object_ids: the labels of the objects
+        :param extents: for each object, the slicing of its expanded bounding box in labels
+        :param features: which features to compute
+        :param axes: axis tags
+
+        :returns: a dictionary with one entry per feature.
+            dict[feature_name] is a sequence (list or numpy.ndarray) with
+            one entry per object, in the order of object_ids
+
+        """
+        results = collections.defaultdict(list)
+        for object_id, extent in zip(object_ids, extents):
+            raw_key = list(extent)
+            raw_key.insert(axes.c, slice(None))
+            rawbbox = image[tuple(raw_key)]
+            binary_bbox = numpy.asarray(labels[tuple(extent)] == object_id)
+            for feature_name, value in self.compute_local(rawbbox, binary_bbox, features, axes).items():
+                results[feature_name].append(value)
+        return dict(results)
+
     def fill_properties(self, feature_dict):
         """
         For every feature in the feature dictionary, fill in its properties,
@@ -217,13 +248,44 @@ PluginExportContext = namedtuple(
 # the manager #
 ###############
 
-pluginManager = PluginManager()
+
+class LazyPluginManager(PluginManager):
+    """
+    Plugin manager that scans the plugin directories, and loads and activates all plugins, when plugins are
+    first requested (instead of at import time).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(LazyPluginManager, self).__init__(*args, **kwargs)
+        self._collected = False
+        # Reentrant, as activating the plugins looks them up again
+        self._collectLock = threading.RLock()
+
+    def _ensureCollected(self):
+        with self._collectLock:
+            if self._collected:
+                return
+            self._collected = True
+            self.collectPlugins()
+            for pluginInfo in self.getAllPlugins():
+                self.activatePluginByName(pluginInfo.name)
+
+    def getAllPlugins(self):
+        self._ensureCollected()
+        return super(LazyPluginManager, self).getAllPlugins()
+
+    def getPluginsOfCategory(self, category_name):
+        self._ensureCollected()
+        return super(LazyPluginManager, self).getPluginsOfCategory(category_name)
+
+    def getPluginByName(self, name, category="Default"):
+        self._ensureCollected()
+        return super(LazyPluginManager, self).getPluginByName(name, category)
+
+
+pluginManager = LazyPluginManager()
 pluginManager.setPluginPlaces(plugin_paths)
 
 pluginManager.setCategoriesFilter(
     {"ObjectFeatures": ObjectFeaturesPlugin, "TrackingExportFormats": TrackingExportFormatPlugin}
 )
-
-pluginManager.collectPlugins()
-for pluginInfo in pluginManager.getAllPlugins():
-    pluginManager.activatePluginByName(pluginInfo.name)
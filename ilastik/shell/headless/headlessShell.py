@@ -85,8 +85,8 @@ class HeadlessShell(object):
         if isUrl(projectFilePath):
             projectFilePath = HeadlessShell.downloadProjectFromDvid(projectFilePath)
 
-        # Make sure all workflow sub-classes have been loaded,
-        #  so we can detect the workflow type in the project.
+        # The workflow type of the project is looked up in the workflow registry,
+        #  which only imports the workflow that the project uses.
         import ilastik.workflows
 
         try:
@@ -255,12 +255,14 @@ def getAvailableWorkflows():
     This function used to iterate over all workflows that have been imported so far,
     but now we rely on the explicit list in workflows/__init__.py,
     and add any extra auto-discovered workflows at the end.
+
+    Note that this imports all known workflows.
     """
     alreadyListed = set()
 
     from . import workflows
 
-    for W in workflows.WORKFLOW_CLASSES + all_subclasses(Workflow):
+    for W in workflows.loadAllWorkflows() + all_subclasses(Workflow):
         if W.__name__ in alreadyListed:
             continue
         alreadyListed.add(W.__name__)
@@ -274,27 +276,42 @@ def getAvailableWorkflows():
         if isbase:
             continue
 
-        if isinstance(W.workflowName, str):
-            if W.workflowDisplayName is None:
-                W.workflowDisplayName = W.workflowName
-            yield W, W.workflowName, W.workflowDisplayName
-        else:
-            originalName = W.__name__
-            wname = originalName[0]
-            for i in originalName[1:]:
-                if i in ascii_uppercase:
-                    wname += " "
-                wname += i
-            if wname.endswith(" Workflow"):
-                wname = wname[:-9]
-            if W.workflowDisplayName is None:
-                W.workflowDisplayName = wname
-
-            yield W, wname, W.workflowDisplayName
+        yield _describeWorkflow(W)
+
+
+def _describeWorkflow(W):
+    """
+    (W, workflowName, workflowDisplayName) for the given workflow class, the display name defaults to the name
+    """
+    if isinstance(W.workflowName, str):
+        if W.workflowDisplayName is None:
+            W.workflowDisplayName = W.workflowName
+        return W, W.workflowName, W.workflowDisplayName
+    else:
+        originalName = W.__name__
+        wname = originalName[0]
+        for i in originalName[1:]:
+            if i in ascii_uppercase:
+                wname += " "
+            wname += i
+        if wname.endswith(" Workflow"):
+            wname = wname[:-9]
+        if W.workflowDisplayName is None:
+            W.workflowDisplayName = wname
+
+        return W, wname, W.workflowDisplayName
 
 
 def getWorkflowFromName(Name):
     """return workflow by naming its workflowName variable"""
+    from . import workflows
+
+    # Known workflows are looked up in the registry, which only imports the requested workflow
+    entryPoint = workflows.findWorkflowEntryPoint(Name)
+    if entryPoint is not None and entryPoint.load() is not None:
+        w, _name, _displayName = _describeWorkflow(entryPoint.load())
+        return w
+
     for w, _name, _displayName in getAvailableWorkflows():
         if _name == Name or w.__name__ == Name or _displayName == Name:
             return w
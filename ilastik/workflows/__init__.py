@@ -20,130 +20,236 @@ from __future__ import absolute_import
 # on the ilastik web site at:
 # 		   http://ilastik.org/license.html
 ###############################################################################
+"""
+Registry of the known workflows.
+
+Workflow modules are only imported when a workflow is first used, so that e.g. a headless pixel classification
+job does not import the tracking or carving stacks.  The workflow classes are still available as attributes
+of this package (``from ilastik.workflows import PixelClassificationWorkflow``), and WORKFLOW_CLASSES lists
+all of them (importing all workflow modules on first access).
+"""
+import importlib
+import importlib.util
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
-WORKFLOW_CLASSES = []
-
 import ilastik.config
 
-from .pixelClassification import PixelClassificationWorkflow
-
-WORKFLOW_CLASSES += [PixelClassificationWorkflow]
 
-from .newAutocontext.newAutocontextWorkflow import AutocontextTwoStage
+class WorkflowEntryPoint:
+    """
+    A workflow class that is imported on first use.
+
+    :param module: module that defines the workflow class, relative to this package
+    :param class_name: name of the workflow class
+    :param names: other names of the workflow, as used by getWorkflowFromName: its workflowName (which is stored in
+        project files) and workflowDisplayName
+    :param import_errors: exceptions that mean that the workflow is not available (e.g. missing dependencies)
+    """
+
+    def __init__(self, module, class_name, names=(), import_errors=(ImportError,)):
+        self.module = module
+        self.class_name = class_name
+        self.names = (class_name,) + tuple(names)
+        self.import_errors = import_errors
+        self._loaded = False
+        self._workflow_class = None
+
+    def load(self):
+        """
+        Import the workflow class.
+
+        :returns: the workflow class, or None if it could not be imported
+        """
+        with _import_lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    module = importlib.import_module(self.module, __name__)
+                    self._workflow_class = getattr(module, self.class_name)
+                except self.import_errors as e:
+                    logger.warning("Failed to import workflow {}; check dependencies: {}".format(self.class_name, e))
+            return self._workflow_class
+
+
+# Imports of workflow modules are serialized, so that each entry point is loaded only once
+_import_lock = threading.RLock()
+
+# All known workflows, in the order in which they are listed
+WORKFLOW_ENTRY_POINTS = [
+    WorkflowEntryPoint(
+        ".pixelClassification.pixelClassificationWorkflow", "PixelClassificationWorkflow", ["Pixel Classification"]
+    ),
+    WorkflowEntryPoint(
+        ".newAutocontext.newAutocontextWorkflow",
+        "AutocontextTwoStage",
+        ["AutocontextTwoStage", "Autocontext (2-stage)"],
+    ),
+]
 
-WORKFLOW_CLASSES += [AutocontextTwoStage]
 if ilastik.config.cfg.getboolean("ilastik", "debug"):
-    from .newAutocontext.newAutocontextWorkflow import AutocontextThreeStage, AutocontextFourStage
+    WORKFLOW_ENTRY_POINTS += [
+        WorkflowEntryPoint(
+            ".newAutocontext.newAutocontextWorkflow",
+            "AutocontextThreeStage",
+            ["AutocontextThreeStage", "Autocontext (3-stage)"],
+        ),
+        WorkflowEntryPoint(
+            ".newAutocontext.newAutocontextWorkflow",
+            "AutocontextFourStage",
+            ["AutocontextFourStage", "Autocontext (4-stage)"],
+        ),
+    ]
 
-    WORKFLOW_CLASSES += [AutocontextThreeStage, AutocontextFourStage]
+WORKFLOW_ENTRY_POINTS += [
+    WorkflowEntryPoint(
+        ".objectClassification.objectClassificationWorkflow",
+        "ObjectClassificationWorkflowPixel",
+        [
+            "Object Classification (from pixel classification)",
+            "Pixel Classification + Object Classification",
+        ],
+    ),
+    WorkflowEntryPoint(
+        ".objectClassification.objectClassificationWorkflow",
+        "ObjectClassificationWorkflowPrediction",
+        [
+            "Object Classification (from prediction image)",
+            "Object Classification [Inputs: Raw Data, Pixel Prediction Map]",
+        ],
+    ),
+    WorkflowEntryPoint(
+        ".objectClassification.objectClassificationWorkflow",
+        "ObjectClassificationWorkflowBinary",
+        ["Object Classification (from binary image)", "Object Classification [Inputs: Raw Data, Segmentation]"],
+    ),
+    WorkflowEntryPoint(
+        ".tracking.manual.manualTrackingWorkflow",
+        "ManualTrackingWorkflow",
+        ["Manual Tracking Workflow", "Manual Tracking Workflow [Inputs: Raw Data, Pixel Prediction Map]"],
+        import_errors=(ImportError, AttributeError),
+    ),
+    WorkflowEntryPoint(
+        ".tracking.conservation.conservationTrackingWorkflow",
+        "ConservationTrackingWorkflowFromBinary",
+        [
+            "Automatic Tracking Workflow (Conservation Tracking) from binary image",
+            "Tracking [Inputs: Raw Data, Binary Image]",
+        ],
+    ),
+    WorkflowEntryPoint(
+        ".tracking.conservation.conservationTrackingWorkflow",
+        "ConservationTrackingWorkflowFromPrediction",
+        [
+            "Automatic Tracking Workflow (Conservation Tracking) from prediction image",
+            "Tracking [Inputs: Raw Data, Pixel Prediction Map]",
+        ],
+    ),
+    WorkflowEntryPoint(
+        ".tracking.conservation.animalConservationTrackingWorkflow",
+        "AnimalConservationTrackingWorkflowFromBinary",
+        [
+            "Animal Conservation Tracking Workflow from Binary Image",
+            "Animal Tracking [Inputs: Raw Data, Binary Image]",
+        ],
+    ),
+    WorkflowEntryPoint(
+        ".tracking.conservation.animalConservationTrackingWorkflow",
+        "AnimalConservationTrackingWorkflowFromPrediction",
+        [
+            "Animal Conservation Tracking Workflow from Prediction Image",
+            "Animal Tracking [Inputs: Raw Data, Pixel Prediction Map]",
+        ],
+    ),
+    WorkflowEntryPoint(
+        ".tracking.structured.structuredTrackingWorkflow",
+        "StructuredTrackingWorkflowFromBinary",
+        [
+            "Structured Learning Tracking Workflow from binary image",
+            "Tracking with Learning [Inputs: Raw Data, Binary Image]",
+        ],
+    ),
+    WorkflowEntryPoint(
+        ".tracking.structured.structuredTrackingWorkflow",
+        "StructuredTrackingWorkflowFromPrediction",
+        [
+            "Structured Learning Tracking Workflow from prediction image",
+            "Tracking with Learning [Inputs: Raw Data, Pixel Prediction Map]",
+        ],
+    ),
+    WorkflowEntryPoint(".carving.carvingWorkflow", "CarvingWorkflow", ["Carving"]),
+    WorkflowEntryPoint(
+        ".edgeTrainingWithMulticut",
+        "EdgeTrainingWithMulticutWorkflow",
+        ["Edge Training With Multicut", "Boundary-based Segmentation with Multicut"],
+    ),
+    WorkflowEntryPoint(".counting", "CountingWorkflow", ["Cell Density Counting"]),
+    WorkflowEntryPoint(
+        ".examples.dataConversion.dataConversionWorkflow", "DataConversionWorkflow", ["Data Conversion"]
+    ),
+]
 
+if ilastik.config.cfg.getboolean("ilastik", "hbp", fallback=False):
+    WORKFLOW_ENTRY_POINTS += [
+        WorkflowEntryPoint(".voxelSegmentation", "VoxelSegmentationWorkflow", ["Voxel Segmentation Workflow"])
+    ]
 
-try:
-    from .objectClassification.objectClassificationWorkflow import (
-        ObjectClassificationWorkflowPixel,
-        ObjectClassificationWorkflowPrediction,
-        ObjectClassificationWorkflowBinary,
-    )
+# network classification, only available if the required modules are installed
+WORKFLOW_ENTRY_POINTS += [
+    WorkflowEntryPoint(".nnClassification", "NNClassificationWorkflow", ["Neural Network Classification (Beta)"])
+]
 
-    WORKFLOW_CLASSES += [
-        ObjectClassificationWorkflowPixel,
-        ObjectClassificationWorkflowPrediction,
-        ObjectClassificationWorkflowBinary,
-    ]
-except ImportError as e:
-    logger.warning("Failed to import object workflow; check dependencies: " + str(e))
-
-try:
-    from .tracking.manual.manualTrackingWorkflow import ManualTrackingWorkflow
-
-    WORKFLOW_CLASSES += [ManualTrackingWorkflow]
-except (ImportError, AttributeError) as e:
-    logger.warning("Failed to import tracking workflow; check pgmlink dependency: " + str(e))
-
-try:
-    from .tracking.conservation.conservationTrackingWorkflow import (
-        ConservationTrackingWorkflowFromBinary,
-        ConservationTrackingWorkflowFromPrediction,
-    )
-    from .tracking.conservation.animalConservationTrackingWorkflow import (
-        AnimalConservationTrackingWorkflowFromBinary,
-        AnimalConservationTrackingWorkflowFromPrediction,
-    )
-
-    WORKFLOW_CLASSES += [
-        ConservationTrackingWorkflowFromBinary,
-        ConservationTrackingWorkflowFromPrediction,
-        AnimalConservationTrackingWorkflowFromBinary,
-        AnimalConservationTrackingWorkflowFromPrediction,
+# Examples, these are found as Workflow subclasses once imported
+EXAMPLE_MODULES = []
+if ilastik.config.cfg.getboolean("ilastik", "debug"):
+    EXAMPLE_MODULES += [
+        ".wsdt",
+        ".examples.layerViewer",
+        ".examples.thresholdMasking",
+        ".examples.deviationFromMean",
+        ".examples.labeling",
+        ".examples.connectedComponents",
     ]
-except ImportError as e:
-    logger.warning(
-        "Failed to import automatic tracking workflow (conservation tracking). For this workflow, see the installation"
-        "instructions on our website ilastik.org; check dependencies: " + str(e)
-    )
-
-try:
-    from .tracking.structured.structuredTrackingWorkflow import (
-        StructuredTrackingWorkflowFromBinary,
-        StructuredTrackingWorkflowFromPrediction,
-    )
-
-    WORKFLOW_CLASSES += [StructuredTrackingWorkflowFromBinary, StructuredTrackingWorkflowFromPrediction]
-except ImportError as e:
-    logger.warning(
-        "Failed to import structured learning tracking workflow. For this workflow, see the installation"
-        "instructions on our website ilastik.org; check dependencies: " + str(e)
-    )
-try:
-    from .carving.carvingWorkflow import CarvingWorkflow
-
-    WORKFLOW_CLASSES += [CarvingWorkflow]
-except ImportError as e:
-    logger.warning("Failed to import carving workflow; check vigra dependency: " + str(e))
-
-# try:
-#     import multicut
-# except ImportError as e:
-#     logger.warning("Failed to import multicut workflow; check dependencies: " + str(e))
-
-try:
-    from .edgeTrainingWithMulticut import EdgeTrainingWithMulticutWorkflow
-
-    WORKFLOW_CLASSES += [EdgeTrainingWithMulticutWorkflow]
-except ImportError as e:
-    logger.warning("Failed to import 'Edge Training With Multicut' workflow; check dependencies: " + str(e))
-
-try:
-    from .counting import CountingWorkflow
-
-    WORKFLOW_CLASSES += [CountingWorkflow]
-except ImportError as e:
-    logger.warning("Failed to import counting workflow; check dependencies: " + str(e))
-
-from .examples.dataConversion.dataConversionWorkflow import DataConversionWorkflow
-
-WORKFLOW_CLASSES += [DataConversionWorkflow]
 
-if ilastik.config.cfg.getboolean("ilastik", "hbp", fallback=False):
-    from .voxelSegmentation import VoxelSegmentationWorkflow
 
-    WORKFLOW_CLASSES += [VoxelSegmentationWorkflow]
+def findWorkflowEntryPoint(name):
+    """
+    The entry point of the workflow with the given class name, workflowName or workflowDisplayName (or None).
+    """
+    for entryPoint in WORKFLOW_ENTRY_POINTS:
+        if name in entryPoint.names:
+            return entryPoint
+    return None
 
-# network classification, check whether required modules are available:
-try:
-    from .nnClassification import NNClassificationWorkflow
-    WORKFLOW_CLASSES += [NNClassificationWorkflow]
-except ImportError as e:
-    logger.warning("Failed to import NeuralNet workflow; check dependencies: " + str(e), exc_info=1)
 
-# Examples
-if ilastik.config.cfg.getboolean("ilastik", "debug"):
-    from . import wsdt
-    from .examples import layerViewer
-    from .examples import thresholdMasking
-    from .examples import deviationFromMean
-    from .examples import labeling
-    from .examples import connectedComponents
+def loadAllWorkflows():
+    """
+    Import all known workflows (and the examples, in debug mode).
+
+    :returns: the workflow classes that could be imported, in the order of WORKFLOW_ENTRY_POINTS
+    """
+    workflowClasses = [entryPoint.load() for entryPoint in WORKFLOW_ENTRY_POINTS]
+    for module in EXAMPLE_MODULES:
+        importlib.import_module(module, __name__)
+    return [W for W in workflowClasses if W is not None]
+
+
+def __getattr__(name):
+    # Called for attributes that are not (yet) defined in this module, see PEP 562
+    if name == "WORKFLOW_CLASSES":
+        return loadAllWorkflows()
+
+    for entryPoint in WORKFLOW_ENTRY_POINTS:
+        if entryPoint.class_name == name:
+            workflowClass = entryPoint.load()
+            if workflowClass is not None:
+                return workflowClass
+            break
+
+    # Sub-packages, e.g. ilastik.workflows.pixelClassification
+    if not name.startswith("_") and importlib.util.find_spec("." + name, __name__) is not None:
+        return importlib.import_module("." + name, __name__)
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
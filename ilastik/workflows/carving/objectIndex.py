@@ -0,0 +1,187 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+import numpy
+
+
+class SupervoxelObjectIndex:
+    """
+    Inverted index from supervoxel id to the carved objects that contain it, together with the 'done' lut,
+    which maps each supervoxel to the number of an object containing it (0 for none).
+
+    Both are updated incrementally when single objects are added or removed.  Where objects overlap, the
+    done lut shows the object with the highest number.  One object (the one currently being edited) can be
+    hidden from the done lut; it is still found by names_at.
+
+    >>> index = SupervoxelObjectIndex(num_nodes=5)
+    >>> index.add("a", 1, [1, 2])
+    >>> index.add("b", 2, [2, 3])
+    >>> index.done_lut.tolist()
+    [0, 1, 2, 2, 0, 0]
+    >>> index.names_at(2)
+    ['a', 'b']
+    >>> index.hide("b")
+    >>> index.done_lut.tolist()
+    [0, 1, 1, 0, 0, 0]
+    >>> index.remove("a")
+    >>> index.names_at(2), index.done_lut.tolist()
+    (['b'], [0, 0, 0, 0, 0, 0])
+    """
+
+    def __init__(self, num_nodes):
+        self.done_lut = numpy.zeros(num_nodes + 1, dtype=numpy.int32)
+        # Number of objects that contain each supervoxel
+        self._count = numpy.zeros(num_nodes + 1, dtype=numpy.int32)
+        # The object that contains each supervoxel (only valid where the count is 1)
+        self._owner = numpy.zeros(num_nodes + 1, dtype=numpy.int32)
+        # Object numbers of the supervoxels that are contained in more than one object
+        self._shared = {}
+
+        self._supervoxels = {}  # object number -> unique supervoxel ids
+        self._numbers = {}  # object name -> object number
+        self._names = {}  # object number -> object name
+        self._hidden = None  # name of the object that is not shown in the done lut
+
+    @classmethod
+    def from_objects(cls, num_nodes, objects):
+        """
+        Build the index for many objects at once (faster than adding them one by one).
+
+        :param objects: iterable of (name, number, supervoxels) tuples
+        """
+        index = cls(num_nodes)
+        numbers = []
+        for name, number, supervoxels in objects:
+            number = int(number)
+            index._supervoxels[number] = numpy.unique(numpy.asarray(supervoxels, dtype=numpy.int64))
+            index._numbers[name] = number
+            index._names[number] = name
+            numbers.append(number)
+
+        if not numbers:
+            return index
+
+        all_supervoxels = numpy.concatenate([index._supervoxels[number] for number in numbers])
+        all_numbers = numpy.repeat(
+            numpy.array(numbers, dtype=numpy.int32), [len(index._supervoxels[number]) for number in numbers]
+        )
+
+        index._count[:] = numpy.bincount(all_supervoxels, minlength=num_nodes + 1)
+        index._owner[all_supervoxels] = all_numbers
+        numpy.maximum.at(index.done_lut, all_supervoxels, all_numbers)
+
+        shared = index._count[all_supervoxels] > 1
+        for supervoxel, number in zip(all_supervoxels[shared].tolist(), all_numbers[shared].tolist()):
+            index._shared.setdefault(supervoxel, set()).add(number)
+        return index
+
+    def __contains__(self, name):
+        return name in self._numbers
+
+    def add(self, name, number, supervoxels):
+        """
+        Add an object (or replace the object with the same name).
+        """
+        if name in self._numbers:
+            self.remove(name)
+
+        number = int(number)
+        supervoxels = numpy.unique(numpy.asarray(supervoxels, dtype=numpy.int64))
+        self._supervoxels[number] = supervoxels
+        self._numbers[name] = number
+        self._names[number] = name
+
+        count = self._count[supervoxels]
+        self._owner[supervoxels[count == 0]] = number
+        for supervoxel in supervoxels[count == 1].tolist():
+            self._shared[supervoxel] = {int(self._owner[supervoxel]), number}
+        for supervoxel in supervoxels[count > 1].tolist():
+            self._shared[supervoxel].add(number)
+        self._count[supervoxels] += 1
+
+        if name != self._hidden:
+            self.done_lut[supervoxels] = numpy.maximum(self.done_lut[supervoxels], number)
+
+    def remove(self, name):
+        """
+        Remove the object with the given name (if present).
+        """
+        if name not in self._numbers:
+            return
+        number = self._numbers.pop(name)
+        del self._names[number]
+        supervoxels = self._supervoxels.pop(number)
+
+        self._count[supervoxels] -= 1
+        count = self._count[supervoxels]
+        self._owner[supervoxels[count == 0]] = 0
+        for supervoxel in supervoxels[count > 0].tolist():
+            owners = self._shared[supervoxel]
+            owners.discard(number)
+            if len(owners) == 1:
+                self._owner[supervoxel] = owners.pop()
+                del self._shared[supervoxel]
+
+        self._update_done(supervoxels[self.done_lut[supervoxels] == number])
+
+    def hide(self, name):
+        """
+        Hide the object with the given name from the done lut (and show the previously hidden one again).
+        Use None (or any name that is not in the index) to show all objects.
+        """
+        previous, self._hidden = self._hidden, name
+        if previous == name:
+            return
+
+        if previous in self._numbers:
+            number = self._numbers[previous]
+            supervoxels = self._supervoxels[number]
+            self.done_lut[supervoxels] = numpy.maximum(self.done_lut[supervoxels], number)
+
+        if name in self._numbers:
+            number = self._numbers[name]
+            supervoxels = self._supervoxels[number]
+            self._update_done(supervoxels[self.done_lut[supervoxels] == number])
+
+    def names_at(self, supervoxel):
+        """
+        Names of all objects that contain the given supervoxel (ordered by object number).
+        """
+        supervoxel = int(supervoxel)
+        count = self._count[supervoxel]
+        if count == 0:
+            return []
+        if count == 1:
+            return [self._names[int(self._owner[supervoxel])]]
+        return [self._names[number] for number in sorted(self._shared[supervoxel])]
+
+    def _update_done(self, supervoxels):
+        """
+        Recompute the done lut for the given supervoxels.
+        """
+        hidden = self._numbers.get(self._hidden, 0)
+        count = self._count[supervoxels]
+        done = numpy.where(count == 1, self._owner[supervoxels], 0)
+        if hidden:
+            done[done == hidden] = 0
+        for i in numpy.flatnonzero(count > 1):
+            visible = self._shared[int(supervoxels[i])] - {hidden}
+            done[i] = max(visible, default=0)
+        self.done_lut[supervoxels] = done
@@ -35,6 +35,7 @@ from lazyflow.operators.valueProviders import OpValueCache
 # ilastik
 from lazyflow.utility.timer import Timer
 from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.workflows.carving.objectIndex import SupervoxelObjectIndex
 
 
 import logging
@@ -128,7 +129,8 @@ class OpCarving(Operator):
         self.LabelNames.setValue(["Background", "Object"])
 
         # supervoxels of finished and saved objects
-        self._done_seg_lut = None
+        self._object_index = None
+        self._object_index_mst = None
         self._hints = None
         self._pmap = None
         if hintOverlayFile is not None:
@@ -211,24 +213,34 @@ class OpCarving(Operator):
 
     def _buildDone(self):
         """
-        Builds the done segmentation anew, for example after saving an object or
-        deleting an object.
+        Builds the object index and done segmentation anew from all objects of the MST,
+        for example after loading a project.  Saving, loading or deleting single objects
+        updates the index incrementally instead.
         """
         if self._mst is None:
             return
         with Timer() as timer:
-            self._done_seg_lut = numpy.zeros(self._mst.numNodes + 1, dtype=numpy.int32)
             logger.info("building 'done' lut")
+            objects = []
             for name, objectSupervoxels in self._mst.object_lut.items():
-                if name == self._currObjectName:
-                    continue
                 assert name in self._mst.object_names, "%s not in self._mst.object_names, keys are %r" % (
                     name,
                     list(self._mst.object_names.keys()),
                 )
-                self._done_seg_lut[objectSupervoxels] = self._mst.object_names[name]
+                objects.append((name, self._mst.object_names[name], objectSupervoxels))
+            self._object_index = SupervoxelObjectIndex.from_objects(self._mst.numNodes, objects)
+            self._object_index.hide(self._currObjectName)
+            self._object_index_mst = self._mst
         logger.info("building the 'done' luts took {} seconds".format(timer.seconds()))
 
+    def _objectIndex(self):
+        """
+        The object index of the current MST (rebuilt if the MST was replaced).
+        """
+        if self._object_index is None or self._object_index_mst is not self._mst:
+            self._buildDone()
+        return self._object_index
+
     def dataIsStorable(self):
         if self._mst is None:
             return False
@@ -308,10 +320,7 @@ class OpCarving(Operator):
 
         # find the supervoxel that was clicked
         sv = self._mst.supervoxelUint32[position3d]
-        names = []
-        for name, objectSupervoxels in self._mst.object_lut.items():
-            if numpy.sum(sv == objectSupervoxels) > 0:
-                names.append(name)
+        names = self._objectIndex().names_at(sv)
         logger.info("click on %r, supervoxel=%d: %r" % (position3d, sv, names))
         return names
 
@@ -378,8 +387,8 @@ class OpCarving(Operator):
         self._setCurrObjectName(name)
         self.HasSegmentation.setValue(True)
 
-        # now that 'name' is no longer part of the set of finished objects, rebuild the done overlay
-        self._buildDone()
+        # now that 'name' is no longer part of the set of finished objects, update the done overlay
+        self._objectIndex().hide(name)
         return (fgVoxelsSeedPos, bgVoxelsSeedPos)
 
     def loadObject(self, name):
@@ -458,6 +467,7 @@ class OpCarving(Operator):
         # clean seeds
         # lut_seeds[:] = 0
 
+        objectIndex = self._objectIndex()
         del self._mst.object_lut[name]
         del self._mst.object_seeds_fg_voxels[name]
         del self._mst.object_seeds_bg_voxels[name]
@@ -471,8 +481,9 @@ class OpCarving(Operator):
 
         self._setCurrObjectName("<not saved yet>")
 
-        # now that 'name' has been deleted, rebuild the done overlay
-        self._buildDone()
+        # now that 'name' has been deleted, update the done overlay
+        objectIndex.remove(name)
+        objectIndex.hide(self._currObjectName)
         # self.updatePreprocessing()
 
     def deleteObject(self, name):
@@ -528,6 +539,7 @@ class OpCarving(Operator):
         sVseg = self._mst.getSuperVoxelSeg()
         sVseed = self._mst.getSuperVoxelSeeds()
 
+        objectIndex = self._objectIndex()
         self._mst.object_names[name] = objNr
 
         self._mst.bg_priority[name] = self.BackgroundPriority.value
@@ -541,9 +553,9 @@ class OpCarving(Operator):
         objects = list(self._mst.object_names.keys())
         self.AllObjectNames.meta.shape = (len(objects),)
 
-        # now that 'name' is no longer part of the set of finished objects, rebuild the done overlay
-
-        self._buildDone()
+        # now that 'name' is part of the set of finished objects, update the done overlay
+        objectIndex.add(name, objNr, self._mst.object_lut[name])
+        objectIndex.hide(self._currObjectName)
         # self._clearLabels()
         # self._mst.clearSegmentation()
         # self.clearCurrentLabeling()
@@ -635,11 +647,11 @@ class OpCarving(Operator):
             temp.shape = (1,) + temp.shape + (1,)
         elif slot == self.DoneSegmentation:
             # avoid data being copied
-            if self._done_seg_lut is None:
+            if self._object_index is None:
                 result[0, :, :, :, 0] = 0
                 return result
             else:
-                temp = self._done_seg_lut[self._mst.supervoxelUint32[sl[1:4]]]
+                temp = self._object_index.done_lut[self._mst.supervoxelUint32[sl[1:4]]]
                 temp.shape = (1,) + temp.shape + (1,)
         elif slot == self.HintOverlay:
             if self._hints is None:
@@ -32,7 +32,8 @@ from ilastik.applets.batchProcessing import BatchProcessingApplet
 
 from lazyflow.graph import Graph
 from lazyflow.operators import OpRelabelConsecutive, OpBlockedArrayCache, OpSimpleStacker
-from lazyflow.operators.generic import OpConvertDtype, OpPixelOperator
+from lazyflow.operators.generic import OpConvertDtype
+from lazyflow.operators.opFusedPixelChain import OpFusedPixelChain, ConvertDtypeStage, PixelFunctionStage
 from lazyflow.operators.valueProviders import OpPrecomputedInput
 
 import logging
@@ -191,24 +192,19 @@ class EdgeTrainingWithMulticutWorkflow(Workflow):
         opConvertRaw.ConversionDtype.setValue(np.float32)
         opConvertRaw.Input.connect(opDataSelection.ImageGroup[self.DATA_ROLE_RAW])
 
-        # PROBABILITIES: Convert to float32
-        opConvertProbabilities = OpConvertDtype(parent=self)
-        opConvertProbabilities.ConversionDtype.setValue(np.float32)
-        opConvertProbabilities.Input.connect(opDataSelection.ImageGroup[self.DATA_ROLE_PROBABILITIES])
-
-        # PROBABILITIES: Normalize drange to [0.0, 1.0]
-        opNormalizeProbabilities = OpPixelOperator(parent=self)
+        # PROBABILITIES: Convert to float32 and normalize drange to [0.0, 1.0] (in one step)
+        opNormalizeProbabilities = OpFusedPixelChain(parent=self)
 
         def normalize_inplace(a):
-            drange = opConvertProbabilities.Output.meta.drange
+            drange = opNormalizeProbabilities.Input.meta.drange
             if drange is None or (drange[0] == 0.0 and drange[1] == 1.0):
                 return a
             a[:] -= drange[0]
             a[:] = a[:] / float((drange[1] - drange[0]))
             return a
 
-        opNormalizeProbabilities.Input.connect(opConvertProbabilities.Output)
-        opNormalizeProbabilities.Function.setValue(normalize_inplace)
+        opNormalizeProbabilities.Stages.setValue([ConvertDtypeStage(np.float32), PixelFunctionStage(normalize_inplace)])
+        opNormalizeProbabilities.Input.connect(opDataSelection.ImageGroup[self.DATA_ROLE_PROBABILITIES])
 
         # GROUNDTRUTH: Convert to uint32, relabel, and cache
         opConvertGroundtruth = OpConvertDtype(parent=self)
@@ -1,4 +1,5 @@
 from builtins import range
+import argparse
 import os
 from lazyflow.graph import Graph
 from ilastik.workflow import Workflow
@@ -168,11 +169,13 @@ class ConservationTrackingWorkflowBase(Workflow):
             self._batch_input_args, unused_args = self.batchProcessingApplet.parse_known_cmdline_args(
                 workflow_cmdline_args
             )
+            self._tracking_args, unused_args = self._parse_tracking_cmdline_args(unused_args)
 
         else:
             unused_args = None
             self._data_export_args = None
             self._batch_input_args = None
+            self._tracking_args = None
 
         if unused_args:
             logger.warning("Unused command-line args: {}".format(unused_args))
@@ -181,6 +184,23 @@ class ConservationTrackingWorkflowBase(Workflow):
     def applets(self):
         return self._applets
 
+    @staticmethod
+    def _parse_tracking_cmdline_args(cmdline_args):
+        parser = argparse.ArgumentParser()
+        parser.add_argument(
+            "--tracking-window-size",
+            help="Track long movies in overlapping time windows of this many frames, and stitch the results "
+            "(0: track all frames at once).",
+            type=int,
+        )
+        parser.add_argument(
+            "--tracking-window-overlap", help="Number of frames by which the tracking windows overlap.", type=int
+        )
+        parser.add_argument(
+            "--tracking-parallel-windows", help="Number of tracking windows to track in parallel.", type=int, default=1
+        )
+        return parser.parse_known_args(cmdline_args)
+
     def _createDivisionDetectionApplet(self, selectedFeatures=dict()):
         return ObjectClassificationApplet(
             workflow=self,
@@ -349,6 +369,17 @@ class ConservationTrackingWorkflowBase(Workflow):
         else:
             numFramesPerSplit = 0
 
+        # Windowed tracking, the command-line arguments take precedence over the project settings
+        windowSize = parameters.get("windowSize", 0)
+        windowOverlap = parameters.get("windowOverlap", 10)
+        numParallelWindows = 1
+        if self._tracking_args:
+            if self._tracking_args.tracking_window_size is not None:
+                windowSize = self._tracking_args.tracking_window_size
+            if self._tracking_args.tracking_window_overlap is not None:
+                windowOverlap = self._tracking_args.tracking_window_overlap
+            numParallelWindows = self._tracking_args.tracking_parallel_windows
+
         self.trackingApplet.topLevelOperator[lane_index].track(
             time_range=time_enum,
             x_range=x_range,
@@ -378,6 +409,9 @@ class ConservationTrackingWorkflowBase(Workflow):
             disappearance_cost=parameters["disappearanceCost"],
             max_nearest_neighbors=parameters["max_nearest_neighbors"],
             numFramesPerSplit=numFramesPerSplit,
+            windowSize=windowSize,
+            windowOverlap=windowOverlap,
+            numParallelWindows=numParallelWindows,
             force_build_hypotheses_graph=False,
             withBatchProcessing=True,
         )
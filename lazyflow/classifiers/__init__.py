@@ -9,6 +9,7 @@ from .vigraRfLazyflowClassifier import VigraRfLazyflowClassifier, VigraRfLazyflo
 from .parallelVigraRfLazyflowClassifier import (
     ParallelVigraRfLazyflowClassifier,
     ParallelVigraRfLazyflowClassifierFactory,
+    IncrementalParallelVigraRfLazyflowClassifierFactory,
 )
 from .sklearnLazyflowClassifier import SklearnLazyflowClassifier, SklearnLazyflowClassifierFactory
 
@@ -111,15 +111,11 @@ class ParallelVigraRfLazyflowClassifierFactory(LazyflowVectorwiseClassifierFacto
     def create_and_train(self, X, y, feature_names=None):
         logger.debug("Training parallel vigra RF")
 
-        # Distribute trees as evenly as possible
-        tree_counts = numpy.array([self._num_trees // self._num_forests] * self._num_forests)
-        tree_counts[: self._num_trees % self._num_forests] += 1
-        assert tree_counts.sum() == self._num_trees
-        tree_counts = list(map(int, tree_counts))
-        tree_counts[:] = (tree_count for tree_count in tree_counts if tree_count != 0)
+        tree_counts = self._distribute_trees(self._num_trees)
 
         # Save for future reference
         known_labels = numpy.unique(y)
+        num_training_samples = len(X)
 
         X = numpy.asarray(X, numpy.float32)
         y = numpy.asarray(y, numpy.uint32)
@@ -166,7 +162,20 @@ class ParallelVigraRfLazyflowClassifierFactory(LazyflowVectorwiseClassifierFacto
             oobs = self._train_forests(forests, X, y)
 
         logger.info("Training complete. Average OOB: {}".format(numpy.average(oobs)))
-        return ParallelVigraRfLazyflowClassifier(forests, oobs, known_labels, feature_names, named_importances)
+        return ParallelVigraRfLazyflowClassifier(
+            forests, oobs, known_labels, feature_names, named_importances, num_training_samples
+        )
+
+    def _distribute_trees(self, num_trees):
+        """
+        Distribute trees as evenly as possible among the forests.  Returns the (non-zero) tree count of each forest.
+        """
+        tree_counts = numpy.array([num_trees // self._num_forests] * self._num_forests)
+        tree_counts[: num_trees % self._num_forests] += 1
+        assert tree_counts.sum() == num_trees
+        tree_counts = list(map(int, tree_counts))
+        tree_counts[:] = (tree_count for tree_count in tree_counts if tree_count != 0)
+        return tree_counts
 
     @staticmethod
     def _train_forests(forests, X, y):
@@ -254,6 +263,188 @@ class ParallelVigraRfLazyflowClassifierFactory(LazyflowVectorwiseClassifierFacto
 assert issubclass(ParallelVigraRfLazyflowClassifierFactory, LazyflowVectorwiseClassifierFactoryABC)
 
 
+class IncrementalParallelVigraRfLazyflowClassifierFactory(ParallelVigraRfLazyflowClassifierFactory):
+    """
+    Parallel RF that is updated incrementally, for interactive training.
+
+    Instead of training all trees from scratch, each update trains a few new forests on a sample
+    of the training data (all samples added since the previous classifier was trained, plus a
+    random subset of the older ones), and retires old forests so that the total number of trees
+    stays at num_trees_total.
+
+    An update is only possible if the caller passes the previous classifier and the rows of the training
+    matrix that were appended since it was trained (all other rows must be exactly the previous training
+    samples, see FeatureMatrixHistory), and the classifier is compatible (same classes, features and
+    number of trees).
+    Otherwise, all trees are trained from scratch.
+    """
+
+    VERSION = 1  # This is used to determine compatibility of pickled classifier factories.
+    # You must bump this if any instance members are added/removed/renamed.
+
+    # OpTrainClassifierFromFeatureVectors passes the previous classifier to create_and_train() if this is set.
+    supports_incremental_training = True
+
+    RETIRE_POLICIES = ("oldest", "worst_oob")
+
+    # Number of samples of each class that are added to the training sample if the class is missing otherwise
+    MIN_SAMPLES_PER_CLASS = 10
+
+    def __init__(
+        self,
+        num_trees_total=100,
+        num_forests=None,
+        trees_per_update=None,
+        sample_size=50000,
+        retire_policy="oldest",
+        **kwargs
+    ):
+        """
+        trees_per_update: The minimal number of trees to train in each incremental update (default: a quarter of
+            the trees). Old forests are retired as a whole, so it can be more.
+
+        sample_size: Maximum number of samples to train the new trees with.
+
+        retire_policy: Which forests to replace by the new ones: "oldest" or "worst_oob" (highest OOB error first).
+
+        See ParallelVigraRfLazyflowClassifierFactory for the other parameters.
+        """
+        assert retire_policy in self.RETIRE_POLICIES, "Unknown retire policy: {}".format(retire_policy)
+        super(IncrementalParallelVigraRfLazyflowClassifierFactory, self).__init__(
+            num_trees_total, num_forests, **kwargs
+        )
+        self._trees_per_update = trees_per_update or max(1, num_trees_total // 4)
+        self._sample_size = sample_size
+        self._retire_policy = retire_policy
+
+    def create_and_train(self, X, y, feature_names=None, previous_classifier=None, appended_rows=None):
+        """
+        previous_classifier: The classifier to update, if possible.
+
+        appended_rows: The indices of the rows of X (and y) that were added since previous_classifier was trained.
+            The other rows must be the samples that previous_classifier was trained with, unchanged.
+        """
+        if not self._can_update(previous_classifier, X, y, feature_names, appended_rows):
+            return super(IncrementalParallelVigraRfLazyflowClassifierFactory, self).create_and_train(
+                X, y, feature_names
+            )
+
+        logger.debug("Updating parallel vigra RF incrementally")
+        X = numpy.asarray(X, numpy.float32)
+        y = numpy.asarray(y, numpy.uint32)
+        if y.ndim == 1:
+            y = y[:, numpy.newaxis]
+
+        # Forests are retired as a whole, the new trees make up for the difference
+        kept_forests, kept_oobs = self._retire_forests(
+            previous_classifier, self._num_trees - min(self._trees_per_update, self._num_trees)
+        )
+        num_new_trees = self._num_trees - sum(f.treeCount() for f in kept_forests)
+
+        sample = self._training_sample(y, numpy.asarray(appended_rows, dtype=int))
+        forests = [
+            vigra.learning.RandomForest(tree_count, **self._kwargs)
+            for tree_count in self._distribute_trees(num_new_trees)
+        ]
+        oobs = self._train_forests(forests, X[sample], y[sample])
+        logger.info(
+            "Trained {} new trees on {} samples. Average OOB: {}".format(
+                num_new_trees, len(sample), numpy.average(oobs)
+            )
+        )
+
+        return ParallelVigraRfLazyflowClassifier(
+            kept_forests + forests,
+            kept_oobs + oobs,
+            numpy.unique(y),
+            feature_names,
+            num_training_samples=len(X),
+        )
+
+    def _can_update(self, previous_classifier, X, y, feature_names, appended_rows):
+        if not isinstance(previous_classifier, ParallelVigraRfLazyflowClassifier) or appended_rows is None:
+            return False
+        if self._variable_importance_enabled or self._label_proportion:
+            # Not supported for incremental updates
+            return False
+        if previous_classifier._num_trees != self._num_trees:
+            # Trained with another number of trees
+            return False
+        num_previous_samples = previous_classifier.num_training_samples
+        if num_previous_samples is None or num_previous_samples != len(X) - len(appended_rows):
+            # Unknown, or the old samples are not the ones the previous classifier was trained with
+            return False
+        if previous_classifier.feature_count != numpy.shape(X)[1]:
+            return False
+        if list(previous_classifier.feature_names or []) != list(feature_names or []):
+            # Other features with the same number of channels
+            return False
+        return set(previous_classifier.known_classes) == set(numpy.unique(y))
+
+    def _training_sample(self, y, appended_rows):
+        """
+        Choose the rows to train new forests with: the new samples, and at least as many old ones.
+        Every class must be present, so that all forests predict the same classes.
+        """
+        is_old = numpy.ones(len(y), dtype=bool)
+        is_old[appended_rows] = False
+        old_rows = numpy.flatnonzero(is_old)
+
+        new_rows = appended_rows
+        if len(new_rows) > self._sample_size // 2:
+            new_rows = numpy.random.choice(new_rows, self._sample_size // 2, replace=False)
+        num_old_rows = min(len(old_rows), self._sample_size - len(new_rows))
+        old_rows = numpy.random.choice(old_rows, num_old_rows, replace=False)
+        sample = numpy.concatenate((new_rows, old_rows))
+
+        for label in set(numpy.unique(y)) - set(numpy.unique(y[sample])):
+            label_rows = numpy.flatnonzero(y[:, 0] == label)
+            num_label_rows = min(len(label_rows), self.MIN_SAMPLES_PER_CLASS)
+            sample = numpy.concatenate((sample, numpy.random.choice(label_rows, num_label_rows, replace=False)))
+        return numpy.sort(sample)
+
+    def _retire_forests(self, previous_classifier, max_trees):
+        """
+        Drop forests of the previous classifier until at most max_trees trees remain.
+        Returns the remaining forests (oldest first) and their oobs.
+        """
+        forests = list(previous_classifier._forests)
+        oobs = list(previous_classifier.oobs)
+        if self._retire_policy == "worst_oob":
+            # Unknown oobs (e.g. from older project files) are retired first
+            retire_order = sorted(range(len(forests)), key=lambda i: -oobs[i] if oobs[i] >= 0 else -numpy.inf)
+        else:
+            retire_order = list(range(len(forests)))
+
+        num_trees = sum(forest.treeCount() for forest in forests)
+        retired = set()
+        for i in retire_order:
+            if num_trees <= max_trees:
+                break
+            retired.add(i)
+            num_trees -= forests[i].treeCount()
+
+        kept = [i for i in range(len(forests)) if i not in retired]
+        return [forests[i] for i in kept], [oobs[i] for i in kept]
+
+    @property
+    def description(self):
+        return "Incremental Parallel Vigra Random Forest Factory ({} trees total, {} per update)".format(
+            self._num_trees, self._trees_per_update
+        )
+
+    def __eq__(self, other):
+        return (
+            super(IncrementalParallelVigraRfLazyflowClassifierFactory, self).__eq__(other)
+            and self._trees_per_update == other._trees_per_update
+            and self._sample_size == other._sample_size
+            and self._retire_policy == other._retire_policy
+        )
+
+
+assert issubclass(IncrementalParallelVigraRfLazyflowClassifierFactory, LazyflowVectorwiseClassifierFactoryABC)
+
+
 def generate_importance_table(named_importances_dict, sort=None, export_path=None):
     """
     Return a string of the given importances dict, in csv format,
@@ -315,11 +506,16 @@ class ParallelVigraRfLazyflowClassifier(LazyflowVectorwiseClassifierABC):
     Adapt the vigra RandomForest class to the interface lazyflow expects.
     """
 
-    def __init__(self, forests, oobs, known_labels, feature_names=None, named_importances=None):
+    def __init__(
+        self, forests, oobs, known_labels, feature_names=None, named_importances=None, num_training_samples=None
+    ):
         self._known_labels = known_labels
         self._forests = forests
         self._feature_names = feature_names
 
+        # Number of rows of the training matrix (None if unknown, e.g. for older project files)
+        self._num_training_samples = num_training_samples
+
         # Note that oobs may not be in the same order as the forests.
         self._oobs = oobs
 
@@ -385,6 +581,10 @@ class ParallelVigraRfLazyflowClassifier(LazyflowVectorwiseClassifierABC):
     def named_importances(self):
         return self._named_importances
 
+    @property
+    def num_training_samples(self):
+        return self._num_training_samples
+
     def serialize_hdf5(self, h5py_group):
         for forest in self._forests:
             if forest is None:
@@ -419,6 +619,11 @@ class ParallelVigraRfLazyflowClassifier(LazyflowVectorwiseClassifierABC):
             h5py_group.create_dataset("named_importances_keys", data=list(self._named_importances.keys()))
             h5py_group.create_dataset("named_importances_values", data=list(self._named_importances.values()))
 
+        if all(oob is not None for oob in self._oobs):
+            h5py_group["oobs"] = numpy.array(self._oobs, dtype=numpy.float64)
+        if self._num_training_samples is not None:
+            h5py_group["num_training_samples"] = self._num_training_samples
+
         os.remove(cachePath)
         os.rmdir(tmpDir)
 
@@ -466,10 +671,18 @@ class ParallelVigraRfLazyflowClassifier(LazyflowVectorwiseClassifierABC):
         except KeyError:
             named_importances = None
 
+        try:
+            num_training_samples = int(h5py_group["num_training_samples"][()])
+        except KeyError:
+            # Older projects didn't store the number of training samples.
+            num_training_samples = None
+
         os.remove(cachePath)
         os.rmdir(tmpDir)
 
-        return ParallelVigraRfLazyflowClassifier(forests, oobs, known_labels, feature_names, named_importances)
+        return ParallelVigraRfLazyflowClassifier(
+            forests, oobs, known_labels, feature_names, named_importances, num_training_samples
+        )
 
 
 assert issubclass(ParallelVigraRfLazyflowClassifier, LazyflowVectorwiseClassifierABC)
@@ -57,6 +57,7 @@ from .opCompressedUserLabelArray import OpCompressedUserLabelArray
 from .opLabelImage import OpLabelImage
 from .opInterpMissingData import OpInterpMissingData
 from .opReorderAxes import OpReorderAxes
+from .opFusedPixelChain import OpFusedPixelChain
 from .opLabelVolume import OpLabelVolume
 from .opRelabelConsecutive import OpRelabelConsecutive
 from .opPixelFeaturesPresmoothed import OpPixelFeaturesPresmoothed
@@ -25,9 +25,11 @@ from __future__ import division
 # Python
 import gc
 import threading
+import time
 import weakref
 import functools
 import atexit
+import collections
 import warnings
 
 
@@ -43,6 +45,68 @@ logger = logging.getLogger(__name__)
 
 default_refresh_interval = 10
 
+# minimum number of seconds between two cleanups triggered by cache admissions
+min_pressure_interval = 1.0
+
+
+class _LeastRecentlyUsedPolicy(object):
+    """
+    evict the cache entries that were accessed least recently first
+    """
+
+    def priorities(self, entries):
+        return [entry.lastAccessTime for entry in entries]
+
+    def evicted(self, entry, priority):
+        pass
+
+
+class _GreedyDualSizePolicy(object):
+    """
+    GreedyDual-Size eviction: evict the entries with the smallest
+    recompute-cost-per-byte first, while aging entries that are not accessed
+
+    Each entry has a priority H = L + cost / size, where L is the priority of
+    the most recently evicted entry. H is (re)assigned whenever the entry is
+    accessed. Since L only changes during cleanup, the priority of an entry
+    accessed since the last cleanup is computed with the current L.
+    Entries with unknown cost are treated as free to recompute.
+    """
+
+    def __init__(self):
+        self._inflation = 0.0
+        # cache -> {block key: (access time, priority)}
+        self._priorities = weakref.WeakKeyDictionary()
+
+    def priorities(self, entries):
+        result = []
+        seen = {}
+        for entry in entries:
+            cache_priorities = self._priorities.get(entry.cache, {})
+            known = cache_priorities.get(entry.key)
+            if known is not None and known[0] == entry.lastAccessTime:
+                priority = known[1]
+            else:
+                cost_per_byte = entry.cost / entry.size if entry.size else 0.0
+                priority = self._inflation + cost_per_byte
+            seen.setdefault(entry.cache, {})[entry.key] = (entry.lastAccessTime, priority)
+            result.append(priority)
+
+        # Forget entries that are no longer in the caches
+        self._priorities = weakref.WeakKeyDictionary(seen)
+        return result
+
+    def evicted(self, entry, priority):
+        self._inflation = max(self._inflation, priority)
+        self._priorities.get(entry.cache, {}).pop(entry.key, None)
+
+
+eviction_policies = {"lru": _LeastRecentlyUsedPolicy, "gds": _GreedyDualSizePolicy}
+
+_CacheEntry = collections.namedtuple(
+    "_CacheEntry", ["cache", "key", "lastAccessTime", "cost", "size", "info", "cleanupFun"]
+)
+
 
 class _CacheMemoryManager(threading.Thread):
     """
@@ -72,6 +136,24 @@ class _CacheMemoryManager(threading.Thread):
 
     the interval is measured in seconds. Each change of refresh interval
     triggers cleanup.
+
+    Caches should report the memory they add via `notifyCacheAdmission()`.
+    As soon as the estimated cache memory exceeds the allowed amount, the
+    cleanup thread is woken up instead of waiting for the next interval,
+    but at most every `min_pressure_interval` seconds. If the last cleanup
+    could not get below the allowed amount (e.g. because of caches that
+    cannot be freed), the thread is only woken up again once the difference
+    between allowed and target amount has been admitted since.
+    Admission and eviction counters are available via `getStatistics()`.
+
+    The order in which cache entries are freed is determined by the eviction
+    policy (one of the keys of `eviction_policies`)::
+
+        cache_mem_manager.setEvictionPolicy("gds")
+
+    "lru" (the default) frees the least recently accessed entries first,
+    "gds" (GreedyDual-Size) frees entries with the smallest recompute cost
+    per byte first, as reported by `ManagedBlockedCache.getBlockCosts()`.
     """
 
     totalCacheMemory = OrderedSignal()
@@ -97,6 +179,18 @@ class _CacheMemoryManager(threading.Thread):
         # target usage fraction
         self._target_usage = 0.90
 
+        self._eviction_policy = _LeastRecentlyUsedPolicy()
+
+        # Bookkeeping for admissions between two cleanups (protected by _statistics_lock)
+        self._statistics_lock = threading.Lock()
+        self._last_total = 0
+        self._last_cleanup_time = 0.0
+        self._admitted_since_cleanup = 0
+        self._cleanup_requested = False
+        self._statistics = dict.fromkeys(
+            ["admissions", "admitted_bytes", "evictions", "evicted_bytes", "cleanups", "pressure_events"], 0
+        )
+
         self._stopped = False
         self.start()
         atexit.register(self.stop)
@@ -163,15 +257,62 @@ class _CacheMemoryManager(threading.Thread):
             # acquire lock so that we don't get disabled during cleanup
             with self._disable_lock:
                 if self._disabled or self._stopped:
+                    with self._statistics_lock:
+                        self._cleanup_requested = False
                     continue
                 self._cleanup()
 
+    def notifyCacheAdmission(self, nbytes):
+        """
+        tell the manager that a cache has stored nbytes of new data
+
+        If the cache memory is now estimated to exceed the allowed amount,
+        the cleanup thread is woken up immediately.
+        """
+        with self._statistics_lock:
+            self._statistics["admissions"] += 1
+            self._statistics["admitted_bytes"] += nbytes
+            self._admitted_since_cleanup += nbytes
+            if self._cleanup_requested:
+                return
+            cache_memory = Memory.getAvailableRamCaches()
+            limit = self._max_usage * cache_memory
+            if self._last_total + self._admitted_since_cleanup <= limit:
+                return
+            if self._last_total > limit:
+                # The last cleanup could not free enough, another one only helps once there is new data to free
+                if self._admitted_since_cleanup < (self._max_usage - self._target_usage) * cache_memory:
+                    return
+            if time.monotonic() - self._last_cleanup_time < min_pressure_interval:
+                # The regular cleanup or a later admission will take care of it
+                return
+            self._cleanup_requested = True
+            self._statistics["pressure_events"] += 1
+
+        with self._condition:
+            self._condition.notify()
+
+    def getStatistics(self):
+        """
+        get a dict of counters: number of admissions, evictions and cleanups,
+        bytes admitted and evicted, and how often the memory limit was crossed
+        between two cleanups (pressure events)
+        """
+        with self._statistics_lock:
+            return dict(self._statistics)
+
     def _cleanup(self):
         """
         clean up once
         """
         from lazyflow.operators.opCache import ObservableCache
 
+        with self._statistics_lock:
+            self._cleanup_requested = False
+            self._admitted_since_cleanup = 0
+            self._last_cleanup_time = time.monotonic()
+            self._statistics["cleanups"] += 1
+
         try:
             # notify subscribed functions about current cache memory
             total = 0
@@ -202,30 +343,55 @@ class _CacheMemoryManager(threading.Thread):
             )
 
             if total <= self._max_usage * cache_memory:
+                with self._statistics_lock:
+                    self._last_total = total
                 return
 
-            cache_entries = []
-            cache_entries += [
-                (cache.lastAccessTime(), cache.name, cache.freeMemory) for cache in list(self._managed_caches)
-            ]
-            cache_entries += [
-                (lastAccessTime, f"{cache.name}: {blockKey}", functools.partial(cache.freeBlock, blockKey))
-                for cache in list(self._managed_blocked_caches)
-                for blockKey, lastAccessTime in cache.getBlockAccessTimes()
+            cache_entries = [
+                _CacheEntry(cache, None, cache.lastAccessTime(), 0.0, 0, cache.name, cache.freeMemory)
+                for cache in list(self._managed_caches)
             ]
-            cache_entries.sort(key=lambda entry: entry[0])
+            for cache in list(self._managed_blocked_caches):
+                costs = {blockKey: (cost, size) for blockKey, cost, size in cache.getBlockCosts()}
+                cache_entries += [
+                    _CacheEntry(
+                        cache,
+                        blockKey,
+                        lastAccessTime,
+                        *costs.get(blockKey, (0.0, 0)),
+                        f"{cache.name}: {blockKey}",
+                        functools.partial(cache.freeBlock, blockKey),
+                    )
+                    for blockKey, lastAccessTime in cache.getBlockAccessTimes()
+                ]
+            cache = None
+
+            policy = self._eviction_policy
+            priorities = policy.priorities(cache_entries)
+            ordered = sorted(zip(priorities, cache_entries), key=lambda p: (p[0], p[1].lastAccessTime))
 
-            for lastAccessTime, info, cleanupFun in cache_entries:
+            evicted = 0
+            for priority, entry in ordered:
                 if total <= self._target_usage * cache_memory:
                     break
-                mem = cleanupFun()
-                logger.debug(f"Cleaned up {info} ({Memory.format(mem)})")
+                mem = entry.cleanupFun()
+                policy.evicted(entry, priority)
+                logger.debug(f"Cleaned up {entry.info} ({Memory.format(mem)})")
                 total -= mem
+                evicted += 1
+                with self._statistics_lock:
+                    self._statistics["evictions"] += 1
+                    self._statistics["evicted_bytes"] += mem
+
+            with self._statistics_lock:
+                self._last_total = total
 
             # Remove references to cache entries before triggering garbage collection.
-            cleanupFun = None
+            entry = None
+            ordered = None
             cache_entries = None
-            gc.collect()
+            if evicted:
+                gc.collect()
 
             msg = "Done cleaning up, cache memory usage is now at {}".format(Memory.format(total))
             if cache_memory > 0:
@@ -239,7 +405,8 @@ class _CacheMemoryManager(threading.Thread):
         sleep for _refresh_interval seconds or until woken up
         """
         with self._condition:
-            self._condition.wait(self._refresh_interval)
+            if not self._cleanup_requested:
+                self._condition.wait(self._refresh_interval)
 
     def stop(self):
         """
@@ -258,6 +425,15 @@ class _CacheMemoryManager(threading.Thread):
             self._refresh_interval = t
             self._condition.notifyAll()
 
+    def setEvictionPolicy(self, name):
+        """
+        select the order in which cache entries are freed (see `eviction_policies`)
+        """
+        if name not in eviction_policies:
+            raise ValueError(f"Unknown cache eviction policy {name!r}, choose from {sorted(eviction_policies)}")
+        with self._disable_lock:
+            self._eviction_policy = eviction_policies[name]()
+
     def disable(self):
         """
         disable all memory management
@@ -300,3 +476,15 @@ def addFirstClassCache(cache):
 
 def setRefreshInterval(seconds):
     _cache_memory_manager.setRefreshInterval(seconds)
+
+
+def setEvictionPolicy(name):
+    _cache_memory_manager.setEvictionPolicy(name)
+
+
+def notifyCacheAdmission(nbytes):
+    _cache_memory_manager.notifyCacheAdmission(nbytes)
+
+
+def getStatistics():
+    return _cache_memory_manager.getStatistics()
@@ -0,0 +1,278 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Second cache tier on local disk.
+
+Blocks that the cache memory manager evicts from an array cache are written to a scratch
+directory instead of being dropped, and read back when they are requested again.
+The tier is disabled by default; enable it with::
+
+    from lazyflow.operators import cacheSpillStore
+    cacheSpillStore.configure("/scratch/ilastik", max_bytes=50 * 1024 ** 3)
+
+Blocks are stored one file per block. Uncompressed blocks are written as .npy files and
+memory-mapped when read back. Compressed blocks (for caches with compression enabled) are
+deflated with zlib at its fastest level. The tier has its own LRU: when ``max_bytes`` is
+exceeded, the least recently used files are deleted.
+"""
+import atexit
+import collections
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+import zlib
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+
+class _SpillStore(object):
+    """
+    LRU-bounded store of numpy arrays in files of a scratch directory
+
+    Entries are keyed by (owner, key), where owner is an id obtained from `newOwner()`
+    (one per cache) and key is any hashable block id.
+
+    Owners are told about entries that the store drops by itself (LRU eviction or reconfiguration),
+    so that they can keep their own index of the spilled blocks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._directory = None
+        self._max_bytes = 0
+        self._used_bytes = 0
+        # (owner, key) -> (path, nbytes, shape, dtype, compressed), in LRU order
+        self._entries = collections.OrderedDict()
+        # owner -> keys of its entries
+        self._owner_keys = collections.defaultdict(set)
+        # owner -> weak reference to its eviction callback
+        self._evicted_callbacks = {}
+        self._owner_ids = itertools.count()
+        self._file_ids = itertools.count()
+        atexit.register(self.configure, None)
+
+    def configure(self, directory, max_bytes=0):
+        """
+        Enable the tier with at most max_bytes in a fresh subdirectory of directory.
+        With directory None or max_bytes 0, the tier is disabled and all files are deleted.
+        """
+        with self._lock:
+            old_directory = self._directory
+            dropped = list(self._entries)
+            self._entries.clear()
+            self._owner_keys.clear()
+            self._used_bytes = 0
+            self._directory = None
+            self._max_bytes = max_bytes
+            if directory is not None and max_bytes > 0:
+                os.makedirs(directory, exist_ok=True)
+                self._directory = tempfile.mkdtemp(prefix="lazyflow-spill-", dir=directory)
+                logger.info(f"Spilling evicted cache blocks to {self._directory}")
+        if old_directory is not None:
+            shutil.rmtree(old_directory, ignore_errors=True)
+        self._notify_evicted(dropped)
+
+    @property
+    def enabled(self):
+        return self._directory is not None
+
+    def usedBytes(self):
+        return self._used_bytes
+
+    def newOwner(self, evicted=None):
+        """
+        evicted: bound method, called with the key of each entry of this owner that the store drops
+            by itself. It is only weakly referenced, and called without holding the store lock.
+        """
+        owner = next(self._owner_ids)
+        if evicted is not None:
+            with self._lock:
+                self._evicted_callbacks[owner] = weakref.WeakMethod(evicted)
+        return owner
+
+    def releaseOwner(self, owner):
+        """
+        Discard all entries of owner, and forget its eviction callback.
+        """
+        with self._lock:
+            self._discard_all_nolock(owner)
+            self._evicted_callbacks.pop(owner, None)
+
+    def put(self, owner, key, data, compress=False):
+        """
+        Store a copy of the array data. Returns False if the data cannot be spilled.
+        """
+        directory = self._directory
+        if directory is None or not isinstance(data, numpy.ndarray) or isinstance(data, numpy.ma.MaskedArray):
+            return False
+        if data.dtype == object or data.nbytes == 0 or data.nbytes > self._max_bytes:
+            return False
+
+        data = numpy.ascontiguousarray(data)
+        path = os.path.join(directory, f"{owner}-{next(self._file_ids)}")
+        try:
+            if compress:
+                with open(path, "wb") as f:
+                    f.write(zlib.compress(data.data, 1))
+            else:
+                numpy.save(path, data, allow_pickle=False)
+                path += ".npy"
+            nbytes = os.path.getsize(path)
+        except OSError:
+            logger.warning(f"Could not spill cache block to {path}", exc_info=True)
+            self._remove_file(path)
+            return False
+
+        evicted = []
+        with self._lock:
+            if self._directory != directory:
+                # Reconfigured in the meantime
+                self._remove_file(path)
+                return False
+            self._discard_nolock((owner, key))
+            self._entries[(owner, key)] = (path, nbytes, data.shape, data.dtype, compress)
+            self._owner_keys[owner].add(key)
+            self._used_bytes += nbytes
+            while self._used_bytes > self._max_bytes:
+                entry_key = next(iter(self._entries))
+                self._discard_nolock(entry_key)
+                evicted.append(entry_key)
+        self._notify_evicted(evicted)
+        return True
+
+    def get(self, owner, key):
+        """
+        Return the stored array (read-only, possibly memory-mapped), or None if it is not stored.
+        """
+        with self._lock:
+            entry = self._entries.get((owner, key))
+            if entry is None:
+                return None
+            self._entries.move_to_end((owner, key))
+        path, _nbytes, shape, dtype, compressed = entry
+        try:
+            if compressed:
+                with open(path, "rb") as f:
+                    data = numpy.frombuffer(zlib.decompress(f.read()), dtype=dtype).reshape(shape)
+            else:
+                data = numpy.load(path, mmap_mode="r")
+        except OSError:
+            # Deleted by a concurrent discard
+            return None
+        return data
+
+    def keys(self, owner):
+        with self._lock:
+            return list(self._owner_keys.get(owner, ()))
+
+    def discard(self, owner, key):
+        with self._lock:
+            self._discard_nolock((owner, key))
+
+    def discardAll(self, owner):
+        with self._lock:
+            self._discard_all_nolock(owner)
+
+    def _discard_all_nolock(self, owner):
+        for key in list(self._owner_keys.get(owner, ())):
+            self._discard_nolock((owner, key))
+
+    def _discard_nolock(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._used_bytes -= entry[1]
+            self._remove_file(entry[0])
+            owner, key = entry_key
+            owner_keys = self._owner_keys[owner]
+            owner_keys.discard(key)
+            if not owner_keys:
+                del self._owner_keys[owner]
+
+    def _notify_evicted(self, entry_keys):
+        callbacks = []
+        with self._lock:
+            for owner, key in entry_keys:
+                callback_ref = self._evicted_callbacks.get(owner)
+                callback = callback_ref and callback_ref()
+                if callback is not None:
+                    callbacks.append((callback, key))
+                elif callback_ref is not None:
+                    # The owner is gone
+                    del self._evicted_callbacks[owner]
+        for callback, key in callbacks:
+            callback(key)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_spill_store = _SpillStore()
+
+
+def configure(directory, max_bytes=0):
+    _spill_store.configure(directory, max_bytes)
+
+
+def usedBytes():
+    return _spill_store.usedBytes()
+
+
+def enabled():
+    return _spill_store.enabled
+
+
+def newOwner(evicted=None):
+    return _spill_store.newOwner(evicted)
+
+
+def releaseOwner(owner):
+    _spill_store.releaseOwner(owner)
+
+
+def put(owner, key, data, compress=False):
+    return _spill_store.put(owner, key, data, compress)
+
+
+def get(owner, key):
+    return _spill_store.get(owner, key)
+
+
+def keys(owner):
+    return _spill_store.keys(owner)
+
+
+def discard(owner, key):
+    _spill_store.discard(owner, key)
+
+
+def discardAll(owner):
+    _spill_store.discardAll(owner)
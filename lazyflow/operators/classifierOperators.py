@@ -313,6 +313,13 @@ class OpTrainClassifierFromFeatureVectors(Operator):
         super(OpTrainClassifierFromFeatureVectors, self).__init__(*args, **kwargs)
         self.trainingCompleteSignal = OrderedSignal()
 
+        # Passed to factories that can update a classifier instead of training from scratch,
+        # along with the rows that were appended to the training matrix since it was trained.
+        # Only if the factory did not change since (a copy, factories can be modified in place).
+        self._previous_classifier = None
+        self._previous_history = None
+        self._previous_factory = None
+
         # TODO: Progress...
         # self.progressSignal = OrderedSignal()
 
@@ -344,7 +351,30 @@ class OpTrainClassifierFromFeatureVectors(Operator):
         )
 
         logger.debug("Training new classifier: {}".format(classifier_factory.description))
-        classifier = classifier_factory.create_and_train(featMatrix, labelsMatrix[:, 0], channel_names)
+        # The previous classifier can only be updated if rows were just appended to the training matrix
+        # (see OpFeatureMatrixCache). If labels or features changed in any other way, it was trained on stale data.
+        history = getattr(labels_and_features, "history", None)
+        appended_rows = None
+        if history is not None:
+            appended_rows = history.appended_rows(self._previous_history)
+
+        if (
+            getattr(classifier_factory, "supports_incremental_training", False)
+            and appended_rows is not None
+            and classifier_factory == self._previous_factory
+        ):
+            classifier = classifier_factory.create_and_train(
+                featMatrix,
+                labelsMatrix[:, 0],
+                channel_names,
+                previous_classifier=self._previous_classifier,
+                appended_rows=appended_rows,
+            )
+        else:
+            classifier = classifier_factory.create_and_train(featMatrix, labelsMatrix[:, 0], channel_names)
+        self._previous_classifier = classifier
+        self._previous_history = history
+        self._previous_factory = copy.copy(classifier_factory)
         result[0] = classifier
         if classifier is not None:
             assert issubclass(type(classifier), LazyflowVectorwiseClassifierABC), (
@@ -356,6 +386,10 @@ class OpTrainClassifierFromFeatureVectors(Operator):
         return result
 
     def propagateDirty(self, slot, subindex, roi):
+        if slot is self.ClassifierFactory:
+            self._previous_classifier = None
+            self._previous_history = None
+            self._previous_factory = None
         self.Classifier.setDirty()
 
 
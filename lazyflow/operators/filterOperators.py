@@ -119,6 +119,9 @@ class OpBaseFilter(Operator):
             *self.Input.meta.shape[2:],
         )
 
+        # Number of extra pixels that are computed around every requested (spatial) roi
+        self.Output.meta.request_halo = int(numpy.ceil(self.max_sigma * self.window_size_smoother))
+
         # The output data range is not necessarily the same as the input data range.
         if "drange" in self.Output.meta:
             del self.Output.meta["drange"]
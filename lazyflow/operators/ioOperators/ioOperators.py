@@ -26,9 +26,17 @@ import os
 import math
 import logging
 import glob
+import threading
+import zlib
 import h5py
 import z5py
 from collections import OrderedDict
+from functools import partial
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 
 logger = logging.getLogger(__name__)
 traceLogger = logging.getLogger("TRACE." + __name__)
@@ -39,7 +47,7 @@ import numpy
 import vigra
 
 from lazyflow.graph import OrderedSignal, Operator, OutputSlot, InputSlot
-from lazyflow.roi import roiToSlice, roiFromShape, determineBlockShape
+from lazyflow.roi import roiToSlice, roiFromShape, determineBlockShape, getIntersectingBlocks
 from lazyflow.utility.bigRequestStreamer import BigRequestStreamer
 
 
@@ -538,10 +546,16 @@ class OpH5N5WriterBigDataset(Operator):
     Image = InputSlot()
     # h5py uses single-threaded gzip comression, which really slows down export.
     CompressionEnabled = InputSlot(value=False)
+    # One of COMPRESSORS.  Overrides CompressionEnabled if set.
+    Compression = InputSlot(optional=True)
+    # If True, blocks are aligned to the chunk shape, compressed on the worker threads and written out of order.
+    ParallelWrite = InputSlot(value=False)
     BatchSize = InputSlot(optional=True)
 
     WriteImage = OutputSlot()
 
+    COMPRESSORS = ("raw", "gzip", "blosc", "zstd")
+
     loggingName = __name__ + ".OpH5N5WriterBigDataset"
     logger = logging.getLogger(loggingName)
     traceLogger = logging.getLogger("TRACE." + loggingName)
@@ -553,6 +567,8 @@ class OpH5N5WriterBigDataset(Operator):
         Image=None,
         BatchSize: int = None,
         CompressionEnabled: bool = None,
+        Compression: str = None,
+        ParallelWrite: bool = None,
         *args,
         **kwargs,
     ):
@@ -561,12 +577,16 @@ class OpH5N5WriterBigDataset(Operator):
         self.progressSignal = OrderedSignal()
         self.d = None
         self.f = None
+        self._chunk_encoder = None
+        self._write_lock = threading.Lock()
 
         self.h5N5File.setOrConnectIfAvailable(h5N5File)
         self.h5N5Path.setOrConnectIfAvailable(h5N5Path)
         self.Image.setOrConnectIfAvailable(Image)
         self.BatchSize.setOrConnectIfAvailable(BatchSize)
         self.CompressionEnabled.setOrConnectIfAvailable(CompressionEnabled)
+        self.Compression.setOrConnectIfAvailable(Compression)
+        self.ParallelWrite.setOrConnectIfAvailable(ParallelWrite)
 
     def cleanUp(self):
         super().cleanUp()
@@ -619,15 +639,7 @@ class OpH5N5WriterBigDataset(Operator):
         if datasetName in list(g.keys()):
             del g[datasetName]
         kwargs = {"shape": dataShape, "dtype": dtype, "chunks": self.chunkShape}
-        if self.CompressionEnabled.value:
-            kwargs["compression"] = "gzip"  # <-- Would be nice to use lzf compression here, but that is h5py-specific.
-            if isinstance(self.f, h5py.File):
-                kwargs["compression_opts"] = 1  # <-- Optimize for speed, not disk space.
-            else:  # z5py has uses different names here
-                kwargs["level"] = 1  # <-- Optimize for speed, not disk space.
-        else:
-            if isinstance(self.f, z5py.N5File):  # n5 uses gzip level 5 as default compression.
-                kwargs["compression"] = "raw"
+        kwargs.update(self._compression_kwargs())
 
         self.d = g.create_dataset(datasetName, **kwargs)
 
@@ -652,8 +664,21 @@ class OpH5N5WriterBigDataset(Operator):
         batch_size = None
         if self.BatchSize.ready():
             batch_size = self.BatchSize.value
-        requester = BigRequestStreamer(self.Image, roiFromShape(self.Image.meta.shape), batchSize=batch_size)
-        requester.resultSignal.subscribe(handle_block_result)
+
+        if self.ParallelWrite.value:
+            # Requests cover whole chunks, so the result handlers never touch the same chunk
+            # and may run in parallel on the worker threads.
+            requester = BigRequestStreamer(
+                self.Image,
+                roiFromShape(self.Image.meta.shape),
+                batchSize=batch_size,
+                allowParallelResults=True,
+                chunkShape=self.chunkShape,
+            )
+            requester.resultSignal.subscribe(self._write_chunks)
+        else:
+            requester = BigRequestStreamer(self.Image, roiFromShape(self.Image.meta.shape), batchSize=batch_size)
+            requester.resultSignal.subscribe(handle_block_result)
         requester.progressSignal.subscribe(self.progressSignal)
         requester.execute()
 
@@ -666,6 +691,75 @@ class OpH5N5WriterBigDataset(Operator):
 
         self.progressSignal(100)
 
+    def _compression_kwargs(self):
+        """
+        Translate the selected compressor into create_dataset() keyword arguments for the backend,
+        and choose the encoder used for direct chunk writes in parallel mode (h5 only).
+        """
+        if self.Compression.ready():
+            compression = self.Compression.value
+        else:
+            compression = "gzip" if self.CompressionEnabled.value else "raw"
+
+        if compression not in self.COMPRESSORS:
+            raise ValueError(f"Unknown compression {compression!r}. Choose one of {self.COMPRESSORS}.")
+
+        self._chunk_encoder = None
+        if isinstance(self.f, h5py.Group):
+            if compression == "raw":
+                self._chunk_encoder = numpy.ndarray.tobytes
+                return {}
+            if compression == "gzip":
+                # The hdf5 deflate filter stores plain zlib streams, so chunks can be compressed outside of hdf5.
+                self._chunk_encoder = partial(zlib.compress, level=1)
+                # Would be nice to use lzf compression here, but that is h5py-specific.
+                return {"compression": "gzip", "compression_opts": 1}  # <-- Optimize for speed, not disk space.
+            if hdf5plugin is None:
+                raise ValueError(f"Compression {compression!r} for hdf5 requires the hdf5plugin package.")
+            # No encoder available outside of hdf5: chunks are still aligned, but written (and compressed) serially.
+            plugin = hdf5plugin.Blosc() if compression == "blosc" else hdf5plugin.Zstd()
+            return dict(plugin)
+
+        available = getattr(z5py.Dataset, "compressors_n5", None)
+        if available is not None and compression not in available:
+            raise ValueError(f"Compression {compression!r} is not supported by this z5py build for n5.")
+        # Always pass the compressor explicitly, n5 uses gzip level 5 as default compression.
+        kwargs = {"compression": compression}
+        if compression == "gzip":
+            kwargs["level"] = 1  # <-- Optimize for speed, not disk space.
+        return kwargs
+
+    def _write_chunks(self, roi, data):
+        """
+        Write a chunk-aligned block.  Called from the worker threads, possibly out of order.
+        """
+        data = data.view(numpy.ndarray)
+        if not isinstance(self.d, h5py.Dataset):
+            # z5py compresses and writes each chunk to its own file without holding the GIL,
+            # and chunk-aligned blocks never share a chunk.
+            self.d[roiToSlice(*roi)] = numpy.require(data, requirements="C")
+            return
+
+        if self._chunk_encoder is None:
+            with self._write_lock:
+                self.d[roiToSlice(*roi)] = data
+            return
+
+        # h5py serializes all calls into hdf5, so compress here and only hand finished chunks to hdf5.
+        chunk_shape = numpy.array(self.chunkShape)
+        for chunk_start in getIntersectingBlocks(chunk_shape, roi):
+            chunk_stop = numpy.minimum(chunk_start + chunk_shape, self.d.shape)
+            block_data = data[roiToSlice(chunk_start - roi[0], chunk_stop - roi[0])]
+            if numpy.array_equal(chunk_stop - chunk_start, chunk_shape):
+                chunk = numpy.ascontiguousarray(block_data, dtype=self.d.dtype)
+            else:
+                # hdf5 always stores complete chunks, even at the border of the dataset.
+                chunk = numpy.zeros(self.chunkShape, dtype=self.d.dtype)
+                chunk[roiToSlice(numpy.zeros_like(chunk_start), chunk_stop - chunk_start)] = block_data
+            payload = self._chunk_encoder(chunk)
+            with self._write_lock:
+                self.d.id.write_direct_chunk(tuple(int(x) for x in chunk_start), payload)
+
     def propagateDirty(self, slot, subindex, roi):
         # The output from this operator isn't generally connected to other operators.
         # If someone is using it that way, we'll assume that the user wants to know that
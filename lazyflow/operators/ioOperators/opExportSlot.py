@@ -77,6 +77,11 @@ class OpExportSlot(Operator):
         optional=True
     )  # Add an offset to the roi coordinates in the export path (useful if Input is a subregion of a larger dataset)
 
+    # hdf5/n5 only: one of OpH5N5WriterBigDataset.COMPRESSORS.  Overrides the "compressed" formats if set.
+    Compression = InputSlot(optional=True)
+    # hdf5/n5 only: compress chunks on the worker threads and write them out of order.
+    ParallelWrite = InputSlot(value=False)
+
     ExportPath = OutputSlot()
     FormatSelectionErrorMsg = OutputSlot()
 
@@ -276,6 +281,9 @@ class OpExportSlot(Operator):
                 opH5N5Writer = OpH5N5WriterBigDataset(parent=self)
                 try:
                     opH5N5Writer.CompressionEnabled.setValue(compress)
+                    if self.Compression.ready():
+                        opH5N5Writer.Compression.setValue(self.Compression.value)
+                    opH5N5Writer.ParallelWrite.setValue(self.ParallelWrite.value)
                     opH5N5Writer.h5N5File.setValue(h5N5File)
                     opH5N5Writer.h5N5Path.setValue(export_components.internalPath)
                     opH5N5Writer.Image.connect(self.Input)
@@ -72,6 +72,8 @@ class OpFormattedDataExport(Operator):
     )  # A format string allowing {roi}, {x_start}, {x_stop}, etc.
     OutputInternalPath = InputSlot(value="exported_data")
     OutputFormat = InputSlot(value="hdf5")
+    Compression = InputSlot(optional=True)  # See OpExportSlot
+    ParallelWrite = InputSlot(value=False)
 
     ConvertedImage = OutputSlot()  # Not yet re-ordered
     ImageToExport = OutputSlot()  # Preview of the pre-processed image that will be exported
@@ -120,6 +122,8 @@ class OpFormattedDataExport(Operator):
         self._opExportSlot = OpExportSlot(parent=self)
         self._opExportSlot.Input.connect(opReorderAxes.Output)
         self._opExportSlot.OutputFormat.connect(self.OutputFormat)
+        self._opExportSlot.Compression.connect(self.Compression)
+        self._opExportSlot.ParallelWrite.connect(self.ParallelWrite)
 
         self.ExportPath.connect(self._opExportSlot.ExportPath)
         self.FormatSelectionErrorMsg.connect(self._opExportSlot.FormatSelectionErrorMsg)
@@ -49,25 +49,44 @@ class OpRESTfulPrecomputedChunkedVolumeReaderNoCache(Operator):
     # There is also the scale to configure
     Scale = InputSlot(optional=True)
 
+    # Directory in which downloaded chunks are kept across sessions (optional)
+    ChunkCacheDir = InputSlot(optional=True)
+
     # Available scales of the data
     AvailableScales = OutputSlot()
     # The data itself
     Output = OutputSlot()
 
+    # Maximum number of concurrent chunk downloads
+    N_THREADS = 8
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._axes = None
         self._volume_object = None
 
+    def cleanUp(self):
+        if self._volume_object is not None:
+            self._volume_object.close()
+            self._volume_object = None
+        super().cleanUp()
+
     def setupOutputs(self):
+        chunk_cache_dir = self.ChunkCacheDir.value if self.ChunkCacheDir.ready() else None
         # Create a RESTfulPrecomputedChunkedVolume object to handle
         if self._volume_object is not None:
             # check if the volume url has changed, to avoid downloading
             # info twice (i.e. setting up the volume twice)
-            if self._volume_object.volume_url == self.BaseUrl.value:
+            if (
+                self._volume_object.volume_url == self.BaseUrl.value
+                and self._volume_object.chunk_cache_dir == chunk_cache_dir
+            ):
                 return
+            self._volume_object.close()
 
-        self._volume_object = RESTfulPrecomputedChunkedVolume(self.BaseUrl.value)
+        self._volume_object = RESTfulPrecomputedChunkedVolume(
+            self.BaseUrl.value, n_threads=self.N_THREADS, chunk_cache_dir=chunk_cache_dir
+        )
 
         self._axes = self._volume_object.axes
 
@@ -140,19 +159,7 @@ class OpRESTfulPrecomputedChunkedVolumeReaderNoCache(Operator):
         scale = self.Scale.value
         assert len(roi) == 2
         assert all(len(x) == len(self._volume_object.get_shape(scale)) for x in roi)
-        block_shape = self._volume_object.get_block_shape(scale)
-        image_shape = self._volume_object.get_shape(scale)
-        array_of_blocks, block_offsets, subimage_roi, subimage_shape = self.get_intersecting_blocks(
-            blockshape=block_shape, roi=roi, shape=image_shape
-        )
-        subimage = numpy.zeros((subimage_shape))
-        assert array_of_blocks.shape[-1] == 4
-
-        for block, offset in zip(array_of_blocks, block_offsets):
-            slicing = lazyflow.roi.roiToSlice(offset, offset + block_shape)
-            subimage[slicing] = self._volume_object.download_block(block, scale)
-        slicing = lazyflow.roi.roiToSlice(subimage_roi[0], subimage_roi[1])
-        result[...] = subimage[slicing]
+        self._volume_object.read(roi, result, scale)
         return result
 
     def propagateDirty(self, slot, subindex, roi):
@@ -167,6 +174,9 @@ class OpRESTfulPrecomputedChunkedVolumeReader(Operator):
     # There is also the scale to configure
     Scale = InputSlot(optional=True)
 
+    # Directory in which downloaded chunks are kept across sessions (optional)
+    ChunkCacheDir = InputSlot(optional=True)
+
     # Available scales of the data
     AvailableScales = OutputSlot()
     # The data itself
@@ -176,6 +186,7 @@ class OpRESTfulPrecomputedChunkedVolumeReader(Operator):
         super().__init__(*args, **kwargs)
         self.RESTfulReader = OpRESTfulPrecomputedChunkedVolumeReaderNoCache(parent=self)
         self.RESTfulReader.BaseUrl.connect(self.BaseUrl)
+        self.RESTfulReader.ChunkCacheDir.connect(self.ChunkCacheDir)
         self.AvailableScales.connect(self.RESTfulReader.AvailableScales)
         self.RESTfulReader.Scale.backpropagate_values = True
         self.RESTfulReader.Scale.connect(self.Scale)
@@ -1,5 +1,9 @@
 from __future__ import print_function
 from builtins import map
+import collections
+import itertools
+import threading
+
 import numpy
 
 # Note: tifffile can also be imported from skimage.external.tifffile.tifffile_local,
@@ -17,21 +21,121 @@ import tifffile
 
 import vigra
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.roi import roiToSlice
-from lazyflow.request import RequestLock
+from lazyflow.roi import roiToSlice, getIntersectingBlocks
 from lazyflow.utility.helpers import get_default_axisordering
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# TIFF sequences can consist of thousands of files, each with its own reader.
+# Only the most recently used file handles are kept open, the others are reopened when needed.
+MAX_OPEN_FILES = 64
+
+_open_filehandles = collections.OrderedDict()
+# Also serializes all reads, since a file handle can't be shared by several threads
+_filehandle_lock = threading.Lock()
+
+
+def _use_filehandle_nolock(filehandle):
+    if filehandle.closed:
+        filehandle.open()
+    _open_filehandles[id(filehandle)] = filehandle
+    _open_filehandles.move_to_end(id(filehandle))
+    while len(_open_filehandles) > MAX_OPEN_FILES:
+        _id, lru_filehandle = _open_filehandles.popitem(last=False)
+        lru_filehandle.close()
+
+
+def _register_filehandle(filehandle):
+    with _filehandle_lock:
+        _use_filehandle_nolock(filehandle)
+
+
+def _read_bytes(filehandle, offset, bytecount):
+    """Read from a tifffile.FileHandle, (re)opening it if necessary."""
+    with _filehandle_lock:
+        _use_filehandle_nolock(filehandle)
+        filehandle.seek(offset)
+        return filehandle.read(bytecount)
+
+
+def _forget_filehandle(filehandle):
+    with _filehandle_lock:
+        _open_filehandles.pop(id(filehandle), None)
+
+
+# Maximum size of the decoded tiles (or pages) that are kept in memory, for all readers together
+TILE_CACHE_BYTES = 64 * 1024 ** 2
+
+
+class _TileCache(object):
+    """
+    LRU cache of decoded tiles (or pages), shared by all readers.
+
+    Entries are keyed by (owner, key), where owner is obtained from `newOwner()` for each opened file.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._used_bytes = 0
+        self._owner_ids = itertools.count()
+
+    def newOwner(self):
+        return next(self._owner_ids)
+
+    def usedBytes(self):
+        return self._used_bytes
+
+    def get(self, owner, key, read, *args):
+        """Return a tile from the cache, or read and add it."""
+        with self._lock:
+            data = self._entries.get((owner, key))
+            if data is not None:
+                self._entries.move_to_end((owner, key))
+                return data
+
+        data = read(*args)
+        with self._lock:
+            if (owner, key) not in self._entries:
+                self._entries[(owner, key)] = data
+                self._used_bytes += data.nbytes
+            # Keep at least the newest entry, even if it exceeds the budget
+            while self._used_bytes > self.max_bytes and len(self._entries) > 1:
+                _key, evicted = self._entries.popitem(last=False)
+                self._used_bytes -= evicted.nbytes
+        return data
+
+    def discardAll(self, owner):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == owner]:
+                self._used_bytes -= self._entries.pop(entry_key).nbytes
+
+
+_tile_cache = _TileCache(TILE_CACHE_BYTES)
+
+
+# Raised by tifffile (or the imagecodecs functions it calls) when it can't decode a tile:
+# unsupported or unknown compression (ValueError, KeyError, NotImplementedError), codec failures (RuntimeError)
+_TIFFFILE_DECODE_ERRORS = (ValueError, KeyError, NotImplementedError, RuntimeError)
+
+
+class _SegmentDecodeError(Exception):
+    """tifffile could not decode a tile (or strip) of the file."""
+
 
 class OpTiffReader(Operator):
     """
     Reads TIFF files as an ND array. We use two different libraries:
 
     - To read the image metadata (determine axis order), we use tifffile.py (by Christoph Gohlke)
-    - To actually read the data, we use vigra (which supports more compression types, e.g. JPEG)
+    - To actually read the data, we let tifffile decode only the tiles (or strips) of a page that
+      intersect the requested roi. The file is parsed only once and its handle is kept open.
+      Recently decoded tiles are kept in a small LRU cache, shared by all readers (see TILE_CACHE_BYTES).
+      If tifffile can't decode the file (e.g. JPEG compression without imagecodecs), we fall back to
+      reading whole pages with vigra (which supports more compression types).
 
     Note: This operator intentionally ignores any colormap
           information and uses only the raw stored pixel values.
@@ -49,98 +153,152 @@ class OpTiffReader(Operator):
         super(OpTiffReader, self).__init__(*args, **kwargs)
         self._filepath = None
         self._page_shape = None
+        self._tiff_file = None
+        self._pages = None
+        # Owner of the tiles of the open file in the tile cache
+        self._tile_cache_owner = None
+
+    def cleanUp(self):
+        self._close()
+        super(OpTiffReader, self).cleanUp()
+
+    def _close(self):
+        if self._tiff_file is not None:
+            _forget_filehandle(self._tiff_file.filehandle)
+            self._tiff_file.close()
+        self._tiff_file = None
+        self._pages = None
+        self._filepath = None
+        if self._tile_cache_owner is not None:
+            _tile_cache.discardAll(self._tile_cache_owner)
+        self._tile_cache_owner = None
 
     def setupOutputs(self):
-        self._filepath = self.Filepath.value
-        with tifffile.TiffFile(self._filepath) as tiff_file:
-            series = tiff_file.series[0]
-            if len(tiff_file.series) > 1:
-                raise RuntimeError(
-                    "Don't know how to read TIFF files with more than one image series.\n"
-                    "(Your image has {} series".format(len(tiff_file.series))
-                )
+        filepath = self.Filepath.value
+        if filepath != self._filepath or self._tiff_file is None:
+            self._close()
+            tiff_file = tifffile.TiffFile(filepath)
+            try:
+                self._parse(tiff_file)
+            except:
+                tiff_file.close()
+                raise
+            self._tiff_file = tiff_file
+            self._filepath = filepath
+            self._tile_cache_owner = _tile_cache.newOwner()
+            _register_filehandle(tiff_file.filehandle)
+
+        self.Output.meta.shape = self._shape
+        self.Output.meta.axistags = vigra.defaultAxistags(str(self._axes))
+        self.Output.meta.dtype = numpy.dtype(self._dtype_code).type
+        self.Output.meta.ideal_blockshape = ((1,) * len(self._non_page_shape)) + self._ideal_page_blockshape
+
+    def _parse(self, tiff_file):
+        """Read the image metadata and index the pages of the first series."""
+        series = tiff_file.series[0]
+        if len(tiff_file.series) > 1:
+            raise RuntimeError(
+                "Don't know how to read TIFF files with more than one image series.\n"
+                "(Your image has {} series".format(len(tiff_file.series))
+            )
 
-            axes = series.axes
-            shape = series.shape
-            pages = series.pages
-            first_page = pages[0]
-
-            dtype_code = first_page.dtype
-            if first_page.is_palette:
-                # For now, we don't support colormaps.
-                # Drop the (last) channel axis
-                # (Yes, there can be more than one :-/)
-                last_C_pos = axes.rfind("C")
-                assert axes[last_C_pos] == "C"
-                axes = axes[:last_C_pos] + axes[last_C_pos + 1 :]
-                shape = shape[:last_C_pos] + shape[last_C_pos + 1 :]
-
-                # first_page.dtype refers to the type AFTER colormapping.
-                # We want the original type.
-                key = (first_page.sample_format, first_page.bits_per_sample)
-                dtype_code = self._dtype = tifffile.TIFF_SAMPLE_DTYPES.get(key, None)
-
-            # From the tifffile.TiffPage code:
-            # -----
-            # The internal, normalized '_shape' attribute is 6 dimensional:
-            #
-            # 0. number planes  (stk)
-            # 1. planar samples_per_pixel
-            # 2. image_depth Z  (sgi)
-            # 3. image_length Y
-            # 4. image_width X
-            # 5. contig samples_per_pixel
-
-            (N, P, D, Y, X, S) = first_page._shape
-            assert N == 1, "Don't know how to handle any number of planes except 1 (per page)"
-            assert P == 1, "Don't know how to handle any number of planar samples per pixel except 1 (per page)"
-            assert D == 1, "Don't know how to handle any image depth except 1"
-
-            if S == 1:
-                self._page_shape = (Y, X)
-                self._page_axes = "yx"
-            else:
-                assert shape[-3:] == (Y, X, S)
-                self._page_shape = (Y, X, S)
-                self._page_axes = "yxc"
-                assert "C" not in axes, (
-                    "If channels are in separate pages, then each page can't have multiple channels itself.\n"
-                    "(Don't know how to weave multi-channel pages together.)"
-                )
+        axes = series.axes
+        shape = series.shape
+        pages = series.pages
+        first_page = pages[0]
+
+        dtype_code = first_page.dtype
+        if first_page.is_palette:
+            # For now, we don't support colormaps.
+            # Drop the (last) channel axis
+            # (Yes, there can be more than one :-/)
+            last_C_pos = axes.rfind("C")
+            assert axes[last_C_pos] == "C"
+            axes = axes[:last_C_pos] + axes[last_C_pos + 1 :]
+            shape = shape[:last_C_pos] + shape[last_C_pos + 1 :]
+
+            # first_page.dtype refers to the type AFTER colormapping.
+            # We want the original type.
+            key = (first_page.sample_format, first_page.bits_per_sample)
+            dtype_code = self._dtype = tifffile.TIFF_SAMPLE_DTYPES.get(key, None)
+
+        # From the tifffile.TiffPage code:
+        # -----
+        # The internal, normalized '_shape' attribute is 6 dimensional:
+        #
+        # 0. number planes  (stk)
+        # 1. planar samples_per_pixel
+        # 2. image_depth Z  (sgi)
+        # 3. image_length Y
+        # 4. image_width X
+        # 5. contig samples_per_pixel
+
+        (N, P, D, Y, X, S) = first_page._shape
+        assert N == 1, "Don't know how to handle any number of planes except 1 (per page)"
+        assert P == 1, "Don't know how to handle any number of planar samples per pixel except 1 (per page)"
+        assert D == 1, "Don't know how to handle any image depth except 1"
+
+        if S == 1:
+            self._page_shape = (Y, X)
+            self._page_axes = "yx"
+        else:
+            assert shape[-3:] == (Y, X, S)
+            self._page_shape = (Y, X, S)
+            self._page_axes = "yxc"
+            assert "C" not in axes, (
+                "If channels are in separate pages, then each page can't have multiple channels itself.\n"
+                "(Don't know how to weave multi-channel pages together.)"
+            )
 
-            self._non_page_shape = shape[: -len(self._page_shape)]
-            assert shape == self._non_page_shape + self._page_shape
-            assert self._non_page_shape or len(pages) == 1
+        self._non_page_shape = shape[: -len(self._page_shape)]
+        assert shape == self._non_page_shape + self._page_shape
+        assert self._non_page_shape or len(pages) == 1
 
-            axes = axes.lower().replace("s", "c")
+        axes = axes.lower().replace("s", "c")
+        if "i" in axes:
+            for k in "tzc":
+                if k not in axes:
+                    axes = axes.replace("i", k)
+                    break
             if "i" in axes:
-                for k in "tzc":
-                    if k not in axes:
-                        axes = axes.replace("i", k)
-                        break
-                if "i" in axes:
-                    raise RuntimeError(
-                        "Image has an 'I' axis, and I don't know what it represents. "
-                        "(Separate T,Z,C axes already exist.)"
-                    )
-
-            if "q" in axes:
-                # in case of unknown axes, assume default axis order TZYXC
-                if not all(elem == "q" for elem in axes):
-                    raise RuntimeError("Image has SOME unknown ('Q') axes, which is currently not supported. ")
-                logger.warning("Unknown axistags detected - assuming default axis order.")
-                axes = get_default_axisordering(shape)
-
-            self.Output.meta.shape = shape
-            self.Output.meta.axistags = vigra.defaultAxistags(str(axes))
-            self.Output.meta.dtype = numpy.dtype(dtype_code).type
-            self.Output.meta.ideal_blockshape = ((1,) * len(self._non_page_shape)) + self._page_shape
+                raise RuntimeError(
+                    "Image has an 'I' axis, and I don't know what it represents. "
+                    "(Separate T,Z,C axes already exist.)"
+                )
 
-    def execute(self, slot, subindex, roi, result):
+        if "q" in axes:
+            # in case of unknown axes, assume default axis order TZYXC
+            if not all(elem == "q" for elem in axes):
+                raise RuntimeError("Image has SOME unknown ('Q') axes, which is currently not supported. ")
+            logger.warning("Unknown axistags detected - assuming default axis order.")
+            axes = get_default_axisordering(shape)
+
+        self._shape = shape
+        self._axes = axes
+        self._dtype_code = dtype_code
+
+        # Index all pages (i.e. read the whole IFD chain) once.
+        self._pages = list(pages)
+        self._segment_shape = self._get_segment_shape(first_page)
+        if self._segment_shape is None:
+            self._ideal_page_blockshape = self._page_shape
+        else:
+            self._ideal_page_blockshape = self._segment_shape + self._page_shape[2:]
+
+    def _get_segment_shape(self, page):
         """
-        Use vigra (not tifffile) to read the result.
-        This allows us to support JPEG-compressed TIFFs.
+        The (y, x) shape of the tiles (or strips) of the pages,
+        or None if tifffile can't decode them individually.
         """
+        if not all(hasattr(page, attr) for attr in ("decode", "dataoffsets", "databytecounts")):
+            # Old tifffile version
+            return None
+        Y, X = self._page_shape[:2]
+        if page.is_tiled:
+            return (page.tilelength, page.tilewidth)
+        return (min(page.rowsperstrip or Y, Y), X)
+
+    def execute(self, slot, subindex, roi, result):
         num_page_axes = len(self._page_shape)
         roi = numpy.array([roi.start, roi.stop])
         page_index_roi = roi[:, :-num_page_axes]
@@ -153,22 +311,83 @@ class OpTiffReader(Operator):
         for roi_page_ndindex in numpy.ndindex(*page_index_roi_shape):
             if self._non_page_shape:
                 tiff_page_ndindex = roi_page_ndindex + page_index_roi[0]
-                tiff_page_list_index = numpy.ravel_multi_index(tiff_page_ndindex, self._non_page_shape)
+                tiff_page_list_index = int(numpy.ravel_multi_index(tiff_page_ndindex, self._non_page_shape))
                 logger.debug("Reading page: {} = {}".format(tuple(tiff_page_ndindex), tiff_page_list_index))
-                page_data = vigra.impex.readImage(
-                    self._filepath, dtype="NATIVE", index=int(tiff_page_list_index), order="C"
-                )
             else:
                 # Only a single page
-                page_data = vigra.impex.readImage(self._filepath, dtype="NATIVE", index=0, order="C")
-
-            page_data = page_data.withAxes(self._page_axes)
-            assert page_data.shape == self._page_shape, "Unexpected page shape: {} vs {}".format(
-                page_data.shape, self._page_shape
-            )
+                tiff_page_list_index = 0
+
+            if self._segment_shape is not None:
+                try:
+                    self._read_from_segments(tiff_page_list_index, roi_within_page, result[roi_page_ndindex])
+                    continue
+                except _SegmentDecodeError:
+                    logger.warning(
+                        "Could not decode tiles of {}, reading whole pages instead".format(self._filepath),
+                        exc_info=True,
+                    )
+                    self._segment_shape = None
 
+            page_data = self._cached((tiff_page_list_index, None), self._read_page, tiff_page_list_index)
             result[roi_page_ndindex] = page_data[roiToSlice(*roi_within_page)]
 
+    def _read_page(self, page_index):
+        """
+        Use vigra (not tifffile) to read a whole page.
+        This allows us to support JPEG-compressed TIFFs.
+        """
+        page_data = vigra.impex.readImage(self._filepath, dtype="NATIVE", index=page_index, order="C")
+        page_data = page_data.withAxes(self._page_axes)
+        assert page_data.shape == self._page_shape, "Unexpected page shape: {} vs {}".format(
+            page_data.shape, self._page_shape
+        )
+        return page_data
+
+    def _read_from_segments(self, page_index, roi_within_page, result):
+        """Decode the tiles (or strips) of a page that intersect the roi, and copy the roi into result."""
+        start, stop = roi_within_page[:, :2]
+        channel_slicing = tuple(slice(*roi_within_page[:, 2:].ravel()) for _ in self._page_shape[2:])
+        segment_shape = numpy.array(self._segment_shape)
+        segments_per_row = -(-self._page_shape[1] // segment_shape[1])
+
+        for segment_start in getIntersectingBlocks(segment_shape, (start, stop)):
+            segment_index = int(
+                segment_start[0] // segment_shape[0] * segments_per_row + segment_start[1] // segment_shape[1]
+            )
+            segment = self._cached((page_index, segment_index), self._decode_segment, page_index, segment_index)
+
+            intersection_start = numpy.maximum(start, segment_start)
+            intersection_stop = numpy.minimum(stop, segment_start + segment_shape)
+            source = roiToSlice(intersection_start - segment_start, intersection_stop - segment_start)
+            destination = roiToSlice(intersection_start - start, intersection_stop - start)
+            result[destination] = segment[source + channel_slicing]
+
+    def _decode_segment(self, page_index, segment_index):
+        """Read and decode one tile (or strip), as a yx or yxc array."""
+        page = self._pages[page_index]
+        # Pages of newer tifffile versions may be TiffFrames, which are decoded by their keyframe
+        keyframe = getattr(page, "keyframe", None) or page
+
+        bytecount = page.databytecounts[segment_index]
+        if bytecount == 0:
+            # Empty tile
+            return numpy.zeros(tuple(self._segment_shape) + self._page_shape[2:], dtype=self._dtype_code)
+
+        data = _read_bytes(self._tiff_file.filehandle, page.dataoffsets[segment_index], bytecount)
+        try:
+            decoded = keyframe.decode(data, segment_index, jpegtables=getattr(keyframe, "jpegtables", None))[0]
+        except _TIFFFILE_DECODE_ERRORS as e:
+            raise _SegmentDecodeError("Tile {} of page {}: {}".format(segment_index, page_index, e)) from e
+        if decoded is None:
+            # Some tifffile versions return no data for unsupported compressions
+            raise _SegmentDecodeError("Tile {} of page {} could not be decoded".format(segment_index, page_index))
+        # The last strip of a page may have fewer rows
+        return numpy.asarray(decoded).reshape((-1, self._segment_shape[1]) + self._page_shape[2:])
+
+    def _cached(self, key, read, *args):
+        """Return a decoded tile (or page) from the shared LRU cache, or read and add it."""
+        return _tile_cache.get(self._tile_cache_owner, key, read, *args)
+
     def propagateDirty(self, slot, subindex, roi):
         if slot == self.Filepath:
             self.Output.setDirty(slice(None))
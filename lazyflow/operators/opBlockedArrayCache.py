@@ -123,6 +123,9 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     def getBlockAccessTimes(self):
         return self._opSimpleBlockedArrayCache.getBlockAccessTimes()
 
+    def getBlockCosts(self):
+        return self._opSimpleBlockedArrayCache.getBlockCosts()
+
     def freeMemory(self):
         return self._opSimpleBlockedArrayCache.freeMemory()
 
@@ -188,6 +188,17 @@ class ManagedBlockedCache(ManagedCache):
         """
         raise NotImplementedError("No default implementation for getBlockAccessTimes()")
 
+    def getBlockCosts(self):
+        """
+        get a list of block ids, the time (in seconds) it took to compute
+        each block and its size in bytes
+
+        Used by cost-aware eviction policies of the cache memory manager.
+        The default implementation reports no costs, which makes all
+        blocks equally cheap to recompute.
+        """
+        return []
+
     @abstractmethod
     def freeBlock(self, block_id):
         """
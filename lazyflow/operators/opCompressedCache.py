@@ -40,6 +40,7 @@ import h5py
 from lazyflow.request import Request, RequestPool, RequestLock
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.roi import TinyVector, getIntersectingBlocks, getBlockBounds, roiToSlice, getIntersection
+from lazyflow.operators import cacheMemoryManager
 from lazyflow.operators.opCache import ManagedBlockedCache
 from lazyflow.utility.chunkHelpers import chooseChunkShape
 
@@ -462,6 +463,7 @@ class OpUnmanagedCompressedCache(Operator):
                     with self._lock:
                         self._dirtyBlocks.remove(block_start)
                     updated_cache = True
+                    self._onBlockCached(block_start)
 
             if updated_cache:
                 # Now that the lock is released, signal that the cache was updated.
@@ -469,6 +471,12 @@ class OpUnmanagedCompressedCache(Operator):
                 self.OutputHdf5._sig_value_changed()
                 self.CleanBlocks._sig_value_changed()
 
+    def _onBlockCached(self, block_start):
+        """
+        Called after the block at block_start was (re)computed and stored.
+        """
+        pass
+
     def setInSlot(self, slot, subindex, roi, value):
         """
         Overridden from Operator
@@ -639,6 +647,14 @@ class OpCompressedCache(OpUnmanagedCompressedCache, ManagedBlockedCache):
         # Now that we're initialized, it's safe to register with the memory manager
         self.registerWithMemoryManager()
 
+    def _onBlockCached(self, block_start):
+        try:
+            mem = get_storage_size(self._cacheFiles[block_start]["data"])
+        except KeyError:
+            # block was freed in the meantime
+            return
+        cacheMemoryManager.notifyCacheAdmission(mem)
+
     def fractionOfUsedMemoryDirty(self):
         tot = 0.0
         dirty = 0.0
@@ -10,6 +10,7 @@ import numpy
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.request import RequestPool, RequestLock
 from lazyflow.utility import OrderedSignal
+from .opFeatureMatrixCache import FeatureMatrixHistory, TrainingMatrix
 
 
 class OpConcatenateFeatureMatrices(Operator):
@@ -125,7 +126,15 @@ class OpConcatenateFeatureMatrices(Operator):
         #  we have to unpack them from their single-element lists.
         subresult_list = list(itertools.chain(*subresults))
 
-        total_matrix = numpy.concatenate(subresult_list, axis=0)
+        if len(subresult_list) == 1:
+            # Nothing to concatenate: pass the (possibly shared) matrix through without copying it.
+            total_matrix = subresult_list[0]
+        else:
+            total_matrix = numpy.concatenate(subresult_list, axis=0)
+
+        # Keep track of the rows that are appended to each lane's matrix
+        history = FeatureMatrixHistory.concatenate([getattr(m, "history", None) for m in subresult_list])
+        total_matrix = TrainingMatrix.wrap(total_matrix, history)
         self.progressSignal(100.0)
         result[0] = total_matrix
 
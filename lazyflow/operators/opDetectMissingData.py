@@ -89,6 +89,12 @@ def SVC(*args, **kwargs):
 
 _defaultBinSize = 30
 
+# upper bound (in bytes) for the temporary arrays of _histogramIntersectionKernel
+_kernelMemoryBudget = 256 * 2 ** 20
+
+# upper bound (in bytes) for the gathered patches in extractHistograms
+_patchMemoryBudget = 64 * 2 ** 20
+
 
 ############################
 ############################
@@ -215,6 +221,7 @@ class OpDetectMissing(Operator):
 
         patchSize = self.PatchSize.value
         haloSize = self.HaloSize.value
+        nBins = self.NHistogramBins.value
 
         if patchSize is None or not patchSize > 0:
             raise ValueError("PatchSize must be a positive integer")
@@ -225,13 +232,11 @@ class OpDetectMissing(Operator):
 
         # walk over slices
         for z in range(maxZ):
-            patches, slices = _patchify(data[z, :, :], patchSize, haloSize)
-            hists = []
+            bins = _histogramBinIndices(data[z, :, :], nBins, self._inputRange)
+            patches, slices = _patchify(bins, patchSize, haloSize)
             # walk over patches
-            for patch in patches:
-                (hist, _) = np.histogram(patch, bins=self.NHistogramBins.value, range=self._inputRange, density=True)
-                hists.append(hist)
-            hists = np.vstack(hists)
+            counts = np.vstack([np.bincount(patch.ravel(), minlength=nBins + 1)[:nBins] for patch in patches])
+            hists = _normalizedHistograms(counts, self._inputRange)
 
             pred = self.predict(hists, method=self.DetectionMethod.value)
             for i, p in enumerate(pred):
@@ -644,16 +649,85 @@ def _patchify(data, patchSize, haloSize):
     return (patches, slices)
 
 
-def _histogramIntersectionKernel(X, Y):
+def _histogramIntersectionKernel(X, Y, memoryBudget=None):
     """
     implements the histogram intersection kernel in a fancy way
     (standard: k(x,y) = sum(min(x_i,y_i)) )
+
+    The kernel matrix is computed in tiles (in parallel), such that the
+    temporary arrays of all tiles together stay within memoryBudget bytes
+    (defaults to _kernelMemoryBudget).
     """
 
-    A = X.reshape((X.shape[0], 1, X.shape[1]))
-    B = Y.reshape((1,) + Y.shape)
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    if memoryBudget is None:
+        memoryBudget = _kernelMemoryBudget
+
+    dtype = np.result_type(X, Y)
+    nBins = X.shape[1]
+    K = np.zeros((X.shape[0], Y.shape[0]), dtype=dtype)
+    if K.size == 0:
+        return K
+
+    # a tile needs rows*cols*nBins temporary entries, each worker handles one tile at a time
+    nWorkers = max(1, Request.global_thread_pool.num_workers)
+    tileEntries = max(1, memoryBudget // (nWorkers * max(1, nBins) * dtype.itemsize))
+    cols = min(Y.shape[0], tileEntries)
+    rows = min(X.shape[0], max(1, tileEntries // cols))
+
+    def partFun(rowSlice, colSlice):
+        A = X[rowSlice].reshape((-1, 1, nBins))
+        B = Y[colSlice].reshape((1, -1, nBins))
+        K[rowSlice, colSlice] = np.sum(np.minimum(A, B), axis=2)
+
+    tiles = [
+        (slice(i, i + rows), slice(j, j + cols)) for i in range(0, X.shape[0], rows) for j in range(0, Y.shape[0], cols)
+    ]
+    if len(tiles) == 1:
+        partFun(*tiles[0])
+        return K
+
+    pool = RequestPool()
+    for rowSlice, colSlice in tiles:
+        pool.add(Request(partial(partFun, rowSlice, colSlice)))
+    pool.wait()
+    pool.clean()
+
+    return K
+
+
+def _histogramBinIndices(data, nBins, intRange):
+    """
+    bin index of every value in data, using the same binning as
+    np.histogram(data, bins=nBins, range=intRange)
+    values outside of intRange get the index nBins
+    """
 
-    return np.sum(np.minimum(A, B), axis=2)
+    data = np.asarray(data)
+    first, last = float(intRange[0]), float(intRange[1])
+    edges = np.linspace(first, last, nBins + 1)
+    values = data.astype(np.float64)
+
+    indices = ((values - first) * (nBins / (last - first))).astype(np.intp)
+    np.clip(indices, 0, nBins - 1, out=indices)
+    # correct for rounding errors at the bin edges (like np.histogram does)
+    indices[values < edges[indices]] -= 1
+    indices[(values >= edges[indices + 1]) & (indices != nBins - 1)] += 1
+    indices[(values < first) | (values > last) | np.isnan(values)] = nBins
+
+    return indices.astype(np.min_scalar_type(nBins))
+
+
+def _normalizedHistograms(counts, intRange):
+    """
+    normalize histogram counts (shape: nHistograms x nBins) to densities,
+    like np.histogram(..., density=True) does
+    """
+
+    binWidth = (intRange[1] - intRange[0]) / counts.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return counts / counts.sum(axis=1, keepdims=True) / binWidth
 
 
 def _defaultTrainingHistograms():
@@ -730,6 +804,20 @@ def extractHistograms(volume, labels, patchSize=64, haloSize=0, nBins=30, intRan
     # compute actual patch size
     patchSize = patchSize + 2 * haloSize
 
+    # bin the volume once, patches are gathered from a strided view of all
+    # patchSize x patchSize windows (indexed by their upper left corner)
+    binsZYX = np.empty(volumeZYX.shape, dtype=np.min_scalar_type(nBins))
+    for z in range(volumeZYX.shape[0]):
+        binsZYX[z] = _histogramBinIndices(volumeZYX[z], nBins, intRange)
+    labelsZYX = np.asarray(labelsZYX)
+
+    nWindows = tuple(max(0, s - patchSize + 1) for s in binsZYX.shape[1:])
+    patchView = np.lib.stride_tricks.as_strided(
+        binsZYX,
+        shape=(binsZYX.shape[0],) + nWindows + (patchSize, patchSize),
+        strides=binsZYX.strides + binsZYX.strides[1:],
+    )
+
     # fill list of patch centers (VigraArray does not support bitwise_or)
     ind_z, ind_y, ind_x = np.where((labelsZYX == 1).view(np.ndarray) | (labelsZYX == 2).view(np.ndarray))
     index = np.arange(len(ind_z))
@@ -765,16 +853,20 @@ def extractHistograms(volume, labels, patchSize=64, haloSize=0, nBins=30, intRan
         else:
             out = np.zeros((len(validPatchIndices), nBins + 1))
 
-        for k, patchInd in enumerate(validPatchIndices):
-            x = xs[patchInd]
-            y = ys[patchInd]
-            z = zs[patchInd]
+        # gather the patches in batches, one bincount per batch
+        batchSize = max(1, _patchMemoryBudget // (patchSize * patchSize * np.dtype(np.intp).itemsize))
+        for start in range(0, len(validPatchIndices), batchSize):
+            batch = validPatchIndices[start : start + batchSize]
+            patches = patchView[zs[batch], ymin[batch], xmin[batch]].reshape((len(batch), -1))
+            patches = patches + (nBins + 1) * np.arange(len(batch)).reshape((-1, 1))
+            counts = np.bincount(patches.ravel(), minlength=len(batch) * (nBins + 1))
+            out[start : start + len(batch), :nBins] = _normalizedHistograms(
+                counts.reshape((len(batch), nBins + 1))[:, :nBins], intRange
+            )
 
-            vol = volumeZYX[z, ymin[patchInd] : ymax[patchInd], xmin[patchInd] : xmax[patchInd]]
-            (out[k, :nBins], _) = np.histogram(vol, bins=nBins, range=intRange, density=True)
-            out[k, nBins] = 1 if labelsZYX[z, y, x] == 1 else 0
-            if appendPositions:
-                out[k, nBins + 1 :] = [z, y, x]
+        out[:, nBins] = labelsZYX[zs[validPatchIndices], ys[validPatchIndices], xs[validPatchIndices]] == 1
+        if appendPositions:
+            out[:, nBins + 1 :] = np.transpose((zs, ys, xs))[validPatchIndices]
 
         return out
 
@@ -22,6 +22,7 @@
 from __future__ import division
 from builtins import map
 from functools import partial
+import itertools
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,17 +31,214 @@ import numpy
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.request import RequestLock, Request, RequestPool
-from lazyflow.utility import OrderedSignal
+from lazyflow.utility import OrderedSignal, request_at_points
 from lazyflow.roi import getBlockBounds, getIntersectingBlocks, determineBlockShape
 
 
+# Source of FeatureMatrixHistory epochs, unique across all feature matrices
+_epochs = itertools.count(1)
+
+
+class FeatureMatrixHistory(object):
+    """
+    Tells which rows of a label+feature matrix were appended since an earlier version of it.
+
+    A matrix consists of one or more parts (one per image lane, see OpConcatenateFeatureMatrices).
+    Each part is described by its epoch and its number of rows.  Within an epoch, rows are only
+    appended to a part; any other change (rows removed or modified) starts a new epoch.
+
+    >>> earlier = FeatureMatrixHistory([(1, 10), (2, 5)])
+    >>> FeatureMatrixHistory([(1, 12), (2, 6)]).appended_rows(earlier).tolist()
+    [10, 11, 17]
+    >>> FeatureMatrixHistory([(3, 12), (2, 6)]).appended_rows(earlier) is None
+    True
+    """
+
+    def __init__(self, parts):
+        self.parts = tuple(parts)
+
+    @classmethod
+    def concatenate(cls, histories):
+        """
+        The history of the concatenation of several matrices (or None if any of them has no history).
+        """
+        if any(history is None for history in histories):
+            return None
+        return cls(itertools.chain(*(history.parts for history in histories)))
+
+    def appended_rows(self, earlier):
+        """
+        Return the indices of the rows that were appended since the earlier version of the matrix,
+        or None if rows of the earlier version were removed or modified (or earlier is None).
+        """
+        if earlier is None or len(earlier.parts) != len(self.parts):
+            return None
+
+        appended_rows = []
+        offset = 0
+        for (epoch, num_rows), (earlier_epoch, earlier_num_rows) in zip(self.parts, earlier.parts):
+            if epoch != earlier_epoch or num_rows < earlier_num_rows:
+                return None
+            appended_rows.append(numpy.arange(offset + earlier_num_rows, offset + num_rows))
+            offset += num_rows
+        return numpy.concatenate(appended_rows)
+
+
+class TrainingMatrix(numpy.ndarray):
+    """
+    A label+feature matrix, along with its FeatureMatrixHistory (or None).
+
+    Only the matrix itself carries the history: arrays derived from it (slices, copies) have none.
+    """
+
+    history = None
+
+    def __array_finalize__(self, obj):
+        self.history = None
+
+    @classmethod
+    def wrap(cls, matrix, history):
+        """
+        A view of the given matrix, with the given history.
+        """
+        result = numpy.asarray(matrix).view(cls)
+        result.history = history
+        return result
+
+
+class BlockwiseFeatureMatrix(object):
+    """
+    Append-only storage for the label+feature rows of all blocks.
+
+    The rows of each block occupy a contiguous row range of one growable buffer.
+    Adding a block appends its rows.  Replacing or removing a block only marks its
+    old rows as dead (a tombstone); dead rows are dropped the next time the matrix
+    is requested.  Growing and compacting always allocate a new buffer, and rows
+    that were handed out are never overwritten, so a matrix returned by matrix()
+    stays valid (and unchanged) after later updates.
+
+    As long as blocks are only added, the rows of the matrix are only appended.
+    Replacing or removing a block starts a new epoch (see FeatureMatrixHistory).
+
+    >>> store = BlockwiseFeatureMatrix(3)
+    >>> store.append((0, 0), numpy.ones((2, 3), dtype=numpy.float32))
+    >>> store.append((0, 10), numpy.zeros((1, 3), dtype=numpy.float32))
+    >>> store.matrix().shape
+    (3, 3)
+    >>> store.update_columns((0, 0), [2], numpy.full((2, 1), 5))
+    >>> store.matrix().tolist()
+    [[0.0, 0.0, 0.0], [1.0, 1.0, 5.0], [1.0, 1.0, 5.0]]
+    """
+
+    MIN_CAPACITY = 1024
+
+    def __init__(self, num_columns, dtype=numpy.float32):
+        self.num_columns = num_columns
+        self._buffer = numpy.ndarray(shape=(0, num_columns), dtype=dtype)
+        self._num_rows = 0
+        self._num_dead_rows = 0
+        self._block_rows = {}  # block id -> (start_row, stop_row)
+        self._epoch = next(_epochs)
+
+    def __contains__(self, block_id):
+        return block_id in self._block_rows
+
+    def __len__(self):
+        return len(self._block_rows)
+
+    def block_ids(self):
+        return list(self._block_rows.keys())
+
+    def block_rows(self, block_id):
+        """
+        Return the (read-only) rows of the given block.
+        """
+        start, stop = self._block_rows[block_id]
+        rows = self._buffer[start:stop]
+        rows.flags.writeable = False
+        return rows
+
+    def append(self, block_id, rows):
+        """
+        Store the rows of the given block, replacing the rows previously stored for it (if any).
+        """
+        self.remove(block_id)
+        if len(rows) == 0:
+            return
+
+        assert rows.shape[1] == self.num_columns, f"Expected {self.num_columns} columns, got {rows.shape[1]}"
+        if self._num_rows + len(rows) > len(self._buffer):
+            # Dead rows are dropped when moving to the new buffer
+            live_rows = self._num_rows - self._num_dead_rows
+            self._reallocate(max(2 * (live_rows + len(rows)), self.MIN_CAPACITY))
+        stop = self._num_rows + len(rows)
+        self._buffer[self._num_rows : stop] = rows
+        self._block_rows[block_id] = (self._num_rows, stop)
+        self._num_rows = stop
+
+    def update_columns(self, block_id, columns, values):
+        """
+        Replace the given columns of a stored block.  The block is re-appended with the new values.
+        """
+        rows = self._buffer[slice(*self._block_rows[block_id])].copy()
+        rows[:, columns] = values
+        self.append(block_id, rows)
+
+    def remove(self, block_id):
+        try:
+            start, stop = self._block_rows.pop(block_id)
+        except KeyError:
+            return
+        self._num_dead_rows += stop - start
+        # Rows were removed (or will be replaced), the matrix is no longer an extension of the previous one
+        self._epoch = next(_epochs)
+
+    def matrix(self):
+        """
+        Return the rows of all blocks as one matrix.
+
+        Without dead rows, this is a view of the buffer (no copy).
+        The result must not be modified.
+        """
+        if self._num_dead_rows > 0:
+            self._reallocate(max(2 * (self._num_rows - self._num_dead_rows), self.MIN_CAPACITY))
+        return self._buffer[: self._num_rows]
+
+    def history(self):
+        """
+        The FeatureMatrixHistory of the matrix returned by matrix().
+        """
+        return FeatureMatrixHistory([(self._epoch, self._num_rows - self._num_dead_rows)])
+
+    def _reallocate(self, capacity):
+        """
+        Move all live rows to a new buffer of the given capacity, dropping the dead rows.
+        """
+        new_buffer = numpy.empty((capacity, self.num_columns), dtype=self._buffer.dtype)
+        new_block_rows = {}
+        num_rows = 0
+        for block_id, (start, stop) in sorted(self._block_rows.items(), key=lambda item: item[1]):
+            new_stop = num_rows + stop - start
+            new_buffer[num_rows:new_stop] = self._buffer[start:stop]
+            new_block_rows[block_id] = (num_rows, new_stop)
+            num_rows = new_stop
+
+        self._buffer = new_buffer
+        self._block_rows = new_block_rows
+        self._num_rows = num_rows
+        self._num_dead_rows = 0
+
+
 class OpFeatureMatrixCache(Operator):
     """
     - Request features and labels in blocks
     - For nonzero label pixels in each block, extract the label image
-    - Cache the feature matrix for each block separately
+    - Cache the feature matrix for each block separately (in a BlockwiseFeatureMatrix)
     - Output the concatenation of all feature matrices
 
+    Dirty features only invalidate the stored blocks (and feature channels) within the dirty roi.
+    For those, only the dirty channels are re-computed, at the already known label positions.
+
     Note: This operator does not currently have "NonZeroLabelBlocks" input slot.
           Instead, it only requests labels for blocks that have been
           marked dirty via dirty notifications from the LabelImage slot.
@@ -70,8 +268,9 @@ class OpFeatureMatrixCache(Operator):
         self._progress_lock = RequestLock()
 
         self._blockshape = None
-        self._dirty_blocks = set()
-        self._blockwise_feature_matrices = {}
+        self._dirty_blocks = set()  # Blocks with dirty labels, which must be re-computed entirely
+        self._dirty_feature_channels = {}  # For stored blocks: block id -> set of dirty feature channels
+        self._feature_matrix = BlockwiseFeatureMatrix(1)
         self._block_locks = {}  # One lock per stored block
 
         self._init_blocks(None, None)
@@ -82,7 +281,7 @@ class OpFeatureMatrixCache(Operator):
             # Nothing to do
             return
 
-        if len(self._dirty_blocks) != 0 or len(self._blockwise_feature_matrices) != 0:
+        if len(self._dirty_blocks) != 0 or len(self._feature_matrix) != 0:
             raise RuntimeError(
                 "It's too late to change the dimensionality of your data after you've already started training.\n"
                 "Delete all your labels and try again."
@@ -102,9 +301,10 @@ class OpFeatureMatrixCache(Operator):
 
         # For now, we assume that the two input images have the same shape (except channel)
         # This constraint could be relaxed in the future if necessary
-        assert self.FeatureImage.meta.shape[:-1] == self.LabelImage.meta.shape[:-1], (
-            "FeatureImage and LabelImage shapes do not match: {} vs {}"
-            "".format(self.FeatureImage.meta.shape, self.LabelImage.meta.shape)
+        assert (
+            self.FeatureImage.meta.shape[:-1] == self.LabelImage.meta.shape[:-1]
+        ), "FeatureImage and LabelImage shapes do not match: {} vs {}" "".format(
+            self.FeatureImage.meta.shape, self.LabelImage.meta.shape
         )
 
         self.LabelAndFeatureMatrix.meta.shape = (1,)
@@ -116,6 +316,13 @@ class OpFeatureMatrixCache(Operator):
             self.LabelAndFeatureMatrix.meta.num_feature_channels = num_feature_channels
             self.LabelAndFeatureMatrix.setDirty()
 
+        if self._feature_matrix.num_columns != 1 + num_feature_channels:
+            # The stored rows have the wrong width: start over, and re-compute all stored blocks.
+            with self._lock:
+                self._dirty_blocks.update(self._feature_matrix.block_ids())
+                self._dirty_feature_channels.clear()
+                self._feature_matrix = BlockwiseFeatureMatrix(1 + num_feature_channels)
+
         self.ProgressSignal.meta.shape = (1,)
         self.ProgressSignal.meta.dtype = object
         self.ProgressSignal.setValue(self.progressSignal)
@@ -129,7 +336,7 @@ class OpFeatureMatrixCache(Operator):
                 # A block should never span multiple time slices.
                 # For txy volumes, that could lead to lots of extra features being computed.
                 tagged_shape["t"] = 1
-            blockshape = determineBlockShape(list(tagged_shape.values()), 40 ** 3)
+            blockshape = determineBlockShape(list(tagged_shape.values()), 40**3)
 
         # Don't span more than 256 px along any axis
         blockshape = tuple(min(x, 256) for x in blockshape)
@@ -144,7 +351,10 @@ class OpFeatureMatrixCache(Operator):
         # This could be fixed with some fancier progress state, but
         # (1) We don't expect that to by typical, and
         # (2) progress reporting is merely informational.
-        num_dirty_blocks = len(self._dirty_blocks)
+        with self._lock:
+            dirty_blocks = set(self._dirty_blocks)
+            dirty_channel_blocks = set(self._dirty_feature_channels.keys()) - dirty_blocks
+        num_dirty_blocks = len(dirty_blocks) + len(dirty_channel_blocks)
         remaining_dirty = [num_dirty_blocks]
 
         def update_progress(result):
@@ -153,24 +363,34 @@ class OpFeatureMatrixCache(Operator):
             self.progressSignal(percent_complete)
 
         # Update all dirty blocks in the cache
-        logger.debug("Updating {} dirty blocks".format(num_dirty_blocks))
+        logger.debug(
+            "Updating {} dirty blocks and {} blocks with dirty features".format(
+                len(dirty_blocks), len(dirty_channel_blocks)
+            )
+        )
 
         # Before updating the blocks, ensure that the necessary block locks exist
         # It's better to do this now instead of inside each request
         #  to avoid contention over self._lock
         with self._lock:
-            for block_start in self._dirty_blocks:
+            for block_start in dirty_blocks:
                 if block_start not in self._block_locks:
                     self._block_locks[block_start] = RequestLock()
 
         # Update each block in its own request.
         pool = RequestPool()
         reqs = {}
-        for block_start in self._dirty_blocks:
+        channel_reqs = {}
+        for block_start in dirty_blocks:
             req = Request(partial(self._get_features_for_block, block_start))
             req.notify_finished(update_progress)
             reqs[block_start] = req
             pool.add(req)
+        for block_start in dirty_channel_blocks:
+            req = Request(partial(self._get_dirty_channels_for_block, block_start))
+            req.notify_finished(update_progress)
+            channel_reqs[block_start] = req
+            pool.add(req)
         pool.wait()
 
         # Now store the results we got.
@@ -183,61 +403,85 @@ class OpFeatureMatrixCache(Operator):
                     continue
                 labels_and_features_matrix = req.result
                 self._dirty_blocks.remove(block_start)
+                self._dirty_feature_channels.pop(block_start, None)
+
+                # Append the new matrix (replacing the old entry of this block).
+                # If all labels were removed from the block, the new matrix is empty and the block is just removed.
+                self._feature_matrix.append(block_start, labels_and_features_matrix)
 
-                if labels_and_features_matrix.shape[0] > 0:
-                    # Update the block entry with the new matrix.
-                    self._blockwise_feature_matrices[block_start] = labels_and_features_matrix
+            for block_start, req in list(channel_reqs.items()):
+                if req.result is None:
+                    continue
+                channels, features_matrix = req.result
+                if block_start in self._feature_matrix and len(features_matrix) != len(
+                    self._feature_matrix.block_rows(block_start)
+                ):
+                    # The labels changed without a dirty notification (yet). Re-compute the whole block next time.
+                    logger.warning("Labels of block {} changed unexpectedly".format(block_start))
+                    self._dirty_blocks.add(block_start)
+                    continue
+                if block_start in self._feature_matrix:
+                    # Column 0 holds the labels
+                    self._feature_matrix.update_columns(block_start, [1 + c for c in channels], features_matrix)
+                remaining_channels = self._dirty_feature_channels.get(block_start, set()) - set(channels)
+                if remaining_channels:
+                    self._dirty_feature_channels[block_start] = remaining_channels
                 else:
-                    # All labels were removed from the block,
-                    # So the new feature matrix is empty.
-                    # Just delete its entry from our list.
-                    try:
-                        del self._blockwise_feature_matrices[block_start]
-                    except KeyError:
-                        pass
-
-        # Concatenate the all blockwise results
-        if self._blockwise_feature_matrices:
-            total_feature_matrix = numpy.concatenate(list(self._blockwise_feature_matrices.values()), axis=0)
-        else:
-            # No label points at all.
-            # Return an empty label&feature matrix (of the correct shape)
-            num_feature_channels = self.FeatureImage.meta.shape[-1]
-            total_feature_matrix = numpy.ndarray(shape=(0, 1 + num_feature_channels), dtype=numpy.float32)
+                    self._dirty_feature_channels.pop(block_start, None)
+
+            # All blockwise results, as one matrix (usually without copying)
+            total_feature_matrix = TrainingMatrix.wrap(self._feature_matrix.matrix(), self._feature_matrix.history())
 
         self.progressSignal(100.0)
-        logger.debug("After update, there are {} clean blocks".format(len(self._blockwise_feature_matrices)))
+        logger.debug("After update, there are {} clean blocks".format(len(self._feature_matrix)))
         result[0] = total_feature_matrix
 
     def propagateDirty(self, slot, subindex, roi):
         assert slot == self.FeatureImage or slot == self.LabelImage
 
-        # Our blocks are tracked by label roi (1 channel)
-        roi = roi.copy()
-        roi.start[-1] = 0
-        roi.stop[-1] = 1
         # Bookkeeping: Track the dirty blocks
 
         # If the features were dirty (not labels), we only really care about
-        #  the blocks that are actually stored already
+        #  the blocks that are actually stored already, and only about the dirty channels.
         # For big dirty rois (e.g. the entire image),
         #  we avoid a lot of unnecessary entries in self._dirty_blocks
         if slot == self.FeatureImage:
-            # We ignore the ROI and assume all blocks are dirty.
-            # Technically, this would be inefficient if it's possible for the features
-            # to become only partially dirty in a small ROI.
-            # But currently, there is no known use-case for that.
-            block_starts = list(self._blockwise_feature_matrices.keys())
+            num_feature_channels = self.FeatureImage.meta.shape[-1]
+            channels = set(range(roi.start[-1], min(roi.stop[-1], num_feature_channels)))
+            with self._lock:
+                for block_start in self._stored_blocks_in_roi(roi):
+                    self._dirty_feature_channels.setdefault(block_start, set()).update(channels)
         else:
+            # Our blocks are tracked by label roi (1 channel)
+            roi = roi.copy()
+            roi.start[-1] = 0
+            roi.stop[-1] = 1
             block_starts = getIntersectingBlocks(self._blockshape, (roi.start, roi.stop))
             block_starts = list(map(tuple, block_starts))
 
-        with self._lock:
-            self._dirty_blocks.update(set(block_starts))
+            with self._lock:
+                self._dirty_blocks.update(set(block_starts))
 
         # Output has no notion of roi. It's all dirty.
         self.LabelAndFeatureMatrix.setDirty()
 
+    def _stored_blocks_in_roi(self, roi):
+        """
+        Return the ids (start coordinates) of the stored blocks that intersect the given roi.
+        """
+        block_starts = self._feature_matrix.block_ids()
+        if not block_starts:
+            return []
+        starts = numpy.array(block_starts)
+        stops = starts + self._blockshape
+        # Ignore the channel axis
+        roi_start = numpy.array(roi.start)[:-1]
+        roi_stop = numpy.array(roi.stop)[:-1]
+        intersecting = numpy.logical_and(
+            (starts[:, :-1] < roi_stop).all(axis=1), (stops[:, :-1] > roi_start).all(axis=1)
+        )
+        return [block_start for block_start, hit in zip(block_starts, intersecting) if hit]
+
     def _get_features_for_block(self, block_start):
         """
         Computes the feature matrix for the given block IFF the block is dirty.
@@ -255,7 +499,27 @@ class OpFeatureMatrixCache(Operator):
             labels_and_features_matrix = self._extract_feature_matrix(block_roi)
             return labels_and_features_matrix
 
-    def _extract_feature_matrix(self, label_block_roi):
+    def _get_dirty_channels_for_block(self, block_start):
+        """
+        Re-computes the dirty feature channels of a stored block (with unchanged labels).
+        Returns the list of channels and their feature matrix, or None if nothing is dirty.
+        """
+        with self._block_locks[block_start]:
+            channels = sorted(self._dirty_feature_channels.get(block_start, ()))
+            if not channels or block_start in self._dirty_blocks:
+                return None
+            block_roi = getBlockBounds(self.LabelImage.meta.shape, self._blockshape, block_start)
+            features_matrix = self._extract_feature_matrix(block_roi, (channels[0], channels[-1] + 1))
+            # The channel range may contain channels that are not dirty
+            features_matrix = features_matrix[:, [c - channels[0] for c in channels]]
+            return channels, features_matrix
+
+    def _extract_feature_matrix(self, label_block_roi, channel_range=None):
+        """
+        Extract the labels and features at all labeled pixels of the block.
+
+        If channel_range is given, return only the features of these channels (without the labels).
+        """
         num_feature_channels = self.FeatureImage.meta.shape[-1]
         labels = self.LabelImage(label_block_roi[0], label_block_roi[1]).wait()
         label_block_positions = numpy.nonzero(labels[..., 0].view(numpy.ndarray))
@@ -263,31 +527,24 @@ class OpFeatureMatrixCache(Operator):
 
         del labels  # Done with dense labels block; delete immediately.
 
+        if channel_range is None:
+            channel_range = (0, num_feature_channels)
+            num_label_columns = 1
+        else:
+            num_label_columns = 0
+
         if len(label_block_positions) == 0 or len(label_block_positions[0]) == 0:
             # No label points in this roi.
             # Return an empty label&feature matrix (of the correct shape)
-            return numpy.ndarray(shape=(0, 1 + num_feature_channels), dtype=numpy.float32)
+            num_columns = num_label_columns + channel_range[1] - channel_range[0]
+            return numpy.ndarray(shape=(0, num_columns), dtype=numpy.float32)
 
-        # Shrink the roi to the bounding box of nonzero labels
-        block_bounding_box_start = numpy.min(label_block_positions, axis=1)
-        block_bounding_box_stop = 1 + numpy.max(label_block_positions, axis=1)
-
-        global_bounding_box_start = block_bounding_box_start + label_block_roi[0][:-1]
-        global_bounding_box_stop = block_bounding_box_stop + label_block_roi[0][:-1]
-
-        # Since we're just requesting the bounding box, offset the feature positions by the box start
-        bounding_box_positions = numpy.transpose(
-            numpy.transpose(label_block_positions) - numpy.array(block_bounding_box_start)
+        # Request the features only in the neighbourhood of the labeled pixels,
+        #  rather than over the (dense) bounding box of all labels in the block.
+        global_positions = tuple(
+            positions + offset for positions, offset in zip(label_block_positions, label_block_roi[0][:-1])
         )
-        bounding_box_positions = tuple(bounding_box_positions)
-
-        # Append channel roi (all feature channels)
-        feature_roi_start = list(global_bounding_box_start) + [0]
-        feature_roi_stop = list(global_bounding_box_stop) + [num_feature_channels]
-
-        # Request features (bounding box only)
-        features = self.FeatureImage(feature_roi_start, feature_roi_stop).wait()
-
-        # Cast as plain ndarray (not VigraArray), since we don't need/want axistags
-        features_matrix = features[bounding_box_positions].view(numpy.ndarray)
+        features_matrix = request_at_points(self.FeatureImage, global_positions, channel_range)
+        if num_label_columns == 0:
+            return features_matrix
         return numpy.concatenate((labels_matrix, features_matrix), axis=1)
@@ -0,0 +1,260 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#          http://ilastik.org/license/
+###############################################################################
+import copy
+
+import numpy
+import vigra
+
+from lazyflow.graph import Operator, InputSlot, OutputSlot
+
+
+class PixelStage:
+    """
+    One step of an OpFusedPixelChain.
+
+    A stage transforms the metadata of its input (setup), maps rois between its output and
+    its input, and transforms the data of a block (apply).  apply() may work in place,
+    or return a view of its input.
+    The default implementation is the identity.
+    """
+
+    def setup(self, meta):
+        """
+        Modify meta (the metadata of the stage input) in place to describe the stage output.
+        """
+        pass
+
+    def input_roi(self, start, stop):
+        """
+        The input roi needed to compute the given output roi.
+        """
+        return start, stop
+
+    def output_roi(self, start, stop):
+        """
+        The output roi affected by a change of the given input roi.
+        """
+        return start, stop
+
+    def apply(self, data):
+        return data
+
+
+class PixelFunctionStage(PixelStage):
+    """
+    Elementwise function, see OpPixelOperator.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def setup(self, meta):
+        # Same as OpPixelOperator: determine the output dtype on a tiny array, and transform the drange.
+        meta.dtype = self.function(numpy.array([1], dtype=meta.dtype)).dtype.type
+        if meta.drange is not None:
+            meta.drange = tuple(self.function(numpy.array(meta.drange)))
+
+    def apply(self, data):
+        return self.function(data)
+
+
+class ConvertDtypeStage(PixelStage):
+    """
+    Dtype conversion, see OpConvertDtype.
+    """
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+
+    def setup(self, meta):
+        meta.dtype = self.dtype
+
+    def apply(self, data):
+        return data.astype(self.dtype, copy=False)
+
+
+class DtypeViewStage(PixelStage):
+    """
+    Reinterpretation of the data as a different (compatible) dtype, see OpDtypeView.
+    """
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+
+    def setup(self, meta):
+        meta.dtype = self.dtype
+
+    def apply(self, data):
+        return data.view(self.dtype)
+
+
+class ChannelSelectorStage(PixelStage):
+    """
+    Selection of a single channel, see OpSingleChannelSelector.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def setup(self, meta):
+        self._channel_axis = meta.axistags.channelIndex
+        if meta.shape[self._channel_axis] <= self.index:
+            meta.NOTREADY = True
+
+        meta.shape = _with_channel(meta.shape, self._channel_axis, 1)
+        for name in ("ideal_blockshape", "max_blockshape"):
+            blockshape = getattr(meta, name)
+            if blockshape is not None and len(blockshape) == len(meta.shape):
+                setattr(meta, name, _with_channel(blockshape, self._channel_axis, 1))
+
+    def input_roi(self, start, stop):
+        start = _with_channel(start, self._channel_axis, self.index)
+        stop = _with_channel(stop, self._channel_axis, self.index + 1)
+        return start, stop
+
+    def output_roi(self, start, stop):
+        return _with_channel(start, self._channel_axis, 0), _with_channel(stop, self._channel_axis, 1)
+
+
+class ReorderAxesStage(PixelStage):
+    """
+    Axis reordering, see OpReorderAxes.  Axes that are dropped must be singletons.
+    """
+
+    def __init__(self, axis_order):
+        self.axis_order = "".join(axis_order)
+
+    def setup(self, meta):
+        input_order = meta.getAxisKeys()
+        output_order = self.axis_order
+        tagged_shape = meta.getTaggedShape()
+
+        # Same as in OpReorderAxes: only fail when the data is actually requested
+        self._invalid_axes = [a for a in input_order if a not in output_order and tagged_shape[a] > 1]
+
+        output_tags = vigra.defaultAxistags(output_order)
+        for a in output_order:
+            if a in input_order:
+                output_tags[a] = meta.axistags[a]
+
+        if meta.original_axistags is None:
+            original_tags = copy.copy(meta.axistags)
+            original_shape = tuple(meta.shape)
+            if not original_tags.axisTypeCount(vigra.AxisType.Channels):
+                original_tags.insertChannelAxis()
+                original_shape += (1,)
+            meta.original_axistags = original_tags
+            meta.original_shape = original_shape
+
+        for name in ("ideal_blockshape", "max_blockshape"):
+            blockshape = getattr(meta, name)
+            if blockshape is not None:
+                setattr(meta, name, self._reorder(blockshape, input_order, output_order, 1))
+        meta.shape = self._reorder(meta.shape, input_order, output_order, 1)
+        meta.axistags = output_tags
+
+        self._input_order = input_order
+        common_input = [a for a in input_order if a in output_order]
+        common_output = [a for a in output_order if a in input_order]
+        self._drop_slicing = tuple(slice(None) if a in output_order else 0 for a in input_order)
+        self._transpose_order = [common_input.index(a) for a in common_output]
+        self._insert_slicing = tuple(slice(None) if a in input_order else numpy.newaxis for a in output_order)
+
+    @staticmethod
+    def _reorder(values, input_order, output_order, missing):
+        tagged = dict(zip(input_order, values))
+        return tuple(tagged.get(a, missing) for a in output_order)
+
+    def input_roi(self, start, stop):
+        assert not self._invalid_axes, f"Can't drop the non-singleton axes {self._invalid_axes}"
+        start = self._reorder(start, self.axis_order, self._input_order, 0)
+        stop = self._reorder(stop, self.axis_order, self._input_order, 1)
+        return start, stop
+
+    def output_roi(self, start, stop):
+        start = self._reorder(start, self._input_order, self.axis_order, 0)
+        stop = self._reorder(stop, self._input_order, self.axis_order, 1)
+        return start, stop
+
+    def apply(self, data):
+        return numpy.transpose(data[self._drop_slicing], self._transpose_order)[self._insert_slicing]
+
+
+def _with_channel(values, channel_axis, value):
+    values = list(values)
+    values[channel_axis] = value
+    return tuple(values)
+
+
+class OpFusedPixelChain(Operator):
+    """
+    Apply a chain of elementwise and reindexing stages (see PixelStage) in a single operator.
+
+    This is equivalent to chaining the corresponding operators (OpPixelOperator, OpConvertDtype,
+    OpDtypeView, OpSingleChannelSelector, OpReorderAxes), but each request is passed upstream
+    only once, and the stages work on a single buffer instead of allocating one array per operator.
+
+    Example (equivalent to OpReorderAxes -> OpConvertDtype -> OpPixelOperator):
+
+        op = OpFusedPixelChain(parent=self)
+        op.Stages.setValue([ReorderAxesStage("tzyxc"), ConvertDtypeStage(numpy.float32), PixelFunctionStage(f)])
+    """
+
+    Input = InputSlot()
+    Stages = InputSlot()  # list of PixelStage
+    Output = OutputSlot()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stages = []
+
+    def setupOutputs(self):
+        # Stages keep per-operator state, so they must not be shared with other operators
+        self._stages = [copy.copy(stage) for stage in self.Stages.value]
+
+        meta = self.Input.meta.copy()
+        for stage in self._stages:
+            stage.setup(meta)
+        self.Output.meta.assignFrom(meta)
+
+    def execute(self, slot, subindex, roi, result):
+        start, stop = tuple(roi.start), tuple(roi.stop)
+        for stage in reversed(self._stages):
+            start, stop = stage.input_roi(start, stop)
+
+        data = self.Input(start, stop).wait()
+        for stage in self._stages:
+            data = stage.apply(data)
+
+        result[...] = data
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        if slot is self.Input:
+            start, stop = tuple(roi.start), tuple(roi.stop)
+            for stage in self._stages:
+                start, stop = stage.output_roi(start, stop)
+            self.Output.setDirty(start, stop)
+        elif slot is self.Stages:
+            self.Output.setDirty()
+        else:
+            assert False, "Unknown input slot: {}".format(slot.name)
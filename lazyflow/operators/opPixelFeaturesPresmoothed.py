@@ -19,9 +19,11 @@
 # This information is also available on the ilastik web site at:
 #          http://ilastik.org/license/
 ###############################################################################
+import collections
 import copy
 import logging
 import math
+import time
 import numpy
 import vigra
 
@@ -29,9 +31,12 @@ from functools import partial
 
 from lazyflow import roi
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.request import RequestPool
-from lazyflow.roi import sliceToRoi, roiToSlice
+from lazyflow.operators import cacheMemoryManager
+from lazyflow.operators.opCache import ManagedBlockedCache
+from lazyflow.request import RequestLock, RequestPool
+from lazyflow.roi import getBlockBounds, getIntersectingBlocks, getIntersection, roiFromShape, sliceToRoi, roiToSlice
 from lazyflow.rtype import SubRegion
+from lazyflow.utility import BufferPool
 
 from .operators import OpArrayPiper
 from .filterOperators import (
@@ -50,7 +55,17 @@ if WITH_FAST_FILTERS:
 logger = logging.getLogger(__name__)
 
 
-class OpPixelFeaturesPresmoothed(Operator):
+class OpPixelFeaturesPresmoothed(Operator, ManagedBlockedCache):
+    """
+    Computes the selected features for all selected scales.
+
+    For each scale, the input is pre-smoothed once and all features of that scale are computed
+    from the pre-smoothed image. Pre-smoothed images are cached blockwise (one block contains all
+    input channels of one time slice), keyed by (sigma, block). Adjacent output requests, and
+    requests for single features or channels, reuse the same pre-smoothed blocks instead of
+    smoothing the overlapping halos again. The blocks are managed by the cache memory manager.
+    """
+
     name = "OpPixelFeaturesPresmoothed"
     category = "Vigra filter"
 
@@ -76,11 +91,24 @@ class OpPixelFeaturesPresmoothed(Operator):
 
     WINDOW_SIZE = 3.5
 
+    # Block shape (zyx) of the pre-smoothing cache, clipped to the input shape.
+    # (z is 1 if all scales are computed in 2D.)
+    PRESMOOTHING_BLOCK_SHAPE = (32, 256, 256)
+
     def __init__(self, *args, **kwargs):
         Operator.__init__(self, *args, **kwargs)
         self.source = OpArrayPiper(parent=self)
         self.source.Input.connect(self.Input)
 
+        self._presmoothing_lock = RequestLock()
+        self._presmoothing_blockshape = None
+        self._presmoothing_input_meta = None
+        self._buffer_pool = BufferPool()
+        self._resetPresmoothedBlocks()
+        self.Input.notifyUnready(self._resetPresmoothedBlocks)
+
+        self.registerWithMemoryManager()
+
     def getInvalidScales(self):
         """
         Check each of the scales the user selected against the shape of the input dataset (in space only).
@@ -209,6 +237,8 @@ class OpPixelFeaturesPresmoothed(Operator):
                     self.Features[featureCount].meta.axistags["c"].description = ""
                     # Discard any semantics related to the input channels
                     self.Features[featureCount].meta.display_mode = ""
+                    # Features are computed from the (cached) pre-smoothed blocks, like the Output
+                    self.Features[featureCount].meta.request_halo = int(numpy.ceil(0.7 * self.WINDOW_SIZE))
                     self.featureOutputChannels.append((channelCount, channelCount + featureChannels))
                     channelCount += featureChannels
                     featureCount += 1
@@ -219,12 +249,6 @@ class OpPixelFeaturesPresmoothed(Operator):
                     oparray[i].append(None)
                     featureNameArray[i].append(None)
 
-        # We use 0.7 as an approximation of not doing any smoothing.
-        if self.matrix.any():
-            self.max_sigma = max(0.7, max(numpy.asarray(self.scales)[self.matrix.any(axis=0)]))
-        else:
-            self.max_sigma = 0.7
-
         self.featureOps = oparray
 
         # Output meta is a modified copy of the input meta
@@ -235,11 +259,22 @@ class OpPixelFeaturesPresmoothed(Operator):
         self.Output.meta.channel_names = channel_names
         self.Output.meta.shape = self.Input.meta.shape[:1] + (channelCount,) + self.Input.meta.shape[2:]
         self.Output.meta.ideal_blockshape = self._get_ideal_blockshape()
+        # Pre-smoothed blocks are cached, so each request only computes the small halo of the feature filters
+        self.Output.meta.request_halo = int(numpy.ceil(0.7 * self.WINDOW_SIZE))
 
         # FIXME: Features are float, so we need AT LEAST 4 bytes per output channel,
         #        but vigra functions may use internal RAM as well.
         self.Output.meta.ram_usage_per_requested_pixel = 4.0 * self.Output.meta.shape[1]
 
+        blockshape = numpy.minimum(self.PRESMOOTHING_BLOCK_SHAPE, self.Input.meta.shape[2:])
+        if all(self.ComputeIn2d.value):
+            blockshape[0] = 1
+        input_meta = (self.Input.meta.shape, self.Input.meta.dtype, tuple(blockshape))
+        if input_meta != self._presmoothing_input_meta:
+            self._resetPresmoothedBlocks()
+            self._presmoothing_blockshape = tuple(blockshape)
+            self._presmoothing_input_meta = input_meta
+
     def _get_ideal_blockshape(self):
         assert self.Output.meta.getAxisKeys() == list("tczyx")
 
@@ -248,8 +283,8 @@ class OpPixelFeaturesPresmoothed(Operator):
 
         # Input channels are independent. Output channels partially. It is not trivial to distinguish which output
         # channels come from a single input channel and which do not, therefore we ask for all/arbitrary many.
-        # The way the pre-smoothing is implemented currently (saved only temporarily per request), it is best to
-        # request all channels at once to only pre-smooth once for all input channels and filters.
+        # (Pre-smoothed blocks are cached, so requesting fewer channels does not pre-smooth more than once,
+        # but the feature filters themselves are cheaper for larger requests.)
         c = self.Output.meta.shape[1]
 
         if self.Output.meta.shape[2] == 1:
@@ -261,6 +296,8 @@ class OpPixelFeaturesPresmoothed(Operator):
 
     def propagateDirty(self, inputSlot, subindex, roi):
         if inputSlot == self.Input:
+            self._freeDirtyPresmoothedBlocks(roi.start, roi.stop)
+
             numChannels = self.Input.meta.shape[1]
             dirtyChannels = roi.stop[1] - roi.start[1]
 
@@ -313,7 +350,7 @@ class OpPixelFeaturesPresmoothed(Operator):
             #  ______________________________
             # | input/output frame           |  input/output shape given by slots
             # |  _________________________   |
-            # | | smooth frame            |  |  pre-smoothing op needs halo around filter roi
+            # | | smooth frame            |  |  pre-smoothing needs halo around filter roi (see _fill_presmoothed)
             # | |  ____________________   |  |
             # | | |filter frame        |  |  |  filter needs halo around target roi
             # | | |  _______________   |  |  |
@@ -350,97 +387,32 @@ class OpPixelFeaturesPresmoothed(Operator):
                 output_start, output_stop, output_shape, 0.7, self.WINDOW_SIZE, enlarge_axes=axes2enlarge
             )
 
-            # smooth roi in input frame
-            input_smooth_start, input_smooth_stop = roi.enlargeRoiForHalo(
-                input_filter_start,
-                input_filter_stop,
-                output_shape,
-                self.max_sigma,
-                self.WINDOW_SIZE,
-                enlarge_axes=axes2enlarge,
-            )
-
             # target roi in filter frame
             filter_target_start = roi.TinyVector(output_start - input_filter_start)
             filter_target_stop = roi.TinyVector(output_stop - input_filter_start)
 
-            # filter roi in smooth frame
-            smooth_filter_start = roi.TinyVector(input_filter_start - input_smooth_start)
-            smooth_filter_stop = roi.TinyVector(input_filter_stop - input_smooth_start)
-
             filter_target_slice = roi.roiToSlice(filter_target_start, filter_target_stop)
-            input_smooth_slice = roi.roiToSlice(input_smooth_start, input_smooth_stop)
-
-            # pre-smooth for all requested time slices and all channels
-            full_input_smooth_slice = (full_output_slice[0], slice(None), *input_smooth_slice)
-            req = self.Input[full_input_smooth_slice]
-            source = req.wait()
-            req.clean()
-            req.destination = None
-            if source.dtype != numpy.float32:
-                sourceF = source.astype(numpy.float32)
-                try:
-                    source.resize((1,), refcheck=False)
-                except Exception:
-                    pass
-                del source
-                source = sourceF
-
-            sourceV = source.view(vigra.VigraArray)
-            sourceV.axistags = copy.copy(self.Input.meta.axistags)
 
             dimCol = len(self.scales)
             dimRow = self.matrix.shape[0]
 
+            # pre-smooth (or take from the cache) the filter roi for all requested time slices and all channels
             presmoothed_source = [None] * dimCol
+            num_timeslices = full_output_stop[0] - full_output_start[0]
+            full_filter_shape = (num_timeslices, self.Input.meta.shape[1]) + tuple(
+                input_filter_stop - input_filter_start
+            )
+            for j in range(dimCol):
+                if self.matrix[:, j].any():
+                    presmoothed_source[j] = self._buffer_pool.acquire(full_filter_shape, numpy.float32)
 
-            source_smooth_shape = tuple(smooth_filter_stop - smooth_filter_start)
-            full_source_smooth_shape = (
-                full_output_stop[0] - full_output_start[0],
-                self.Input.meta.shape[1],
-            ) + source_smooth_shape
-            try:
-                for j in range(dimCol):
-                    for i in range(dimRow):
-                        if self.matrix[i, j]:
-                            # There is at least one filter op with this scale
-                            break
-                    else:
-                        # There is no filter op at this scale
-                        continue
-
-                    if self.scales[j] > 1.0:
-                        tempSigma = math.sqrt(self.scales[j] ** 2 - 1.0)
-                    else:
-                        tempSigma = self.scales[j]
-
-                    presmoothed_source[j] = numpy.ndarray(full_source_smooth_shape, numpy.float32)
-
-                    droi = (
-                        (0, *tuple(smooth_filter_start._asint())),
-                        (sourceV.shape[1], *tuple(smooth_filter_stop._asint())),
-                    )
-                    for i, vsa in enumerate(sourceV.timeIter()):
-                        presmoothed_source[j][i, ...] = self._computeGaussianSmoothing(
-                            vsa, tempSigma, droi, in2d=self.ComputeIn2d.value[j]
-                        )
-
-            except RuntimeError as e:
-                if "kernel longer than line" in str(e):
-                    raise RuntimeError(
-                        "Feature computation error:\nYour image is too small to apply a filter with "
-                        f"sigma={self.scales[j]:.1f}. Please select features with smaller sigmas."
-                    )
-                else:
-                    raise e
-
-            del sourceV
             try:
-                source.resize((1,), refcheck=False)
-            except ValueError:
-                # Sometimes this fails, but that's okay.
-                logger.debug("Failed to free array memory.")
-            del source
+                self._fill_presmoothed(
+                    presmoothed_source, full_output_start[0], full_output_stop[0], input_filter_start, input_filter_stop
+                )
+            except BaseException:
+                self._release_buffers(presmoothed_source)
+                raise
 
             cnt = 0
             written = 0
@@ -450,7 +422,6 @@ class OpPixelFeaturesPresmoothed(Operator):
                 for j in range(dimCol):
                     if self.matrix[i, j]:
                         oslot = self.featureOps[i][j].Output
-                        req = None
                         slices = oslot.meta.shape[1]
                         if (
                             cnt + slices >= slot_roi.start[1]
@@ -484,18 +455,203 @@ class OpPixelFeaturesPresmoothed(Operator):
 
                             written += end - begin
                         cnt += slices
-            pool = RequestPool()
-            for c in closures:
-                pool.request(c)
-            pool.wait()
-            pool.clean()
-
-            for i in range(len(presmoothed_source)):
-                if presmoothed_source[i] is not None:
-                    try:
-                        presmoothed_source[i].resize((1,))
-                    except Exception:
-                        presmoothed_source[i] = None
+            try:
+                pool = RequestPool()
+                for c in closures:
+                    pool.request(c)
+                pool.wait()
+                pool.clean()
+            finally:
+                self._release_buffers(presmoothed_source)
+
+    def _release_buffers(self, buffers):
+        for buf in buffers:
+            if buf is not None:
+                self._buffer_pool.release(buf)
+
+    def _presmoothing_sigma(self, j):
+        # Scales > 1 are computed on an image pre-smoothed with sigma sqrt(scale**2 - 1),
+        # followed by a filter with sigma 1.0 (see self.newScales)
+        if self.scales[j] > 1.0:
+            return math.sqrt(self.scales[j] ** 2 - 1.0)
+        else:
+            return self.scales[j]
+
+    def _fill_presmoothed(self, presmoothed_source, t_start, t_stop, filter_start, filter_stop):
+        """
+        Write the pre-smoothed input within the (spatial) filter roi into the given arrays (one per scale, or None),
+        assembling it from cached blocks. Missing blocks are computed in parallel.
+        """
+        filter_roi = (numpy.asarray(filter_start), numpy.asarray(filter_stop))
+        spatial_shape = self.Input.meta.shape[2:]
+        block_starts = getIntersectingBlocks(self._presmoothing_blockshape, filter_roi)
+
+        def copy_block(j, target, t, block_start):
+            block_roi = getBlockBounds(spatial_shape, self._presmoothing_blockshape, block_start)
+            try:
+                block_data = self._get_presmoothed_block(
+                    self._presmoothing_sigma(j), self.ComputeIn2d.value[j], t, block_roi
+                )
+            except RuntimeError as e:
+                if "kernel longer than line" in str(e):
+                    raise RuntimeError(
+                        "Feature computation error:\nYour image is too small to apply a filter with "
+                        f"sigma={self.scales[j]:.1f}. Please select features with smaller sigmas."
+                    )
+                else:
+                    raise e
+            intersection = getIntersection(block_roi, filter_roi)
+            target_slicing = (t - t_start, slice(None)) + roiToSlice(*(intersection - filter_roi[0]))
+            block_slicing = (slice(None),) + roiToSlice(*(intersection - block_roi[0]))
+            target[target_slicing] = block_data[block_slicing]
+
+        pool = RequestPool()
+        for j, target in enumerate(presmoothed_source):
+            if target is None:
+                continue
+            for t in range(t_start, t_stop):
+                for block_start in block_starts:
+                    pool.request(partial(copy_block, j, target, t, block_start))
+        pool.wait()
+        pool.clean()
+
+    def _get_presmoothed_block(self, sigma, in2d, t, block_roi):
+        """
+        Return the pre-smoothed block (all channels, time slice t), computing and caching it if necessary.
+        """
+        key = (sigma, in2d, t, tuple(map(int, block_roi[0])))
+
+        with self._presmoothing_lock:
+            if key not in self._presmoothing_block_locks:
+                self._presmoothing_block_locks[key] = RequestLock()
+            block_lock = self._presmoothing_block_locks[key]
+
+        # Identical simultaneous requests for the same block wait for each other
+        with block_lock:
+            with self._presmoothing_lock:
+                block_data = self._presmoothed_blocks.get(key)
+                if block_data is not None:
+                    self._presmoothing_access_times[key] = time.time()
+                    return block_data
+
+            start_time = time.perf_counter()
+            block_data = self._compute_presmoothed_block(sigma, in2d, t, block_roi)
+            compute_time = time.perf_counter() - start_time
+
+            with self._presmoothing_lock:
+                # The block may have been marked dirty while we were computing it
+                if key in self._presmoothing_block_locks:
+                    self._presmoothed_blocks[key] = block_data
+                    self._presmoothing_access_times[key] = time.time()
+                    self._presmoothing_compute_times[key] = compute_time
+        cacheMemoryManager.notifyCacheAdmission(block_data.nbytes)
+        return block_data
+
+    def _compute_presmoothed_block(self, sigma, in2d, t, block_roi):
+        spatial_shape = self.Input.meta.shape[2:]
+        enlarge_axes = (0, 1, 1) if in2d else (1, 1, 1)
+        (source_start, source_stop), block_in_source = roi.enlargeRoiForHalo(
+            block_roi[0],
+            block_roi[1],
+            spatial_shape,
+            sigma,
+            self.WINDOW_SIZE,
+            enlarge_axes=enlarge_axes,
+            return_result_roi=True,
+        )
+
+        source = self.Input[(slice(t, t + 1), slice(None)) + roiToSlice(source_start, source_stop)].wait()
+        source = source.astype(numpy.float32, copy=False)
+        sourceV = source.view(vigra.VigraArray)
+        sourceV.axistags = copy.copy(self.Input.meta.axistags)
+
+        num_channels = self.Input.meta.shape[1]
+        droi = ((0, *tuple(block_in_source[0])), (num_channels, *tuple(block_in_source[1])))
+        vsa = next(sourceV.timeIter())
+        smoothed = self._computeGaussianSmoothing(vsa, sigma, droi, in2d=in2d)
+
+        # Copy, so that the cached block does not keep a (larger) source array alive
+        return numpy.array(smoothed.view(numpy.ndarray), dtype=numpy.float32, order="C")
+
+    def _freeDirtyPresmoothedBlocks(self, dirty_start, dirty_stop):
+        if self._presmoothing_blockshape is None:
+            return
+        dirty_start = tuple(dirty_start)
+        dirty_stop = tuple(dirty_stop)
+        if (dirty_start, dirty_stop) == tuple(map(tuple, roiFromShape(self.Input.meta.shape))):
+            self._resetPresmoothedBlocks()
+            return
+
+        spatial_shape = self.Input.meta.shape[2:]
+        dirty_roi = (dirty_start[2:], dirty_stop[2:])
+        with self._presmoothing_lock:
+            for key in list(self._presmoothing_block_locks):
+                sigma, in2d, t, block_start = key
+                if not dirty_start[0] <= t < dirty_stop[0]:
+                    continue
+                # A block depends on the input within its halo
+                block_roi = getBlockBounds(spatial_shape, self._presmoothing_blockshape, block_start)
+                source_roi = roi.enlargeRoiForHalo(
+                    block_roi[0],
+                    block_roi[1],
+                    spatial_shape,
+                    sigma,
+                    self.WINDOW_SIZE,
+                    enlarge_axes=(0, 1, 1) if in2d else (1, 1, 1),
+                )
+                if getIntersection(source_roi, dirty_roi, assertIntersect=False) is not None:
+                    self._freePresmoothedBlock_nolock(key)
+
+    def _freePresmoothedBlock_nolock(self, key):
+        block_data = self._presmoothed_blocks.pop(key, None)
+        del self._presmoothing_block_locks[key]
+        self._presmoothing_access_times.pop(key, None)
+        self._presmoothing_compute_times.pop(key, None)
+        return 0 if block_data is None else block_data.nbytes
+
+    def _resetPresmoothedBlocks(self, *_):
+        with self._presmoothing_lock:
+            self._presmoothed_blocks = {}
+            self._presmoothing_block_locks = {}
+            self._presmoothing_access_times = collections.defaultdict(float)
+            self._presmoothing_compute_times = {}
+
+    ##
+    ## ManagedBlockedCache interface implementation
+    ##
+    def usedMemory(self):
+        with self._presmoothing_lock:
+            return sum(block.nbytes for block in self._presmoothed_blocks.values()) + self._buffer_pool.nbytes()
+
+    def fractionOfUsedMemoryDirty(self):
+        # dirty blocks are discarded immediately
+        return 0.0
+
+    def getBlockAccessTimes(self):
+        with self._presmoothing_lock:
+            return [(k, self._presmoothing_access_times[k]) for k in self._presmoothed_blocks]
+
+    def getBlockCosts(self):
+        with self._presmoothing_lock:
+            return [
+                (k, self._presmoothing_compute_times[k], self._presmoothed_blocks[k].nbytes)
+                for k in self._presmoothed_blocks
+            ]
+
+    def freeBlock(self, key):
+        with self._presmoothing_lock:
+            if key not in self._presmoothing_block_locks:
+                return 0
+            return self._freePresmoothedBlock_nolock(key)
+
+    def freeMemory(self):
+        used = self.usedMemory()
+        self._resetPresmoothedBlocks()
+        self._buffer_pool.clear()
+        return used
+
+    def freeDirtyMemory(self):
+        return 0.0
 
     def _computeGaussianSmoothing(self, vol, sigma, roi, in2d):
         if WITH_FAST_FILTERS:
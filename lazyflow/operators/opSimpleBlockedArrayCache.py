@@ -53,6 +53,12 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
 
         self.Output.meta.ram_usage_per_requested_pixel = ram_per_pixel
 
+    def _index_cell_shape(self, block_roi):
+        """
+        Overridden from OpUnblockedArrayCache
+        """
+        return self._blockshape
+
     def _execute_Output(self, slot, subindex, roi, result):
         """
         Overridden from OpUnblockedArrayCache
@@ -63,7 +69,8 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
             clipped_block_roi = numpy.asarray(clipped_block_roi)
             output_roi = numpy.asarray(clipped_block_roi) - roi.start
 
-            block_roi = self._get_containing_block_roi(clipped_block_roi)
+            with self._lock:
+                block_roi = self._get_containing_block_roi(clipped_block_roi)
 
             # Skip cache and copy full block directly
             if self.BypassModeEnabled.value:
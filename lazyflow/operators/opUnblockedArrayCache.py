@@ -29,9 +29,11 @@ import numpy
 import vigra
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.operators import cacheMemoryManager, cacheSpillStore
 from lazyflow.operators.opCache import ManagedBlockedCache
 from lazyflow.request import RequestLock
-from lazyflow.roi import getIntersection, roiFromShape, roiToSlice, containing_rois, sliceToRoi
+from lazyflow.utility import RoiIndex
+from lazyflow.roi import roiFromShape, roiToSlice, sliceToRoi
 
 import logging
 
@@ -52,6 +54,9 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     Instead, it is assumed that the downstream operators have chosen some reasonable blocking.
     Hopefully the downstream operators are reasonably consistent in the blocks they request data with,
     since every unique result is cached separately.
+
+    If the disk tier is enabled (see cacheSpillStore), blocks evicted by the cache memory manager
+    are written to disk and read back from there on the next request.
     """
 
     Input = InputSlot(allow_mask=True)
@@ -63,6 +68,7 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     def __init__(self, *args, **kwargs):
         super(OpUnblockedArrayCache, self).__init__(*args, **kwargs)
         self._lock = RequestLock()
+        self._spill_owner = cacheSpillStore.newOwner(self._forgetSpilledBlock)
         self._resetBlocks()
 
         self.Input.notifyUnready(self._resetBlocks)
@@ -95,13 +101,11 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
 
     def _execute_Output_impl(self, request_roi, result):
         request_roi = self._standardize_roi(*request_roi)
-        with self._lock:
-            block_roi = self._get_containing_block_roi(request_roi)
-            if block_roi is not None:
-                # Data is already in the cache. Just extract it.
-                block_relative_roi = numpy.array(request_roi) - block_roi[0]
-                self.Output.stype.copy_data(result, self._block_data[block_roi][roiToSlice(*block_relative_roi)])
-                return
+        if self._copy_from_cached_block(request_roi, result):
+            return
+
+        if self._restore_spilled_block(request_roi) and self._copy_from_cached_block(request_roi, result):
+            return
 
         if self.Input.meta.dontcache:
             # Data isn't in the cache, but we don't want to cache it anyway.
@@ -111,15 +115,59 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         # Data isn't in the cache, so request it and cache it
         self._fetch_and_store_block(request_roi, out=result)
 
+    def _copy_from_cached_block(self, request_roi, result):
+        with self._lock:
+            block_roi = self._get_containing_block_roi(request_roi)
+            if block_roi is None:
+                return False
+            # Data is already in the cache. Just extract it.
+            block_relative_roi = numpy.array(request_roi) - block_roi[0]
+            self.Output.stype.copy_data(result, self._block_data[block_roi][roiToSlice(*block_relative_roi)])
+            return True
+
+    def _restore_spilled_block(self, request_roi):
+        """
+        If a block containing request_roi was spilled to disk, load it back into memory.
+        Returns True if a block was restored.
+        """
+        if not cacheSpillStore.enabled():
+            return False
+        with self._lock:
+            if self._spill_index is None:
+                return False
+            block_roi = self._spill_index.containing(request_roi)
+            if block_roi is None:
+                return False
+            if block_roi not in self._block_locks:
+                self._block_locks[block_roi] = RequestLock()
+            block_lock = self._block_locks[block_roi]
+
+        with block_lock:
+            if block_roi in self._block_data:
+                return True
+            block_data = cacheSpillStore.get(self._spill_owner, block_roi)
+            compute_time = self._forgetSpilledBlock(block_roi)
+            if block_data is None:
+                return False
+            self._store_block_data(block_roi, block_data, compute_time)
+            # The block is spilled again if it is evicted again
+            cacheSpillStore.discard(self._spill_owner, block_roi)
+        return True
+
     def _get_containing_block_roi(self, request_roi):
         # Does this roi happen to fit ENTIRELY within an existing stored block?
+        # (Call with self._lock held.)
+        if self._block_index is None:
+            return None
         request_roi = self._standardize_roi(*request_roi)
-        outer_rois = containing_rois(list(self._block_data.keys()), request_roi)
-        if len(outer_rois) > 0:
-            # Standardize roi for usage as dict key
-            block_roi = self._standardize_roi(*outer_rois[0])
-            return block_roi
-        return None
+        return self._block_index.containing(request_roi)
+
+    def _index_cell_shape(self, block_roi):
+        """
+        Cell shape for the spatial index of the stored blocks, chosen when the first block is stored.
+        Subclasses that know their block shape should return it here.
+        """
+        return tuple(numpy.subtract(block_roi[1], block_roi[0]))
 
     def _fetch_and_store_block(self, block_roi, out):
         if out is not None:
@@ -147,14 +195,17 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             req = self.Input(*block_roi)
             if out is not None:
                 req.writeInto(out)
+            start_time = time.perf_counter()
             block_data = req.wait()
-            self._store_block_data(block_roi, block_data)
+            self._store_block_data(block_roi, block_data, time.perf_counter() - start_time)
         return block_data
 
-    def _store_block_data(self, block_roi, block_data):
+    def _store_block_data(self, block_roi, block_data, compute_time=0.0):
         """
         Copy block_data and store it into the cache.
         The block_lock is not obtained here, so lock it before you call this.
+
+        compute_time is the time it took to obtain block_data from upstream (for cost-aware eviction).
         """
         with self._lock:
             if self.CompressionEnabled.value and numpy.dtype(block_data.dtype) in [
@@ -176,8 +227,15 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             # (Could have happened via propagateDirty() or eventually the arrayCacheMemoryMgr)
             if block_roi in self._block_locks:
                 self._block_data[block_roi] = block_storage_data
+                self._block_compute_times[block_roi] = compute_time
+                if self._block_index is None:
+                    self._block_index = RoiIndex(numpy.maximum(self._index_cell_shape(block_roi), 1))
+                self._block_index.add(block_roi)
 
         self._last_access_times[block_roi] = time.time()
+        cacheMemoryManager.notifyCacheAdmission(
+            block_storage_data.size * numpy.dtype(block_storage_data.dtype).itemsize
+        )
 
     def _execute_CleanBlocks(self, slot, subindex, roi, result):
         with self._lock:
@@ -210,11 +268,15 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             # Everything is dirty, so no need to loop
             self._resetBlocks()
         else:
-            # FIXME: This is O(N) for now.
-            #        We should speed this up by maintaining a bookkeeping data structure in execute().
-            for block_roi in list(self._block_data.keys()):
-                if getIntersection(block_roi, dirty_roi, assertIntersect=False):
-                    self.freeBlock(block_roi)
+            with self._lock:
+                self._dirty_generation += 1
+                dirty_block_rois = [] if self._block_index is None else self._block_index.intersecting(dirty_roi)
+                dirty_spilled_rois = [] if self._spill_index is None else self._spill_index.intersecting(dirty_roi)
+            for block_roi in dirty_block_rois:
+                self._freeBlock(block_roi, spill=False)
+            for block_roi in dirty_spilled_rois:
+                self._forgetSpilledBlock(block_roi)
+                cacheSpillStore.discard(self._spill_owner, block_roi)
 
         self.Output.setDirty(roi.start, roi.stop)
 
@@ -251,12 +313,29 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             l = [(k, self._last_access_times[k]) for k in self._last_access_times]
         return l
 
+    def getBlockCosts(self):
+        with self._lock:
+            return [
+                (
+                    k,
+                    self._block_compute_times[k],
+                    self._block_data[k].size * numpy.dtype(self._block_data[k].dtype).itemsize,
+                )
+                for k in self._block_data
+            ]
+
     def freeMemory(self):
         used = self.usedMemory()
         self._resetBlocks()
         return used
 
     def freeBlock(self, key):
+        return self._freeBlock(key, spill=True)
+
+    def _freeBlock(self, key, spill):
+        """
+        Remove a block from memory. If spill is True, it is moved to the disk tier (if enabled).
+        """
         with self._lock:
             if key not in self._block_locks:
                 return 0
@@ -265,8 +344,34 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             mem = block.size * bytes_per_pixel
             del self._block_data[key]
             del self._block_locks[key]
+            self._block_index.remove(key)
             del self._last_access_times[key]
-            return mem
+            compute_time = self._block_compute_times.pop(key, 0.0)
+            generation = self._dirty_generation
+
+        if spill and cacheSpillStore.enabled():
+            # Extra [:] here is in case we are decompressing from a chunkedarray
+            if cacheSpillStore.put(self._spill_owner, key, block[:], compress=self.CompressionEnabled.value):
+                with self._lock:
+                    if generation != self._dirty_generation:
+                        # Marked dirty while we were writing
+                        cacheSpillStore.discard(self._spill_owner, key)
+                    else:
+                        if self._spill_index is None:
+                            self._spill_index = RoiIndex(numpy.maximum(self._index_cell_shape(key), 1))
+                        self._spill_index.add(key)
+                        self._spilled_compute_times[key] = compute_time
+        return mem
+
+    def _forgetSpilledBlock(self, key):
+        """
+        Remove a block from the index of spilled blocks (e.g. after the spill store dropped it).
+        Returns its compute time.
+        """
+        with self._lock:
+            if self._spill_index is not None:
+                self._spill_index.remove(key)
+            return self._spilled_compute_times.pop(key, 0.0)
 
     def freeDirtyMemory(self):
         return 0.0
@@ -275,4 +380,16 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         with self._lock:
             self._block_data = {}
             self._block_locks = {}
+            # Spatial index of the keys of _block_data (created when the first block is stored)
+            self._block_index = None
             self._last_access_times = collections.defaultdict(float)
+            self._block_compute_times = {}
+            # Spatial index of the blocks spilled to disk, and their compute times
+            self._spill_index = None
+            self._spilled_compute_times = {}
+            self._dirty_generation = getattr(self, "_dirty_generation", 0) + 1
+            cacheSpillStore.discardAll(self._spill_owner)
+
+    def cleanUp(self):
+        cacheSpillStore.releaseOwner(self._spill_owner)
+        super(OpUnblockedArrayCache, self).cleanUp()
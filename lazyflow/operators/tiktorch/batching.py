@@ -0,0 +1,184 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#          http://ilastik.org/license/
+###############################################################################
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+import numpy
+
+from lazyflow.request import Request
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingTile:
+    """
+    A single tile waiting for its slice of a batched prediction.
+    """
+
+    def __init__(self, tensor: numpy.ndarray):
+        self.tensor = tensor
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._waiting_request = None
+        self._result = None
+        self._exception = None
+
+    def set_result(self, result=None, exception=None):
+        with self._lock:
+            self._result = result
+            self._exception = exception
+            self._done.set()
+            waiting_request = self._waiting_request
+
+        if waiting_request is not None:
+            waiting_request._wake_up()
+
+    def wait(self) -> numpy.ndarray:
+        """
+        Block until the result is available.  Within a lazyflow request, the request is suspended
+        (freeing the worker thread) instead of blocking.
+        """
+        current_rq = Request._current_request()
+        if current_rq is None:
+            self._done.wait()
+        else:
+            with self._lock:
+                suspend = not self._done.is_set()
+                if suspend:
+                    self._waiting_request = current_rq
+            if suspend:
+                current_rq._suspend()
+            assert self._done.is_set()
+
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class PredictionBatcher:
+    """
+    Collect concurrent prediction requests for tiles of the same shape and dtype, and send them as one batch.
+
+    The first tile of a batch waits at most ``max_delay`` seconds for others to join.  A batch is sent
+    earlier once it contains ``max_batch_size`` tiles.  Each caller gets its own slice of the batched result.
+
+    The batcher does not know about the transport: ``predict_batch`` receives the concatenated tensor and
+    must return a future (``concurrent.futures.Future`` or a grpc future) that resolves to the predicted
+    batch as a numpy array.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> executor = ThreadPoolExecutor(1)
+    >>> batcher = PredictionBatcher(lambda batch: executor.submit(lambda: batch * 2), batch_axis=0)
+    >>> batcher.predict(numpy.ones((1, 3))).tolist()
+    [[2.0, 2.0, 2.0]]
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[numpy.ndarray], Future],
+        batch_axis: int,
+        output_batch_axis: int = None,
+        max_batch_size: int = 8,
+        max_delay: float = 0.005,
+    ):
+        """
+        :param predict_batch: callable sending one batched tensor, returns a future of the batched prediction
+        :param batch_axis: index of the batch axis in the input tensors (tiles have size 1 along it)
+        :param output_batch_axis: index of the batch axis in the prediction (defaults to batch_axis)
+        :param max_batch_size: maximum number of tiles per batch
+        :param max_delay: maximum time (in seconds) to wait for other tiles before sending a batch
+        """
+        assert max_batch_size >= 1
+        self._predict_batch = predict_batch
+        self._batch_axis = batch_axis
+        self._output_batch_axis = batch_axis if output_batch_axis is None else output_batch_axis
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple, List[_PendingTile]] = {}
+
+    def predict(self, tensor: numpy.ndarray) -> numpy.ndarray:
+        """
+        Predict a single tile (size 1 along the batch axis), possibly batched with concurrent calls.
+        """
+        assert tensor.shape[self._batch_axis] == 1, f"Expected a single tile, got shape {tensor.shape}"
+        tile = _PendingTile(tensor)
+        key = (tensor.shape, tensor.dtype.str)
+
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = []
+                if self._max_batch_size > 1:
+                    timer = threading.Timer(self._max_delay, self._flush, args=(key, batch))
+                    timer.daemon = True
+                    timer.start()
+            batch.append(tile)
+            full = len(batch) >= self._max_batch_size
+            if full:
+                del self._pending[key]
+
+        if full:
+            self._send(batch)
+        return tile.wait()
+
+    def _flush(self, key, batch):
+        with self._lock:
+            if self._pending.get(key) is not batch:
+                # Already sent because it was full
+                return
+            del self._pending[key]
+        self._send(batch)
+
+    def _send(self, batch: List[_PendingTile]):
+        logger.debug(f"Sending a batch of {len(batch)} tiles of shape {batch[0].tensor.shape}")
+        try:
+            if len(batch) == 1:
+                batch_tensor = batch[0].tensor
+            else:
+                batch_tensor = numpy.concatenate([tile.tensor for tile in batch], axis=self._batch_axis)
+            future = self._predict_batch(batch_tensor)
+        except Exception as e:
+            for tile in batch:
+                tile.set_result(exception=e)
+            return
+
+        future.add_done_callback(lambda f: self._distribute(batch, f))
+
+    def _distribute(self, batch: List[_PendingTile], future):
+        try:
+            result = future.result()
+            if result.shape[self._output_batch_axis] != len(batch):
+                raise ValueError(
+                    f"Expected a prediction with {len(batch)} entries along axis {self._output_batch_axis}, "
+                    f"got shape {result.shape}"
+                )
+        except Exception as e:
+            for tile in batch:
+                tile.set_result(exception=e)
+            return
+
+        for tile, tile_result in zip(batch, numpy.split(result, len(batch), axis=self._output_batch_axis)):
+            tile.set_result(tile_result)
@@ -21,6 +21,7 @@
 ###############################################################################
 import logging
 import socket
+import threading
 import numpy
 import warnings
 import numpy as np
@@ -29,12 +30,14 @@ from typing import Iterable, Tuple, Optional, List
 
 import vigra
 import grpc
+from concurrent.futures import Future
 
 
 from lazyflow.operators.opReorderAxes import OpReorderAxes
 from lazyflow.graph import Graph
 from lazyflow.request import Request
 from lazyflow.roi import roiToSlice
+from lazyflow.operators.tiktorch.batching import PredictionBatcher
 
 from tiktorch.launcher import LocalServerLauncher, RemoteSSHServerLauncher, SSHCred, ConnConf
 from tiktorch import converters
@@ -47,9 +50,15 @@ logger = logging.getLogger(__name__)
 
 
 class ModelSession:
+    # Concurrent tile predictions of the same shape are sent as one batch (if the model has a batch axis)
+    MAX_BATCH_SIZE = 8
+    MAX_BATCH_DELAY = 0.005  # seconds
+
     def __init__(self, session, factory):
         self.__session = session
         self.__factory = factory
+        self.__batcher = None
+        self.__batcher_lock = threading.Lock()
 
     @property
     def tiktorchClient(self):
@@ -150,16 +159,20 @@ class ModelSession:
         reordered_feature_image = reorder_axes(feature_image, from_axes_tags=axistags, to_axes_tags=self.input_axes)
 
         try:
-            current_rq = Request._current_request()
-            resp = self.tiktorchClient.Predict.future(
-                inference_pb2.PredictRequest(
-                    tensor=converters.numpy_to_pb_tensor(reordered_feature_image), modelSessionId=self.__session.id
+            batcher = self._get_batcher()
+            if batcher is not None:
+                result = batcher.predict(numpy.asarray(reordered_feature_image))
+            else:
+                current_rq = Request._current_request()
+                resp = self.tiktorchClient.Predict.future(
+                    inference_pb2.PredictRequest(
+                        tensor=converters.numpy_to_pb_tensor(reordered_feature_image), modelSessionId=self.__session.id
+                    )
                 )
-            )
-            resp.add_done_callback(lambda o: current_rq._wake_up())
-            current_rq._suspend()
-            resp = resp.result()
-            result = converters.pb_tensor_to_numpy(resp.tensor)
+                resp.add_done_callback(lambda o: current_rq._wake_up())
+                current_rq._suspend()
+                resp = resp.result()
+                result = converters.pb_tensor_to_numpy(resp.tensor)
         except Exception:
             logger.exception("Predict call failed")
             return 0
@@ -183,6 +196,42 @@ class ModelSession:
 
         return reorder_axes(result, from_axes_tags=output_axis_order, to_axes_tags=axistags)
 
+    def _get_batcher(self) -> Optional[PredictionBatcher]:
+        """
+        Batching needs a batch axis ('b') in both the model's input and output axes.
+        """
+        if "b" not in self.input_axes or "b" not in self.output_axes:
+            return None
+
+        with self.__batcher_lock:
+            if self.__batcher is None:
+                self.__batcher = PredictionBatcher(
+                    self._predict_batch,
+                    batch_axis=self.input_axes.index("b"),
+                    output_batch_axis=self.output_axes.index("b"),
+                    max_batch_size=self.MAX_BATCH_SIZE,
+                    max_delay=self.MAX_BATCH_DELAY,
+                )
+            return self.__batcher
+
+    def _predict_batch(self, batch: numpy.ndarray) -> Future:
+        """
+        Send one (batched) Predict call, returns a future of the prediction as numpy array.
+        """
+        result = Future()
+
+        def on_response(response_future):
+            try:
+                result.set_result(converters.pb_tensor_to_numpy(response_future.result().tensor))
+            except Exception as e:
+                result.set_exception(e)
+
+        response = self.tiktorchClient.Predict.future(
+            inference_pb2.PredictRequest(tensor=converters.numpy_to_pb_tensor(batch), modelSessionId=self.__session.id)
+        )
+        response.add_done_callback(on_response)
+        return result
+
 
 def reorder_axes(input_arr: numpy.ndarray, *, from_axes_tags: str, to_axes_tags: str):
     if isinstance(from_axes_tags, AxisTags):
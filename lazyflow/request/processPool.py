@@ -0,0 +1,268 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Optional process pool for CPU-bound, GIL-holding computations.
+
+Operators cannot be moved to another process as a whole (their slots and caches live in the
+main process), so the unit of work is a *kernel*: a module-level function that receives plain
+arguments (numpy arrays, numbers, dicts, ...) and returns a result.
+Marking a kernel with :func:`process_pool_kernel` makes every call to it run in the global
+process pool, if one is configured, and inline otherwise:
+
+.. code-block:: python
+
+    @process_pool_kernel
+    def _compute_features(image, labels):
+        ...  # pure python loops
+
+    class OpMyFeatures(Operator):
+        def execute(self, slot, subindex, roi, result):
+            image = self.Image(roi.start, roi.stop).wait()
+            labels = self.Labels(roi.start, roi.stop).wait()
+            result[:] = _compute_features(image, labels)
+
+Numpy arrays passed as arguments or returned as results are transferred through shared memory
+instead of being pickled. Inside the kernel, array arguments are read-only.
+
+When called from within a request, the request is suspended (its worker thread is free to run
+other requests) until the kernel finishes. Exceptions raised by the kernel are re-raised in the
+caller. A request that is cancelled while its kernel is running raises ``CancellationException``
+as soon as the kernel returns.
+
+The pool is configured via ``Request.reset_thread_pool(num_processes=...)``.
+"""
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+
+import numpy
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: arrays are pickled instead.
+    shared_memory = None
+
+logger = logging.getLogger(__name__)
+
+# True inside the worker processes, where kernels always run inline.
+_in_worker_process = False
+
+# The pool used by process_pool_kernel(). See reset_process_pool().
+global_process_pool = None
+
+
+class _SharedArray:
+    """Picklable handle for a numpy array stored in a shared memory block."""
+
+    def __init__(self, array):
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.name = self._shm.name
+        numpy.ndarray(self.shape, self.dtype, buffer=self._shm.buf)[...] = array
+
+    def __getstate__(self):
+        return {"shape": self.shape, "dtype": self.dtype, "name": self.name}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+
+    def attach(self, readonly=False):
+        """Return a numpy array backed by the shared memory block (valid until close())."""
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        array = numpy.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+        array.flags.writeable = not readonly
+        return array
+
+    def close(self):
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # Someone still holds a view of the buffer; it is released on garbage collection.
+                pass
+
+    def unlink(self):
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        self.close()
+        self._shm.unlink()
+
+
+def _share(value):
+    if shared_memory is not None and isinstance(value, numpy.ndarray) and value.dtype != object:
+        return _SharedArray(value)
+    return value
+
+
+def _unshare(value, readonly=False):
+    if isinstance(value, _SharedArray):
+        return value.attach(readonly)
+    return value
+
+
+def _run_kernel(fn, args, kwargs):
+    """Entry point in the worker process."""
+    args = tuple(_unshare(a, readonly=True) for a in args)
+    kwargs = {k: _unshare(v, readonly=True) for k, v in kwargs.items()}
+    result = fn(*args, **kwargs)
+    del args, kwargs
+
+    if isinstance(result, tuple):
+        shared = tuple(_share(r) for r in result)
+    else:
+        shared = _share(result)
+
+    for handle in shared if isinstance(shared, tuple) else (shared,):
+        if isinstance(handle, _SharedArray):
+            handle.close()
+    return shared
+
+
+def _collect_result(shared):
+    """Copy shared result arrays into process-local memory and free the shared blocks."""
+
+    def collect(value):
+        if not isinstance(value, _SharedArray):
+            return value
+        try:
+            return value.attach().copy()
+        finally:
+            value.unlink()
+
+    if isinstance(shared, tuple):
+        return tuple(collect(v) for v in shared)
+    return collect(shared)
+
+
+def _init_worker():
+    global _in_worker_process
+    _in_worker_process = True
+
+
+class ProcessPool:
+    """Manages a set of worker processes that run kernels.
+
+    Attributes:
+        num_workers: The number of worker processes.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        # "spawn" rather than "fork": forking a process that runs lazyflow's worker threads can deadlock.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            num_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+        )
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        """Schedule ``fn(*args, **kwargs)`` in a worker process.
+
+        Array arguments are copied to shared memory, which is released when the returned future is done.
+        The future's result still has to be passed through :func:`_collect_result`.
+        """
+        shared_args = tuple(_share(a) for a in args)
+        shared_kwargs = {k: _share(v) for k, v in kwargs.items()}
+        handles = [v for v in shared_args + tuple(shared_kwargs.values()) if isinstance(v, _SharedArray)]
+
+        def release(_future):
+            for handle in handles:
+                handle.unlink()
+
+        try:
+            future = self._executor.submit(_run_kernel, fn, shared_args, shared_kwargs)
+        except BaseException:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return future
+
+    def stop(self):
+        """Shut down the worker processes, after all queued kernels are done."""
+        self._executor.shutdown(wait=True)
+
+
+def reset_process_pool(num_workers: int):
+    """Replace the global process pool. With ``num_workers == 0``, kernels run inline."""
+    global global_process_pool
+    if global_process_pool is not None:
+        global_process_pool.stop()
+    global_process_pool = ProcessPool(num_workers) if num_workers > 0 else None
+
+
+def run_in_process_pool(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` in the global process pool and return its result.
+
+    Behaves like a synchronous call: from within a request, only the request is suspended,
+    not the worker thread. Runs ``fn`` inline if no process pool is configured.
+    """
+    from .request import Request, RequestLock
+
+    pool = global_process_pool
+    if pool is None or _in_worker_process:
+        return fn(*args, **kwargs)
+
+    Request.raise_if_cancelled()
+    future = pool.submit(fn, *args, **kwargs)
+
+    if Request._current_request() is None or Request.global_thread_pool.num_workers == 0:
+        shared = future.result()
+    else:
+        # The lock is released by the executor's management thread once the kernel is done.
+        done = RequestLock()
+        done.acquire()
+        future.add_done_callback(lambda _f: done.release())
+        try:
+            done.acquire()
+            Request.raise_if_cancelled()
+        except Request.CancellationException:
+            _discard_result(future)
+            raise
+        shared = future.result()
+
+    return _collect_result(shared)
+
+
+def _discard_result(future):
+    """Free the shared memory of a finished kernel whose result is not needed."""
+    if not future.cancelled() and future.exception() is None:
+        _collect_result(future.result())
+
+
+def process_pool_kernel(fn):
+    """Decorator: calls to ``fn`` are dispatched via :func:`run_in_process_pool`.
+
+    ``fn`` must be a module-level function, so that the worker processes can import it.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if global_process_pool is None or _in_worker_process:
+            return fn(*args, **kwargs)
+        # Worker processes look up the kernel by name, i.e. they unpickle the wrapper,
+        # which runs inline there (see _in_worker_process).
+        return run_in_process_pool(wrapper, *args, **kwargs)
+
+    return wrapper
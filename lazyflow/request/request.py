@@ -45,7 +45,7 @@ logger = logging.getLogger(__name__)
 import greenlet
 
 # lazyflow
-from . import threadPool
+from . import processPool, threadPool
 
 # This module's code needs to be sanitized if you're not using CPython.
 # In particular, check that set operations like remove() are still atomic.
@@ -118,7 +118,7 @@ class Request(object):
     active_count = 0
 
     @classmethod
-    def reset_thread_pool(cls, num_workers=min(multiprocessing.cpu_count(), 8)):
+    def reset_thread_pool(cls, num_workers=min(multiprocessing.cpu_count(), 8), scheduler="default", num_processes=None):
         """
         Change the number of threads allocated to the request system.
 
@@ -127,6 +127,13 @@ class Request(object):
                             workers, even on machines with many CPUs.
                             For more details, see:
                             https://github.com/ilastik/ilastik/issues/1458
+        :param scheduler: Which thread pool implementation to use, one of the keys of
+                          ``threadPool.SCHEDULERS``: ``"default"`` (one shared queue for
+                          unstarted requests) or ``"work_stealing"`` (per-worker queues).
+        :param num_processes: How many worker processes to start for kernels marked with
+                              ``processPool.process_pool_kernel``. With 0, these kernels run
+                              inline in the calling request. With None (the default), the
+                              current process pool is kept.
 
         As a special case, you may set ``num_workers`` to 0.
         In that case, the normal thread pool is not used at all.
@@ -142,7 +149,9 @@ class Request(object):
 
             if cls.global_thread_pool is not None:
                 cls.global_thread_pool.stop()
-            cls.global_thread_pool = threadPool.ThreadPool(num_workers)
+            cls.global_thread_pool = threadPool.SCHEDULERS[scheduler](num_workers)
+            if num_processes is not None:
+                processPool.reset_process_pool(num_processes)
 
     class CancellationException(Exception):
         """
@@ -21,6 +21,8 @@
 ###############################################################################
 
 import atexit
+import heapq
+import itertools
 import logging
 import queue
 import threading
@@ -182,3 +184,227 @@ class _Worker(threading.Thread):
                 # You may have to wrap it in a custom class first.
                 task.assigned_worker = self
                 return task
+
+
+class WorkStealingThreadPool:
+    """Manages a set of worker threads, each with its own queue of unstarted tasks.
+
+    Unstarted tasks are pushed to the queue of the submitting worker (or, for tasks submitted from
+    a foreign thread, distributed round-robin). An idle worker first drains its own queues and then
+    steals the highest-priority unstarted task from one of its peers.
+
+    Tasks that have already been started remain pinned to their assigned worker, because a greenlet
+    can only be resumed in the thread that created it. Both kinds of queues are priority heaps, so the
+    ordering defined by ``Request.__lt__`` is preserved within each worker.
+
+    In contrast to :class:`ThreadPool`, waking up an unassigned task notifies a single idle worker
+    instead of all of them.
+
+    Attributes:
+        num_workers: The number of worker threads.
+    """
+
+    def __init__(self, num_workers: int):
+        """Start all workers."""
+        self._idle_lock = threading.Lock()
+        self._idle_workers = []
+        self._next_victim = itertools.count()
+
+        self._worker_list = [_StealingWorker(self, i) for i in range(num_workers)]
+        self.workers = set(self._worker_list)
+        for w in self._worker_list:
+            w.start()
+
+        atexit.register(self.stop)
+
+    @property
+    def num_workers(self):
+        return len(self.workers)
+
+    def wake_up(self, task: Callable[[], None]) -> None:
+        """Schedule the given task on the worker that is assigned to it.
+
+        If it has no assigned worker yet, queue it on the current worker (or any worker, if called from
+        a foreign thread) and wake up one idle worker that can pick it up.
+        """
+        if getattr(task, "assigned_worker", None) is not None:
+            task.assigned_worker.wake_up(task)
+            return
+
+        current = threading.current_thread()
+        if isinstance(current, _StealingWorker) and current.thread_pool is self:
+            owner = current
+        else:
+            owner = self._worker_list[next(self._next_victim) % len(self._worker_list)]
+        owner.push_unassigned(task)
+
+        with self._idle_lock:
+            idle_worker = self._idle_workers.pop() if self._idle_workers else None
+        if idle_worker is not None:
+            idle_worker.notify()
+
+    def stop(self) -> None:
+        """Stop all threads in the pool, and block for them to complete.
+
+        Postcondition: All worker threads have stopped, unfinished tasks are simply dropped.
+        """
+        for w in self._worker_list:
+            w.stop()
+
+        for w in self._worker_list:
+            w.join()
+
+    def get_states(self) -> List[str]:
+        return [w.state for w in self._worker_list]
+
+    def _steal(self, thief):
+        """Take the highest-priority unstarted task from one of the thief's peers.
+
+        Victims are visited starting at a rotating offset, so that thieves don't all hammer the same worker.
+        Returns None if no peer has unstarted work.
+        """
+        n = len(self._worker_list)
+        start = next(self._next_victim)
+        for offset in range(n):
+            victim = self._worker_list[(start + offset) % n]
+            if victim is thief:
+                continue
+            task = victim.pop_unassigned()
+            if task is not None:
+                return task
+        return None
+
+    def _register_idle(self, worker):
+        with self._idle_lock:
+            self._idle_workers.append(worker)
+
+    def _unregister_idle(self, worker):
+        with self._idle_lock:
+            try:
+                self._idle_workers.remove(worker)
+            except ValueError:
+                pass
+
+
+class _StealingWorker(threading.Thread):
+    """Worker thread of a :class:`WorkStealingThreadPool`.
+
+    Keeps two priority heaps: ``job_queue`` holds started tasks that are pinned to this worker,
+    ``unassigned_tasks`` holds unstarted tasks that may be stolen by other workers.
+    """
+
+    def __init__(self, thread_pool, index):
+        super().__init__(name=f"Worker #{index}", daemon=True)
+        self.thread_pool = thread_pool
+        self.stopped = False
+        self.state = "initialized"
+
+        # Protects both heaps. Never held while acquiring another worker's lock.
+        self._queue_lock = threading.Lock()
+        self.job_queue = []
+        self.unassigned_tasks = []
+
+        self._wakeup_condition = threading.Condition()
+        self._signalled = False
+
+    def run(self):
+        """Keep executing available tasks until we're stopped."""
+        self.state = "waiting"
+        next_task = self._get_next_job()
+
+        while not self.stopped:
+            self.state = "running task"
+            try:
+                next_task()
+            except Exception:
+                logger.exception("Exception during processing %s", next_task)
+
+            self.state = "freeing task"
+            next_task = None
+
+            if self.stopped:
+                return
+
+            self.state = "waiting"
+            next_task = self._get_next_job()
+
+    def stop(self):
+        """Tell this worker to stop running.
+
+        Does not block for thread completion.
+        """
+        self.stopped = True
+        self.notify()
+
+    def notify(self):
+        """Wake this worker up if it is waiting for work."""
+        with self._wakeup_condition:
+            self._signalled = True
+            self._wakeup_condition.notify()
+
+    def wake_up(self, task):
+        """Add this (already started) task to the queue of tasks that are ready to be resumed."""
+        assert task.assigned_worker is self
+        with self._queue_lock:
+            heapq.heappush(self.job_queue, task)
+        self.notify()
+
+    def push_unassigned(self, task):
+        with self._queue_lock:
+            heapq.heappush(self.unassigned_tasks, task)
+
+    def pop_unassigned(self):
+        with self._queue_lock:
+            if self.unassigned_tasks:
+                return heapq.heappop(self.unassigned_tasks)
+        return None
+
+    def _get_next_job(self):
+        """Get the next available job to perform.
+
+        If necessary, block until a task is available (return it) or the worker has been stopped (return None).
+        """
+        while not self.stopped:
+            next_task = self._pop_job()
+            if next_task is not None:
+                return next_task
+
+            # Register as idle *before* looking once more, so that a task queued in between
+            # is either seen by us or results in a notification.
+            self.thread_pool._register_idle(self)
+            next_task = self._pop_job()
+            if next_task is not None:
+                self.thread_pool._unregister_idle(self)
+                return next_task
+
+            with self._wakeup_condition:
+                while not self._signalled and not self.stopped:
+                    self._wakeup_condition.wait()
+                self._signalled = False
+            self.thread_pool._unregister_idle(self)
+
+        return None
+
+    def _pop_job(self):
+        """Get a job from our own queues, or steal one from another worker.
+
+        As in ThreadPool, tasks that were already started on this worker take precedence over new ones.
+        Return None if no work is available. Non-blocking.
+        """
+        with self._queue_lock:
+            if self.job_queue:
+                return heapq.heappop(self.job_queue)
+            task = heapq.heappop(self.unassigned_tasks) if self.unassigned_tasks else None
+
+        if task is None:
+            task = self.thread_pool._steal(self)
+            if task is None:
+                return None
+
+        # See ThreadPool: the callable must allow setting arbitrary members.
+        task.assigned_worker = self
+        return task
+
+
+#: Thread pool implementations selectable via ``Request.reset_thread_pool(scheduler=...)``
+SCHEDULERS = {"default": ThreadPool, "work_stealing": WorkStealingThreadPool}
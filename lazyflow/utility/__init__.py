@@ -34,6 +34,7 @@ from .pathHelpers import PathComponents, getPathVariants, isUrl, make_absolute,
 
 from .roiRequestBatch import RoiRequestBatch
 from .bigRequestStreamer import BigRequestStreamer
+from .pointSetRequest import request_at_points
 from . import io_util
 from .format_known_keys import format_known_keys
 from .timer import Timer, timeLogged
@@ -45,3 +46,5 @@ from .log_exception import log_exception
 from .transposed_view import TransposedView
 from .reorderAxesDecorator import reorder_options, reorder
 from .pipeline import Pipeline
+from .roiIndex import RoiIndex
+from .bufferPool import BufferPool
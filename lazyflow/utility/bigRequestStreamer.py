@@ -94,7 +94,14 @@ class BigRequestStreamer(object):
     """
 
     def __init__(
-        self, outputSlot, roi, blockshape=None, batchSize=None, blockAlignment="absolute", allowParallelResults=False
+        self,
+        outputSlot,
+        roi,
+        blockshape=None,
+        batchSize=None,
+        blockAlignment="absolute",
+        allowParallelResults=False,
+        chunkShape=None,
     ):
         """
         Constructor.
@@ -106,6 +113,8 @@ class BigRequestStreamer(object):
         :param blockAlignment: Determines how block the requests. Choices are 'absolute' or 'relative'.
         :param allowParallelResults: If False, The resultSignal will not be called in parallel.
                                      In that case, your handler function has no need for locks.
+        :param chunkShape: If given, the blockshape is rounded to a multiple of this shape, so that (with absolute
+                           alignment) every request covers whole chunks and no chunk is split between requests.
         """
         self._outputSlot = outputSlot
         self._bigRoi = roi
@@ -119,6 +128,9 @@ class BigRequestStreamer(object):
         if blockshape is None:
             blockshape = self._determine_blockshape(outputSlot)
 
+        if chunkShape is not None:
+            blockshape = self._align_blockshape(blockshape, chunkShape)
+
         assert blockAlignment in ["relative", "absolute"]
         if blockAlignment == "relative":
             # Align the blocking with the start of the roi
@@ -175,6 +187,17 @@ class BigRequestStreamer(object):
 
         self._requestBatch = RoiRequestBatch(self._outputSlot, roiGen(), totalVolume, batchSize, allowParallelResults)
 
+    @staticmethod
+    def _align_blockshape(blockshape, chunkShape):
+        """
+        Round each dimension of the blockshape to the nearest multiple of the chunk shape (at least one chunk).
+        """
+        chunkShape = numpy.asarray(chunkShape)
+        num_chunks = numpy.maximum(1, numpy.round(numpy.divide(blockshape, chunkShape))).astype(int)
+        aligned = tuple(int(x) for x in num_chunks * chunkShape)
+        logger.debug("Aligned blockshape {} to chunk shape {}: {}".format(blockshape, tuple(chunkShape), aligned))
+        return aligned
+
     def _determine_blockshape(self, outputSlot):
         """
         Choose a blockshape using the slot metadata (if available) or an arbitrary guess otherwise.
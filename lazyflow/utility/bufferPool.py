@@ -0,0 +1,97 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import collections
+import threading
+
+import numpy
+
+
+class BufferPool(object):
+    """
+    A thread-safe pool of reusable numpy arrays.
+
+    Operators that allocate the same temporary arrays for every request (e.g. one per tile of a
+    blockwise export) can take them from a pool instead, to avoid the cost of allocating and
+    page-faulting fresh memory each time. Arrays returned by `acquire()` are uninitialized.
+
+    >>> pool = BufferPool(max_buffers=2)
+    >>> a = pool.acquire((10, 10), numpy.float32)
+    >>> pool.release(a)
+    >>> pool.acquire((10, 10), numpy.float32) is a
+    True
+    """
+
+    def __init__(self, max_buffers=8):
+        """
+        max_buffers: How many released arrays are kept for reuse (the least recently released are dropped).
+        """
+        self.max_buffers = max_buffers
+        self._lock = threading.Lock()
+        # (shape, dtype) -> [arrays], in release order
+        self._free = collections.OrderedDict()
+        self._count = 0
+        self._nbytes = 0
+
+    def acquire(self, shape, dtype):
+        key = (tuple(map(int, shape)), numpy.dtype(dtype))
+        with self._lock:
+            buffers = self._free.get(key)
+            if buffers:
+                array = buffers.pop()
+                if not buffers:
+                    del self._free[key]
+                self._count -= 1
+                self._nbytes -= array.nbytes
+                return array
+        return numpy.empty(*key)
+
+    def release(self, array):
+        """
+        Hand an array obtained from `acquire()` back to the pool. The caller must not use it anymore.
+        """
+        if self.max_buffers <= 0:
+            return
+        key = (array.shape, array.dtype)
+        with self._lock:
+            self._free.setdefault(key, []).append(array)
+            self._free.move_to_end(key)
+            self._count += 1
+            self._nbytes += array.nbytes
+            while self._count > self.max_buffers:
+                oldest_key = next(iter(self._free))
+                buffers = self._free[oldest_key]
+                self._nbytes -= buffers.pop(0).nbytes
+                self._count -= 1
+                if not buffers:
+                    del self._free[oldest_key]
+
+    def nbytes(self):
+        """
+        Memory held by the arrays that are currently in the pool.
+        """
+        return self._nbytes
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+            self._count = 0
+            self._nbytes = 0
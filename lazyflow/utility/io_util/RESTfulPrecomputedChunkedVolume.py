@@ -19,9 +19,14 @@
 # This information is also available on the ilastik web site at:
 #          http://ilastik.org/license/
 ###############################################################################
+import concurrent.futures
+import hashlib
 import json
 import jsonschema
 import logging
+import os
+import tempfile
+import threading
 import requests
 
 import numpy
@@ -50,6 +55,10 @@ class RESTfulPrecomputedChunkedVolume(object):
 
     Note: all code, except the setup code, will assume 'czyx' order of
       coordinates, shapes, rois.
+
+    Chunks are downloaded concurrently (at most `n_threads` at a time) over a
+    pooled keep-alive session. If a `chunk_cache_dir` is given, downloaded chunks
+    are also stored there, and reused by later sessions that read the same volume.
     """
 
     info_schema = {
@@ -63,7 +72,7 @@ class RESTfulPrecomputedChunkedVolume(object):
         "required": ["type", "data_type", "num_channels", "scales"],
     }
 
-    def __init__(self, volume_url, tmp_data_file=None, n_threads=4):
+    def __init__(self, volume_url, tmp_data_file=None, n_threads=4, chunk_cache_dir=None):
         """
         Args:
             volume_url (string): base url of the precomputed volume.
@@ -74,7 +83,15 @@ class RESTfulPrecomputedChunkedVolume(object):
               temporary hdf5 file. If `None`, a file will be generated in the
               temp-folder.
             n_threads (int, optional): number of concurrent downloads
+            chunk_cache_dir (string, optional): directory to keep downloaded
+              chunks in, across sessions. If `None`, chunks are not stored.
         """
+        self.n_threads = max(1, n_threads)
+        self.chunk_cache_dir = chunk_cache_dir
+        self._session = self._create_session()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
         # might come in handy if one wants to process data on a different scale.
         # ilastik can only process data at a single scale.
         self._scale_info = None
@@ -121,6 +138,32 @@ class RESTfulPrecomputedChunkedVolume(object):
         self.dtype = self._json_info["data_type"]
         self.n_channels = self._json_info["num_channels"]
 
+        if self.chunk_cache_dir is not None:
+            # Chunks of different volumes (or of a volume that changed on the server) must not mix
+            volume_key = json.dumps([self.volume_url, self._json_info], sort_keys=True)
+            self._chunk_cache_volume_dir = os.path.join(
+                self.chunk_cache_dir, hashlib.sha1(volume_key.encode("utf-8")).hexdigest()
+            )
+
+    def _create_session(self):
+        """
+        Generate a requests.Session object with a connection pool that is large
+        enough for all concurrent downloads, so that connections are kept alive
+        instead of being established for every chunk.
+        """
+        session = requests.Session()
+        for prefix in ("http://", "https://"):
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.n_threads, pool_maxsize=self.n_threads)
+            session.mount(prefix, adapter)
+        return session
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        self._session.close()
+
     @staticmethod
     def determine_lowest_scale(scales_info_dict):
         scales = scales_info_dict.keys()
@@ -165,7 +208,7 @@ class RESTfulPrecomputedChunkedVolume(object):
 
     def download_info(self):
         logger.debug(f"getting volume from {self.volume_url}/info")
-        r = requests.get(f"{self.volume_url}/info")
+        r = self._session.get(f"{self.volume_url}/info")
 
         # check if success:
         if r.status_code != 200:
@@ -186,11 +229,80 @@ class RESTfulPrecomputedChunkedVolume(object):
 
         url, blockshape = self.generate_url(block_coordinates, scale)
         try:
-            content = self.downloading(url)
+            content = self._get_chunk(url, scale)
         except requests.exceptions.ConnectionError:
             return numpy.zeros(shape=blockshape, dtype=self.dtype)
         return self.decode_content(content, encoding=self.get_encoding(scale), shape=blockshape, dtype=self.dtype)
 
+    def read(self, roi, result, scale=None):
+        """Read the given roi into result, downloading the intersecting blocks concurrently
+
+        Each block is written directly into `result` as soon as it is decoded.
+
+        Args:
+            roi (tuple): (start, stop) in 'czyx' order
+            result (ndarray): destination of shape stop - start
+            scale (string): key identifying the scale to be used
+        """
+        if scale is None:
+            scale = self._use_scale
+        start, stop = numpy.asarray(roi[0]), numpy.asarray(roi[1])
+        assert tuple(result.shape) == tuple(stop - start), f"result shape {result.shape} does not match roi {roi}"
+        block_starts = lazyflow.roi.getIntersectingBlocks(self.get_block_shape(scale), (start, stop))
+
+        def read_block(block_start):
+            block = self.download_block(block_start, scale)
+            block_stop = block_start + block.shape
+            intersection_start = numpy.maximum(start, block_start)
+            intersection_stop = numpy.minimum(stop, block_stop)
+            source = lazyflow.roi.roiToSlice(intersection_start - block_start, intersection_stop - block_start)
+            destination = lazyflow.roi.roiToSlice(intersection_start - start, intersection_stop - start)
+            result[destination] = block[source]
+
+        if len(block_starts) == 1 or self.n_threads == 1:
+            for block_start in block_starts:
+                read_block(block_start)
+        else:
+            # The executor has n_threads workers, which bounds the number of downloads in flight
+            futures = [self._get_executor().submit(read_block, block_start) for block_start in block_starts]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+        return result
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.n_threads)
+            return self._executor
+
+    def _get_chunk(self, url, scale):
+        """Return the (encoded) content of the chunk at url, from the chunk cache if possible"""
+        if self.chunk_cache_dir is None:
+            return self.downloading(url)
+
+        cache_path = os.path.join(self._chunk_cache_volume_dir, scale, url.rsplit("/", 1)[-1])
+        try:
+            with open(cache_path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+
+        content = self.downloading(url)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Write to a temporary file first, so that concurrent readers never see partial chunks
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            logger.warning(f"Could not store chunk in {cache_path}", exc_info=True)
+        return content
+
     @classmethod
     def decode_content(cls, content, encoding, shape, dtype):
         """converts to numpy array according to self.encoding
@@ -202,15 +314,15 @@ class RESTfulPrecomputedChunkedVolume(object):
         logger.debug(f"decoding encoding {encoding}; dtype {dtype}")
         if encoding == "raw":
             raw = content
-            arr = numpy.fromstring(raw, dtype=dtype).reshape(shape)
+            arr = numpy.frombuffer(raw, dtype=dtype).reshape(shape)
             return arr
         else:
             raise NotImplementedError(f"encoding {encoding} not supported :(")
 
-    @staticmethod
-    def downloading(url):
+    def downloading(self, url):
         logger.debug(f"requesting {url}")
-        r = requests.get(url)
+        r = self._session.get(url)
+        r.raise_for_status()
         return r.content
 
     def generate_url(self, block_coordinates, scale=None):
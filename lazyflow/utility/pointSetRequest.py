@@ -0,0 +1,141 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#          http://ilastik.org/license/
+###############################################################################
+import logging
+from functools import partial
+
+import numpy
+
+from lazyflow.request import RequestPool
+
+logger = logging.getLogger(__name__)
+
+# Edge lengths (in pixels) of the neighbourhood tiles that are considered for grouping the points
+DEFAULT_TILE_SIZES = (8, 16, 32, 64)
+
+# Fixed cost of issuing one more request, in units of computed pixels
+REQUEST_OVERHEAD_PIXELS = 512
+
+
+def get_request_halo(slot):
+    """
+    Per-axis halo (in pixels) the producer of the slot computes around every requested roi.
+
+    Operators that compute their output from a neighbourhood of the input (e.g. the feature filters)
+    publish the halo size of their spatial axes as ``meta.request_halo``.
+    """
+    halo = slot.meta.request_halo or 0
+    return numpy.array([halo if key in "zyx" else 0 for key in slot.meta.getAxisKeys()], dtype=numpy.int64)
+
+
+def plan_point_tiles(coords, shape, halo, tile_sizes=DEFAULT_TILE_SIZES):
+    """
+    Group points into neighbourhood tiles, such that the estimated cost of computing all tiles
+    (including the halo around each of them) is minimal.
+    A single tile covering the bounding box of all points is always one of the candidates.
+
+    >>> coords = numpy.array([[0, 0], [1, 1], [100, 100]])
+    >>> starts, stops, tile_index = plan_point_tiles(coords, shape=(128, 128), halo=numpy.array([2, 2]))
+    >>> starts.tolist(), stops.tolist(), tile_index.tolist()
+    ([[0, 0], [100, 100]], [[2, 2], [101, 101]], [0, 0, 1])
+
+    :param coords: point coordinates, shape (N, D)
+    :param shape: shape of the (non-channel) axes of the data
+    :param halo: halo per axis, shape (D,)
+    :param tile_sizes: tile edge lengths to consider
+    :returns: tuple (starts, stops, tile_index): bounding box of the points in each tile, shape (T, D),
+              and the tile of every point, shape (N,)
+    """
+    shape = numpy.asarray(shape)
+
+    def estimated_cost(starts, stops):
+        extent = numpy.minimum(stops - starts + 2 * halo, shape)
+        return numpy.prod(extent, axis=1, dtype=numpy.float64).sum() + REQUEST_OVERHEAD_PIXELS * len(starts)
+
+    best_starts = coords.min(axis=0, keepdims=True)
+    best_stops = coords.max(axis=0, keepdims=True) + 1
+    best_tile_index = numpy.zeros(len(coords), dtype=numpy.int64)
+    best_cost = estimated_cost(best_starts, best_stops)
+
+    for tile_size in sorted(tile_sizes, reverse=True):
+        tiles, tile_index = numpy.unique(coords // tile_size, axis=0, return_inverse=True)
+        tile_index = tile_index.reshape(-1)
+        if len(tiles) == 1:
+            continue
+
+        starts = numpy.full(tiles.shape, numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+        stops = numpy.zeros(tiles.shape, dtype=numpy.int64)
+        numpy.minimum.at(starts, tile_index, coords)
+        numpy.maximum.at(stops, tile_index, coords + 1)
+
+        cost = estimated_cost(starts, stops)
+        if cost < best_cost:
+            best_starts, best_stops, best_tile_index, best_cost = starts, stops, tile_index, cost
+
+    return best_starts, best_stops, best_tile_index
+
+
+def request_at_points(slot, positions, channel_range=None, tile_sizes=DEFAULT_TILE_SIZES):
+    """
+    Request the values of an array slot at a sparse set of points.
+
+    Instead of requesting the dense bounding box of all points, the points are grouped into small
+    neighbourhood tiles (see :func:`plan_point_tiles`), and only the occupied tiles are requested (in parallel).
+    For operators that compute their output from a neighbourhood of the input, this avoids computing
+    the regions between the points.
+
+    The channel axis of the slot must be the last axis.
+
+    :param slot: the slot to request from
+    :param positions: tuple of index arrays, one per non-channel axis (as returned by numpy.nonzero)
+    :param channel_range: tuple (start, stop) of the channels to request, all channels by default
+    :returns: plain ndarray of shape (N, num_channels), with one row per point (in the order of positions)
+    """
+    assert slot.meta.getAxisKeys()[-1] == "c", "This function assumes channel is the last axis."
+    if channel_range is None:
+        channel_range = (0, slot.meta.shape[-1])
+
+    coords = numpy.transpose(positions).astype(numpy.int64).reshape(-1, len(slot.meta.shape) - 1)
+    result = numpy.empty((len(coords), channel_range[1] - channel_range[0]), dtype=slot.meta.dtype)
+    if len(coords) == 0:
+        return result
+
+    halo = get_request_halo(slot)[:-1]
+    starts, stops, tile_index = plan_point_tiles(coords, slot.meta.shape[:-1], halo, tile_sizes)
+    logger.debug(f"Requesting {len(coords)} points in {len(starts)} tiles")
+
+    # Indices of the points in each tile
+    order = numpy.argsort(tile_index, kind="stable")
+    tile_bounds = numpy.searchsorted(tile_index[order], numpy.arange(len(starts) + 1))
+
+    def store(point_indices, tile_positions, tile_data):
+        result[point_indices] = tile_data[tile_positions].view(numpy.ndarray)
+
+    pool = RequestPool()
+    for tile, (start, stop) in enumerate(zip(starts, stops)):
+        point_indices = order[tile_bounds[tile] : tile_bounds[tile + 1]]
+        tile_positions = tuple(numpy.transpose(coords[point_indices] - start))
+
+        req = slot(list(start) + [channel_range[0]], list(stop) + [channel_range[1]])
+        req.notify_finished(partial(store, point_indices, tile_positions))
+        pool.add(req)
+    pool.wait()
+    return result
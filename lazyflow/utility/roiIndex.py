@@ -0,0 +1,137 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2020, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import collections
+import itertools
+
+
+class RoiIndex(object):
+    """
+    A spatial index (grid hash) for a set of rois, supporting containment and intersection queries.
+
+    Space is divided into cells of a fixed shape. Each roi is registered with every cell it overlaps,
+    so a query only has to look at the rois registered with the cells it touches instead of all rois.
+    Rois that would touch more than ``max_cells_per_roi`` cells are kept in a separate list
+    that is always scanned.
+
+    All rois are ``(start, stop)`` pairs of tuples of ints.
+
+    >>> index = RoiIndex(cell_shape=(10, 10))
+    >>> index.add(((0, 0), (10, 10)))
+    >>> index.add(((10, 0), (20, 10)))
+    >>> index.containing(((2, 2), (5, 5)))
+    ((0, 0), (10, 10))
+    >>> sorted(index.intersecting(((5, 5), (15, 6))))
+    [((0, 0), (10, 10)), ((10, 0), (20, 10))]
+    """
+
+    def __init__(self, cell_shape, max_cells_per_roi=64):
+        """
+        cell_shape: Shape of the grid cells. Ideally the (typical) shape of the indexed rois.
+        """
+        assert all(s > 0 for s in cell_shape), "Cell shape must be positive: {}".format(cell_shape)
+        self.cell_shape = tuple(int(s) for s in cell_shape)
+        self.max_cells_per_roi = max_cells_per_roi
+        self._cells = collections.defaultdict(set)
+        self._oversized = set()
+        self._rois = set()
+
+    def __len__(self):
+        return len(self._rois)
+
+    def __contains__(self, roi):
+        return roi in self._rois
+
+    def __iter__(self):
+        return iter(list(self._rois))
+
+    def _cell_range(self, roi):
+        start, stop = roi
+        return [range(b // s, (max(e, b + 1) - 1) // s + 1) for b, e, s in zip(start, stop, self.cell_shape)]
+
+    @staticmethod
+    def _num_cells(cell_range):
+        n = 1
+        for r in cell_range:
+            n *= len(r)
+        return n
+
+    def add(self, roi):
+        if roi in self._rois:
+            return
+        self._rois.add(roi)
+        cell_range = self._cell_range(roi)
+        if self._num_cells(cell_range) > self.max_cells_per_roi:
+            self._oversized.add(roi)
+            return
+        for cell in itertools.product(*cell_range):
+            self._cells[cell].add(roi)
+
+    def remove(self, roi):
+        if roi not in self._rois:
+            return
+        self._rois.remove(roi)
+        if roi in self._oversized:
+            self._oversized.remove(roi)
+            return
+        for cell in itertools.product(*self._cell_range(roi)):
+            rois = self._cells[cell]
+            rois.discard(roi)
+            if not rois:
+                del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._oversized.clear()
+        self._rois.clear()
+
+    def containing(self, inner_roi):
+        """
+        Return one roi that entirely contains inner_roi, or None.
+        """
+        start, stop = inner_roi
+        # Any containing roi also contains the first pixel of inner_roi.
+        cell = tuple(b // s for b, s in zip(start, self.cell_shape))
+        for roi in itertools.chain(self._cells.get(cell, ()), self._oversized):
+            outer_start, outer_stop = roi
+            if all(ob <= b for ob, b in zip(outer_start, start)) and all(oe >= e for oe, e in zip(outer_stop, stop)):
+                return roi
+        return None
+
+    def intersecting(self, roi):
+        """
+        Return all rois that intersect the given roi.
+        """
+        start, stop = roi
+        cell_range = self._cell_range(roi)
+        if self._num_cells(cell_range) > len(self._cells):
+            # Cheaper to look at all cells that are in use
+            candidates = self._rois
+        else:
+            candidates = set(self._oversized)
+            for cell in itertools.product(*cell_range):
+                candidates.update(self._cells.get(cell, ()))
+
+        return [
+            other
+            for other in candidates
+            if all(ob < e and b < oe for (ob, oe, b, e) in zip(other[0], other[1], start, stop))
+        ]
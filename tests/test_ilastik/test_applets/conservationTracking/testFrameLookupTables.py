@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from hytra.core.hypothesesgraph import HypothesesGraph
+from hytra.core.probabilitygenerator import Traxel
+from lazyflow.graph import Graph
+
+from ilastik.applets.tracking.conservation.opConservationTracking import OpConservationTracking
+
+
+def hypotheses_graph(nodes, links):
+    """
+    Solved traxel level hypotheses graph: nodes maps (t, id) to the number of objects, links are the selected links.
+    """
+    graph = HypothesesGraph()
+    for (t, idx), value in sorted(nodes.items()):
+        traxel = Traxel()
+        traxel.Timestep = t
+        traxel.Id = idx
+        graph.addNodeFromTraxel(traxel, value=value, divisionValue=False)
+    for source, destination in links:
+        graph._graph.add_edge(source, destination, value=1)
+    graph.computeLineage()
+    return graph
+
+
+def reference_lineage_ids(hypothesesGraph, resolvedMergersDict, volume, time, onlyMergers=False):
+    """
+    Per-label relabelling, as done before the lookup tables were cached.
+    """
+    indexMapping = np.zeros(np.amax(volume) + 1, dtype=volume.dtype)
+    idxs = np.unique(volume)
+    if onlyMergers:
+        if resolvedMergersDict:
+            newIds = [newId for nodeDict in resolvedMergersDict.get(time, {}).values() for newId in nodeDict["newIds"]]
+            idxs = [idx for idx in idxs if idx in newIds]
+        else:
+            idxs = [
+                idx
+                for idx in idxs
+                if idx > 0
+                and hypothesesGraph.hasNode((time, idx))
+                and hypothesesGraph._graph.node[(time, idx)]["value"] > 1
+            ]
+
+    for idx in idxs:
+        if idx > 0 and hypothesesGraph.hasNode((time, idx)):
+            lineage_id = hypothesesGraph.getLineageId(time, idx)
+            indexMapping[idx] = 1 if lineage_id is None else lineage_id
+    return indexMapping[volume]
+
+
+class RecordingMergerResolver:
+    """
+    Records which labels the merger resolver plugin is asked to relabel.
+    """
+
+    def __init__(self):
+        self.relabeled = []
+
+    def updateLabelImage(self, volume, idx, fits, newIds, offset=None):
+        self.relabeled.append(idx)
+
+
+# Frame 0: object 2 is a merger of two objects, object 3 a false detection
+NODES = {(0, 1): 1, (0, 2): 2, (0, 3): 0, (1, 1): 1, (1, 2): 2, (1, 4): 1}
+LINKS = [((0, 1), (1, 1)), ((0, 2), (1, 2))]
+
+# The same, after merger resolving: object 2 of frame 0 became objects 5 and 6
+RESOLVED_NODES = {(0, 1): 1, (0, 3): 0, (0, 5): 1, (0, 6): 1, (1, 1): 1, (1, 2): 1, (1, 4): 1}
+RESOLVED_LINKS = [((0, 1), (1, 1)), ((0, 5), (1, 2))]
+RESOLVED_MERGERS = {0: {2: {"fits": [], "newIds": [5, 6]}}}
+
+
+@pytest.fixture
+def op():
+    return OpConservationTracking(graph=Graph())
+
+
+@pytest.fixture
+def volumes():
+    # Label 7 is not in the graph
+    rng = np.random.RandomState(0)
+    return {t: rng.randint(0, 8, size=(20, 30)).astype(np.uint32) for t in (0, 1)}
+
+
+@pytest.mark.parametrize("onlyMergers", [False, True])
+@pytest.mark.parametrize("resolved", [False, True])
+def test_lineage_ids_match_per_label_lookup(op, volumes, onlyMergers, resolved):
+    if resolved:
+        hypothesesGraph = hypotheses_graph(RESOLVED_NODES, RESOLVED_LINKS)
+        resolvedMergers = RESOLVED_MERGERS
+    else:
+        hypothesesGraph = hypotheses_graph(NODES, LINKS)
+        resolvedMergers = {}
+    op.HypothesesGraph.setValue(hypothesesGraph)
+    op.ResolvedMergers.setValue(resolvedMergers)
+
+    for t, volume in volumes.items():
+        expected = reference_lineage_ids(hypothesesGraph, resolvedMergers, volume, t, onlyMergers)
+        relabeled = op._labelLineageIds(volume, t, onlyMergers=onlyMergers)
+        assert relabeled.dtype == volume.dtype
+        np.testing.assert_array_equal(relabeled, expected)
+
+
+def test_label_mergers(op, volumes):
+    op.HypothesesGraph.setValue(hypotheses_graph(RESOLVED_NODES, RESOLVED_LINKS))
+    op.ResolvedMergers.setValue(RESOLVED_MERGERS)
+    op.mergerResolverPlugin = RecordingMergerResolver()
+
+    op._labelMergers(volumes[0], 0, offset=[0, 0])
+    assert op.mergerResolverPlugin.relabeled == [2]
+
+    # No mergers in frame 1
+    op._labelMergers(volumes[1], 1, offset=[0, 0])
+    assert op.mergerResolverPlugin.relabeled == [2]
+
+
+def test_lookup_tables_are_reset(op, volumes):
+    op.HypothesesGraph.setValue(hypotheses_graph(NODES, LINKS))
+    op._labelLineageIds(volumes[0], 0)
+    assert 0 in op._frameLookupTables
+
+    # A new tracking result
+    hypothesesGraph = hypotheses_graph(RESOLVED_NODES, RESOLVED_LINKS)
+    op.HypothesesGraph.setValue(hypothesesGraph)
+    assert op._frameLookupTables == {}
+    np.testing.assert_array_equal(
+        op._labelLineageIds(volumes[0], 0), reference_lineage_ids(hypothesesGraph, {}, volumes[0], 0)
+    )
+
+    op.ResolvedMergers.setValue(RESOLVED_MERGERS)
+    assert op._frameLookupTables == {}
+    np.testing.assert_array_equal(
+        op._labelLineageIds(volumes[0], 0, onlyMergers=True),
+        reference_lineage_ids(hypothesesGraph, RESOLVED_MERGERS, volumes[0], 0, onlyMergers=True),
+    )
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+
+from ilastik.applets.tracking.base.traxelTable import FrameTraxels, build_hypotheses_graph, transition_candidates
+
+
+class RecordingTraxel:
+    """
+    Stand-in for hytra's Traxel, with the same setter interface.
+    """
+
+    def __init__(self):
+        self.Id = None
+        self.Timestep = None
+        self.scale = [None, None, None]
+        self.Features = {}
+
+    def set_x_scale(self, value):
+        self.scale[0] = value
+
+    def set_y_scale(self, value):
+        self.scale[1] = value
+
+    def set_z_scale(self, value):
+        self.scale[2] = value
+
+    def add_feature_array(self, name, length):
+        self.Features[name] = [0.0] * length
+
+    def set_feature_value(self, name, index, value):
+        self.Features[name][index] = value
+
+
+class RecordingGraph:
+    """
+    Stand-in for hytra's HypothesesGraph, with the interface used by build_hypotheses_graph.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.edges = {}
+        self._graph = self
+
+    def addNodeFromTraxel(self, traxel):
+        self.nodes.append((traxel.Timestep, traxel.Id))
+
+    def add_edges_from(self, edges):
+        for source, destination, attributes in edges:
+            self.edges[(source, destination)] = attributes
+
+
+def frame_at(time, centers):
+    centers = np.asarray(centers, dtype=np.float64)
+    return FrameTraxels(time, np.arange(1, len(centers) + 1), centers, centers, centers, np.ones(len(centers)))
+
+
+@pytest.fixture
+def region_features_2d():
+    # Background object first, then three objects
+    return {
+        "RegionCenter": np.array([[0, 0], [1.5, 2.5], [10, 10], [20, 5]]),
+        "Coord<Minimum>": np.array([[0, 0], [1, 2], [9, 9], [18, 4]]),
+        "Coord<Maximum>": np.array([[0, 0], [2, 3], [11, 11], [22, 6]]),
+        "Count": np.array([[0], [4], [9], [15]]),
+    }
+
+
+def test_from_region_features_pads_2d(region_features_2d):
+    frame = FrameTraxels.from_region_features(3, region_features_2d)
+
+    assert len(frame) == 3
+    assert frame.ids.tolist() == [1, 2, 3]
+    assert frame.com.tolist() == [[1.5, 2.5, 0], [10, 10, 0], [20, 5, 0]]
+    assert frame.count.tolist() == [4, 9, 15]
+
+
+def test_filter_and_probabilities(region_features_2d):
+    frame = FrameTraxels.from_region_features(3, region_features_2d)
+    frame.add_division_probabilities(np.array([[1, 0], [1, 0], [0.3, 0.7], [0.0, 1.0]]))
+    frame.add_probabilities("detProb", np.array([[1, 0], [0.2, 0.8], [0.5, 0.5], [0.9, 0.1]]))
+
+    in_range = frame.in_range(x_range=(0, 15), y_range=(0, 100), z_range=(0, 1), size_range=(5, 100))
+    assert in_range.tolist() == [False, True, False]
+
+    selected = frame.select(in_range)
+    assert selected.ids.tolist() == [2]
+    np.testing.assert_allclose(selected.features["divProb"], [[0.3, 0.7]])
+    np.testing.assert_allclose(selected.features["detProb"], [[0.5, 0.5]])
+
+    # Probabilities are clipped away from 0 and 1
+    assert 0 < frame.features["divProb"].min() and frame.features["divProb"].max() < 1
+
+
+def test_to_traxels(region_features_2d):
+    frame = FrameTraxels.from_region_features(3, region_features_2d)
+    frame.add_local_centers({1: [[1, 2, 0], [2, 3, 0]], 2: [[10, 10, 0]], 3: []})
+
+    traxels = frame.to_traxels(RecordingTraxel, scales=(1.0, 2.0, 3.0))
+
+    assert list(traxels.keys()) == [1, 2, 3]
+    traxel = traxels[1]
+    assert traxel.Id == 1
+    assert traxel.Timestep == 3
+    assert traxel.scale == [1.0, 2.0, 3.0]
+    assert traxel.Features["com"] == [1.5, 2.5, 0.0]
+    assert traxel.Features["CoordMinimum"] == [1.0, 2.0, 0.0]
+    assert traxel.Features["CoordMaximum"] == [2.0, 3.0, 0.0]
+    assert traxel.Features["count"] == [4.0]
+    assert traxel.Features["localCentersX"] == [1.0, 2.0]
+    assert traxels[2].Features["localCentersY"] == [10.0]
+
+
+def test_transition_candidates():
+    source = frame_at(0, [[0, 0, 0], [10, 0, 0], [50, 50, 0]])
+    target = frame_at(1, [[1, 0, 0], [11, 0, 0], [9, 0, 0], [100, 100, 0]])
+
+    sources, targets = transition_candidates(source, target, num_neighbors=1, max_distance=20, forward_backward=False)
+    assert list(zip(sources.tolist(), targets.tolist())) == [(1, 1), (2, 2)]
+
+    # Going backwards, target 3 is closest to source 2 as well: a division candidate
+    sources, targets = transition_candidates(source, target, num_neighbors=1, max_distance=20)
+    assert list(zip(sources.tolist(), targets.tolist())) == [(1, 1), (2, 2), (2, 3)]
+
+    sources, targets = transition_candidates(source, target, num_neighbors=2, max_distance=20, forward_backward=False)
+    assert list(zip(sources.tolist(), targets.tolist())) == [(1, 1), (1, 3), (2, 2), (2, 3)]
+
+
+def test_transition_candidates_with_few_traxels():
+    source = frame_at(0, [[0, 0, 0], [10, 0, 0]])
+    target = frame_at(1, [[500, 0, 0]])
+
+    # No more traxels than neighbours: all pairs are candidates, regardless of the distance
+    sources, targets = transition_candidates(source, target, num_neighbors=1, max_distance=20, forward_backward=False)
+    assert list(zip(sources.tolist(), targets.tolist())) == [(1, 1), (2, 1)]
+
+    sources, targets = transition_candidates(source, frame_at(1, np.zeros((0, 3))), num_neighbors=1, max_distance=20)
+    assert len(sources) == len(targets) == 0
+
+
+def test_build_hypotheses_graph():
+    frames = {
+        0: frame_at(0, [[0, 0, 0], [10, 0, 0]]),
+        1: frame_at(1, [[1, 0, 0], [11, 0, 0]]),
+        3: frame_at(3, [[2, 0, 0]]),
+    }
+    traxels_per_frame = {t: frame.to_traxels(RecordingTraxel) for t, frame in frames.items()}
+
+    graph = RecordingGraph()
+    build_hypotheses_graph(graph, frames, traxels_per_frame, num_neighbors=1, max_distance=5, skip_links=2)
+
+    assert graph.nodes == [(0, 1), (0, 2), (1, 1), (1, 2), (3, 1)]
+    # Frame 3 has a single traxel, which is a candidate for all traxels of frame 1
+    assert graph.edges == {
+        ((0, 1), (1, 1)): {"gap": 1},
+        ((0, 2), (1, 2)): {"gap": 1},
+        ((1, 1), (3, 1)): {"gap": 2},
+        ((1, 2), (3, 1)): {"gap": 2},
+    }
@@ -0,0 +1,177 @@
+import collections
+
+import pytest
+
+from ilastik.applets.tracking.conservation.windowedTracking import WindowSolution, time_windows
+
+Traxel = collections.namedtuple("Traxel", ["Timestep", "Id"])
+
+
+class FakeNetworkxGraph:
+    def __init__(self):
+        self._nodes = {}
+        self._edges = {}
+
+    def add_node(self, node, **attributes):
+        self._nodes[node] = attributes
+
+    def add_edge(self, source, destination, **attributes):
+        self._edges[(source, destination)] = attributes
+
+    def nodes(self, data=False):
+        return list(self._nodes.items()) if data else list(self._nodes)
+
+    def edges(self, data=False):
+        if data:
+            return [(source, destination, attributes) for (source, destination), attributes in self._edges.items()]
+        return list(self._edges)
+
+
+class FakeHypothesesGraph:
+    """
+    Stand-in for hytra's HypothesesGraph, with the same node and edge layout.
+    """
+
+    def __init__(self):
+        self._graph = FakeNetworkxGraph()
+        self._nextNodeUuid = 0
+
+    def addNodeFromTraxel(self, traxel, **kwargs):
+        self._graph.add_node((traxel.Timestep, traxel.Id), traxel=traxel, id=self._nextNodeUuid, **kwargs)
+        self._nextNodeUuid += 1
+
+
+def solved_window(first, last, num_objects, active, links, divisions=(), mergers=None):
+    """
+    Solved hypotheses graph with num_objects traxels per frame, of which the ones in active are selected.
+    All links are candidates, the ones in links are selected.
+    """
+    graph = FakeHypothesesGraph()
+    for t in range(first, last + 1):
+        for idx in range(1, num_objects + 1):
+            node = (t, idx)
+            graph.addNodeFromTraxel(
+                Traxel(t, idx), value=int(node in active), divisionValue=node in divisions, features=[[t]]
+            )
+    for t in range(first, last):
+        for source in range(1, num_objects + 1):
+            for destination in range(1, num_objects + 1):
+                link = ((t, source), (t + 1, destination))
+                graph._graph.add_edge(*link, value=int(link in links), gap=1)
+    return WindowSolution.from_hypotheses_graph(graph, (first, last), mergers)
+
+
+def all_nodes(solution):
+    return {node: attributes for frame in solution.nodes.values() for node, attributes in frame.items()}
+
+
+def all_links(solution):
+    return {link: attributes for frame in solution.links.values() for link, attributes in frame.items()}
+
+
+def track(first, last, idx):
+    nodes = [(t, idx) for t in range(first, last + 1)]
+    return nodes, list(zip(nodes, nodes[1:]))
+
+
+def test_time_windows():
+    assert time_windows(0, 9, 4, 2) == [(0, 3), (2, 5), (4, 7), (6, 9)]
+    assert time_windows(5, 7, 10, 2) == [(5, 7)]
+    # The last window is extended backwards to full length
+    assert time_windows(0, 10, 6, 2) == [(0, 5), (4, 9), (5, 10)]
+
+    with pytest.raises(ValueError):
+        time_windows(0, 10, 5, 1)
+    with pytest.raises(ValueError):
+        time_windows(0, 10, 3, 3)
+
+
+def test_stitch_agreeing_windows():
+    nodes, links = track(0, 8, 1)
+    first = solved_window(0, 5, 2, nodes, links)
+    second = solved_window(3, 8, 2, nodes, links)
+
+    stitched = first.stitch(second)
+
+    assert (stitched.first, stitched.last) == (0, 8)
+    assert sorted(all_links(stitched)) == links
+    assert sorted(node for node, attributes in all_nodes(stitched).items() if attributes["value"]) == nodes
+    # Inactive traxels are kept
+    assert len(all_nodes(stitched)) == 18
+
+
+def test_stitch_only_touches_overlap():
+    nodes, links = track(0, 8, 1)
+    first = solved_window(0, 5, 2, nodes, links)
+    second = solved_window(3, 8, 2, nodes, links)
+    frames_before_overlap = [first.nodes[t] for t in range(3)]
+    frames_after_overlap = [second.nodes[t] for t in range(6, 9)]
+
+    stitched = first.stitch(second)
+
+    # Stitching extends the first solution in place, frames outside of the overlap are not copied
+    assert stitched is first
+    assert all(stitched.nodes[t] is frame for t, frame in zip(range(3), frames_before_overlap))
+    assert all(stitched.nodes[t] is frame for t, frame in zip(range(6, 9), frames_after_overlap))
+
+
+def test_only_solution_attributes_are_kept():
+    nodes, links = track(0, 3, 1)
+    solution = solved_window(0, 3, 2, nodes, links)
+
+    assert all(set(attributes) == {"traxel", "value", "divisionValue"} for attributes in all_nodes(solution).values())
+    assert all(set(attributes) == {"value", "gap"} for attributes in all_links(solution).values())
+
+
+def test_stitch_mergers():
+    nodes, links = track(0, 8, 1)
+    first = solved_window(0, 5, 2, nodes, links, mergers={1: "first", 4: "first", 5: "first"})
+    second = solved_window(3, 8, 2, nodes, links, mergers={3: "second", 5: "second", 7: "second"})
+
+    stitched = first.stitch(second)
+
+    # The windows agree everywhere, so they are cut in the middle of the overlap, between frames 3 and 4
+    assert stitched.mergers == {1: "first", 5: "second", 7: "second"}
+
+
+def test_stitch_at_agreement():
+    nodes, links = track(0, 8, 1)
+    first = solved_window(0, 5, 2, nodes, links)
+    # The second window also selects object 2 in frame 3, both windows agree from frame 4 on
+    second = solved_window(3, 8, 2, nodes + [(3, 2)], links)
+
+    stitched = first.stitch(second)
+
+    assert stitched.nodes[3][(3, 2)]["value"] == 0
+    assert sorted(all_links(stitched)) == links
+
+
+def test_stitch_keeps_only_agreed_links_at_cut():
+    nodes_1, links_1 = track(0, 5, 1)
+    nodes_2, links_2 = track(0, 5, 2)
+    # The windows overlap in frames 2 and 3 only, and swap the identities of the objects in between
+    swapped = [((2, 1), (3, 2)), ((2, 2), (3, 1))]
+    first = solved_window(0, 3, 2, nodes_1 + nodes_2, links_1 + links_2)
+    second = solved_window(2, 5, 2, nodes_1 + nodes_2, [l for l in links_1 + links_2 if l[0][0] != 2] + swapped)
+
+    stitched = first.stitch(second)
+
+    # All detections are kept, and the links on which the windows disagree are dropped
+    assert all(attributes["value"] == 1 for attributes in all_nodes(stitched).values())
+    assert len(all_links(stitched)) == len(links_1) + len(links_2) - 2
+    assert not set(all_links(stitched)) & set(swapped)
+
+
+def test_to_hypotheses_graph():
+    nodes, links = track(0, 3, 1)
+    division = [((1, 1), (2, 2))]
+    solution = solved_window(0, 3, 2, nodes + [(2, 2), (3, 2)], links + division + [((2, 2), (3, 2))], [(1, 1)])
+
+    graph = solution.to_hypotheses_graph(FakeHypothesesGraph)
+
+    assert graph.allowLengthOneTracks
+    assert sorted(graph._graph.nodes()) == sorted(all_nodes(solution))
+    assert graph._graph._nodes[(1, 1)]["divisionValue"]
+    assert graph._graph._nodes[(1, 1)]["traxel"] == Traxel(1, 1)
+    # Only the selected links are added
+    assert sorted(graph._graph.edges()) == sorted(links + division + [((2, 2), (3, 2))])
@@ -23,15 +23,18 @@ import tempfile
 import shutil
 from pathlib import Path
 
+import h5py
 import numpy
 import pytest
 import vigra
 
 from lazyflow.graph import Graph
 from lazyflow.roi import roiToSlice
+from lazyflow.utility import PathComponents
 from lazyflow.operators.ioOperators import OpInputDataReader
 from ilastik.applets.dataSelection.opDataSelection import FilesystemDatasetInfo
 
+from ilastik.applets.dataExport.dataExportApplet import DataExportApplet
 from ilastik.applets.dataExport.opDataExport import OpDataExport, DataExportPathFormatter
 
 
@@ -102,6 +105,45 @@ class TestOpDataExport(object):
             opRead.cleanUp()
 
 
+    def testCompressedParallelExportFromCmdline(self, tmp_h5_single_dataset: Path):
+        parsed_args, unused_args = DataExportApplet.parse_known_cmdline_args(
+            ["--output_format=hdf5", "--export_compression=gzip", "--export_parallel_write"]
+        )
+        assert not unused_args
+
+        graph = Graph()
+        opExport = OpDataExport(graph=graph)
+        try:
+            opExport.TransactionSlot.setValue(True)
+            opExport.WorkingDirectory.setValue(self._tmpdir)
+            opExport.RawDatasetInfo.setValue(
+                FilesystemDatasetInfo(filePath=str(tmp_h5_single_dataset / "test_group/test_data"), nickname="cmdline")
+            )
+            opExport.SelectionNames.setValue(["Mock Export Data"])
+
+            data = numpy.random.random((100, 100)).astype(numpy.float32)
+            data = vigra.taggedView(data, vigra.defaultAxistags("xy"))
+            opExport.Inputs.resize(1)
+            opExport.Inputs[0].setValue(data)
+
+            opExport.OutputFilenameFormat.setValue("{dataset_dir}/{nickname}_compressed_export")
+            opExport.OutputInternalPath.setValue("volume/data")
+            DataExportApplet._configure_operator_with_parsed_args(parsed_args, opExport)
+
+            assert opExport.Compression.value == "gzip"
+            assert opExport.ParallelWrite.value
+            opExport.run_export()
+            export_path = opExport.ExportPath.value
+        finally:
+            opExport.cleanUp()
+
+        export_components = PathComponents(export_path)
+        with h5py.File(export_components.externalPath, "r") as f:
+            dataset = f[export_components.internalPath]
+            assert dataset.compression == "gzip"
+            assert (dataset[...] == data.view(numpy.ndarray)).all()
+
+
 class TestDataExportPathFormatter:
     class DummyDSInfo:
         def __init__(self, filePath, nickname, default_output_dir):
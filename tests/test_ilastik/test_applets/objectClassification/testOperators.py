@@ -298,6 +298,37 @@ class TestOpObjectPredict(unittest.TestCase):
         uncerts = self.op.UncertaintyEstimate([0]).wait()
         self.assertTrue(uncerts[0][0] == 0)
 
+    def test_uncertainty_is_margin(self):
+        probs = self.op.Probabilities([0, 1]).wait()
+        uncerts = self.op.UncertaintyEstimate([0, 1]).wait()
+        for t in [0, 1]:
+            for i in range(1, len(probs[t])):
+                first, second = sorted(probs[t][i])[::-1][:2]
+                self.assertAlmostEqual(uncerts[t][i], 1 - (first - second))
+
+    def test_dirty_time_step(self):
+        self.op.Probabilities([0, 1]).wait()
+        self.op.UncertaintyEstimate([0, 1]).wait()
+
+        dirty_times = []
+        self.op.Predictions.notifyDirty(lambda slot, roi: dirty_times.append(list(roi)))
+
+        # Only time step 1 is invalidated
+        self.op.Features.setDirty([1])
+        self.assertEqual(dirty_times, [[1]])
+        self.assertIn(0, self.op.prob_cache)
+        self.assertIn(0, self.op.uncertainty_estimate)
+        self.assertNotIn(1, self.op.prob_cache)
+        self.assertNotIn(1, self.op.uncertainty_estimate)
+
+        preds = self.op.Predictions([0, 1]).wait()
+        self.assertTrue(np.all(preds[1] == np.array([0, 1, 1, 2])))
+
+        # A new classifier invalidates all time steps
+        self.op.Classifier.setDirty()
+        self.assertEqual(dirty_times[-1], [])
+        self.assertEqual(self.op.prob_cache, {})
+
 
 class TestFeatureSelection(unittest.TestCase):
     def setUp(self):
@@ -30,6 +30,8 @@ import unittest
 import numpy as np
 import vigra
 from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+from lazyflow.roi import roiToSlice
 from ilastik.applets.objectClassification.opObjectClassification import (
     OpRelabelSegmentation,
     OpObjectTrain,
@@ -43,6 +45,7 @@ from ilastik.applets.counting.opCounting import (
     OpCounting,
     OpMean,
     OpVolumeOperator,
+    OpDensityIntegral,
     OpLabelPipeline,
     OpPredictionPipelineNoCache,
     OpPredictionPipeline,
@@ -103,6 +106,116 @@ class TestOpMean(unittest.TestCase):
         np.testing.assert_allclose(np.mean(rimg.view(np.ndarray), axis=2), mean.view(np.ndarray)[..., 0:1, 0])
 
 
+class OpCountingPiper(OpArrayPiper):
+    """
+    Counts the pixels it was asked for.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(OpCountingPiper, self).__init__(*args, **kwargs)
+        self.requested_pixels = 0
+
+    def execute(self, slot, subindex, roi, result):
+        self.requested_pixels += np.prod(roi.stop - roi.start)
+        super(OpCountingPiper, self).execute(slot, subindex, roi, result)
+
+
+def densityImage():
+    img = np.random.rand(300, 200, 1).astype(np.float32)
+    return vigra.taggedView(img, "yxc")
+
+
+class TestOpVolumeOperator(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.density = densityImage()
+        self.opPiper = OpCountingPiper(graph=g)
+        self.opPiper.Input.setValue(self.density)
+        self.op = OpVolumeOperator(graph=g)
+        self.op.Input.connect(self.opPiper.Output)
+        self.op.Function.setValue(np.sum)
+
+    def test(self):
+        np.testing.assert_allclose(self.op.Output.value, self.density.sum(), rtol=1e-5)
+
+    def test_dirty_blocks_are_recomputed(self):
+        self.op.Output.value
+        self.opPiper.requested_pixels = 0
+
+        self.density[10:20, 10:20] = 0
+        self.opPiper.Input.setDirty(np.s_[10:20, 10:20, :])
+
+        np.testing.assert_allclose(self.op.Output.value, self.density.sum(), rtol=1e-5)
+        # Only the first block (128 x 128) was requested again
+        assert self.opPiper.requested_pixels == 128 * 128
+
+    def test_block_dirty_during_execute(self):
+        edited = []
+
+        def sum_and_edit(data):
+            if not edited and data.shape[:2] == (128, 128) and np.array_equal(data, self.density[:128, :128]):
+                # The first block becomes dirty right after its data was read
+                edited.append(True)
+                self.density[10:20, 10:20] = 0
+                self.opPiper.Input.setDirty(np.s_[10:20, 10:20, :])
+            return np.sum(data)
+
+        self.op.Function.setValue(sum_and_edit)
+        self.op.Output.value
+        assert edited
+
+        # The stale sum of the first block was not kept
+        np.testing.assert_allclose(self.op.Output.value, self.density.sum(), rtol=1e-5)
+
+
+class TestOpDensityIntegral(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.density = densityImage()
+        self.opPiper = OpCountingPiper(graph=g)
+        self.opPiper.Input.setValue(self.density)
+        self.op = OpDensityIntegral(graph=g)
+        self.op.Input.connect(self.opPiper.Output)
+        self.op.BlockShape.setValue((64, 64, None))
+
+    def test_total(self):
+        np.testing.assert_allclose(self.op.Output.value, self.density.sum(), rtol=1e-6)
+
+    def test_box_sum(self):
+        for start, stop in [((0, 0, 0), (1, 1, 1)), ((5, 70, 0), (250, 199, 1)), ((63, 63, 0), (65, 65, 1))]:
+            expected = self.density[roiToSlice(start, stop)].sum()
+            np.testing.assert_allclose(self.op.box_sum(start, stop), expected, rtol=1e-6)
+
+        # Boxes are clipped to the image, empty boxes have sum 0
+        np.testing.assert_allclose(
+            self.op.box_sum((290, -5, 0), (400, 10, 1)), self.density[290:, :10].sum(), rtol=1e-6
+        )
+        assert self.op.box_sum((10, 10, 0), (10, 20, 1)) == 0
+
+    def test_blocks_are_reused(self):
+        self.op.box_sum((0, 0, 0), (300, 200, 1))
+        self.opPiper.requested_pixels = 0
+
+        for offset in range(10):
+            self.op.box_sum((offset, 2 * offset, 0), (200 + offset, 100 + offset, 1))
+        assert self.opPiper.requested_pixels == 0
+
+    def test_dirty_blocks_are_recomputed(self):
+        self.op.box_sum((0, 0, 0), (300, 200, 1))
+        self.opPiper.requested_pixels = 0
+
+        dirty_notifications = []
+        self.op.Output.notifyDirty(lambda *args: dirty_notifications.append(args))
+
+        self.density[100:110, 70:80] = 1
+        self.opPiper.Input.setDirty(np.s_[100:110, 70:80, :])
+        assert len(dirty_notifications) == 1
+
+        np.testing.assert_allclose(self.op.box_sum((90, 0, 0), (120, 200, 1)), self.density[90:120].sum(), rtol=1e-6)
+        # Only the dirty block was requested again
+        assert self.opPiper.requested_pixels == 64 * 64
+
+
 # class TestOpObjectTrain(unittest.TestCase):
 #
 #     nRandomForests = 1
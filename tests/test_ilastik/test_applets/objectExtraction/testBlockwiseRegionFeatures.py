@@ -0,0 +1,95 @@
+import itertools
+
+import numpy
+import pytest
+
+from ilastik.applets.objectExtraction.blockwiseRegionFeatures import RegionFeatureAccumulator, SUPPORTED_FEATURES
+
+
+@pytest.fixture
+def frame():
+    rng = numpy.random.RandomState(0)
+    labels = rng.randint(0, 6, size=(23, 17, 9))
+    raw = rng.rand(23, 17, 9, 2) * 100
+    return labels, raw
+
+
+def accumulate(labels, raw, blockshape, features=SUPPORTED_FEATURES, coord_axes=(0, 1, 2)):
+    acc = RegionFeatureAccumulator(sorted(features), num_channels=raw.shape[-1], coord_axes=coord_axes)
+    starts = itertools.product(*(range(0, s, b) for s, b in zip(labels.shape, blockshape)))
+    for start in starts:
+        slicing = tuple(slice(b, b + s) for b, s in zip(start, blockshape))
+        acc.update(labels[slicing], raw[slicing], offset=start)
+    return acc.features()
+
+
+def test_against_numpy(frame):
+    labels, raw = frame
+    feats = accumulate(labels, raw, (10, 8, 4))
+
+    for label in range(1, labels.max() + 1):
+        row = label - 1
+        mask = labels == label
+        values = raw[mask]
+        coords = numpy.array(numpy.nonzero(mask)).T.astype(float)
+        deviation = values - values.mean(axis=0)
+        n = len(values)
+
+        numpy.testing.assert_allclose(feats["Count"][row], [n])
+        numpy.testing.assert_allclose(feats["Sum"][row], values.sum(axis=0))
+        numpy.testing.assert_allclose(feats["Mean"][row], values.mean(axis=0))
+        numpy.testing.assert_allclose(feats["Variance"][row], values.var(axis=0))
+        numpy.testing.assert_allclose(
+            feats["Skewness"][row], numpy.sqrt(n) * (deviation ** 3).sum(0) / ((deviation ** 2).sum(0) ** 1.5)
+        )
+        numpy.testing.assert_allclose(
+            feats["Kurtosis"][row], n * (deviation ** 4).sum(0) / ((deviation ** 2).sum(0) ** 2) - 3
+        )
+        numpy.testing.assert_allclose(feats["Minimum"][row], values.min(axis=0))
+        numpy.testing.assert_allclose(feats["Maximum"][row], values.max(axis=0))
+        numpy.testing.assert_allclose(feats["Coord<Minimum>"][row], coords.min(axis=0))
+        numpy.testing.assert_allclose(feats["Coord<Maximum>"][row], coords.max(axis=0) + 1)
+        numpy.testing.assert_allclose(feats["RegionCenter"][row], coords.mean(axis=0))
+        radii = numpy.sqrt(numpy.linalg.eigvalsh(numpy.cov(coords.T, bias=True))[::-1])
+        numpy.testing.assert_allclose(feats["RegionRadii"][row], radii)
+
+
+@pytest.mark.parametrize("blockshape", [(1, 1, 1), (5, 17, 9), (7, 3, 2), (23, 17, 9)])
+def test_independent_of_blockshape(frame, blockshape):
+    labels, raw = frame
+    expected = accumulate(labels, raw, labels.shape)
+    feats = accumulate(labels, raw, blockshape)
+    for name in SUPPORTED_FEATURES:
+        numpy.testing.assert_allclose(feats[name], expected[name], rtol=1e-9, atol=1e-9, err_msg=name)
+
+
+def test_2d_coordinates(frame):
+    labels, raw = frame
+    labels, raw = labels[:, :, :1], raw[:, :, :1]
+    feats = accumulate(labels, raw, (8, 8, 1), features=["Coord<Minimum>", "RegionCenter"], coord_axes=(0, 1))
+    assert feats["Coord<Minimum>"].shape == (labels.max(), 2)
+    assert feats["RegionCenter"].shape == (labels.max(), 2)
+
+
+def test_unsupported_feature():
+    with pytest.raises(ValueError):
+        RegionFeatureAccumulator(["Count", "Quantiles"], num_channels=1, coord_axes=(0, 1))
+
+
+def test_merge_block_statistics_in_any_order(frame):
+    labels, raw = frame
+    expected = accumulate(labels, raw, (10, 8, 4))
+
+    # Block statistics can be computed independently (in parallel) and merged in any order
+    acc = RegionFeatureAccumulator(sorted(SUPPORTED_FEATURES), num_channels=raw.shape[-1], coord_axes=(0, 1, 2))
+    starts = list(itertools.product(*(range(0, s, b) for s, b in zip(labels.shape, (10, 8, 4)))))
+    block_stats = []
+    for start in starts:
+        slicing = tuple(slice(b, b + s) for b, s in zip(start, (10, 8, 4)))
+        block_stats.append(acc.block_statistics(labels[slicing], raw[slicing], offset=start))
+    for stats in reversed(block_stats):
+        acc.merge(stats)
+
+    feats = acc.features()
+    for name in SUPPORTED_FEATURES:
+        numpy.testing.assert_allclose(feats[name], expected[name], rtol=1e-9, atol=1e-9, err_msg=name)
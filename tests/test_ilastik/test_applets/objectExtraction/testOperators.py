@@ -24,10 +24,12 @@ from __future__ import division
 from builtins import range
 from past.utils import old_div
 import unittest
+from unittest import mock
 import numpy as np
 import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators import OpLabelVolume
+from lazyflow.request import processPool
 from ilastik.applets.objectExtraction.opObjectExtraction import OpAdaptTimeListRoi, OpRegionFeatures, OpObjectExtraction
 from ilastik.plugins import pluginManager
 
@@ -211,3 +213,99 @@ class TestOpRegionFeaturesAgainstNumpy(unittest.TestCase):
                 # that means bounding box centers can differ with a maximum of 0.5
                 bbox_center = mins[iobj] + ((maxs[iobj] - mins[iobj]) / 2.0)
                 np.testing.assert_allclose(centers[iobj], bbox_center, atol=0.5)
+
+    def test_local_features_in_chunks(self):
+        opAdapt = OpAdaptTimeListRoi(graph=self.op.graph)
+        opAdapt.Input.connect(self.op.Output)
+        feats_single_chunk = opAdapt.Output([0, 1]).wait()
+
+        # One object per request
+        self.op.LOCAL_FEATURES_CHUNK_SIZE = 1
+        feats_chunked = opAdapt.Output([0, 1]).wait()
+
+        for t in range(self.img.shape[0]):
+            for key in ("Sum in neighborhood", "Mean in neighborhood", "Sum in object and neighborhood"):
+                np.testing.assert_array_equal(feats_chunked[t][NAME][key], feats_single_chunk[t][NAME][key])
+
+    def test_features_in_process_pool(self):
+        opAdapt = OpAdaptTimeListRoi(graph=self.op.graph)
+        opAdapt.Input.connect(self.op.Output)
+        feats_inline = opAdapt.Output([0, 1]).wait()
+
+        self.op.LOCAL_FEATURES_CHUNK_SIZE = 2
+        processPool.reset_process_pool(2)
+        try:
+            feats_pool = opAdapt.Output([0, 1]).wait()
+        finally:
+            processPool.reset_process_pool(0)
+
+        for t in range(self.img.shape[0]):
+            for plugin_name in (NAME, "Default features"):
+                assert feats_pool[t][plugin_name].keys() == feats_inline[t][plugin_name].keys()
+                for key, value in feats_inline[t][plugin_name].items():
+                    np.testing.assert_array_equal(feats_pool[t][plugin_name][key], value)
+
+    def test_blockwise(self):
+        features = {NAME: {"Count": {}, "Sum": {}, "Mean": {}, "Variance": {}, "RegionRadii": {}}}
+        self.op.Features.setValue(features)
+        opAdapt = OpAdaptTimeListRoi(graph=self.op.graph)
+        opAdapt.Input.connect(self.op.Output)
+        feats_whole = opAdapt.Output([0, 1]).wait()
+
+        self.op.BlockShape3dDict.setValue({"x": 20, "y": 13, "z": 1})
+        feats_blockwise = opAdapt.Output([0, 1]).wait()
+
+        for t in range(self.img.shape[0]):
+            for plugin_name in (NAME, "Default features"):
+                assert feats_blockwise[t][plugin_name].keys() == feats_whole[t][plugin_name].keys()
+                for key, value in feats_whole[t][plugin_name].items():
+                    np.testing.assert_allclose(feats_blockwise[t][plugin_name][key], value, rtol=1e-4, atol=1e-3)
+
+    def test_blockwise_local_features_not_supported(self):
+        self.op.BlockShape3dDict.setValue({"x": 20, "y": 13, "z": 1})
+        with self.assertRaises(ValueError):
+            self.op.Output[0:1].wait()
+
+
+class TestObjectExtractionOfLargeFrames(unittest.TestCase):
+    """
+    Without a BlockShape3dDict, time slices larger than OpRegionFeatures.MAX_FRAME_VOXELS are processed blockwise.
+    """
+
+    def setUp(self):
+        self.features = {NAME: {"Count": {}, "Sum": {}, "Mean": {}, "Variance": {}, "RegionRadii": {}}}
+        self.feats_whole = self.extract(self.features)
+
+    def extract(self, features):
+        op = OpObjectExtraction(graph=Graph())
+        op.RawImage.setValue(rawImage())
+        op.BinaryImage.setValue(binaryImage())
+        op.Features.setValue(features)
+        return op.RegionFeatures([0, 1]).wait()
+
+    def large_frames(self):
+        return mock.patch.multiple(
+            OpRegionFeatures, MAX_FRAME_VOXELS=50 ** 3 - 1, DEFAULT_BLOCK_SHAPE_3D={"x": 20, "y": 13, "z": 50}
+        )
+
+    def test_blockwise(self):
+        with self.large_frames(), mock.patch.object(OpRegionFeatures, "_extract") as extract:
+            feats_blockwise = self.extract(self.features)
+        extract.assert_not_called()
+
+        for t in range(2):
+            for plugin_name in (NAME, "Default features"):
+                assert feats_blockwise[t][plugin_name].keys() == self.feats_whole[t][plugin_name].keys()
+                for key, value in self.feats_whole[t][plugin_name].items():
+                    np.testing.assert_allclose(feats_blockwise[t][plugin_name][key], value, rtol=1e-4, atol=1e-3)
+
+    def test_local_features_need_whole_frames(self):
+        features = {NAME: {"Count": {}, "Mean in neighborhood": {"margin": (3, 3, 1)}}}
+        feats_whole = self.extract(features)
+        with self.large_frames(), mock.patch.object(OpRegionFeatures, "_extract_blockwise") as extract_blockwise:
+            feats = self.extract(features)
+        extract_blockwise.assert_not_called()
+
+        for t in range(2):
+            for key, value in feats_whole[t][NAME].items():
+                np.testing.assert_array_equal(feats[t][NAME][key], value)
@@ -0,0 +1,87 @@
+import numpy
+import pytest
+
+from ilastik.workflows.carving.objectIndex import SupervoxelObjectIndex
+
+NUM_NODES = 100
+
+
+def reference_done_lut(objects, hidden=None):
+    done_lut = numpy.zeros(NUM_NODES + 1, dtype=numpy.int32)
+    for name, (number, supervoxels) in objects.items():
+        if name != hidden:
+            done_lut[supervoxels] = numpy.maximum(done_lut[supervoxels], number)
+    return done_lut
+
+
+def reference_names_at(objects, supervoxel):
+    return [
+        name
+        for name, (number, supervoxels) in sorted(objects.items(), key=lambda item: item[1][0])
+        if supervoxel in supervoxels
+    ]
+
+
+@pytest.fixture
+def objects():
+    rng = numpy.random.RandomState(42)
+    return {f"object{i}": (i + 1, rng.randint(1, NUM_NODES + 1, size=30)) for i in range(6)}
+
+
+def assert_consistent(index, objects, hidden=None):
+    numpy.testing.assert_array_equal(index.done_lut, reference_done_lut(objects, hidden))
+    for supervoxel in range(NUM_NODES + 1):
+        assert index.names_at(supervoxel) == reference_names_at(objects, supervoxel)
+
+
+def test_from_objects(objects):
+    # object_lut entries are stored as the result of numpy.where
+    index = SupervoxelObjectIndex.from_objects(
+        NUM_NODES,
+        [
+            (name, number, numpy.where(numpy.isin(numpy.arange(NUM_NODES + 1), sv)))
+            for name, (number, sv) in objects.items()
+        ],
+    )
+    assert_consistent(index, objects)
+
+
+def test_incremental_updates_match_rebuild(objects):
+    index = SupervoxelObjectIndex(NUM_NODES)
+    current = {}
+    for name, (number, supervoxels) in objects.items():
+        index.add(name, number, supervoxels)
+        current[name] = (number, supervoxels)
+        assert_consistent(index, current)
+
+    # Replace an object
+    current["object2"] = (3, numpy.arange(1, 20))
+    index.add("object2", 3, numpy.arange(1, 20))
+    assert_consistent(index, current)
+
+    for name in ["object0", "object3", "object5"]:
+        index.remove(name)
+        del current[name]
+        assert_consistent(index, current)
+
+    # Removing an unknown object is a no-op
+    index.remove("object0")
+    assert_consistent(index, current)
+
+
+def test_hidden_object(objects):
+    index = SupervoxelObjectIndex.from_objects(NUM_NODES, [(name, n, sv) for name, (n, sv) in objects.items()])
+
+    index.hide("object4")
+    assert_consistent(index, objects, hidden="object4")
+
+    index.hide("object1")
+    assert_consistent(index, objects, hidden="object1")
+
+    # The hidden object stays hidden when it is saved again
+    objects["object1"] = (2, numpy.arange(50, 60))
+    index.add("object1", 2, numpy.arange(50, 60))
+    assert_consistent(index, objects, hidden="object1")
+
+    index.hide(None)
+    assert_consistent(index, objects)
@@ -0,0 +1,45 @@
+import subprocess
+import sys
+
+import pytest
+
+from ilastik import workflows
+from ilastik.workflow import _describeWorkflow, getWorkflowFromName
+
+
+@pytest.mark.parametrize("entryPoint", workflows.WORKFLOW_ENTRY_POINTS, ids=lambda e: e.class_name)
+def test_entry_point_names(entryPoint):
+    workflowClass = entryPoint.load()
+    if workflowClass is None:
+        pytest.skip("{} is not available".format(entryPoint.class_name))
+
+    _, name, displayName = _describeWorkflow(workflowClass)
+
+    # The registry must know all names under which the workflow can be looked up
+    assert workflowClass.__name__ == entryPoint.class_name
+    assert name in entryPoint.names
+    assert displayName in entryPoint.names
+    assert workflows.findWorkflowEntryPoint(name) is not None
+    assert getWorkflowFromName(name) is workflowClass
+
+
+def test_workflow_attributes():
+    assert workflows.PixelClassificationWorkflow is getWorkflowFromName("Pixel Classification")
+    assert workflows.PixelClassificationWorkflow in workflows.WORKFLOW_CLASSES
+    assert workflows.findWorkflowEntryPoint("No Such Workflow") is None
+    with pytest.raises(AttributeError):
+        workflows.NoSuchWorkflow
+
+
+def test_lookup_imports_only_requested_workflow():
+    script = "\n".join(
+        [
+            "import sys",
+            "from ilastik.workflow import getWorkflowFromName",
+            "assert getWorkflowFromName('Pixel Classification').__name__ == 'PixelClassificationWorkflow'",
+            "unrelated = ('ilastik.workflows.tracking', 'ilastik.workflows.carving', 'ilastik.workflows.counting')",
+            "loaded = [m for m in sys.modules if m.startswith(unrelated)]",
+            "assert not loaded, loaded",
+        ]
+    )
+    subprocess.check_call([sys.executable, "-c", script])
@@ -1,6 +1,11 @@
 from builtins import object
 import numpy
-from lazyflow.classifiers import ParallelVigraRfLazyflowClassifierFactory, ParallelVigraRfLazyflowClassifier
+import h5py
+from lazyflow.classifiers import (
+    ParallelVigraRfLazyflowClassifierFactory,
+    ParallelVigraRfLazyflowClassifier,
+    IncrementalParallelVigraRfLazyflowClassifierFactory,
+)
 
 
 class TestParallelVigraRfLazyflowClassifier(object):
@@ -99,3 +104,156 @@ class TestParallelVigraRfLazyflowClassifier(object):
                 "_num_forests",
             ]
         )
+
+
+class TestIncrementalParallelVigraRfLazyflowClassifier(object):
+    def setup_method(self, method):
+        # Same XOR problem as above, in random order, so that any prefix contains both classes.
+        feature_grid = numpy.mgrid[-5:5, -5:5]
+        feature_matrix = numpy.concatenate(feature_grid.transpose()).astype(numpy.float32)
+        labels = (feature_matrix.prod(axis=-1) >= 0).astype(numpy.uint32) + 1
+
+        order = numpy.random.RandomState(0).permutation(len(labels))
+        self.training_feature_matrix = feature_matrix[order]
+        self.training_labels = labels[order]
+
+        self.prediction_data = [[1.5, 2.5], [-1.5, -2.5], [3.4, -4.0], [-1.2, 2.0]]
+        self.expected_classes = (numpy.prod(self.prediction_data, axis=-1) > 0).astype(numpy.uint32) + 1
+
+    def test_update(self):
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(
+            12, num_forests=4, trees_per_update=4, retire_policy="oldest"
+        )
+        X, y = self.training_feature_matrix, self.training_labels
+
+        # No previous classifier: all trees are trained from scratch
+        classifier = factory.create_and_train(X[:60], y[:60])
+        assert classifier.num_training_samples == 60
+        assert sum(f.treeCount() for f in classifier._forests) == 12
+
+        # Update with more samples: the oldest forest(s) are replaced
+        updated = factory.create_and_train(X, y, previous_classifier=classifier, appended_rows=numpy.arange(60, len(X)))
+        assert updated.num_training_samples == len(X)
+        assert sum(f.treeCount() for f in updated._forests) == 12
+        assert updated._forests[:2] == classifier._forests[2:]
+        assert len(updated.oobs) == len(updated._forests)
+
+        probabilities = updated.predict_probabilities(self.prediction_data)
+        assert probabilities.shape == (4, 2)
+        assert (numpy.argmax(probabilities, axis=-1) + 1 == self.expected_classes).all()
+
+    def test_retire_worst_oob(self):
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(
+            8, num_forests=4, trees_per_update=2, retire_policy="worst_oob"
+        )
+        X, y = self.training_feature_matrix, self.training_labels
+        classifier = factory.create_and_train(X[:60], y[:60])
+        classifier._oobs = [0.1, 0.4, 0.2, 0.3]
+
+        updated = factory.create_and_train(X, y, previous_classifier=classifier, appended_rows=numpy.arange(60, len(X)))
+        forests = classifier._forests
+        assert updated._forests[:3] == [forests[0], forests[2], forests[3]]
+
+    def test_incompatible_previous_classifier(self):
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(8, num_forests=2, trees_per_update=2)
+        X, y = self.training_feature_matrix, self.training_labels
+        classifier = factory.create_and_train(X, y)
+
+        # Samples were removed or changed (the appended rows are unknown): train from scratch
+        retrained = factory.create_and_train(X[:50], y[:50], previous_classifier=classifier)
+        assert not set(retrained._forests) & set(classifier._forests)
+        retrained = factory.create_and_train(X, y[::-1], previous_classifier=classifier)
+        assert not set(retrained._forests) & set(classifier._forests)
+
+        # The old rows are not the previous training samples: train from scratch
+        retrained = factory.create_and_train(X, y, previous_classifier=classifier, appended_rows=[0])
+        assert not set(retrained._forests) & set(classifier._forests)
+
+        # A new class appeared: train from scratch
+        X3 = numpy.concatenate((X, X[:1]))
+        y3 = numpy.concatenate((y, [3]))
+        retrained = factory.create_and_train(X3, y3, previous_classifier=classifier, appended_rows=[len(X)])
+        assert not set(retrained._forests) & set(classifier._forests)
+        assert list(retrained.known_classes) == [1, 2, 3]
+
+    def test_different_features(self):
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(8, num_forests=2, trees_per_update=2)
+        X, y = self.training_feature_matrix, self.training_labels
+        classifier = factory.create_and_train(X[:60], y[:60], ["a", "b"])
+
+        # Other features with the same number of channels: train from scratch
+        retrained = factory.create_and_train(
+            X, y, ["a", "c"], previous_classifier=classifier, appended_rows=numpy.arange(60, len(X))
+        )
+        assert not set(retrained._forests) & set(classifier._forests)
+
+        updated = factory.create_and_train(
+            X, y, ["a", "b"], previous_classifier=classifier, appended_rows=numpy.arange(60, len(X))
+        )
+        assert set(updated._forests) & set(classifier._forests)
+
+    def test_different_tree_count(self):
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(8, num_forests=2, trees_per_update=2)
+        X, y = self.training_feature_matrix, self.training_labels
+        classifier = factory.create_and_train(X, y)
+
+        # Trained by a factory with another number of trees: train from scratch
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(16, num_forests=2, trees_per_update=4)
+        retrained = factory.create_and_train(X, y, previous_classifier=classifier, appended_rows=[])
+        assert not set(retrained._forests) & set(classifier._forests)
+        assert sum(f.treeCount() for f in retrained._forests) == 16
+
+    def test_appended_rows_anywhere(self):
+        # E.g. with several lanes, rows of the first lane are appended in the middle of the matrix
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(8, num_forests=4, trees_per_update=2)
+        X, y = self.training_feature_matrix, self.training_labels
+        old_rows = numpy.concatenate((numpy.arange(0, 40), numpy.arange(50, len(X))))
+        classifier = factory.create_and_train(X[old_rows], y[old_rows])
+
+        appended_rows = numpy.arange(40, 50)
+        sample = factory._training_sample(y[:, numpy.newaxis], appended_rows)
+        assert set(appended_rows) <= set(sample)
+
+        updated = factory.create_and_train(X, y, previous_classifier=classifier, appended_rows=appended_rows)
+        assert updated.num_training_samples == len(X)
+        assert set(updated._forests) & set(classifier._forests)
+
+    def test_serialization(self, tmp_path):
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(8, num_forests=2, trees_per_update=2)
+        classifier = factory.create_and_train(self.training_feature_matrix, self.training_labels)
+
+        with h5py.File(str(tmp_path / "classifier.h5"), "w") as f:
+            classifier.serialize_hdf5(f.create_group("classifier"))
+            loaded = ParallelVigraRfLazyflowClassifier.deserialize_hdf5(f["classifier"])
+
+        assert loaded.num_training_samples == classifier.num_training_samples
+        numpy.testing.assert_allclose(loaded.oobs, classifier.oobs)
+
+        # The loaded classifier can be updated
+        updated = factory.create_and_train(
+            self.training_feature_matrix, self.training_labels, previous_classifier=loaded, appended_rows=[]
+        )
+        assert sum(f.treeCount() for f in updated._forests) == 8
+
+    def test_pickle_fields(self):
+        """
+        See TestParallelVigraRfLazyflowClassifier.test_pickle_fields
+        """
+        factory = IncrementalParallelVigraRfLazyflowClassifierFactory(10)
+        members = set(factory.__dict__.keys())
+
+        assert IncrementalParallelVigraRfLazyflowClassifierFactory.VERSION == 1
+        assert members == set(
+            [
+                "VERSION",
+                "_variable_importance_path",
+                "_kwargs",
+                "_variable_importance_enabled",
+                "_num_trees",
+                "_label_proportion",
+                "_num_forests",
+                "_trees_per_update",
+                "_sample_size",
+                "_retire_policy",
+            ]
+        )
@@ -37,7 +37,7 @@ from lazyflow.roi import enlargeRoiForHalo, roiToSlice
 from lazyflow.rtype import SubRegion
 from lazyflow.request import Request
 from lazyflow.utility import BigRequestStreamer
-from lazyflow.operators.cacheMemoryManager import _CacheMemoryManager
+from lazyflow.operators.cacheMemoryManager import _CacheMemoryManager, _CacheEntry, eviction_policies
 from lazyflow.utility import Memory
 from lazyflow.operators.cacheMemoryManager import default_refresh_interval
 from lazyflow.operators.opCache import Cache
@@ -200,6 +200,57 @@ class TestCacheMemoryManager:
         c = pipe.accessCount
         assert c > b, "did not clean up"
 
+    def testAdmissionTriggersCleanup(self, cacheMemoryManager):
+        n, k = 10, 5
+        vol = np.zeros((n,) * 5, dtype=np.uint8)
+        vol = vigra.taggedView(vol, axistags="txyzc")
+
+        g = Graph()
+        pipe = OpArrayPiperWithAccessCount(graph=g)
+        cache = OpBlockedArrayCache(graph=g)
+
+        # restrict cache memory to 0 Byte, but never clean up on a timer
+        Memory.setAvailableRamCaches(0)
+        cacheMemoryManager.setRefreshInterval(1000)
+        cacheMemoryManager.enable()
+
+        cache.BlockShape.setValue((k,) * 5)
+        cache.Input.connect(pipe.Output)
+        pipe.Input.setValue(vol)
+        cache.Output[...].wait()
+
+        timeout = time.time() + 5
+        while cacheMemoryManager.getStatistics()["evictions"] == 0 and time.time() < timeout:
+            time.sleep(0.01)
+
+        stats = cacheMemoryManager.getStatistics()
+        assert stats["admissions"] == (n // k) ** 5
+        assert stats["admitted_bytes"] == n ** 5
+        assert stats["pressure_events"] >= 1
+        assert stats["evictions"] > 0
+        assert stats["evicted_bytes"] > 0
+
+    def testAdmissionWakeupsAreRateLimited(self, cacheMemoryManager):
+        # only count the wakeups, never clean up
+        cacheMemoryManager.disable()
+        cacheMemoryManager.setRefreshInterval(1000)
+        Memory.setAvailableRamCaches(1000)
+
+        # the last cleanup could not get below the limit (max 100%, target 90%)
+        cacheMemoryManager._last_total = 2000
+        cacheMemoryManager.notifyCacheAdmission(10)
+        assert cacheMemoryManager.getStatistics()["pressure_events"] == 0
+        cacheMemoryManager.notifyCacheAdmission(100)
+        assert cacheMemoryManager.getStatistics()["pressure_events"] == 1
+
+        # not again right after a cleanup
+        cacheMemoryManager._cleanup_requested = False
+        cacheMemoryManager._admitted_since_cleanup = 0
+        cacheMemoryManager._last_total = 0
+        cacheMemoryManager._last_cleanup_time = time.monotonic()
+        cacheMemoryManager.notifyCacheAdmission(2000)
+        assert cacheMemoryManager.getStatistics()["pressure_events"] == 1
+
     def testBadMemoryConditions(self):
         """
         TestCacheMemoryManager.testBadMemoryConditions
@@ -264,6 +315,66 @@ class TestCacheMemoryManager:
         np.testing.assert_equal(pipe.accessCount, 9)
 
 
+def _entry(cache, key, lastAccessTime, cost, size):
+    return _CacheEntry(cache, key, lastAccessTime, cost, size, f"{key}", None)
+
+
+class TestEvictionPolicies:
+    def testLRUOrdersByAccessTime(self):
+        cache = NonRegisteredCache("c")
+        policy = eviction_policies["lru"]()
+        entries = [_entry(cache, "a", 3.0, 0.0, 1), _entry(cache, "b", 1.0, 10.0, 1)]
+        assert policy.priorities(entries) == [3.0, 1.0]
+
+    def testGreedyDualSizeKeepsExpensiveBlocks(self):
+        cache = NonRegisteredCache("c")
+        policy = eviction_policies["gds"]()
+        expensive = _entry(cache, "hessian", 1.0, 10.0, 1000)
+        cheap = _entry(cache, "raw", 2.0, 0.001, 1000)
+        prio_expensive, prio_cheap = policy.priorities([expensive, cheap])
+        assert prio_cheap < prio_expensive
+
+    def testGreedyDualSizeAgesUnusedBlocks(self):
+        cache = NonRegisteredCache("c")
+        policy = eviction_policies["gds"]()
+        expensive = _entry(cache, "expensive", 1.0, 2.0, 1)
+        cheap = _entry(cache, "cheap", 1.0, 1.0, 1)
+        prio_expensive, prio_cheap = policy.priorities([expensive, cheap])
+        assert prio_cheap < prio_expensive
+
+        # evicting the cheap block inflates the priority of everything accessed afterwards
+        policy.evicted(cheap, prio_cheap)
+        recomputed = _entry(cache, "cheap", 5.0, 1.0, 1)
+        prio_expensive_again, prio_recomputed = policy.priorities([expensive, recomputed])
+        assert prio_expensive_again == prio_expensive
+        assert prio_recomputed == prio_cheap + 1.0
+
+        # without being accessed, the expensive block is now evicted first
+        policy.evicted(recomputed, prio_recomputed)
+        _, prio_recomputed = policy.priorities([expensive, _entry(cache, "cheap", 9.0, 1.0, 1)])
+        assert prio_expensive < prio_recomputed
+
+    def testUnknownPolicy(self, cacheMemoryManager):
+        with pytest.raises(ValueError):
+            cacheMemoryManager.setEvictionPolicy("unknown")
+
+    def testCachesReportBlockCosts(self):
+        g = Graph()
+        pipe = OpEnlarge(graph=g)
+        pipe.delay = 0.05
+        pipe.Input.setValue(vigra.taggedView(np.zeros((20, 20), dtype=np.float32), axistags="xy"))
+        cache = OpBlockedArrayCache(graph=g)
+        cache.Input.connect(pipe.Output)
+        cache.BlockShape.setValue((10, 20))
+
+        cache.Output[:10, :].wait()
+        (costs,) = cache.getBlockCosts()
+        block, seconds, size = costs
+        assert block == ((0, 0), (10, 20))
+        assert seconds >= pipe.delay
+        assert size == 10 * 20 * 4
+
+
 class OpEnlarge(OpArrayPiperWithAccessCount):
     delay = 0.1
 
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from lazyflow.operators.cacheSpillStore import _SpillStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = _SpillStore()
+    s.configure(str(tmp_path), max_bytes=3 * 8000 + 3 * 128)
+    yield s
+    s.configure(None)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_roundtrip(store, compress):
+    data = np.arange(1000, dtype=np.uint64).reshape(10, 100)
+    assert store.put(0, "a", data, compress=compress)
+    restored = store.get(0, "a")
+    assert restored.dtype == data.dtype
+    np.testing.assert_array_equal(restored, data)
+
+
+def test_disabled_store_does_not_spill(tmp_path):
+    s = _SpillStore()
+    assert not s.enabled
+    assert not s.put(0, "a", np.zeros(10))
+    assert s.get(0, "a") is None
+
+
+def test_unspillable_data(store):
+    assert not store.put(0, "obj", np.array([None, 1], dtype=object))
+    assert not store.put(0, "masked", np.ma.masked_array(np.zeros(3), mask=[0, 1, 0]))
+    assert not store.put(0, "huge", np.zeros(10 ** 6))
+
+
+def test_lru_eviction(store):
+    blocks = {k: np.full(1000, i, dtype=np.float64) for i, k in enumerate("abcd")}
+    for k in "abc":
+        assert store.put(0, k, blocks[k])
+    # touch "a", so that "b" is the least recently used block
+    store.get(0, "a")
+    assert store.put(0, "d", blocks["d"])
+
+    assert sorted(store.keys(0)) == ["a", "c", "d"]
+    assert store.get(0, "b") is None
+
+
+def test_discard_all_only_affects_owner(store):
+    store.put(0, "a", np.zeros(10))
+    store.put(1, "a", np.ones(10))
+    store.discardAll(0)
+    assert store.keys(0) == []
+    assert store.keys(1) == ["a"]
+    np.testing.assert_array_equal(store.get(1, "a"), 1)
+
+
+def test_reconfigure_removes_files(store, tmp_path):
+    store.put(0, "a", np.zeros(10))
+    assert len(list(tmp_path.glob("*/*"))) == 1
+    store.configure(None)
+    assert list(tmp_path.iterdir()) == []
+    assert store.usedBytes() == 0
+
+
+class EvictionRecorder(object):
+    def __init__(self):
+        self.evicted = []
+
+    def on_evicted(self, key):
+        self.evicted.append(key)
+
+
+def test_owners_are_told_about_evictions(store):
+    recorder = EvictionRecorder()
+    owner = store.newOwner(recorder.on_evicted)
+    other = store.newOwner()
+    for k in "abc":
+        assert store.put(owner, k, np.zeros(1000))
+    assert store.put(other, "d", np.zeros(1000))
+    assert recorder.evicted == ["a"]
+
+    # Explicit discards are not reported
+    store.discard(owner, "b")
+    assert recorder.evicted == ["a"]
+
+    store.configure(None)
+    assert recorder.evicted == ["a", "c"]
+
+
+def test_released_owner_is_not_told_about_evictions(store):
+    recorder = EvictionRecorder()
+    owner = store.newOwner(recorder.on_evicted)
+    store.put(owner, "a", np.zeros(10))
+    store.releaseOwner(owner)
+    assert store.keys(owner) == []
+    store.put(owner, "b", np.zeros(10))
+    store.configure(None)
+    assert recorder.evicted == []
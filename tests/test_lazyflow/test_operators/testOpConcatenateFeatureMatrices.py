@@ -26,10 +26,29 @@ class TestOpConcatenateFeatureMatrices(object):
         assert (result[:, 0] == 1).sum() == 4
         assert (result[:, 0] == 2).sum() == 4
 
-    def _getMatrixOp(self, graph):
-        features = numpy.indices((100, 100)).astype(numpy.float32) + 0.5
-        features = numpy.rollaxis(features, 0, 3)
-        features = vigra.taggedView(features, "xyc")
+    def testHistory(self):
+        graph = Graph()
+        labels1 = self._getLabels()
+        op1 = self._getMatrixOp(graph, labels1)
+        op2 = self._getMatrixOp(graph)
+
+        opConcatenate = OpConcatenateFeatureMatrices(graph=graph)
+        opConcatenate.FeatureMatrices.resize(2)
+        opConcatenate.FeatureMatrices[0].connect(op1.LabelAndFeatureMatrix)
+        opConcatenate.FeatureMatrices[1].connect(op2.LabelAndFeatureMatrix)
+        opConcatenate.ProgressSignals.resize(2)
+        opConcatenate.ProgressSignals[0].connect(op1.ProgressSignal)
+        opConcatenate.ProgressSignals[1].connect(op2.ProgressSignal)
+        history = opConcatenate.ConcatenatedOutput.value.history
+
+        # Rows appended to the first lane end up in the middle of the concatenated matrix
+        labels1[50, 50] = 1
+        op1.LabelImage.setDirty(numpy.s_[50:51, 50:51])
+        result = opConcatenate.ConcatenatedOutput.value
+        assert result.shape == (9, 3)
+        assert result.history.appended_rows(history).tolist() == [4]
+
+    def _getLabels(self):
         labels = numpy.zeros((100, 100, 1), dtype=numpy.uint8)
         labels = vigra.taggedView(labels, "xyc")
 
@@ -37,10 +56,18 @@ class TestOpConcatenateFeatureMatrices(object):
         labels[10, 11] = 1
         labels[20, 20] = 2
         labels[20, 21] = 2
+        return labels
+
+    def _getMatrixOp(self, graph, labels=None):
+        features = numpy.indices((100, 100)).astype(numpy.float32) + 0.5
+        features = numpy.rollaxis(features, 0, 3)
+        features = vigra.taggedView(features, "xyc")
+        if labels is None:
+            labels = self._getLabels()
 
         opFeatureMatrixCache = OpFeatureMatrixCache(graph=graph)
         opFeatureMatrixCache.FeatureImage.setValue(features)
-        opFeatureMatrixCache.LabelImage.setValue(labels)
+        opFeatureMatrixCache.LabelImage.setValue(labels, extra_meta={"ideal_blockshape": (10, 10, 1)})
 
         opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[10:11, 10:12])
         opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[20:21, 20:22])
@@ -5,6 +5,21 @@ import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators.opFeatureMatrixCache import OpFeatureMatrixCache
 from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+
+
+class OpRecordingArrayPiper(OpArrayPiper):
+    """
+    Remembers the rois it was asked for.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(OpRecordingArrayPiper, self).__init__(*args, **kwargs)
+        self.requested_rois = []
+
+    def execute(self, slot, subindex, roi, result):
+        self.requested_rois.append((tuple(roi.start), tuple(roi.stop)))
+        return super(OpRecordingArrayPiper, self).execute(slot, subindex, roi, result)
 
 
 class TestOpFeatureMatrixCache(object):
@@ -51,3 +66,78 @@ class TestOpFeatureMatrixCache(object):
         # Just check that all features are present, regardless of order.
         for feature_vec in [[10.5, 10.5], [10.5, 11.5], [20.5, 20.5], [20.5, 21.5]]:
             assert feature_vec in labels_and_features[:, 1:]
+
+    def testDirtyFeatureChannels(self):
+        features = numpy.indices((100, 100)).astype(numpy.float32) + 0.5
+        features = numpy.rollaxis(features, 0, 3)
+        features = vigra.taggedView(features, "xyc")
+
+        labels = numpy.zeros((100, 100, 1), dtype=numpy.uint8)
+        labels = vigra.taggedView(labels, "xyc")
+        labels[10, 10] = 1
+        labels[50, 50] = 2
+
+        graph = Graph()
+        opLabelCache = OpBlockedArrayCache(graph=graph)
+        opLabelCache.BlockShape.setValue((10, 10, 1))
+        opLabelCache.Input.setValue(labels)
+
+        opFeatures = OpRecordingArrayPiper(graph=graph)
+        opFeatures.Input.setValue(features)
+
+        opFeatureMatrixCache = OpFeatureMatrixCache(graph=graph)
+        opFeatureMatrixCache.LabelImage.connect(opLabelCache.Output)
+        opFeatureMatrixCache.FeatureImage.connect(opFeatures.Output)
+
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[10:11, 10:11])
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[50:51, 50:51])
+        labels_and_features = opFeatureMatrixCache.LabelAndFeatureMatrix.value
+        assert labels_and_features.shape == (2, 3)
+
+        # Only the second channel of the block around (50, 50) is dirty
+        del opFeatures.requested_rois[:]
+        opFeatureMatrixCache.FeatureImage.setDirty(numpy.s_[40:60, 40:60, 1:2])
+        labels_and_features = opFeatureMatrixCache.LabelAndFeatureMatrix.value
+        assert opFeatures.requested_rois == [((50, 50, 1), (51, 51, 2))]
+        assert labels_and_features.shape == (2, 3)
+        for label_and_feature_vec in [[1, 10.5, 10.5], [2, 50.5, 50.5]]:
+            assert label_and_feature_vec in labels_and_features
+
+        # Nothing is re-computed if no stored block is dirty
+        del opFeatures.requested_rois[:]
+        opFeatureMatrixCache.FeatureImage.setDirty(numpy.s_[80:90, 80:90, :])
+        assert opFeatureMatrixCache.LabelAndFeatureMatrix.value.shape == (2, 3)
+        assert opFeatures.requested_rois == []
+
+    def testHistory(self):
+        features = numpy.indices((100, 100)).astype(numpy.float32) + 0.5
+        features = numpy.rollaxis(features, 0, 3)
+        features = vigra.taggedView(features, "xyc")
+
+        labels = numpy.zeros((100, 100, 1), dtype=numpy.uint8)
+        labels = vigra.taggedView(labels, "xyc")
+        labels[10, 10] = 1
+
+        # The labels are modified in place (no label cache in between)
+        opFeatureMatrixCache = OpFeatureMatrixCache(graph=Graph())
+        opFeatureMatrixCache.FeatureImage.setValue(features)
+        opFeatureMatrixCache.LabelImage.setValue(labels, extra_meta={"ideal_blockshape": (10, 10, 1)})
+
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[10:11, 10:11])
+        first = opFeatureMatrixCache.LabelAndFeatureMatrix.value.history
+
+        # Labels in a new block are appended
+        labels[50, 50] = 2
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[50:51, 50:51])
+        second = opFeatureMatrixCache.LabelAndFeatureMatrix.value.history
+        assert second.appended_rows(first).tolist() == [1]
+
+        # Relabelled pixels change rows of the matrix
+        labels[10, 10] = 2
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[10:11, 10:11])
+        third = opFeatureMatrixCache.LabelAndFeatureMatrix.value.history
+        assert third.appended_rows(second) is None
+
+        # So do changed features
+        opFeatureMatrixCache.FeatureImage.setDirty(numpy.s_[40:60, 40:60, 1:2])
+        assert opFeatureMatrixCache.LabelAndFeatureMatrix.value.history.appended_rows(third) is None
@@ -0,0 +1,115 @@
+import numpy
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper, OpReorderAxes
+from lazyflow.operators.generic import OpConvertDtype, OpPixelOperator, OpSingleChannelSelector
+from lazyflow.operators.valueProviders import OpMetadataInjector
+from lazyflow.operators.opFusedPixelChain import (
+    OpFusedPixelChain,
+    ReorderAxesStage,
+    ConvertDtypeStage,
+    DtypeViewStage,
+    PixelFunctionStage,
+    ChannelSelectorStage,
+)
+
+
+def make_data():
+    data = numpy.random.randint(0, 255, size=(20, 30, 3)).astype(numpy.uint8)
+    return vigra.taggedView(data, "yxc")
+
+
+def test_equivalent_to_operator_chain():
+    graph = Graph()
+    data = make_data()
+
+    opSelect = OpSingleChannelSelector(graph=graph)
+    opSelect.Input.setValue(data)
+    opSelect.Index.setValue(1)
+    opReorder = OpReorderAxes(graph=graph)
+    opReorder.Input.connect(opSelect.Output)
+    opReorder.AxisOrder.setValue("tzyxc")
+    opConvert = OpConvertDtype(graph=graph)
+    opConvert.Input.connect(opReorder.Output)
+    opConvert.ConversionDtype.setValue(numpy.float32)
+    opFunction = OpPixelOperator(graph=graph)
+    opFunction.Input.connect(opConvert.Output)
+    opFunction.Function.setValue(lambda a: a / 255.0)
+
+    op = OpFusedPixelChain(graph=graph)
+    op.Input.setValue(data)
+    op.Stages.setValue(
+        [
+            ChannelSelectorStage(1),
+            ReorderAxesStage("tzyxc"),
+            ConvertDtypeStage(numpy.float32),
+            PixelFunctionStage(lambda a: a / 255.0),
+        ]
+    )
+
+    assert op.Output.meta.shape == opFunction.Output.meta.shape == (1, 1, 20, 30, 1)
+    assert op.Output.meta.dtype == opFunction.Output.meta.dtype
+    assert op.Output.meta.getAxisKeys() == list("tzyxc")
+
+    numpy.testing.assert_array_equal(op.Output[:].wait(), opFunction.Output[:].wait())
+    numpy.testing.assert_array_equal(op.Output[:, :, 5:10, 3:7, :].wait(), opFunction.Output[:, :, 5:10, 3:7, :].wait())
+
+
+def test_in_place_function():
+    data = make_data()
+
+    def subtract_inplace(a):
+        a[:] -= 10
+        return a
+
+    op = OpFusedPixelChain(graph=Graph())
+    op.Input.setValue(data)
+    op.Stages.setValue([ConvertDtypeStage(numpy.int16), PixelFunctionStage(subtract_inplace)])
+
+    numpy.testing.assert_array_equal(op.Output[:].wait(), data.astype(numpy.int16) - 10)
+    # The input was not modified
+    numpy.testing.assert_array_equal(op.Input[:].wait(), data)
+
+
+def test_dtype_view():
+    data = vigra.taggedView(numpy.arange(-5, 5, dtype=numpy.int32).reshape((2, 5)), "yx")
+
+    op = OpFusedPixelChain(graph=Graph())
+    op.Input.setValue(data)
+    op.Stages.setValue([DtypeViewStage(numpy.uint32)])
+
+    assert op.Output.meta.dtype == numpy.uint32
+    numpy.testing.assert_array_equal(op.Output[:].wait(), data.view(numpy.ndarray).view(numpy.uint32))
+
+
+def test_drange():
+    graph = Graph()
+    opDrange = OpMetadataInjector(graph=graph)
+    opDrange.Input.setValue(make_data())
+    opDrange.Metadata.setValue({"drange": (0, 255)})
+
+    op = OpFusedPixelChain(graph=graph)
+    op.Input.connect(opDrange.Output)
+    op.Stages.setValue([ConvertDtypeStage(numpy.float32), PixelFunctionStage(lambda a: a / 255)])
+
+    assert op.Output.meta.drange == (0.0, 1.0)
+
+
+def test_dirty_propagation():
+    graph = Graph()
+    opPiper = OpArrayPiper(graph=graph)
+    opPiper.Input.setValue(make_data())
+
+    op = OpFusedPixelChain(graph=graph)
+    op.Input.connect(opPiper.Output)
+    op.Stages.setValue([ChannelSelectorStage(2), ReorderAxesStage("cxy")])
+
+    dirty_rois = []
+    op.Output.notifyDirty(lambda slot, roi: dirty_rois.append((tuple(roi.start), tuple(roi.stop))))
+
+    opPiper.Input.setDirty((slice(2, 5), slice(3, 10), slice(1, 2)))
+    assert dirty_rois == [((0, 3, 2), (1, 10, 5))]
+
+    op.Stages.setValue([ReorderAxesStage("xyc")])
+    assert dirty_rois[-1] == ((0, 0, 0), (30, 20, 3))
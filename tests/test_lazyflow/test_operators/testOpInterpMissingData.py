@@ -340,6 +340,38 @@ class TestDetection(unittest.TestCase):
 
         assert_array_equal(expected[3:5, 3:5], out[3:5, 3:5])
 
+    def testHistogramIntersectionKernel(self):
+        from lazyflow.operators.opDetectMissingData import _histogramIntersectionKernel
+
+        X = np.random.rand(37, 30)
+        Y = np.random.rand(23, 30)
+        expected = np.sum(np.minimum(X[:, np.newaxis, :], Y[np.newaxis, :, :]), axis=2)
+
+        assert_array_almost_equal(_histogramIntersectionKernel(X, Y), expected)
+        # tiny budget => one tile per kernel entry
+        assert_array_almost_equal(_histogramIntersectionKernel(X, Y, memoryBudget=1), expected)
+        assert_array_almost_equal(_histogramIntersectionKernel(X, Y, memoryBudget=1000), expected)
+
+    def testExtractHistograms(self):
+        from lazyflow.operators.opDetectMissingData import extractHistograms
+
+        vol = np.random.randint(0, 256, size=(3, 40, 50)).astype(np.uint8)
+        labels = np.zeros(vol.shape, dtype=np.uint8)
+        labels[0, 20, 25] = 1
+        labels[1, 10, 12] = 2
+        labels[2, 30, 40] = 1
+        # too close to the border
+        labels[2, 1, 1] = 2
+
+        hists = extractHistograms(vol, labels, patchSize=8, haloSize=2, nBins=20, appendPositions=True)
+
+        assert hists.shape == (3, 24)
+        for hist in hists:
+            z, y, x = hist[21:].astype(int)
+            (expected, _) = np.histogram(vol[z, y - 6 : y + 6, x - 6 : x + 6], bins=20, range=(0, 255), density=True)
+            assert_array_almost_equal(hist[:20], expected)
+            assert hist[20] == (1 if labels[z, y, x] == 1 else 0)
+
 
 class TestInterpolation(unittest.TestCase):
     """
@@ -75,3 +75,75 @@ class TestOpPixelFeaturesPresmoothed(object):
 
         assert computed_whole.shape == computed_per_slice.shape
         assert numpy.allclose(computed_whole, computed_per_slice), abs(computed_whole - computed_per_slice).max()
+
+
+class TestPresmoothingCache(object):
+    scales = [0.3, 1.0, 3.5]
+
+    @classmethod
+    def setup_class(cls):
+        cls.data = numpy.random.rand(2, 2, 12, 30, 31).astype(numpy.float32).view(vigra.VigraArray)
+        cls.data.axistags = vigra.defaultAxistags("tczyx")
+
+    def make_op(self, data, blockshape=None):
+        op = OpPixelFeaturesPresmoothed(graph=Graph())
+        if blockshape is not None:
+            op.PRESMOOTHING_BLOCK_SHAPE = blockshape
+        op.Scales.setValue(self.scales)
+        op.FeatureIds.setValue(["GaussianSmoothing", "HessianOfGaussianEigenvalues"])
+        op.SelectionMatrix.setValue(numpy.array([[True, True, True], [False, True, True]]))
+        op.ComputeIn2d.setValue([False] * len(self.scales))
+        op.Input.setValue(data)
+        return op
+
+    def count_presmoothing(self, op):
+        calls = []
+        compute = op._compute_presmoothed_block
+
+        def counting_compute(*args):
+            calls.append(args)
+            return compute(*args)
+
+        op._compute_presmoothed_block = counting_compute
+        return calls
+
+    def test_tiled_requests_match_whole(self):
+        expected = self.make_op(self.data).Output[:].wait()
+
+        op = self.make_op(self.data, blockshape=(5, 8, 9))
+        result = numpy.zeros_like(expected)
+        for z in (slice(0, 7), slice(7, 12)):
+            for y in (slice(0, 11), slice(11, 30)):
+                result[:, :, z, y, :] = op.Output[:, :, z, y, :].wait()
+
+        numpy.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-5)
+
+    def test_presmoothed_blocks_are_reused(self):
+        op = self.make_op(self.data, blockshape=(6, 15, 16))
+        calls = self.count_presmoothing(op)
+
+        op.Output[:, :, 0:6, 0:15, 0:16].wait()
+        num_blocks = len(calls)
+        assert num_blocks > 0
+        assert op.usedMemory() > 0
+
+        # Requests for other channels or single features don't smooth again
+        op.Output[:, 0:1, 0:6, 0:15, 0:16].wait()
+        op.Features[1][:, :, 0:6, 0:15, 0:16].wait()
+        assert len(calls) == num_blocks
+
+        op.freeMemory()
+        assert op.usedMemory() == 0
+        op.Output[:, :, 0:6, 0:15, 0:16].wait()
+        assert len(calls) == 2 * num_blocks
+
+    def test_dirty_input_invalidates_presmoothed_blocks(self):
+        op = self.make_op(self.data, blockshape=(6, 15, 16))
+        op.Output[:].wait()
+
+        new_data = self.data.copy()
+        new_data[:, :, 2:4, 20:25, 5:9] = 0
+        op.Input.setValue(new_data)
+
+        expected = self.make_op(new_data).Output[:].wait()
+        numpy.testing.assert_allclose(op.Output[:].wait(), expected, rtol=1e-5, atol=1e-5)
@@ -5,7 +5,11 @@ import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators.opFeatureMatrixCache import OpFeatureMatrixCache
 from lazyflow.operators.classifierOperators import OpTrainClassifierFromFeatureVectors
-from lazyflow.classifiers import ParallelVigraRfLazyflowClassifierFactory, ParallelVigraRfLazyflowClassifier
+from lazyflow.classifiers import (
+    ParallelVigraRfLazyflowClassifierFactory,
+    ParallelVigraRfLazyflowClassifier,
+    IncrementalParallelVigraRfLazyflowClassifierFactory,
+)
 
 
 class TestOpTrainClassifierFromFeatureVectors(object):
@@ -43,3 +47,80 @@ class TestOpTrainClassifierFromFeatureVectors(object):
         assert isinstance(
             trained_classifier, ParallelVigraRfLazyflowClassifier
         ), "classifier is of the wrong type: {}".format(type(trained_classifier))
+
+    def testIncremental(self):
+        features = numpy.indices((100, 100)).astype(numpy.float32) + 0.5
+        features = numpy.rollaxis(features, 0, 3)
+        features = vigra.taggedView(features, "xyc")
+        labels = numpy.zeros((100, 100, 1), dtype=numpy.uint8)
+        labels = vigra.taggedView(labels, "xyc")
+
+        labels[10, 10:15] = 1
+        labels[20, 20:25] = 2
+
+        graph = Graph()
+        opFeatureMatrixCache = OpFeatureMatrixCache(graph=graph)
+        opFeatureMatrixCache.FeatureImage.setValue(features)
+        opFeatureMatrixCache.LabelImage.setValue(labels, extra_meta={"ideal_blockshape": (10, 10, 1)})
+
+        opTrain = OpTrainClassifierFromFeatureVectors(graph=graph)
+        opTrain.ClassifierFactory.setValue(
+            IncrementalParallelVigraRfLazyflowClassifierFactory(8, num_forests=4, trees_per_update=2)
+        )
+        opTrain.MaxLabel.setValue(2)
+        opTrain.LabelAndFeatureMatrix.connect(opFeatureMatrixCache.LabelAndFeatureMatrix)
+
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[10:11, 10:15])
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[20:21, 20:25])
+        first = opTrain.Classifier.value
+
+        # New labels in a new block: the classifier is updated
+        labels[80, 80:85] = 2
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[80:81, 80:85])
+        updated = opTrain.Classifier.value
+        assert set(updated._forests) & set(first._forests)
+
+        # Relabelled pixels (same number of samples): the old forests were trained on wrong labels
+        labels[80, 80:85] = 1
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[80:81, 80:85])
+        retrained = opTrain.Classifier.value
+        assert not set(retrained._forests) & set(updated._forests)
+
+    def testIncrementalFactoryChanged(self):
+        features = numpy.indices((100, 100)).astype(numpy.float32) + 0.5
+        features = numpy.rollaxis(features, 0, 3)
+        features = vigra.taggedView(features, "xyc")
+        labels = numpy.zeros((100, 100, 1), dtype=numpy.uint8)
+        labels = vigra.taggedView(labels, "xyc")
+
+        labels[10, 10:15] = 1
+        labels[20, 20:25] = 2
+
+        graph = Graph()
+        opFeatureMatrixCache = OpFeatureMatrixCache(graph=graph)
+        opFeatureMatrixCache.FeatureImage.setValue(features)
+        opFeatureMatrixCache.LabelImage.setValue(labels, extra_meta={"ideal_blockshape": (10, 10, 1)})
+
+        opTrain = OpTrainClassifierFromFeatureVectors(graph=graph)
+        opTrain.ClassifierFactory.setValue(
+            IncrementalParallelVigraRfLazyflowClassifierFactory(8, num_forests=4, trees_per_update=2)
+        )
+        opTrain.MaxLabel.setValue(2)
+        opTrain.LabelAndFeatureMatrix.connect(opFeatureMatrixCache.LabelAndFeatureMatrix)
+
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[10:11, 10:15])
+        opFeatureMatrixCache.LabelImage.setDirty(numpy.s_[20:21, 20:25])
+        first = opTrain.Classifier.value
+
+        # More trees, same labels: all trees are trained by the new factory
+        opTrain.ClassifierFactory.setValue(
+            IncrementalParallelVigraRfLazyflowClassifierFactory(16, num_forests=4, trees_per_update=4)
+        )
+        retrained = opTrain.Classifier.value
+        assert sum(f.treeCount() for f in retrained._forests) == 16
+        assert not set(retrained._forests) & set(first._forests)
+
+        # Another factory type, same labels
+        opTrain.ClassifierFactory.setValue(ParallelVigraRfLazyflowClassifierFactory(16, num_forests=4))
+        other = opTrain.Classifier.value
+        assert not set(other._forests) & set(retrained._forests)
@@ -1,11 +1,13 @@
 from builtins import range
 from builtins import object
 import numpy as np
+import pytest
 import vigra
 
 from lazyflow.request import RequestPool
 from lazyflow.graph import Graph
 from lazyflow.roi import roiToSlice
+from lazyflow.operators import cacheSpillStore
 from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
 from lazyflow.utility.testing import OpArrayPiperWithAccessCount
 
@@ -168,3 +170,95 @@ class TestOpUnblockedArrayCacheCache(object):
         cache_data = opCache.Output(*inner_roi).wait()
         assert (cache_data == data[roiToSlice(*inner_roi)]).all()
         assert opDataProvider.accessCount == 0
+
+
+class TestOpUnblockedArrayCacheSpilling(object):
+    @pytest.fixture(autouse=True)
+    def spill_directory(self, tmp_path):
+        cacheSpillStore.configure(str(tmp_path), max_bytes=10 * 1024 ** 2)
+        yield tmp_path
+        cacheSpillStore.configure(None)
+
+    @pytest.fixture(params=[False, True], ids=["raw", "compressed"])
+    def setup(self, request):
+        graph = Graph()
+        opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+        opCache = OpUnblockedArrayCache(graph=graph)
+        opCache.CompressionEnabled.setValue(request.param)
+
+        data = np.random.random((100, 100, 100)).astype(np.float32)
+        opDataProvider.Input.setValue(vigra.taggedView(data, "zyx"))
+        opCache.Input.connect(opDataProvider.Output)
+        return opDataProvider, opCache, data
+
+    def testEvictedBlocksAreReadFromDisk(self, setup):
+        opDataProvider, opCache, data = setup
+        roi = ((30, 30, 30), (50, 50, 50))
+        opCache.Output(*roi).wait()
+        assert opDataProvider.accessCount == 1
+
+        ((block, _),) = opCache.getBlockAccessTimes()
+        assert opCache.freeBlock(block) == 20 ** 3 * 4
+        assert opCache.CleanBlocks.value == []
+        assert cacheSpillStore.usedBytes() > 0
+
+        inner_roi = ((35, 35, 35), (45, 45, 45))
+        cache_data = opCache.Output(*inner_roi).wait()
+        assert (cache_data == data[roiToSlice(*inner_roi)]).all()
+        assert opDataProvider.accessCount == 1
+        assert opCache.CleanBlocks.value == [roiToSlice(*roi)]
+
+    def testDirtyBlocksAreDiscardedFromDisk(self, setup):
+        opDataProvider, opCache, data = setup
+        roi = ((30, 30, 30), (50, 50, 50))
+        opCache.Output(*roi).wait()
+        ((block, _),) = opCache.getBlockAccessTimes()
+        opCache.freeBlock(block)
+
+        opDataProvider.Input.setDirty((30, 30, 30), (31, 31, 31))
+        assert cacheSpillStore.keys(opCache._spill_owner) == []
+
+        cache_data = opCache.Output(*roi).wait()
+        assert (cache_data == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == 2
+
+    def testCleanUpRemovesFiles(self, setup, spill_directory):
+        opDataProvider, opCache, data = setup
+        opCache.Output[10:20, 10:20, 10:20].wait()
+        ((block, _),) = opCache.getBlockAccessTimes()
+        opCache.freeBlock(block)
+        assert len(list(spill_directory.glob("*/*"))) == 1
+
+        opCache.cleanUp()
+        assert len(list(spill_directory.glob("*/*"))) == 0
+        assert cacheSpillStore.usedBytes() == 0
+
+    def testRestoredBlocksAreForgotten(self, setup):
+        opDataProvider, opCache, data = setup
+        roi = ((30, 30, 30), (50, 50, 50))
+        opCache.Output(*roi).wait()
+        ((block, _),) = opCache.getBlockAccessTimes()
+        opCache.freeBlock(block)
+        assert list(opCache._spilled_compute_times) == [block]
+
+        opCache.Output(*roi).wait()
+        assert opCache._spilled_compute_times == {}
+        assert len(opCache._spill_index) == 0
+        assert cacheSpillStore.keys(opCache._spill_owner) == []
+
+    def testBlocksDroppedFromDiskAreForgotten(self, setup, spill_directory):
+        opDataProvider, opCache, data = setup
+        # Room for one block on disk
+        cacheSpillStore.configure(str(spill_directory), max_bytes=20 ** 3 * 4 + 1024)
+        rois = [((0, 0, 0), (20, 20, 20)), ((50, 50, 50), (70, 70, 70))]
+        for roi in rois:
+            opCache.Output(*roi).wait()
+        for block, _ in sorted(opCache.getBlockAccessTimes()):
+            opCache.freeBlock(block)
+
+        assert list(opCache._spilled_compute_times) == [rois[1]]
+        assert list(opCache._spill_index) == [rois[1]]
+
+        opDataProvider.Input.setDirty((60, 60, 60), (61, 61, 61))
+        assert opCache._spilled_compute_times == {}
+        assert len(opCache._spill_index) == 0
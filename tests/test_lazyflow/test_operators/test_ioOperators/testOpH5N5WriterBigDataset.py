@@ -233,3 +233,55 @@ class TestOpH5N5WriterBigDataset_3(object):
         assert (numpy.all(n5_dataset[...] == self.testData.view(numpy.ndarray)[...])).all()
         hdf5File.close()
         n5File.close()
+
+
+class TestOpH5N5WriterBigDatasetParallelWrite(object):
+    def setup_method(self, method):
+        self.graph = lazyflow.graph.Graph()
+        self.testDataH5FileName = "bigH5TestData.h5"
+        self.testDataN5FileName = "bigN5TestData.n5"
+        self.datasetInternalPath = "volume/data"
+
+        # Odd shape, so that the border chunks are incomplete
+        self.dataShape = (1, 10, 130, 77, 1)
+        self.testData = vigra.VigraArray(self.dataShape, axistags=vigra.defaultAxistags("txyzc"), order="C")
+        self.testData[...] = numpy.indices(self.dataShape).sum(0)
+
+    def teardown_method(self, method):
+        try:
+            os.remove(self.testDataH5FileName)
+            rmtree(self.testDataN5FileName)
+        except:
+            pass
+
+    def test_Writer(self):
+        for compression in ("raw", "gzip"):
+            hdf5File = h5py.File(self.testDataH5FileName, "w")
+            n5File = z5py.N5File(self.testDataN5FileName, "w")
+
+            opPiper = OpArrayPiper(graph=self.graph)
+            opPiper.Input.setValue(self.testData)
+            # Force many small requests, which will be rounded up to whole chunks
+            opPiper.Output.meta.ideal_blockshape = (1, 1, 0, 0, 1)
+            opPiper.Output.meta.ram_usage_per_requested_pixel = 1000000.0
+
+            for f in (hdf5File, n5File):
+                opWriter = OpH5N5WriterBigDataset(
+                    graph=self.graph, Compression=compression, ParallelWrite=True, BatchSize=4
+                )
+                opWriter.h5N5File.setValue(f)
+                opWriter.h5N5Path.setValue(self.datasetInternalPath)
+                opWriter.Image.connect(opPiper.Output)
+                assert opWriter.WriteImage.value
+                opWriter.cleanUp()
+
+            hdf5File.close()
+            n5File.close()
+
+            hdf5File = h5py.File(self.testDataH5FileName, "r")
+            n5File = z5py.N5File(self.testDataN5FileName, "r")
+            for dataset in (hdf5File[self.datasetInternalPath], n5File[self.datasetInternalPath]):
+                assert dataset.shape == self.dataShape
+                assert (dataset[...] == self.testData.view(numpy.ndarray)).all()
+            hdf5File.close()
+            n5File.close()
@@ -5,10 +5,12 @@ import contextlib
 
 import numpy
 from numpy.testing import assert_array_equal
+import pytest
 import vigra
 
 from lazyflow.graph import Graph
 from lazyflow.operators.ioOperators import OpTiffReader
+from lazyflow.operators.ioOperators import opTiffReader
 
 
 @contextlib.contextmanager
@@ -64,6 +66,74 @@ class TestOpTiffReader(object):
             assert op.Output.ready()
             assert (op.Output[20:30, 50:100, 50:150].wait() == data[20:30, 50:100, 50:150]).all()
 
+    def test_tiled(self):
+        import tifffile
+
+        data = numpy.random.randint(0, 255, (4, 100, 200)).astype(numpy.uint8)
+        with tempdir() as d:
+            tiff_path = d + "/test-tiled.tiff"
+            tifffile.imsave(tiff_path, data, tile=(32, 48))
+
+            op = OpTiffReader(graph=Graph())
+            op.Filepath.setValue(tiff_path)
+            assert op.Output.ready()
+            assert op.Output.meta.ideal_blockshape == (1, 32, 48)
+            assert_array_equal(op.Output[1:3, 20:90, 50:150].wait(), data[1:3, 20:90, 50:150])
+            assert_array_equal(op.Output[:].wait(), data)
+            op.cleanUp()
+
+    def _tiled_reader(self, d, data, name="test-tiled.tiff"):
+        import tifffile
+
+        tiff_path = d + "/" + name
+        tifffile.imsave(tiff_path, data, tile=(32, 48))
+        op = OpTiffReader(graph=Graph())
+        op.Filepath.setValue(tiff_path)
+        return op
+
+    def test_tile_decode_error_falls_back_to_pages(self, monkeypatch):
+        data = numpy.random.randint(0, 255, (4, 100, 200)).astype(numpy.uint8)
+        with tempdir() as d:
+            op = self._tiled_reader(d, data)
+
+            def fail(page_index, segment_index):
+                raise opTiffReader._SegmentDecodeError("unsupported compression")
+
+            monkeypatch.setattr(op, "_decode_segment", fail)
+            assert_array_equal(op.Output[1:3, 20:90, 50:150].wait(), data[1:3, 20:90, 50:150])
+            assert op._segment_shape is None
+            op.cleanUp()
+
+    def test_tile_read_errors_propagate(self, monkeypatch):
+        data = numpy.random.randint(0, 255, (4, 100, 200)).astype(numpy.uint8)
+        with tempdir() as d:
+            op = self._tiled_reader(d, data)
+
+            def fail(page_index, segment_index):
+                raise IndexError("not a decoding problem")
+
+            monkeypatch.setattr(op, "_decode_segment", fail)
+            with pytest.raises(IndexError):
+                op.Output[1:3, 20:90, 50:150].wait()
+            # No permanent fallback to whole pages
+            assert op._segment_shape is not None
+            op.cleanUp()
+
+    def test_tile_cache_is_shared(self, monkeypatch):
+        # Room for 10 tiles, for all readers together
+        monkeypatch.setattr(opTiffReader._tile_cache, "max_bytes", 10 * 32 * 48)
+        data = numpy.random.randint(0, 255, (4, 100, 200)).astype(numpy.uint8)
+        with tempdir() as d:
+            ops = [self._tiled_reader(d, data, "test-tiled-{}.tiff".format(i)) for i in range(2)]
+            for op in ops:
+                assert_array_equal(op.Output[:].wait(), data)
+            assert opTiffReader._tile_cache.usedBytes() <= 10 * 32 * 48
+
+            owners = [op._tile_cache_owner for op in ops]
+            for op in ops:
+                op.cleanUp()
+            assert not [k for k in opTiffReader._tile_cache._entries if k[0] in owners]
+
     def test_unknown_axes_tags(self):
         """
         This test is related to https://github.com/ilastik/ilastik/issues/1487
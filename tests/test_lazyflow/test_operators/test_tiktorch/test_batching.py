@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pytest
+
+from lazyflow.request import Request
+from lazyflow.operators.tiktorch.batching import PredictionBatcher
+
+
+class StandInServer:
+    """
+    Local replacement for the inference server: "predicts" by doubling the input, and records batch sizes.
+    """
+
+    def __init__(self, fail=False):
+        self.executor = ThreadPoolExecutor(2)
+        self.batch_sizes = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def predict_batch(self, batch):
+        with self._lock:
+            self.batch_sizes.append(batch.shape[0])
+
+        def predict():
+            if self.fail:
+                raise RuntimeError("prediction failed")
+            return batch * 2
+
+        return self.executor.submit(predict)
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    yield server
+    server.executor.shutdown()
+
+
+def test_concurrent_requests_are_batched(server):
+    batcher = PredictionBatcher(server.predict_batch, batch_axis=0, max_batch_size=4, max_delay=0.5)
+    tiles = [numpy.full((1, 2, 8, 8), i, dtype=numpy.float32) for i in range(8)]
+
+    requests = [Request(lambda tile=tile: batcher.predict(tile)) for tile in tiles]
+    for rq in requests:
+        rq.submit()
+    results = [rq.wait() for rq in requests]
+
+    for tile, result in zip(tiles, results):
+        numpy.testing.assert_array_equal(result, tile * 2)
+    # All tiles were collected in two full batches, without waiting for the (long) delay
+    assert server.batch_sizes == [4, 4]
+
+
+def test_different_shapes_are_not_batched_together(server):
+    batcher = PredictionBatcher(server.predict_batch, batch_axis=0, max_batch_size=4, max_delay=0.01)
+    tiles = [numpy.ones((1, 2, 8, 8)), numpy.ones((1, 2, 4, 4))]
+
+    requests = [Request(lambda tile=tile: batcher.predict(tile)) for tile in tiles]
+    for rq in requests:
+        rq.submit()
+    results = [rq.wait() for rq in requests]
+
+    assert [r.shape for r in results] == [t.shape for t in tiles]
+    assert sorted(server.batch_sizes) == [1, 1]
+
+
+def test_partial_batch_is_sent_after_delay(server):
+    batcher = PredictionBatcher(server.predict_batch, batch_axis=0, max_batch_size=8, max_delay=0.01)
+
+    # Called from a foreign thread, not from within a request
+    result = batcher.predict(numpy.ones((1, 3)))
+    numpy.testing.assert_array_equal(result, 2 * numpy.ones((1, 3)))
+    assert server.batch_sizes == [1]
+
+
+def test_output_batch_axis(server):
+    def predict_transposed(batch):
+        return server.executor.submit(lambda: numpy.moveaxis(batch, 0, -1))
+
+    batcher = PredictionBatcher(predict_transposed, batch_axis=0, output_batch_axis=2, max_batch_size=2)
+    tiles = [numpy.full((1, 3, 5), i) for i in range(2)]
+
+    requests = [Request(lambda tile=tile: batcher.predict(tile)) for tile in tiles]
+    for rq in requests:
+        rq.submit()
+
+    for tile, rq in zip(tiles, requests):
+        numpy.testing.assert_array_equal(rq.wait(), numpy.moveaxis(tile, 0, -1))
+
+
+def test_errors_are_raised_in_every_caller():
+    server = StandInServer(fail=True)
+    batcher = PredictionBatcher(server.predict_batch, batch_axis=0, max_batch_size=2, max_delay=0.5)
+
+    errors = []
+
+    def predict():
+        try:
+            batcher.predict(numpy.ones((1, 3)))
+        except RuntimeError as e:
+            errors.append(e)
+
+    requests = [Request(predict) for _ in range(2)]
+    for rq in requests:
+        rq.submit()
+    for rq in requests:
+        rq.wait()
+
+    server.executor.shutdown()
+    assert len(errors) == 2
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from lazyflow.request import processPool
+from lazyflow.request.processPool import process_pool_kernel
+from lazyflow.request.request import Request, RequestPool
+
+
+class KernelExc(Exception):
+    pass
+
+
+@process_pool_kernel
+def add(a, b):
+    return a + b
+
+
+@process_pool_kernel
+def min_max(a):
+    return a.min(), a.max(), "done"
+
+
+@process_pool_kernel
+def fail(msg):
+    raise KernelExc(msg)
+
+
+@process_pool_kernel
+def modify_inplace(a):
+    a[...] = 0
+
+
+@process_pool_kernel
+def worker_flag():
+    return processPool._in_worker_process
+
+
+@pytest.fixture
+def process_pool():
+    processPool.reset_process_pool(2)
+    yield processPool.global_process_pool
+    processPool.reset_process_pool(0)
+
+
+def test_kernel_runs_inline_without_pool():
+    assert processPool.global_process_pool is None
+    assert not worker_flag()
+    assert add(1, 2) == 3
+
+
+def test_kernel_runs_in_worker_process(process_pool):
+    assert worker_flag()
+
+
+def test_arrays_are_transferred(process_pool):
+    a = np.arange(1000, dtype=np.float32).reshape(10, 100)
+    b = np.ones((10, 100), dtype=np.float32)
+    result = add(a, b)
+    assert result.dtype == np.float32
+    assert_array_equal(result, a + 1)
+
+
+def test_tuple_results(process_pool):
+    a = np.arange(10, dtype=np.uint8)
+    assert min_max(a) == (0, 9, "done")
+
+
+def test_array_arguments_are_readonly(process_pool):
+    a = np.ones(10)
+    with pytest.raises(ValueError):
+        modify_inplace(a)
+    assert_array_equal(a, 1)
+
+
+def test_exception_propagates_to_caller(process_pool):
+    with pytest.raises(KernelExc, match="boom"):
+        fail("boom")
+
+
+def test_exception_propagates_through_request(process_pool):
+    with pytest.raises(KernelExc):
+        Request(lambda: fail("boom")).wait()
+
+
+def test_kernels_from_many_requests(process_pool):
+    data = [np.full((50, 50), i, dtype=np.int64) for i in range(16)]
+    results = [None] * len(data)
+
+    def compute(i):
+        results[i] = add(data[i], data[i])
+
+    pool = RequestPool()
+    for i in range(len(data)):
+        pool.add(Request(lambda i=i: compute(i)))
+    pool.wait()
+
+    for i, result in enumerate(results):
+        assert_array_equal(result, 2 * i)
+
+
+def test_thread_pool_reset_keeps_process_pool(process_pool):
+    num_workers = Request.global_thread_pool.num_workers
+    Request.reset_thread_pool(num_workers)
+    assert processPool.global_process_pool is process_pool
+
+    Request.reset_thread_pool(num_workers, num_processes=0)
+    assert processPool.global_process_pool is None
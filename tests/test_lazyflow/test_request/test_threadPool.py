@@ -5,7 +5,7 @@ import itertools
 
 import pytest
 
-from lazyflow.request.threadPool import ThreadPool
+from lazyflow.request.threadPool import ThreadPool, WorkStealingThreadPool
 
 
 NUM_WORKERS = 4
@@ -119,3 +119,99 @@ def test_exception_in_task_logged(caplog, pool):
     record = caplog.records[0]
 
     assert issubclass(record.exc_info[0], MyExc)
+
+
+@pytest.fixture
+def stealing_pool():
+    p = WorkStealingThreadPool(NUM_WORKERS)
+    yield p
+    p.stop()
+
+
+def test_work_stealing_pool_wakes_single_idle_worker(stealing_pool: WorkStealingThreadPool):
+    release = threading.Event()
+    started = threading.Event()
+
+    def task():
+        started.set()
+        release.wait()
+
+    stealing_pool.wake_up(Task(task))
+    assert started.wait(timeout=1)
+    time.sleep(0.1)
+    assert stealing_pool.get_states().count("running task") == 1
+    assert stealing_pool.get_states().count("waiting") == NUM_WORKERS - 1
+    release.set()
+
+
+def test_work_stealing_pool_idle_workers_steal_queued_tasks(stealing_pool: WorkStealingThreadPool):
+    release = threading.Event()
+    all_started = threading.Barrier(NUM_WORKERS + 1)
+    threads = set()
+
+    def spawner():
+        # Queue all tasks locally on this worker; the idle workers have to steal them.
+        for _ in range(NUM_WORKERS - 1):
+            stealing_pool.wake_up(Task(blocker))
+        blocker()
+
+    def blocker():
+        threads.add(threading.current_thread())
+        all_started.wait(timeout=1)
+        release.wait()
+
+    stealing_pool.wake_up(Task(spawner))
+    all_started.wait(timeout=1)
+    assert len(threads) == NUM_WORKERS
+    release.set()
+
+
+def test_work_stealing_pool_honours_priority():
+    pool = WorkStealingThreadPool(1)
+    release = threading.Event()
+    done = threading.Event()
+    order = []
+
+    class PrioTask:
+        def __init__(self, priority):
+            self.priority = priority
+            self.assigned_worker = None
+
+        def __lt__(self, other):
+            return self.priority < other.priority
+
+        def __call__(self):
+            if self.priority < 0:
+                release.wait()
+            else:
+                order.append(self.priority)
+                if len(order) == 3:
+                    done.set()
+
+    pool.wake_up(PrioTask(-1))
+    for priority in (3, 1, 2):
+        pool.wake_up(PrioTask(priority))
+    release.set()
+
+    assert done.wait(timeout=1)
+    assert order == [1, 2, 3]
+    pool.stop()
+
+
+def test_work_stealing_pool_resumes_task_on_assigned_worker(stealing_pool: WorkStealingThreadPool):
+    done = threading.Event()
+    workers = []
+
+    def task():
+        workers.append(threading.current_thread())
+        if len(workers) == 2:
+            done.set()
+
+    t = Task(task)
+    stealing_pool.wake_up(t)
+    while t.assigned_worker is None:
+        time.sleep(0.01)
+    stealing_pool.wake_up(t)
+
+    assert done.wait(timeout=1)
+    assert workers[0] is workers[1] is t.assigned_worker
@@ -0,0 +1,86 @@
+import numpy
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+from lazyflow.utility import request_at_points
+
+
+class OpRecordingPiper(OpArrayPiper):
+    """
+    Records the requested rois, and pretends to need a halo around each of them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_rois = []
+
+    def setupOutputs(self):
+        super().setupOutputs()
+        self.Output.meta.request_halo = 4
+
+    def execute(self, slot, subindex, roi, result):
+        self.requested_rois.append((tuple(roi.start), tuple(roi.stop)))
+        super().execute(slot, subindex, roi, result)
+
+
+def make_op(data):
+    op = OpRecordingPiper(graph=Graph())
+    op.Input.setValue(vigra.taggedView(data, "yxc"))
+    return op
+
+
+def test_values_at_points():
+    data = numpy.random.random((200, 300, 3)).astype(numpy.float32)
+    op = make_op(data)
+
+    positions = (numpy.array([0, 5, 150, 199, 3]), numpy.array([0, 7, 250, 299, 290]))
+    result = request_at_points(op.Output, positions)
+
+    assert result.shape == (5, 3)
+    assert result.dtype == numpy.float32
+    numpy.testing.assert_array_equal(result, data[positions])
+
+
+def test_channel_range():
+    data = numpy.random.random((50, 50, 4)).astype(numpy.float32)
+    op = make_op(data)
+
+    positions = numpy.nonzero(numpy.random.random((50, 50)) > 0.9)
+    result = request_at_points(op.Output, positions, channel_range=(1, 3))
+
+    numpy.testing.assert_array_equal(result, data[positions][:, 1:3])
+    assert all(start[-1] == 1 and stop[-1] == 3 for start, stop in op.requested_rois)
+
+
+def test_sparse_points_are_requested_in_tiles():
+    data = numpy.random.random((512, 512, 1)).astype(numpy.float32)
+    op = make_op(data)
+
+    positions = (numpy.array([10, 11, 500, 250]), numpy.array([10, 12, 20, 400]))
+    result = request_at_points(op.Output, positions)
+
+    numpy.testing.assert_array_equal(result, data[positions])
+    assert len(op.requested_rois) == 3
+    requested_pixels = sum(numpy.prod(numpy.subtract(stop, start)) for start, stop in op.requested_rois)
+    assert requested_pixels < 10
+
+
+def test_clustered_points_are_requested_as_bounding_box():
+    data = numpy.random.random((512, 512, 1)).astype(numpy.float32)
+    op = make_op(data)
+
+    positions = numpy.nonzero(numpy.ones((20, 20)))
+    result = request_at_points(op.Output, positions)
+
+    numpy.testing.assert_array_equal(result, data[positions])
+    assert op.requested_rois == [((0, 0, 0), (20, 20, 1))]
+
+
+def test_no_points():
+    op = make_op(numpy.zeros((10, 10, 2), dtype=numpy.uint8))
+
+    result = request_at_points(op.Output, (numpy.array([], int), numpy.array([], int)))
+
+    assert result.shape == (0, 2)
+    assert op.requested_rois == []
@@ -0,0 +1,88 @@
+import itertools
+import random
+
+import pytest
+
+from lazyflow.roi import containing_rois, getIntersection
+from lazyflow.utility.roiIndex import RoiIndex
+
+
+def _grid_rois(shape, blockshape):
+    ranges = [range(0, s, b) for s, b in zip(shape, blockshape)]
+    for start in itertools.product(*ranges):
+        stop = tuple(min(b + bs, s) for b, bs, s in zip(start, blockshape, shape))
+        yield (tuple(start), stop)
+
+
+def _random_roi(rng, shape):
+    start = tuple(rng.randrange(0, s) for s in shape)
+    stop = tuple(rng.randrange(b + 1, s + 1) for b, s in zip(start, shape))
+    return (start, stop)
+
+
+def test_add_remove():
+    index = RoiIndex((10, 10))
+    roi = ((0, 0), (10, 10))
+    index.add(roi)
+    index.add(roi)
+    assert len(index) == 1
+    assert roi in index
+    assert list(index) == [roi]
+
+    index.remove(roi)
+    index.remove(roi)
+    assert len(index) == 0
+    assert index.containing(((1, 1), (2, 2))) is None
+    assert index.intersecting(((0, 0), (100, 100))) == []
+
+
+def test_clear():
+    index = RoiIndex((10, 10))
+    for roi in _grid_rois((50, 50), (10, 10)):
+        index.add(roi)
+    assert len(index) == 25
+    index.clear()
+    assert len(index) == 0
+    assert index.containing(((1, 1), (2, 2))) is None
+
+
+@pytest.mark.parametrize("cell_shape", [(10, 10, 10), (3, 7, 5), (64, 64, 64), (1, 1, 1)])
+def test_matches_linear_scan(cell_shape):
+    rng = random.Random(42)
+    shape = (40, 50, 30)
+    index = RoiIndex(cell_shape)
+    rois = set(_grid_rois(shape, (10, 10, 10)))
+    # Some irregular (overlapping, large) rois, too
+    rois.update(_random_roi(rng, shape) for _ in range(30))
+    for roi in rois:
+        index.add(roi)
+
+    for _ in range(300):
+        query = _random_roi(rng, shape)
+        expected_containing = containing_rois(list(rois), query)
+        found = index.containing(query)
+        if len(expected_containing) == 0:
+            assert found is None
+        else:
+            assert found in {tuple(map(tuple, r)) for r in expected_containing}
+
+        expected_intersecting = {r for r in rois if getIntersection(r, query, assertIntersect=False) is not None}
+        assert set(index.intersecting(query)) == expected_intersecting
+
+    # Remove half of the rois and check again
+    for roi in list(rois)[::2]:
+        index.remove(roi)
+        rois.remove(roi)
+    assert len(index) == len(rois)
+    for _ in range(100):
+        query = _random_roi(rng, shape)
+        expected_intersecting = {r for r in rois if getIntersection(r, query, assertIntersect=False) is not None}
+        assert set(index.intersecting(query)) == expected_intersecting
+
+
+def test_touching_rois_do_not_intersect():
+    index = RoiIndex((10,))
+    index.add(((0,), (10,)))
+    index.add(((10,), (20,)))
+    assert index.intersecting(((10,), (15,))) == [((10,), (20,))]
+    assert index.containing(((5,), (15,))) is None
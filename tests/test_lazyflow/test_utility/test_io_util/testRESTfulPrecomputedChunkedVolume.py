@@ -0,0 +1,110 @@
+import http.server
+import json
+import os
+import socketserver
+import threading
+
+import numpy
+import pytest
+
+from lazyflow.roi import roiToSlice
+from lazyflow.utility.io_util.RESTfulPrecomputedChunkedVolume import RESTfulPrecomputedChunkedVolume
+
+SCALE = "1_1_1"
+CHUNK_SIZE_XYZ = [16, 8, 4]
+
+
+def write_precomputed(directory, data):
+    """Write data ('czyx') as a raw-encoded precomputed volume"""
+    c, z, y, x = data.shape
+    info = {
+        "type": "image",
+        "data_type": data.dtype.name,
+        "num_channels": c,
+        "scales": [
+            {
+                "key": SCALE,
+                "size": [x, y, z],
+                "resolution": [1, 1, 1],
+                "voxel_offset": [0, 0, 0],
+                "chunk_sizes": [CHUNK_SIZE_XYZ],
+                "encoding": "raw",
+            }
+        ],
+    }
+    with open(os.path.join(directory, "info"), "w") as f:
+        json.dump(info, f)
+
+    os.makedirs(os.path.join(directory, SCALE))
+    cx, cy, cz = CHUNK_SIZE_XYZ
+    for z0 in range(0, z, cz):
+        for y0 in range(0, y, cy):
+            for x0 in range(0, x, cx):
+                z1, y1, x1 = min(z0 + cz, z), min(y0 + cy, y), min(x0 + cx, x)
+                name = f"{x0}-{x1}_{y0}-{y1}_{z0}-{z1}"
+                with open(os.path.join(directory, SCALE, name), "wb") as f:
+                    f.write(numpy.ascontiguousarray(data[:, z0:z1, y0:y1, x0:x1]).tobytes())
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serves a precomputed volume from a local directory, and counts the chunk requests"""
+    data = numpy.random.randint(0, 2 ** 16, (2, 10, 20, 35)).astype(numpy.uint16)
+    write_precomputed(str(tmp_path), data)
+    chunk_requests = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(tmp_path), **kwargs)
+
+        def do_GET(self):
+            if self.path.startswith(f"/{SCALE}/"):
+                chunk_requests.append(self.path)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    httpd = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", data, chunk_requests
+    httpd.shutdown()
+    httpd.server_close()
+    thread.join()
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_read(server, n_threads):
+    url, data, chunk_requests = server
+    volume = RESTfulPrecomputedChunkedVolume(url, n_threads=n_threads)
+    assert tuple(volume.get_shape()) == data.shape
+
+    roi = numpy.array([(0, 3, 5, 7), (2, 9, 20, 30)])
+    result = numpy.zeros(roi[1] - roi[0], dtype=volume.dtype)
+    volume.read(roi, result)
+    numpy.testing.assert_array_equal(result, data[roiToSlice(*roi)])
+    # z: 0-4, 4-8, 8-10; y: 0-8, 8-16, 16-20; x: 0-16, 16-32
+    assert len(chunk_requests) == 3 * 3 * 2
+    volume.close()
+
+
+def test_chunk_cache_persists(server, tmp_path_factory):
+    url, data, chunk_requests = server
+    cache_dir = str(tmp_path_factory.mktemp("chunk_cache"))
+
+    volume = RESTfulPrecomputedChunkedVolume(url, chunk_cache_dir=cache_dir)
+    expected = volume.read(([0, 0, 0, 0], data.shape), numpy.zeros(data.shape, dtype=data.dtype))
+    num_chunks = len(chunk_requests)
+    volume.close()
+
+    # A new session reads the chunks from disk
+    volume = RESTfulPrecomputedChunkedVolume(url, chunk_cache_dir=cache_dir)
+    result = volume.read(([0, 0, 0, 0], data.shape), numpy.zeros(data.shape, dtype=data.dtype))
+    assert len(chunk_requests) == num_chunks
+    numpy.testing.assert_array_equal(result, expected)
+    numpy.testing.assert_array_equal(result, data)
+    volume.close()